@@ -38,6 +38,8 @@ from weave.flow.dataset import Dataset
 from weave.flow.model import Model
 from weave.flow.eval import Evaluation, Scorer
 from weave.flow.agent import Agent, AgentState
+from weave.trace.sampling import SamplingPolicy
+from weave.trace.op_cache import OpCachePolicy
 
 # See the comment above pre_init_modules above. This is check to ensure we don't accidentally
 # introduce loading weave.ops or weave.panels when importing weave.
@@ -346,4 +346,6 @@ def client(request) -> Generator[weave_client.WeaveClient, None, None]:
     try:
         yield inited_client.client
     finally:
+        # Calls still buffered would otherwise land in the next test's tables
+        inited_client.client.flush()
         inited_client.reset()
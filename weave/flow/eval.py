@@ -1,4 +1,6 @@
 import asyncio
+import contextlib
+import contextvars
 import time
 import inspect
 import textwrap
@@ -37,11 +39,122 @@ def async_call(
     return asyncio.to_thread(func, *args, **kwargs)
 
 
+async def _call_scorer(
+    scorer: Union[Op, Scorer],
+    example: dict,
+    model_output: Any,
+    dependency_scores: dict[str, Any],
+) -> Any:
+    scorer_name, score_fn, _ = get_scorer_attributes(scorer)
+    if isinstance(score_fn, Op):
+        score_signature = score_fn.signature
+    else:
+        score_signature = inspect.signature(score_fn)
+    score_arg_names = list(score_signature.parameters.keys())
+
+    # If the op is a `BoundOp`, then the first arg is automatically added at
+    # call time and we should exclude it from the args required from the
+    # user.
+    if isinstance(score_arg_names, BoundOp):
+        score_arg_names = score_arg_names[1:]
+
+    if "model_output" not in score_arg_names:
+        raise OpCallError(
+            f"Scorer {scorer_name} must have a 'model_output' argument, to receive the output of the model function."
+        )
+
+    if isinstance(example, dict):
+        score_args = {k: v for k, v in example.items() if k in score_arg_names}
+    else:
+        if len(score_arg_names) == 2 + len(dependency_scores):
+            score_args = {score_arg_names[0]: example}
+        else:
+            raise ValueError(
+                f"{score_fn} expects arguments: {score_arg_names}, provide a preprocess_model_input function that returns a dict with those keys."
+            )
+    score_args["model_output"] = model_output
+    score_args.update(dependency_scores)
+
+    try:
+        result = await async_call(score_fn, **score_args)
+    except OpCallError as e:
+        dataset_column_names = list(example.keys())
+        dataset_column_names_str = ", ".join(dataset_column_names[:3])
+        if len(dataset_column_names) > 3:
+            dataset_column_names_str += ", ..."
+        required_arg_names = [
+            param.name
+            for param in score_signature.parameters.values()
+            if param.default == inspect.Parameter.empty
+        ]
+        if isinstance(score_fn, BoundOp):
+            required_arg_names = required_arg_names[1:]
+        required_arg_names.remove("model_output")
+        for name in dependency_scores:
+            if name in required_arg_names:
+                required_arg_names.remove(name)
+
+        message = textwrap.dedent(
+            f"""
+            Call error: {e}
+
+            Options for resolving:
+            a. change {scorer_name} argument names to match a subset of dataset column names ({dataset_column_names_str})
+            b. change dataset column names to match expected {scorer_name} argument names: {required_arg_names}
+            """
+        )
+        raise OpCallError(message)
+    return result
+
+
+class _ScorerLimits:
+    """Bounds the scorer calls of an evaluation running at once, overall and
+    per scorer."""
+
+    def __init__(self, concurrency: int, scorer_concurrency: dict[str, int]):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._scorer_semaphores = {
+            scorer_name: asyncio.Semaphore(limit)
+            for scorer_name, limit in scorer_concurrency.items()
+        }
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, scorer_name: str) -> typing.AsyncIterator[None]:
+        scorer_semaphore = self._scorer_semaphores.get(scorer_name)
+        async with contextlib.AsyncExitStack() as stack:
+            if scorer_semaphore is not None:
+                await stack.enter_async_context(scorer_semaphore)
+            await stack.enter_async_context(self._semaphore)
+            yield
+
+
+# The limits shared by the examples of the evaluation being run
+_scorer_limits: contextvars.ContextVar[
+    Optional[_ScorerLimits]
+] = contextvars.ContextVar("_scorer_limits", default=None)
+
+
+def _make_scorer_limits(evaluation: "Evaluation") -> _ScorerLimits:
+    return _ScorerLimits(
+        getattr(evaluation, "scorer_concurrency", None) or get_weave_parallelism(),
+        getattr(evaluation, "scorer_concurrency_limits", None) or {},
+    )
+
+
 class Evaluation(Object):
     dataset: Union[Dataset, list]
     scorers: Optional[list[Union[Callable, Op, Scorer]]] = None
     preprocess_model_input: Optional[Callable] = None
     trials: int = 1
+    # Maximum scorer calls running at once across the evaluation,
+    # `WEAVE_PARALLELISM` by default
+    scorer_concurrency: Optional[int] = None
+    # Maximum calls of individual scorers running at once, by scorer name
+    scorer_concurrency_limits: Optional[dict[str, int]] = None
+    # The scorers that each scorer takes the scores of, by scorer name. A
+    # scorer runs once those it depends on are done, and gets each of their
+    # scores as the argument named after that scorer.
+    scorer_dependencies: Optional[dict[str, list[str]]] = None
 
     def model_post_init(self, __context: Any) -> None:
         scorers = []
@@ -60,6 +173,7 @@ class Evaluation(Object):
                 raise ValueError(f"Invalid scorer: {scorer}")
             scorers.append(scorer)
         self.scorers = scorers
+        self._validate_scorer_options()
 
         if isinstance(self.dataset, list):
             self.dataset = Dataset(rows=self.dataset)
@@ -67,6 +181,41 @@ class Evaluation(Object):
         if self.name == None and self.dataset.name != None:
             self.name = self.dataset.name + "-evaluation"  # type: ignore
 
+    def _validate_scorer_options(self) -> None:
+        scorer_names = {
+            get_scorer_attributes(scorer)[0] for scorer in self.scorers or []
+        }
+        if self.scorer_concurrency is not None and self.scorer_concurrency < 1:
+            raise ValueError("scorer_concurrency must be at least 1")
+        for scorer_name, limit in (self.scorer_concurrency_limits or {}).items():
+            if scorer_name not in scorer_names:
+                raise ValueError(f"Concurrency limit for unknown scorer {scorer_name}")
+            if limit < 1:
+                raise ValueError(
+                    f"Concurrency limit of {scorer_name} must be at least 1"
+                )
+        dependencies = self.scorer_dependencies or {}
+        for scorer_name, scorer_dependencies in dependencies.items():
+            for name in [scorer_name, *scorer_dependencies]:
+                if name not in scorer_names:
+                    raise ValueError(f"Dependency on unknown scorer {name}")
+
+        # Scorers that depend on themselves, directly or not, would never run
+        done: set[str] = set()
+
+        def visit(scorer_name: str, path: list[str]) -> None:
+            if scorer_name in path:
+                cycle = " -> ".join(path[path.index(scorer_name) :] + [scorer_name])
+                raise ValueError(f"Scorer dependencies form a cycle: {cycle}")
+            if scorer_name in done:
+                return
+            for name in dependencies.get(scorer_name, []):
+                visit(name, path + [scorer_name])
+            done.add(scorer_name)
+
+        for scorer_name in dependencies:
+            visit(scorer_name, [])
+
     @weave.op()
     async def predict_and_score(
         self, model: Union[Callable, Model], example: dict
@@ -142,65 +291,34 @@ class Evaluation(Object):
             model_output = None
         model_latency = time.time() - model_start_time
 
-        scores = {}
         scorers = typing.cast(list[Union[Op, Scorer]], self.scorers or [])
-        for scorer in scorers:
-            scorer_name, score_fn, _ = get_scorer_attributes(scorer)
-            if isinstance(score_fn, Op):
-                score_signature = score_fn.signature
-            else:
-                score_signature = inspect.signature(score_fn)
-            score_arg_names = list(score_signature.parameters.keys())
-
-            # If the op is a `BoundOp`, then the first arg is automatically added at
-            # call time and we should exclude it from the args required from the
-            # user.
-            if isinstance(score_arg_names, BoundOp):
-                score_arg_names = score_arg_names[1:]
-
-            if "model_output" not in score_arg_names:
-                raise OpCallError(
-                    f"Scorer {scorer_name} must have a 'model_output' argument, to receive the output of the model function."
+        limits = _scorer_limits.get() or _make_scorer_limits(self)
+        # Evaluations saved before the scorer options were added don't have them
+        scorer_dependencies = getattr(self, "scorer_dependencies", None) or {}
+        score_tasks: list[tuple[str, asyncio.Task]] = []
+        tasks_by_name: dict[str, asyncio.Task] = {}
+
+        async def score(scorer: Union[Op, Scorer]) -> Any:
+            scorer_name, _, _ = get_scorer_attributes(scorer)
+            dependencies = scorer_dependencies.get(scorer_name, [])
+            dependency_scores = {
+                name: await tasks_by_name[name] for name in dependencies
+            }
+            async with limits.acquire(scorer_name):
+                return await _call_scorer(
+                    scorer, example, model_output, dependency_scores
                 )
 
-            if isinstance(example, dict):
-                score_args = {k: v for k, v in example.items() if k in score_arg_names}
-            else:
-                if len(score_arg_names) == 2:
-                    score_args = {score_arg_names[0]: example}
-                else:
-                    raise ValueError(
-                        f"{score_fn} expects arguments: {score_arg_names}, provide a preprocess_model_input function that returns a dict with those keys."
-                    )
-            score_args["model_output"] = model_output
-
-            try:
-                result = await async_call(score_fn, **score_args)
-            except OpCallError as e:
-                dataset_column_names = list(example.keys())
-                dataset_column_names_str = ", ".join(dataset_column_names[:3])
-                if len(dataset_column_names) > 3:
-                    dataset_column_names_str += ", ..."
-                required_arg_names = [
-                    param.name
-                    for param in score_signature.parameters.values()
-                    if param.default == inspect.Parameter.empty
-                ]
-                if isinstance(score_fn, BoundOp):
-                    required_arg_names = required_arg_names[1:]
-                required_arg_names.remove("model_output")
-
-                message = textwrap.dedent(
-                    f"""
-                    Call error: {e}
-
-                    Options for resolving:
-                    a. change {scorer_name} argument names to match a subset of dataset column names ({dataset_column_names_str})
-                    b. change dataset column names to match expected {scorer_name} argument names: {required_arg_names}
-                    """
-                )
-                raise OpCallError(message)
-            scores[scorer_name] = result
+        # Scorers run concurrently, those with dependencies once the scorers
+        # they depend on are done
+        for scorer in scorers:
+            scorer_name, _, _ = get_scorer_attributes(scorer)
+            task = asyncio.create_task(score(scorer))
+            score_tasks.append((scorer_name, task))
+            tasks_by_name[scorer_name] = task
+        await asyncio.gather(*(task for _, task in score_tasks), return_exceptions=True)
+        # Raises the error of the first scorer that failed
+        scores = {scorer_name: task.result() for scorer_name, task in score_tasks}
 
         return {
             "model_output": model_output,
@@ -246,29 +364,34 @@ class Evaluation(Object):
                 return {"model_output": None, "scores": {}}
             return eval_row
 
-        n_complete = 0
-        # with console.status("Evaluating...") as status:
-        dataset = typing.cast(Dataset, self.dataset)
-        _rows = dataset.rows
-        trial_rows = list(_rows) * self.trials
-        async for example, eval_row in util.async_foreach(
-            trial_rows, eval_example, get_weave_parallelism()
-        ):
-            n_complete += 1
-            duration = time.time() - start_time
-            print(f"Evaluated {n_complete} of {len(trial_rows)} examples")
-            # status.update(
-            #     f"Evaluating... {duration:.2f}s [{n_complete} / {len(self.dataset.rows)} complete]"  # type:ignore
-            # )
-            if eval_row == None:
-                eval_row = {"model_output": None, "scores": {}}
-            if eval_row["scores"] == None:
-                eval_row["scores"] = {}
-            for scorer in self.scorers or []:
-                scorer_name, _, _ = get_scorer_attributes(scorer)
-                if scorer_name not in eval_row["scores"]:
-                    eval_row["scores"][scorer_name] = {}
-            eval_rows.append(eval_row)
+        # Scorer limits apply across the examples
+        limits_token = _scorer_limits.set(_make_scorer_limits(self))
+        try:
+            n_complete = 0
+            # with console.status("Evaluating...") as status:
+            dataset = typing.cast(Dataset, self.dataset)
+            _rows = dataset.rows
+            trial_rows = list(_rows) * self.trials
+            async for example, eval_row in util.async_foreach(
+                trial_rows, eval_example, get_weave_parallelism()
+            ):
+                n_complete += 1
+                duration = time.time() - start_time
+                print(f"Evaluated {n_complete} of {len(trial_rows)} examples")
+                # status.update(
+                #     f"Evaluating... {duration:.2f}s [{n_complete} / {len(self.dataset.rows)} complete]"  # type:ignore
+                # )
+                if eval_row == None:
+                    eval_row = {"model_output": None, "scores": {}}
+                if eval_row["scores"] == None:
+                    eval_row["scores"] = {}
+                for scorer in self.scorers or []:
+                    scorer_name, _, _ = get_scorer_attributes(scorer)
+                    if scorer_name not in eval_row["scores"]:
+                        eval_row["scores"][scorer_name] = {}
+                eval_rows.append(eval_row)
+        finally:
+            _scorer_limits.reset(limits_token)
 
         # eval_table: weave.WeaveList = weave.WeaveList(eval_rows)
 
@@ -12,6 +12,11 @@ _run_stack: contextvars.ContextVar[list["Call"]] = contextvars.ContextVar(
     "run", default=[]
 )
 
+# Set while running the calls of a trace that isn't sampled, which aren't traced
+_sampled_out: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "sampled_out", default=False
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -80,3 +85,16 @@ def set_run_stack(
         yield stack
     finally:
         _run_stack.reset(token)
+
+
+def is_sampled_out() -> bool:
+    return _sampled_out.get()
+
+
+@contextlib.contextmanager
+def sampled_out() -> typing.Iterator[None]:
+    token = _sampled_out.set(True)
+    try:
+        yield
+    finally:
+        _sampled_out.reset(token)
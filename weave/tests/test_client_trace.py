@@ -20,6 +20,7 @@ from ..trace_server.trace_server_interface_util import (
     generate_id,
 )
 from ..trace_server import trace_server_interface as tsi
+from ..trace_server.errors import InvalidRequest
 
 pytestmark = pytest.mark.trace
 
@@ -672,6 +673,82 @@ def test_trace_call_query_offset(client):
         assert len(inner_res.calls) == exp_count
 
 
+def test_trace_call_query_cursor(client):
+    call_spec = simple_line_call_bootstrap()
+    server = get_client_trace_server(client)
+    project_id = get_client_project_id(client)
+    all_ids = [
+        c.id for c in server.calls_query(tsi.CallsQueryReq(project_id=project_id)).calls
+    ]
+
+    ids = []
+    cursor = None
+    while True:
+        res = server.calls_query(
+            tsi.CallsQueryReq(project_id=project_id, limit=4, cursor=cursor)
+        )
+        ids += [c.id for c in res.calls]
+        if res.next_cursor is None:
+            break
+        cursor = res.next_cursor
+    assert ids == all_ids
+    assert len(ids) == call_spec.total_calls
+
+    with pytest.raises(InvalidRequest):
+        server.calls_query(
+            tsi.CallsQueryReq(
+                project_id=project_id,
+                sort_by=[tsi._SortBy(field="inputs.a", direction="asc")],
+                cursor=cursor,
+            )
+        )
+
+
+def test_calls_iter_random_access(client):
+    call_spec = simple_line_call_bootstrap()
+    calls = client.calls()
+    ids = [c.id for c in calls]
+    assert len(ids) == call_spec.total_calls
+    assert len(calls) == call_spec.total_calls
+    assert calls[3].id == ids[3]
+    assert calls[-1].id == ids[-1]
+    assert [c.id for c in calls[2:5]] == ids[2:5]
+    assert [c.id for c in calls[-3:]] == ids[-3:]
+    assert [c.id for c in calls[5:1:-2]] == ids[5:1:-2]
+    with pytest.raises(IndexError):
+        calls[len(ids)]
+
+
+def test_trace_calls_export(client, monkeypatch):
+    from weave.trace_server import calls_export
+
+    call_spec = simple_line_call_bootstrap()
+    # Force several keyset pages
+    monkeypatch.setattr(calls_export, "CALLS_EXPORT_PAGE_SIZE", 7)
+
+    table = client.calls().to_arrow()
+    assert table.num_rows == call_spec.total_calls
+    assert len(set(table.column("id").to_pylist())) == call_spec.total_calls
+    started_at = table.column("started_at").to_pylist()
+    assert started_at == sorted(started_at)
+
+    df = client.calls().to_pandas(columns=["id", "op_name", "inputs"])
+    assert list(df.columns) == ["id", "op_name", "inputs"]
+    assert len(df) == call_spec.total_calls
+
+    chunks = get_client_trace_server(client).calls_export(
+        tsi.CallsExportReq(
+            project_id=get_client_project_id(client),
+            limit=10,
+            columns=["id", "summary"],
+            format="parquet",
+        )
+    )
+    table = calls_export.read_calls_export(chunks, "parquet")
+    assert table.num_rows == 10
+    assert table.column_names == ["id", "summary"]
+
+
 def test_trace_call_sort(client):
     @weave.op()
     def basic_op(in_val: dict, delay) -> dict:
@@ -1199,6 +1276,558 @@ def test_dataset_row_type(client):
         d = weave.Dataset(rows=[{"a": 1}, {}])
 
 
+def test_dataset_rows_are_paged(client, monkeypatch):
+    from weave.trace import object_cache
+    from weave.trace.vals import TraceTable
+
+    monkeypatch.setattr(object_cache, "_cache", None)
+    monkeypatch.setattr(TraceTable, "page_size", 4)
+    rows = [{"i": i, "sq": i * i} for i in range(10)]
+    ref = weave.publish(weave.Dataset(rows=rows), name="paged")
+
+    queries = []
+    table_query = client.server.table_query
+
+    def counting_table_query(req):
+        queries.append((req.offset, req.limit))
+        return table_query(req)
+
+    monkeypatch.setattr(client.server, "table_query", counting_table_query)
+    table = ref.get().rows
+    assert len(table) == 10
+    assert table[5]["i"] == 5
+    assert queries == [(4, 4)]
+    assert table[-1]["i"] == 9
+    assert [r["i"] for r in table[2:7]] == [2, 3, 4, 5, 6]
+    assert [r["i"] for r in table[::-3]] == [9, 6, 3, 0]
+    with pytest.raises(IndexError):
+        table[10]
+    assert [r["i"] for r in table] == list(range(10))
+
+    row_digest = table[3].ref.extra[-1]
+    assert table[row_digest]["sq"] == 9
+    with pytest.raises(KeyError):
+        table["missing"]
+
+    assert [dict(r) for r in table.select(["sq"])][:2] == [{"sq": 0}, {"sq": 1}]
+
+    res = get_client_trace_server(client).table_query(
+        tsi.TableQueryReq(
+            project_id=get_client_project_id(client),
+            digest=table.table_ref.digest,
+            offset=8,
+            limit=5,
+        )
+    )
+    assert [r.val["i"] for r in res.rows] == [8, 9]
+
+
+def test_uploads_skip_existing_digests(client, monkeypatch):
+    import weakref
+
+    from weave.trace import digest_dedupe
+
+    server = get_client_trace_server(client)
+    project_id = get_client_project_id(client)
+    sent = []
+    for method in ["obj_create", "table_create", "file_create"]:
+
+        def counting(req, method=method, orig=getattr(client.server, method)):
+            sent.append(method)
+            return orig(req)
+
+        monkeypatch.setattr(client.server, method, counting)
+
+    big = "x" * digest_dedupe.DIGEST_CHECK_MIN_BYTES
+    rows = [{"i": i, "text": big} for i in range(3)]
+    ref = weave.publish(weave.Dataset(rows=rows), name="big")
+    assert sent == ["table_create", "obj_create"]
+    # Known digests are skipped without asking the server
+    assert weave.publish(weave.Dataset(rows=rows), name="big").digest == ref.digest
+    assert sent == ["table_create", "obj_create"]
+
+    # A new process asks the server, which already has the large table
+    monkeypatch.setattr(digest_dedupe, "_known_digests", weakref.WeakKeyDictionary())
+    assert weave.publish(weave.Dataset(rows=rows), name="big").digest == ref.digest
+    assert sent == ["table_create", "obj_create", "obj_create"]
+    assert ref.get().rows[2]["i"] == 2
+
+    file_digests = digest_dedupe.create_files(
+        client.server, project_id, {"a": big.encode(), "b": big.encode()}
+    )
+    assert file_digests["a"] == file_digests["b"]
+    assert sent.count("file_create") == 1
+
+    res = server.digests_exist(
+        tsi.DigestsExistReq(
+            project_id=project_id,
+            files=[file_digests["a"], "missing"],
+            objs=[
+                tsi.ObjDigest(object_id="big", digest=ref.digest),
+                tsi.ObjDigest(object_id="other", digest=ref.digest),
+            ],
+        )
+    )
+    assert res.files == [file_digests["a"]]
+    assert res.objs == [tsi.ObjDigest(object_id="big", digest=ref.digest)]
+    assert res.tables == [] and res.table_rows == []
+
+
+def test_save_table_in_chunks(client, monkeypatch):
+    from weave.table import Table
+    from weave.trace import digest_dedupe
+
+    monkeypatch.setattr(digest_dedupe, "TABLE_ROWS_CHUNK_SIZE", 3)
+    sent = []
+    for method in ["table_create", "table_rows_create", "table_create_from_digests"]:
+
+        def counting(req, method=method, orig=getattr(client.server, method)):
+            sent.append(method)
+            return orig(req)
+
+        monkeypatch.setattr(client.server, method, counting)
+
+    rows = [{"i": i} for i in range(10)]
+    chunked_ref = client.save_table(Table(rows))
+    assert sent.count("table_rows_create") == 4
+    # The table is created once, from all the row digests
+    assert sent.count("table_create_from_digests") == 1
+    # The chunked protocol results in the same table as a single request
+    monkeypatch.setattr(digest_dedupe, "TABLE_ROWS_CHUNK_SIZE", 100)
+    assert client.save_table(Table(rows + [{"i": 10}])).digest != chunked_ref.digest
+    assert client.save_table(Table(rows)).digest == chunked_ref.digest
+
+    res = get_client_trace_server(client).table_query(
+        tsi.TableQueryReq(
+            project_id=get_client_project_id(client), digest=chunked_ref.digest
+        )
+    )
+    assert [r.val["i"] for r in res.rows] == list(range(10))
+
+    # Derive a new version without re-sending the rows it shares with the base
+    sent.clear()
+    removed = [r.digest for r in res.rows[:2]]
+    append_rows = [{"i": 0}, {"i": 11}]
+    new_ref = client.save_table_version(
+        chunked_ref, append_rows=append_rows, remove_row_digests=removed
+    )
+    assert sent == ["table_rows_create", "table_create_from_digests"]
+    assert new_ref.digest == client.save_table(Table(rows[2:] + append_rows)).digest
+
+    with pytest.raises(Exception):
+        get_client_trace_server(client).table_create_from_digests(
+            tsi.TableCreateFromDigestsReq(
+                project_id=get_client_project_id(client), row_digests=["missing"]
+            )
+        )
+
+
+def test_server_files_are_read_in_ranges(client, monkeypatch):
+    from weave.trace import custom_objs, object_cache
+
+    monkeypatch.setattr(object_cache, "_cache", None)
+    monkeypatch.setattr(custom_objs, "SERVER_FILE_READ_BYTES", 4)
+    server = get_client_trace_server(client)
+    project_id = get_client_project_id(client)
+    content = bytes(range(10))
+    digest = server.file_create(
+        tsi.FileCreateReq(project_id=project_id, name="f", content=content)
+    ).digest
+    res = server.file_content_read(
+        tsi.FileContentReadReq(project_id=project_id, digest=digest, offset=8)
+    )
+    assert res.content == content[8:]
+
+    reads = []
+    file_content_read = client.server.file_content_read
+
+    def counting_file_content_read(req):
+        reads.append((req.offset, req.length))
+        return file_content_read(req)
+
+    monkeypatch.setattr(client.server, "file_content_read", counting_file_content_read)
+    art = custom_objs.MemTraceFilesArtifact(
+        {"f": custom_objs.ServerFile(client.server, project_id, digest)}
+    )
+    with art.open("f", binary=True) as f:
+        assert f.read(2) == content[:2]
+        f.seek(6)
+        assert f.read(2) == content[6:8]
+    assert reads == [(0, 4), (6, 4)]
+
+    with open(art.path("f"), "rb") as f:
+        assert f.read() == content
+    # Streaming doesn't go through ranged reads
+    assert len(reads) == 2
+
+
+def test_call_files_upload_in_background(client, monkeypatch):
+    import threading
+
+    from weave.trace.serializer import register_serializer
+
+    class Blob:
+        def __init__(self, data: bytes):
+            self.data = data
+
+    def save_blob(obj, artifact, name):
+        with artifact.new_file(f"{name}.bin", binary=True) as f:
+            f.write(obj.data)
+
+    def load_blob(artifact, name):
+        with artifact.open(f"{name}.bin", binary=True) as f:
+            return Blob(f.read())
+
+    register_serializer(Blob, save_blob, load_blob)
+
+    release = threading.Event()
+    file_create = client.server.file_create
+
+    def slow_file_create(req):
+        # Only hold up the blob, not the source of its load op
+        if req.name == "obj.bin":
+            release.wait()
+        return file_create(req)
+
+    monkeypatch.setattr(client.server, "file_create", slow_file_create)
+
+    @weave.op()
+    def make_blob() -> Blob:
+        return Blob(b"abc")
+
+    # The op returns while the file is still uploading, and its end is only
+    # sent once the upload is done
+    assert make_blob().data == b"abc"
+    server = get_client_trace_server(client)
+    res = server.calls_query(
+        tsi.CallsQueryReq(project_id=get_client_project_id(client))
+    )
+    make_blob_calls = [c for c in res.calls if "make_blob" in c.op_name]
+    assert len(make_blob_calls) == 1
+    assert make_blob_calls[0].ended_at is None
+
+    release.set()
+    assert client.flush()
+    res = server.calls_query(
+        tsi.CallsQueryReq(project_id=get_client_project_id(client))
+    )
+    assert [c.ended_at is not None for c in res.calls if "make_blob" in c.op_name] == [
+        True
+    ]
+    output = [c.output for c in res.calls if "make_blob" in c.op_name][0]
+    file_res = server.file_content_read(
+        tsi.FileContentReadReq(
+            project_id=get_client_project_id(client),
+            digest=output["files"]["obj.bin"],
+        )
+    )
+    assert file_res.content == b"abc"
+
+
+def test_call_file_upload_failures(client, monkeypatch):
+    from weave.trace import digest_dedupe
+
+    monkeypatch.setattr(digest_dedupe, "FILE_UPLOAD_RETRY_DELAY", 0)
+    file_create = client.server.file_create
+    attempts = []
+
+    def flaky_file_create(req):
+        attempts.append(req.name)
+        if req.name == "broken.txt" or attempts.count(req.name) < 2:
+            raise ConnectionError("connection reset")
+        return file_create(req)
+
+    monkeypatch.setattr(client.server, "file_create", flaky_file_create)
+    project_id = get_client_project_id(client)
+    sent = []
+
+    def send_after_upload(name, content):
+        uploads = []
+        digest_dedupe.create_files(
+            client.server, project_id, {name: content}, pending_uploads=uploads
+        )
+        client._send_call_event(uploads, lambda: sent.append(name))
+
+    # A failed upload is retried before the event is sent
+    send_after_upload("flaky.txt", b"flaky")
+    # An event whose file can't be uploaded is not sent
+    send_after_upload("broken.txt", b"broken")
+    assert client.flush()
+    assert sent == ["flaky.txt"]
+    assert attempts.count("flaky.txt") == 2
+    assert attempts.count("broken.txt") == digest_dedupe.FILE_UPLOAD_ATTEMPTS
+
+    # Events are still sent once the client is closed
+    client.close()
+    send_after_upload("late.txt", b"late")
+    assert sent == ["flaky.txt", "late.txt"]
+
+
+def test_trace_tree_read(client):
+    @weave.op()
+    def leaf(x: int) -> int:
+        return x
+
+    @weave.op()
+    def middle(x: int) -> int:
+        return leaf(x) + leaf(x + 1)
+
+    @weave.op()
+    def root() -> int:
+        return middle(1) + middle(2)
+
+    root()
+    server = get_client_trace_server(client)
+    project_id = get_client_project_id(client)
+    calls = list(client.calls())
+    root_call = [c for c in calls if "root" in c.op_name][0]
+
+    def names(res):
+        return [c.op_name.split("/")[-1].split(":")[0] for c in res.calls]
+
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(project_id=project_id, trace_id=root_call.trace_id)
+    )
+    assert names(res) == ["root", "middle", "leaf", "leaf", "middle", "leaf", "leaf"]
+    assert [c.inputs.get("x") for c in res.calls] == [None, 1, 1, 2, 2, 2, 3]
+    ids = [c.id for c in res.calls]
+    assert [ids.index(c.parent_id) if c.parent_id else None for c in res.calls] == [
+        None,
+        0,
+        1,
+        1,
+        0,
+        4,
+        4,
+    ]
+
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(
+            project_id=project_id,
+            root_call_id=ids[4],
+            max_depth=0,
+            columns=["output"],
+        )
+    )
+    assert names(res) == ["middle"]
+    assert res.calls[0].output == 5
+    assert res.calls[0].inputs == {}
+
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(project_id=project_id, root_call_id=ids[4])
+    )
+    assert [c.id for c in res.calls] == ids[4:]
+
+    # The client reads traces and children the same way
+    assert [c.id for c in client.trace(root_call.trace_id)] == ids
+    children = root_call.children()
+    assert isinstance(children, weave_client.CallsIter)
+    assert [c.id for c in children] == [ids[1], ids[4]]
+    assert len(children) == 2
+    assert children[-1].id == ids[4]
+    assert [c.id for c in children[1:]] == [ids[4]]
+    assert [c.output for c in client.trace(root_call.trace_id)[4].children()] == [
+        2,
+        3,
+    ]
+
+    # Deleting a call deletes its subtree
+    server.calls_delete(tsi.CallsDeleteReq(project_id=project_id, call_ids=[ids[1]]))
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(project_id=project_id, trace_id=root_call.trace_id)
+    )
+    assert [c.id for c in res.calls] == [ids[0], *ids[4:]]
+
+    with pytest.raises(InvalidRequest):
+        server.trace_tree_read(tsi.TraceTreeReadReq(project_id=project_id))
+
+
+def test_calls_sort_and_filter_by_derived_fields(client):
+    server = get_client_trace_server(client)
+    project_id = get_client_project_id(client)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    for name, latency_ms, exception, usage in [
+        ("fast", 10, None, {"gpt-4": {"prompt_tokens": 5, "total_tokens": 7}}),
+        ("slow", 500, None, {"gpt-3": {"prompt_tokens": 1, "total_tokens": 2}}),
+        ("failed", 50, "boom", {}),
+        ("running", None, None, None),
+    ]:
+        server.call_start(
+            tsi.CallStartReq(
+                start=tsi.StartedCallSchemaForInsert(
+                    project_id=project_id,
+                    id=name,
+                    op_name=name,
+                    trace_id=generate_id(),
+                    started_at=start,
+                    attributes={},
+                    inputs={},
+                )
+            )
+        )
+        if latency_ms is None:
+            continue
+        server.call_end(
+            tsi.CallEndReq(
+                end=tsi.EndedCallSchemaForInsert(
+                    project_id=project_id,
+                    id=name,
+                    ended_at=start + datetime.timedelta(milliseconds=latency_ms),
+                    exception=exception,
+                    summary={"usage": usage},
+                )
+            )
+        )
+
+    def query_ids(sort_by=None, query=None, limit=None):
+        res = server.calls_query(
+            tsi.CallsQueryReq.model_validate(
+                dict(
+                    project_id=project_id,
+                    sort_by=sort_by,
+                    query=query,
+                    limit=limit,
+                )
+            )
+        )
+        return [c.id for c in res.calls]
+
+    assert query_ids(
+        sort_by=[{"field": "latency_ms", "direction": "desc"}],
+        query={"$expr": {"$gt": [{"$getField": "latency_ms"}, {"$literal": 20}]}},
+    ) == ["slow", "failed"]
+    for status, ids in [
+        ("error", ["failed"]),
+        ("running", ["running"]),
+        ("success", ["fast", "slow"]),
+    ]:
+        assert (
+            query_ids(
+                sort_by=[{"field": "op_name", "direction": "asc"}],
+                query={
+                    "$expr": {"$eq": [{"$getField": "status"}, {"$literal": status}]}
+                },
+            )
+            == ids
+        )
+    assert query_ids(
+        sort_by=[{"field": "total_tokens", "direction": "desc"}], limit=1
+    ) == ["fast"]
+    assert query_ids(
+        query={"$expr": {"$eq": [{"$getField": "model"}, {"$literal": "gpt-3"}]}}
+    ) == ["slow"]
+
+
+def test_calls_query_stats_aggregates(client):
+    server = get_client_trace_server(client)
+    project_id = get_client_project_id(client)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    for i, (op_name, latency_ms, exception, usage) in enumerate(
+        [
+            ("a", 100, None, {"gpt-4": {"total_tokens": 10}}),
+            ("a", 200, "boom", {"gpt-4": {"total_tokens": 20}}),
+            (
+                "a",
+                300,
+                None,
+                {"gpt-4": {"total_tokens": 30}, "gpt-3": {"total_tokens": 1}},
+            ),
+            ("b", 1000, None, {}),
+        ]
+    ):
+        call_id = generate_id()
+        started_at = start + datetime.timedelta(seconds=30 * i)
+        server.call_start(
+            tsi.CallStartReq(
+                start=tsi.StartedCallSchemaForInsert(
+                    project_id=project_id,
+                    id=call_id,
+                    op_name=op_name,
+                    trace_id=generate_id(),
+                    started_at=started_at,
+                    attributes={"env": "prod" if i % 2 else "dev"},
+                    inputs={},
+                )
+            )
+        )
+        server.call_end(
+            tsi.CallEndReq(
+                end=tsi.EndedCallSchemaForInsert(
+                    project_id=project_id,
+                    id=call_id,
+                    ended_at=started_at + datetime.timedelta(milliseconds=latency_ms),
+                    exception=exception,
+                    summary={"usage": usage},
+                    output=None,
+                )
+            )
+        )
+
+    res = server.calls_query_stats(
+        tsi.CallsQueryStatsReq(
+            project_id=project_id,
+            group_by=["op_name"],
+            aggregations=[
+                tsi.CallsStatsAggregation(fn="count"),
+                tsi.CallsStatsAggregation(fn="count_exceptions"),
+                tsi.CallsStatsAggregation(fn="avg", field="latency_ms"),
+                tsi.CallsStatsAggregation(
+                    fn="quantile", field="latency_ms", quantile=0.5, name="p50"
+                ),
+                tsi.CallsStatsAggregation(fn="max", field="latency_ms"),
+            ],
+        )
+    )
+    assert res.count == 4
+    assert [
+        (g["op_name"], g["count"], g["count_exceptions"], g["max(latency_ms)"])
+        for g in res.groups
+    ] == [("a", 3, 1, 300), ("b", 1, 0, 1000)]
+    assert res.groups[0]["avg(latency_ms)"] == pytest.approx(200)
+    assert res.groups[0]["p50"] == pytest.approx(200, rel=0.05)
+
+    res = server.calls_query_stats(
+        tsi.CallsQueryStatsReq(
+            project_id=project_id,
+            group_by=["usage_model"],
+            aggregations=[
+                tsi.CallsStatsAggregation(fn="sum", field="usage.total_tokens")
+            ],
+        )
+    )
+    assert [(g["usage_model"], g["sum(usage.total_tokens)"]) for g in res.groups] == [
+        ("gpt-3", 1),
+        ("gpt-4", 60),
+    ]
+
+    res = server.calls_query_stats(
+        tsi.CallsQueryStatsReq(
+            project_id=project_id,
+            filter=tsi._CallsFilter(op_names=["a"]),
+            group_by=["attributes.env"],
+            time_bucket_seconds=60,
+        )
+    )
+    assert res.count == 3
+    assert [
+        (g["attributes.env"], g["time_bucket"], g["count"]) for g in res.groups
+    ] == [
+        ("dev", start, 1),
+        ("dev", start + datetime.timedelta(seconds=60), 1),
+        ("prod", start, 1),
+    ]
+
+    with pytest.raises(InvalidRequest):
+        server.calls_query_stats(
+            tsi.CallsQueryStatsReq(
+                project_id=project_id,
+                aggregations=[
+                    tsi.CallsStatsAggregation(fn="sum", field="usage.total_tokens")
+                ],
+            )
+        )
+
+
 def test_dataclass_support(client):
     @dataclasses.dataclass
     class MyDataclass:
@@ -189,3 +189,93 @@ def test_multiclass_f1_score(client):
             "mean": Nearly(0),
         },
     }
+
+
+def make_slow_scorer(name, running, max_running):
+    async def slow_score(target, model_output):
+        running[0] += 1
+        max_running[name] = max(max_running.get(name, 0), running[0])
+        await asyncio.sleep(0.05)
+        running[0] -= 1
+        return target == model_output
+
+    slow_score.__name__ = name
+    return weave.op()(slow_score)
+
+
+def test_scorers_run_concurrently(client):
+    running = [0]
+    max_running: dict = {}
+    scorers = [make_slow_scorer(f"score_{i}", running, max_running) for i in range(3)]
+    evaluation = Evaluation(dataset=dataset_rows[:1], scorers=scorers)
+    result = asyncio.run(evaluation.predict_and_score(EvalModel(), dataset_rows[0]))
+    assert result["scores"] == {"score_0": True, "score_1": True, "score_2": True}
+    assert max(max_running.values()) == 3
+
+
+def test_scorer_concurrency_limits(client):
+    running = [0]
+    max_running: dict = {}
+    scorers = [make_slow_scorer(f"score_{i}", running, max_running) for i in range(3)]
+    evaluation = Evaluation(
+        dataset=dataset_rows[:1], scorers=scorers, scorer_concurrency=1
+    )
+    asyncio.run(evaluation.predict_and_score(EvalModel(), dataset_rows[0]))
+    assert max(max_running.values()) == 1
+
+    # Per scorer limits apply across the examples of an evaluation
+    running = [0]
+    max_running = {}
+    scorer = make_slow_scorer("score", running, max_running)
+    evaluation = Evaluation(
+        dataset=dataset_rows * 2,
+        scorers=[scorer],
+        scorer_concurrency_limits={"score": 1},
+    )
+    asyncio.run(evaluation.evaluate(EvalModel()))
+    assert max_running["score"] == 1
+
+
+def test_scorer_dependencies(client):
+    @weave.op()
+    async def correct(target, model_output):
+        await asyncio.sleep(0.01)
+        return target == model_output
+
+    @weave.op()
+    def judged(model_output, correct):
+        return {"model_output": model_output, "correct": correct}
+
+    evaluation = Evaluation(
+        dataset=dataset_rows,
+        scorers=[judged, correct],
+        scorer_dependencies={"judged": ["correct"]},
+    )
+    result = asyncio.run(evaluation.predict_and_score(EvalModel(), dataset_rows[0]))
+    assert result["scores"] == {
+        "judged": {"model_output": 3, "correct": True},
+        "correct": True,
+    }
+
+
+def test_scorer_options_validation():
+    @weave.op()
+    def a(model_output, b):
+        return b
+
+    @weave.op()
+    def b(model_output, a):
+        return a
+
+    with pytest.raises(ValueError, match="cycle"):
+        Evaluation(
+            dataset=dataset_rows,
+            scorers=[a, b],
+            scorer_dependencies={"a": ["b"], "b": ["a"]},
+        )
+    with pytest.raises(ValueError, match="unknown scorer"):
+        Evaluation(dataset=dataset_rows, scorers=[a], scorer_dependencies={"a": ["c"]})
+    with pytest.raises(ValueError, match="at least 1"):
+        Evaluation(
+            dataset=dataset_rows, scorers=[a], scorer_concurrency_limits={"a": 0}
+        )
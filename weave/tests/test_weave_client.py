@@ -115,6 +115,17 @@ def test_save_load(client):
     assert val_table[2] == 3
 
 
+def test_async_save_load(client):
+    async def save_load():
+        saved_val = await client.asave({"a": [1, 2, 3]}, "my-obj")
+        val = await client.aget(saved_val.ref)
+        return saved_val, list(val["a"])
+
+    saved_val, val_table = asyncio.run(save_load())
+    assert val_table == [1, 2, 3]
+    assert client.get(saved_val.ref)["a"] == [1, 2, 3]
+
+
 def test_dataset_refs(client):
     ref = client.save(weave.Dataset(rows=[{"v": 1}, {"v": 2}]), "my-dataset")
     new_table_rows = []
@@ -241,6 +252,21 @@ def test_calls_query(client):
     client.finish_call(call0, None)
 
 
+def test_async_calls_query(client):
+    call0 = client.create_call("x", None, {"a": 5, "b": 10})
+    call1 = client.create_call("y", None, {"a": 6, "b": 11})
+    client.finish_call(call1, None)
+    client.finish_call(call0, None)
+
+    async def query():
+        calls = [call async for call in client.acalls()]
+        return calls, await client.acall(call1.id)
+
+    calls, fetched = asyncio.run(query())
+    assert [c.id for c in calls] == [call0.id, call1.id]
+    assert fetched.inputs == {"a": 6, "b": 11}
+
+
 def test_calls_delete(client):
     call0 = client.create_call("x", None, {"a": 5, "b": 10})
     call0_child1 = client.create_call("x", call0, {"a": 5, "b": 11})
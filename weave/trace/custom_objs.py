@@ -2,12 +2,26 @@ import contextlib
 import io
 import os
 import tempfile
-from typing import Any, Dict, Optional, Union, Mapping, Iterator, Generator
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Optional,
+    Union,
+    Mapping,
+    Iterator,
+    Generator,
+)
 from weave import artifact_fs
+from weave.trace import object_cache
 from weave.trace.op import Op, op
 from weave.trace.serializer import get_serializer_for_obj, get_serializer_by_id
 from weave.trace.refs import parse_uri, ObjectRef
 from weave.graph_client_context import require_graph_client
+from weave.trace_server.trace_server_interface import (
+    FileContentReadReq,
+    TraceServerInterface,
+)
 from weave.trace_server.trace_server_interface_util import (
     encode_bytes_as_b64,
     decode_b64_to_bytes,
@@ -16,14 +30,125 @@ from weave.trace_server.trace_server_interface_util import (
 from weave.trace import op_type  # Must import this to register op save/load
 
 
+# Size of the ranges in which files are read from the trace server
+SERVER_FILE_READ_BYTES = 4 * 1024 * 1024
+
+
+class ServerFile:
+    """A file stored by the trace server, read only as far as it is used.
+
+    Opening it reads it in ranges, and `write_to` streams it, so large files
+    are never held in memory whole. Small files are still read with a single
+    request, and go through the object cache.
+    """
+
+    def __init__(
+        self, server: TraceServerInterface, project_id: str, digest: str
+    ) -> None:
+        self.server = server
+        self.project_id = project_id
+        self.digest = digest
+
+    def read(self) -> bytes:
+        return object_cache.read_file_content(self.server, self.project_id, self.digest)
+
+    def open(self) -> BinaryIO:
+        cached = object_cache.get_cached_file_content(self.project_id, self.digest)
+        if cached is not None:
+            return io.BytesIO(cached)
+        return io.BufferedReader(  # type: ignore
+            _ServerFileReader(self), buffer_size=SERVER_FILE_READ_BYTES
+        )
+
+    def write_to(self, f: BinaryIO) -> None:
+        cached = object_cache.get_cached_file_content(self.project_id, self.digest)
+        if cached is not None:
+            f.write(cached)
+            return
+        for chunk in self.server.file_content_stream(
+            FileContentReadReq(project_id=self.project_id, digest=self.digest)
+        ):
+            f.write(chunk)
+
+    def read_range(self, offset: int, length: Optional[int]) -> bytes:
+        return self.server.file_content_read(
+            FileContentReadReq(
+                project_id=self.project_id,
+                digest=self.digest,
+                offset=offset,
+                length=length,
+            )
+        ).content
+
+
+class _ServerFileReader(io.RawIOBase):
+    """Reads a `ServerFile` with ranged requests."""
+
+    def __init__(self, file: ServerFile) -> None:
+        self._file = file
+        self._pos = 0
+        # The whole content, once it has been read
+        self._content: Optional[bytes] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            # The size of the file is only known once all of it has been read
+            self._content = self._file.read()
+            self._pos = len(self._content) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._pos
+
+    def readinto(self, b: Any) -> int:
+        if self._content is not None:
+            data = self._content[self._pos : self._pos + len(b)]
+        else:
+            data = self._file.read_range(self._pos, len(b))
+            if self._pos == 0 and len(data) < len(b):
+                # That was the whole file
+                self._content = data
+                object_cache.cache_file_content(
+                    self._file.project_id, self._file.digest, data
+                )
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+    def readall(self) -> bytes:
+        if self._content is None:
+            if self._pos == 0:
+                self._content = self._file.read()
+            else:
+                data = self._file.read_range(self._pos, None)
+                self._pos += len(data)
+                return data
+        data = self._content[self._pos :]
+        self._pos += len(data)
+        return data
+
+
 class MemTraceFilesArtifact(artifact_fs.FilesystemArtifact):
     RefClass = artifact_fs.FilesystemArtifactRef
     temp_read_dir: Optional[tempfile.TemporaryDirectory]
-    path_contents: dict[str, bytes]
+    path_contents: dict[str, Union[bytes, ServerFile]]
 
     def __init__(
         self,
-        path_contents: Optional[Mapping[str, Union[str, bytes]]] = None,
+        path_contents: Optional[Mapping[str, Union[str, bytes, ServerFile]]] = None,
         metadata: Optional[dict[str, str]] = None,
     ):
         if path_contents is None:
@@ -54,18 +179,23 @@ class MemTraceFilesArtifact(artifact_fs.FilesystemArtifact):
     @contextlib.contextmanager
     def open(
         self, path: str, binary: bool = False
-    ) -> Iterator[Union[io.StringIO, io.BytesIO]]:
-        f: Union[io.StringIO, io.BytesIO]
+    ) -> Iterator[Union[io.StringIO, io.BytesIO, BinaryIO]]:
+        f: Union[io.StringIO, io.BytesIO, BinaryIO]
         try:
             if binary:
                 val = self.path_contents[path]
-                if not isinstance(val, bytes):
+                if isinstance(val, ServerFile):
+                    f = val.open()
+                elif not isinstance(val, bytes):
                     raise ValueError(
                         f"Expected binary file, but got string for path {path}"
                     )
-                f = io.BytesIO(val)
+                else:
+                    f = io.BytesIO(val)
             else:
                 val = self.path_contents[path]
+                if isinstance(val, ServerFile):
+                    val = val.read()
                 f = io.StringIO(val.decode("utf-8"))
         except KeyError:
             raise FileNotFoundError(path)
@@ -79,7 +209,11 @@ class MemTraceFilesArtifact(artifact_fs.FilesystemArtifact):
         self.temp_read_dir = tempfile.TemporaryDirectory()
         write_path = os.path.join(self.temp_read_dir.name, path)
         with open(write_path, "wb") as f:
-            f.write(self.path_contents[path])
+            val = self.path_contents[path]
+            if isinstance(val, ServerFile):
+                val.write_to(f)
+            else:
+                f.write(val)
             f.flush()
             os.fsync(f.fileno())
         return write_path
@@ -137,7 +271,7 @@ def encode_custom_obj(obj: Any) -> Optional[dict]:
 
 def decode_custom_obj(
     weave_type: Dict,
-    encoded_path_contents: Mapping[str, Union[str, bytes]],
+    encoded_path_contents: Mapping[str, Union[str, bytes, ServerFile]],
     load_instance_op_uri: Optional[str],
 ) -> Any:
     from .. import artifact_fs
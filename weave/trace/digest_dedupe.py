@@ -0,0 +1,368 @@
+"""Skips uploading content that the trace server already has.
+
+Files, table rows, tables and object versions are addressed by the digest of
+their content. The client computes those digests the same way the server
+does, so before sending a large payload it can ask the server (in bulk) which
+digests it already has and only send the rest. Digests that are known to be
+on a server are also remembered for the life of the process, so re-logging
+the same images, weights or datasets doesn't even need the round trip.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import threading
+import time
+import typing
+import weakref
+
+from weave.trace_server.trace_server_interface import (
+    DigestsExistReq,
+    FileCreateReq,
+    ObjCreateReq,
+    ObjDigest,
+    TableCreateFromDigestsReq,
+    TableCreateReq,
+    TableRowsCreateReq,
+    TableSchemaForInsert,
+    TraceServerInterface,
+)
+from weave.trace_server.trace_server_interface_util import (
+    bytes_digest,
+    str_digest,
+    table_digest,
+)
+
+# Payloads smaller than this are sent without asking the server first, the
+# round trip would cost about as much as the upload itself.
+DIGEST_CHECK_MIN_BYTES = 16 * 1024
+
+# Tables with more rows than this are uploaded in chunks of this many rows,
+# TABLE_UPLOAD_WORKERS at a time, and then assembled from their row digests in
+# a single request.
+TABLE_ROWS_CHUNK_SIZE = 5000
+TABLE_UPLOAD_WORKERS = 4
+
+# Files are uploaded by this many background threads, and serializing blocks
+# once this many bytes are waiting to be uploaded. A failed upload is tried
+# up to FILE_UPLOAD_ATTEMPTS times.
+FILE_UPLOAD_WORKERS = 8
+FILE_UPLOAD_MAX_PENDING_BYTES = 256 * 1024 * 1024
+FILE_UPLOAD_ATTEMPTS = 3
+FILE_UPLOAD_RETRY_DELAY = 1.0
+
+DigestKey = typing.Tuple[str, ...]
+
+_known_digests: "weakref.WeakKeyDictionary[TraceServerInterface, typing.Set[DigestKey]]" = (
+    weakref.WeakKeyDictionary()
+)
+_known_digests_lock = threading.Lock()
+
+
+def is_known(server: TraceServerInterface, key: DigestKey) -> bool:
+    with _known_digests_lock:
+        return key in _known_digests.get(server, ())
+
+
+def mark_known(server: TraceServerInterface, keys: typing.Iterable[DigestKey]) -> None:
+    with _known_digests_lock:
+        _known_digests.setdefault(server, set()).update(keys)
+
+
+class FileUploadPool:
+    """Uploads files from a bounded number of background threads.
+
+    Uploads of the same file that overlap share a single request. Once
+    `max_pending_bytes` are waiting to be uploaded, further uploads block
+    until some of them are done.
+    """
+
+    def __init__(self, max_workers: int, max_pending_bytes: int) -> None:
+        self.max_pending_bytes = max_pending_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="weave-file-upload"
+        )
+        # Keyed by the server itself, not its id, which a later server can reuse
+        self._in_flight: typing.Dict[
+            typing.Tuple[TraceServerInterface, str, str], Future
+        ] = {}
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+
+    def upload(
+        self,
+        server: TraceServerInterface,
+        project_id: str,
+        name: str,
+        content: bytes,
+        digest: str,
+    ) -> Future:
+        key = (server, project_id, digest)
+        size = len(content)
+        with self._cond:
+            while True:
+                future = self._in_flight.get(key)
+                if future is not None:
+                    return future
+                # A file larger than the budget is let through on its own
+                if (
+                    self._pending_bytes == 0
+                    or self._pending_bytes + size <= self.max_pending_bytes
+                ):
+                    break
+                self._cond.wait()
+            self._pending_bytes += size
+            future = self._executor.submit(
+                _upload_file, server, project_id, name, content, digest
+            )
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._upload_done(key, size))
+        return future
+
+    def _upload_done(
+        self, key: typing.Tuple[TraceServerInterface, str, str], size: int
+    ) -> None:
+        with self._cond:
+            self._in_flight.pop(key, None)
+            self._pending_bytes -= size
+            self._cond.notify_all()
+
+
+def _upload_file(
+    server: TraceServerInterface,
+    project_id: str,
+    name: str,
+    content: bytes,
+    digest: str,
+) -> None:
+    if is_known(server, ("file", project_id, digest)):
+        return
+    for attempt in range(FILE_UPLOAD_ATTEMPTS):
+        try:
+            server.file_create(
+                FileCreateReq(project_id=project_id, name=name, content=content)
+            )
+            break
+        except Exception:
+            if attempt == FILE_UPLOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(FILE_UPLOAD_RETRY_DELAY * 2**attempt)
+    mark_known(server, [("file", project_id, digest)])
+
+
+_file_upload_pool: typing.Optional[FileUploadPool] = None
+_file_upload_pool_lock = threading.Lock()
+
+
+def get_file_upload_pool() -> FileUploadPool:
+    global _file_upload_pool
+    with _file_upload_pool_lock:
+        if _file_upload_pool is None:
+            _file_upload_pool = FileUploadPool(
+                FILE_UPLOAD_WORKERS, FILE_UPLOAD_MAX_PENDING_BYTES
+            )
+        return _file_upload_pool
+
+
+class DeferredUploads(typing.List[Future]):
+    """Pending uploads whose files are only uploaded once `start` is called.
+
+    Passed as `pending_uploads` for values that may be discarded, like those
+    of traces that aren't sampled, so that their files are never uploaded
+    unless the values are kept.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._files: typing.List[
+            typing.Tuple[TraceServerInterface, str, typing.Dict[str, bytes]]
+        ] = []
+
+    def defer(
+        self,
+        server: TraceServerInterface,
+        project_id: str,
+        files: typing.Dict[str, bytes],
+    ) -> None:
+        self._files.append((server, project_id, files))
+
+    def start(self) -> typing.List[Future]:
+        """Uploads the files in the background, returns their uploads."""
+        uploads: typing.List[Future] = []
+        for server, project_id, files in self._files:
+            create_files(server, project_id, files, uploads)
+        self._files = []
+        return uploads
+
+
+def create_files(
+    server: TraceServerInterface,
+    project_id: str,
+    files: typing.Dict[str, bytes],
+    pending_uploads: typing.Optional[typing.List[Future]] = None,
+) -> typing.Dict[str, str]:
+    """Uploads the files that the server doesn't have, returns their digests.
+
+    The files are uploaded in parallel. If `pending_uploads` is given, this
+    returns right away and the uploads are added to it instead of waited for,
+    or deferred until they are started if it is `DeferredUploads`.
+    """
+    digests = {name: bytes_digest(content) for name, content in files.items()}
+    if isinstance(pending_uploads, DeferredUploads):
+        pending_uploads.defer(server, project_id, files)
+        return digests
+    missing = {
+        digest: name
+        for name, digest in digests.items()
+        if not is_known(server, ("file", project_id, digest))
+    }
+    if sum(len(files[name]) for name in missing.values()) >= DIGEST_CHECK_MIN_BYTES:
+        existing = server.digests_exist(
+            DigestsExistReq(project_id=project_id, files=list(missing))
+        ).files
+        mark_known(server, [("file", project_id, d) for d in existing])
+        for digest in existing:
+            missing.pop(digest, None)
+    pool = get_file_upload_pool()
+    uploads = [
+        pool.upload(server, project_id, name, files[name], digest)
+        for digest, name in missing.items()
+    ]
+    if pending_uploads is not None:
+        pending_uploads.extend(uploads)
+    else:
+        for upload in uploads:
+            upload.result()
+    return digests
+
+
+def create_obj(server: TraceServerInterface, req: ObjCreateReq) -> str:
+    """Creates an object version unless the server has it, returns its digest."""
+    try:
+        json_val = json.dumps(req.obj.val)
+    except TypeError:
+        return server.obj_create(req).digest
+    digest = str_digest(json_val)
+    key = ("obj", req.obj.project_id, req.obj.object_id, digest)
+    if is_known(server, key):
+        return digest
+    if len(json_val) >= DIGEST_CHECK_MIN_BYTES:
+        existing = server.digests_exist(
+            DigestsExistReq(
+                project_id=req.obj.project_id,
+                objs=[ObjDigest(object_id=req.obj.object_id, digest=digest)],
+            )
+        ).objs
+        if existing:
+            mark_known(server, [key])
+            return digest
+    digest = server.obj_create(req).digest
+    mark_known(server, [("obj", req.obj.project_id, req.obj.object_id, digest)])
+    return digest
+
+
+def create_table(
+    server: TraceServerInterface, project_id: str, rows: typing.List[typing.Any]
+) -> str:
+    """Creates a table unless the server has it, returns its digest."""
+    if len(rows) > TABLE_ROWS_CHUNK_SIZE:
+        return _create_table_chunked(server, project_id, rows)
+    req = TableCreateReq(table=TableSchemaForInsert(project_id=project_id, rows=rows))
+    try:
+        row_jsons = [json.dumps(row) for row in rows]
+    except TypeError:
+        return server.table_create(req).digest
+    digest = table_digest(str_digest(row_json) for row_json in row_jsons)
+    key = ("table", project_id, digest)
+    if is_known(server, key):
+        return digest
+    if sum(len(row_json) for row_json in row_jsons) >= DIGEST_CHECK_MIN_BYTES:
+        existing = server.digests_exist(
+            DigestsExistReq(project_id=project_id, tables=[digest])
+        ).tables
+        if existing:
+            mark_known(server, [key])
+            return digest
+    digest = server.table_create(req).digest
+    mark_known(server, [("table", project_id, digest)])
+    return digest
+
+
+def _create_table_chunked(
+    server: TraceServerInterface, project_id: str, rows: typing.List[typing.Any]
+) -> str:
+    row_digests = create_table_rows(server, project_id, rows)
+    digest = table_digest(row_digests)
+    key = ("table", project_id, digest)
+    if is_known(server, key):
+        return digest
+    existing = server.digests_exist(
+        DigestsExistReq(project_id=project_id, tables=[digest])
+    ).tables
+    if not existing:
+        digest = create_table_from_digests(server, project_id, row_digests)
+    mark_known(server, [("table", project_id, digest)])
+    return digest
+
+
+def create_table_rows(
+    server: TraceServerInterface, project_id: str, rows: typing.List[typing.Any]
+) -> typing.List[str]:
+    """Uploads the rows that the server doesn't have, returns their digests.
+
+    Rows are uploaded in chunks, several chunks at a time, so no single
+    request holds more than TABLE_ROWS_CHUNK_SIZE rows.
+    """
+
+    def upload_chunk(chunk: typing.List[typing.Any]) -> typing.List[str]:
+        digests = [str_digest(json.dumps(row)) for row in chunk]
+        unknown = {
+            d for d in digests if not is_known(server, ("table_row", project_id, d))
+        }
+        if unknown:
+            unknown -= set(
+                server.digests_exist(
+                    DigestsExistReq(project_id=project_id, table_rows=list(unknown))
+                ).table_rows
+            )
+        missing_rows = []
+        for row, digest in zip(chunk, digests):
+            if digest in unknown:
+                missing_rows.append(row)
+                unknown.discard(digest)
+        if missing_rows:
+            server.table_rows_create(
+                TableRowsCreateReq(project_id=project_id, rows=missing_rows)
+            )
+        mark_known(server, [("table_row", project_id, d) for d in digests])
+        return digests
+
+    chunks = [
+        rows[i : i + TABLE_ROWS_CHUNK_SIZE]
+        for i in range(0, len(rows), TABLE_ROWS_CHUNK_SIZE)
+    ]
+    if len(chunks) == 1:
+        return upload_chunk(chunks[0])
+    with ThreadPoolExecutor(max_workers=TABLE_UPLOAD_WORKERS) as executor:
+        return [d for digests in executor.map(upload_chunk, chunks) for d in digests]
+
+
+def create_table_from_digests(
+    server: TraceServerInterface,
+    project_id: str,
+    row_digests: typing.List[str],
+    base_digest: typing.Optional[str] = None,
+    remove_row_digests: typing.Optional[typing.List[str]] = None,
+) -> str:
+    """Creates a table out of rows that the server already has.
+
+    All the digests are sent in one request, so the server only creates the
+    final table (digests are small next to the rows they stand for).
+    """
+    return server.table_create_from_digests(
+        TableCreateFromDigestsReq(
+            project_id=project_id,
+            row_digests=row_digests,
+            base_digest=base_digest,
+            remove_row_digests=remove_row_digests,
+        )
+    ).digest
@@ -1,7 +1,34 @@
 import os
+import typing
 
 WEAVE_PARALLELISM = "WEAVE_PARALLELISM"
 
 
 def get_weave_parallelism() -> int:
     return int(os.getenv(WEAVE_PARALLELISM, "20"))
+
+
+WEAVE_CLIENT_CACHE_MAX_BYTES = "WEAVE_CLIENT_CACHE_MAX_BYTES"
+WEAVE_CLIENT_CACHE_DIR = "WEAVE_CLIENT_CACHE_DIR"
+WEAVE_CLIENT_CACHE_MAX_DISK_BYTES = "WEAVE_CLIENT_CACHE_MAX_DISK_BYTES"
+
+
+def get_weave_client_cache_max_bytes() -> int:
+    return int(os.getenv(WEAVE_CLIENT_CACHE_MAX_BYTES, str(256 * 1024 * 1024)))
+
+
+def get_weave_client_cache_dir() -> typing.Optional[str]:
+    return os.getenv(WEAVE_CLIENT_CACHE_DIR) or None
+
+
+def get_weave_client_cache_max_disk_bytes() -> int:
+    return int(
+        os.getenv(WEAVE_CLIENT_CACHE_MAX_DISK_BYTES, str(4 * 1024 * 1024 * 1024))
+    )
+
+
+WEAVE_CALL_VALUE_OFFLOAD_BYTES = "WEAVE_CALL_VALUE_OFFLOAD_BYTES"
+
+
+def get_weave_call_value_offload_bytes() -> int:
+    return int(os.getenv(WEAVE_CALL_VALUE_OFFLOAD_BYTES, str(256 * 1024)))
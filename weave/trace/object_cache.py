@@ -0,0 +1,307 @@
+"""A process-wide cache of immutable, digest-addressed trace server values.
+
+Object versions, tables and files are addressed by the digest of their
+content, so once read they never change. Caching them lets repeated
+dereferences of the same refs (eg. the model, prompts and dataset rows of an
+evaluation) skip the trace server. Only reads by digest are cached; aliases
+like `latest` or `v3` are always resolved by the server.
+
+Values are kept serialized (JSON), which both bounds memory by size and hands
+every reader a fresh copy that it is free to mutate. Set
+`WEAVE_CLIENT_CACHE_DIR` to also keep them on disk across processes.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import typing
+import uuid
+
+from weave.trace import env
+from weave.trace_server.trace_server_interface import (
+    FileContentReadReq,
+    ObjReadReq,
+    TableQueryReq,
+    TableQueryStatsReq,
+    TraceServerInterface,
+    _TableRowFilter,
+)
+
+logger = logging.getLogger(__name__)
+
+CacheKey = typing.Tuple[str, ...]
+
+
+def is_content_digest(digest: str) -> bool:
+    """Returns False for aliases that the server has to resolve."""
+    if digest == "latest":
+        return False
+    return not (digest.startswith("v") and digest[1:].isdigit())
+
+
+class ObjectCache:
+    """A size-bounded LRU of bytes, optionally backed by a directory."""
+
+    def __init__(
+        self,
+        max_bytes: int,
+        cache_dir: typing.Optional[str] = None,
+        max_disk_bytes: typing.Optional[int] = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.num_hits = 0
+        self.num_misses = 0
+        self._entries: OrderedDict[CacheKey, bytes] = OrderedDict()
+        self._size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_size = sum(
+                entry.stat().st_size for entry in os.scandir(cache_dir)
+            )
+
+    def get(self, key: CacheKey) -> typing.Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.num_hits += 1
+                return value
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.num_misses += 1
+                return None
+            self.num_hits += 1
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key: CacheKey, value: bytes) -> None:
+        with self._lock:
+            if self._entries.get(key) == value:
+                return
+            self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _put_memory(self, key: CacheKey, value: bytes) -> None:
+        replaced = self._entries.pop(key, None)
+        if replaced is not None:
+            self._size -= len(replaced)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    # Disk
+
+    def _path(self, key: CacheKey) -> str:
+        assert self.cache_dir is not None
+        name = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name)
+
+    def _read_disk(self, key: CacheKey) -> typing.Optional[bytes]:
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+        except OSError:
+            return None
+        # Keep recently used entries from being pruned
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write_disk(self, key: CacheKey, value: bytes) -> None:
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            replaced_size = os.stat(path).st_size
+        except OSError:
+            replaced_size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write to object cache: {e}")
+            return
+        with self._lock:
+            self._disk_size += len(value) - replaced_size
+            over_budget = (
+                self.max_disk_bytes is not None
+                and self._disk_size > self.max_disk_bytes
+            )
+        if over_budget:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Deletes the least recently used files until the disk budget is met."""
+        assert self.cache_dir is not None and self.max_disk_bytes is not None
+        entries = sorted(os.scandir(self.cache_dir), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        target = self.max_disk_bytes // 2
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_size = total
+
+
+_cache: typing.Optional[ObjectCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_object_cache() -> ObjectCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ObjectCache(
+                env.get_weave_client_cache_max_bytes(),
+                cache_dir=env.get_weave_client_cache_dir(),
+                max_disk_bytes=env.get_weave_client_cache_max_disk_bytes(),
+            )
+        return _cache
+
+
+# Cached reads. Each returns the same value as the corresponding server read.
+
+
+def get_cached_obj_val(
+    project_id: str, object_id: str, digest: str
+) -> typing.Optional[typing.Any]:
+    if not is_content_digest(digest):
+        return None
+    cached = get_object_cache().get(("obj", project_id, object_id, digest))
+    if cached is None:
+        return None
+    return json.loads(cached)
+
+
+def cache_obj_val(
+    project_id: str, object_id: str, digest: str, val: typing.Any
+) -> None:
+    get_object_cache().put(
+        ("obj", project_id, object_id, digest), json.dumps(val).encode("utf-8")
+    )
+
+
+def read_obj_val(
+    server: TraceServerInterface, project_id: str, object_id: str, digest: str
+) -> typing.Tuple[str, typing.Any]:
+    """Returns the resolved digest and the (JSON) value of an object version."""
+    cached = get_cached_obj_val(project_id, object_id, digest)
+    if cached is not None:
+        return digest, cached
+    read_res = server.obj_read(
+        ObjReadReq(project_id=project_id, object_id=object_id, digest=digest)
+    )
+    cache_obj_val(project_id, object_id, read_res.obj.digest, read_res.obj.val)
+    return read_res.obj.digest, read_res.obj.val
+
+
+def read_table_page(
+    server: TraceServerInterface,
+    project_id: str,
+    digest: str,
+    offset: int,
+    limit: int,
+    filter: typing.Optional[_TableRowFilter] = None,
+    columns: typing.Optional[typing.List[str]] = None,
+) -> typing.List[typing.Tuple[str, typing.Any]]:
+    """Returns the (row digest, value) pairs of one page of a table."""
+    cache = get_object_cache()
+    key = (
+        "table_page",
+        project_id,
+        digest,
+        str(offset),
+        str(limit),
+        filter.model_dump_json() if filter else "",
+        json.dumps(columns),
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return [(row_digest, val) for row_digest, val in json.loads(cached)]
+    response = server.table_query(
+        TableQueryReq(
+            project_id=project_id,
+            digest=digest,
+            filter=filter,
+            offset=offset,
+            limit=limit,
+            columns=columns,
+        )
+    )
+    rows = [(row.digest, row.val) for row in response.rows]
+    cache.put(key, json.dumps(rows).encode("utf-8"))
+    return rows
+
+
+def read_table_len(
+    server: TraceServerInterface,
+    project_id: str,
+    digest: str,
+    filter: typing.Optional[_TableRowFilter] = None,
+) -> int:
+    cache = get_object_cache()
+    key = (
+        "table_len",
+        project_id,
+        digest,
+        filter.model_dump_json() if filter else "",
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return int(cached)
+    count = server.table_query_stats(
+        TableQueryStatsReq(project_id=project_id, digest=digest, filter=filter)
+    ).count
+    cache.put(key, str(count).encode("utf-8"))
+    return count
+
+
+def get_cached_file_content(project_id: str, digest: str) -> typing.Optional[bytes]:
+    return get_object_cache().get(("file", project_id, digest))
+
+
+def cache_file_content(project_id: str, digest: str, content: bytes) -> None:
+    get_object_cache().put(("file", project_id, digest), content)
+
+
+def read_file_content(
+    server: TraceServerInterface, project_id: str, digest: str
+) -> bytes:
+    cached = get_cached_file_content(project_id, digest)
+    if cached is not None:
+        return cached
+    content = server.file_content_read(
+        FileContentReadReq(project_id=project_id, digest=digest)
+    ).content
+    cache_file_content(project_id, digest, content)
+    return content
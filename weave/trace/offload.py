@@ -0,0 +1,202 @@
+"""Moves large call inputs and outputs out of the calls table.
+
+Parts of a call's inputs or output whose JSON is larger than
+`WEAVE_CALL_VALUE_OFFLOAD_BYTES` are stored as files (deduplicated by digest,
+like the files of custom objects), and the call holds a small placeholder
+with the file digest, the size and a preview of the value instead. Reading a
+call returns an `OffloadedValue` for each placeholder, which reads the file
+the first time the value is used.
+
+The smallest parts over the limit are moved, so the rest of the structure
+stays queryable. Parts that contain refs are never moved, since the server
+indexes the refs of call inputs and outputs.
+"""
+
+from concurrent.futures import Future
+import json
+import typing
+
+from weave.trace import digest_dedupe, env, object_cache
+from weave.trace_server.trace_server_interface import TraceServerInterface
+
+OFFLOADED_VALUE_TYPE = "OffloadedValue"
+OFFLOADED_VALUE_FILE_NAME = "value.json"
+
+# Characters of the JSON of an offloaded value kept in its placeholder, at
+# most a quarter of the limit so that placeholders stay well under it
+OFFLOAD_PREVIEW_CHARS = 1000
+
+# JSON size of a placeholder besides its preview, with room for the digest
+PLACEHOLDER_BYTES = 200
+
+
+class OffloadedValue:
+    """A call value stored in a file, read when it is first used."""
+
+    def __init__(
+        self,
+        server: TraceServerInterface,
+        project_id: str,
+        digest: str,
+        size: int,
+        preview: str,
+        # Whether the value is decoded with `from_json` once loaded, like the
+        # rest of the value it was in
+        decode: bool,
+    ) -> None:
+        self.server = server
+        self.project_id = project_id
+        self.digest = digest
+        self.size = size
+        self.preview = preview
+        self.decode = decode
+
+    def load(self) -> typing.Any:
+        """Reads the JSON of the value."""
+        return json.loads(
+            object_cache.read_file_content(self.server, self.project_id, self.digest)
+        )
+
+    def __repr__(self) -> str:
+        return f"OffloadedValue({self.size} bytes: {self.preview!r})"
+
+
+def is_offloaded_value(val: typing.Any) -> bool:
+    return isinstance(val, dict) and val.get("_type") == OFFLOADED_VALUE_TYPE
+
+
+def offloaded_value_from_json(
+    val: dict, project_id: str, server: TraceServerInterface, decode: bool
+) -> OffloadedValue:
+    return OffloadedValue(
+        server, project_id, val["file"], val["size"], val["preview"], decode
+    )
+
+
+def decode_offloaded_values(
+    val: typing.Any, project_id: str, server: TraceServerInterface
+) -> typing.Any:
+    """Replaces the placeholders in a JSON value that isn't otherwise decoded."""
+    if isinstance(val, list):
+        return [decode_offloaded_values(v, project_id, server) for v in val]
+    elif is_offloaded_value(val):
+        return offloaded_value_from_json(val, project_id, server, decode=False)
+    elif isinstance(val, dict):
+        return {
+            k: decode_offloaded_values(v, project_id, server) for k, v in val.items()
+        }
+    return val
+
+
+def offload_large_values(
+    val: typing.Any,
+    project_id: str,
+    server: TraceServerInterface,
+    pending_uploads: typing.Optional[typing.List[Future]] = None,
+    max_bytes: typing.Optional[int] = None,
+) -> typing.Any:
+    """Replaces the parts of a JSON value over `max_bytes` with placeholders.
+
+    Sizes are estimated from the structure of the value rather than by
+    encoding it. The files are uploaded like those of custom objects: in the
+    background if `pending_uploads` is given, with their uploads added to it.
+    """
+    limit = env.get_weave_call_value_offload_bytes() if max_bytes is None else max_bytes
+    if limit <= 0 or not _json_size_over(val, limit):
+        return val
+    preview_chars = min(OFFLOAD_PREVIEW_CHARS, limit // 4)
+
+    def offload(val: typing.Any) -> typing.Tuple[typing.Any, int, bool]:
+        # Returns the value with its large parts moved, its JSON size and
+        # whether it holds refs
+        if isinstance(val, dict):
+            size, has_refs = 2, False
+            new_val = {}
+            for k, v in val.items():
+                new_val[k], v_size, v_has_refs = offload(v)
+                size += len(str(k)) + v_size + 6
+                has_refs = has_refs or v_has_refs
+            val = new_val
+        elif isinstance(val, list):
+            size, has_refs = 2, False
+            new_list = []
+            for v in val:
+                new_v, v_size, v_has_refs = offload(v)
+                new_list.append(new_v)
+                size += v_size + 2
+                has_refs = has_refs or v_has_refs
+            val = new_list
+        else:
+            size = _json_leaf_size(val)
+            has_refs = isinstance(val, str) and val.startswith("weave://")
+        if size <= limit or has_refs:
+            return val, size, has_refs
+        placeholder = _offload_value(
+            val, project_id, server, pending_uploads, preview_chars
+        )
+        return placeholder, len(placeholder["preview"]) + PLACEHOLDER_BYTES, False
+
+    return offload(val)[0]
+
+
+def _json_size_over(val: typing.Any, limit: int) -> bool:
+    """Whether the JSON of a value is estimated to be over `limit` bytes.
+
+    Stops walking the value as soon as it is, so large values cost no more
+    than the first `limit` bytes of them.
+    """
+    size = 0
+    stack = [val]
+    while stack:
+        val = stack.pop()
+        if isinstance(val, dict):
+            size += 2
+            for k, v in val.items():
+                size += len(str(k)) + 6
+                stack.append(v)
+        elif isinstance(val, list):
+            size += 2 + 2 * len(val)
+            stack.extend(val)
+        else:
+            size += _json_leaf_size(val)
+        if size > limit:
+            return True
+    return False
+
+
+def _json_leaf_size(val: typing.Any) -> int:
+    # Escapes in strings are not counted, the estimate only needs to be close
+    if isinstance(val, str):
+        return len(val) + 2
+    elif val is None or val is True:
+        return 4
+    elif val is False:
+        return 5
+    elif isinstance(val, (int, float)):
+        return len(repr(val))
+    try:
+        return len(json.dumps(val))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _offload_value(
+    val: typing.Any,
+    project_id: str,
+    server: TraceServerInterface,
+    pending_uploads: typing.Optional[typing.List[Future]],
+    preview_chars: int,
+) -> dict:
+    content = json.dumps(val)
+    digests = digest_dedupe.create_files(
+        server,
+        project_id,
+        {OFFLOADED_VALUE_FILE_NAME: content.encode("utf-8")},
+        pending_uploads,
+    )
+    return {
+        "_type": OFFLOADED_VALUE_TYPE,
+        "file": digests[OFFLOADED_VALUE_FILE_NAME],
+        "size": len(content),
+        "preview": content[:preview_chars],
+    }
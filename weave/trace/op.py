@@ -8,6 +8,7 @@ from typing_extensions import ParamSpec
 from weave.trace.errors import OpCallError
 from weave.trace.refs import ObjectRef
 from weave.trace.context import call_attributes
+from weave.trace.op_cache import OpCache, OpCachePolicy, cache_policy
 from weave import graph_client_context
 from weave import run_context
 from weave import box
@@ -47,11 +48,16 @@ class Op:
     # double-underscore to avoid conflict with old Weave refs
     __ref: Optional[ObjectRef] = None
 
-    def __init__(self, resolve_fn: Callable) -> None:
+    # Memoization of the op's outputs, see `weave.trace.op_cache`
+    _cache_policy: Optional[OpCachePolicy] = None
+
+    def __init__(self, resolve_fn: Callable, cache: OpCache = None) -> None:
         self.resolve_fn = resolve_fn
         self.name = resolve_fn.__name__
         self.signature = inspect.signature(resolve_fn)
+        self._input_defaults = _fn_input_defaults(self.signature)
         self._on_output_handler = None
+        self._cache_policy = cache_policy(cache)
 
     def __get__(
         self, obj: Optional[object], objtype: Optional[type[object]] = None
@@ -60,7 +66,7 @@ class Op:
 
     def __call__(self, *args: Any, **kwargs: Any) -> Any:
         maybe_client = graph_client_context.get_graph_client()
-        if maybe_client is None:
+        if maybe_client is None or run_context.is_sampled_out():
             return self.resolve_fn(*args, **kwargs)
         client = typing.cast("WeaveClient", maybe_client)
 
@@ -68,19 +74,26 @@ class Op:
             inputs = self.signature.bind(*args, **kwargs).arguments
         except TypeError as e:
             raise OpCallError(f"Error calling {self.name}: {e}")
-        inputs_with_defaults = _apply_fn_defaults_to_inputs(self.resolve_fn, inputs)
+
+        parent_run = run_context.get_current_run()
+        sample = client._sample_call(self.name, parent_run)
+        if sample == "drop":
+            return _call_sampled_out(self.resolve_fn, *args, **kwargs)
+
+        inputs_with_defaults = _apply_input_defaults(inputs, self._input_defaults)
 
         # This should probably be configurable, but for now we redact the api_key
         if "api_key" in inputs_with_defaults:
             inputs_with_defaults["api_key"] = "REDACTED"
 
-        # If/When we do memoization, this would be a good spot
-
-        parent_run = run_context.get_current_run()
-        client.save_nested_objects(inputs_with_defaults)
         attributes = call_attributes.get()
         run = client.create_call(
-            self, parent_run, inputs_with_defaults, attributes=attributes
+            self,
+            parent_run,
+            inputs_with_defaults,
+            attributes=attributes,
+            buffer_trace=sample == "buffer",
+            cache=self._cache_policy,
         )
 
         has_finished = False
@@ -92,7 +105,8 @@ class Op:
             if has_finished:
                 raise ValueError("Should not call finish more than once")
             client.finish_call(run, output, exception)
-            if not parent_run:
+            # Buffered traces are only sent if they turn out to be worth keeping
+            if not parent_run and sample == "record":
                 print_call_link(run)
 
         def on_output(output: Any) -> Any:
@@ -101,6 +115,13 @@ class Op:
             finish(output)
             return output
 
+        if run._cached_output is not None:
+            output = client._cached_call_output(run._cached_output)
+            finish(output)
+            if inspect.iscoroutinefunction(self.resolve_fn):
+                return _async_value(output)
+            return output
+
         try:
             res = self.resolve_fn(*args, **kwargs)
             # TODO: can we get rid of this?
@@ -166,7 +187,10 @@ class BoundOp(Op):
             self.name = op.resolve_fn.__name__
         else:
             self.name = arg0_class.__name__ + "." + op.resolve_fn.__name__
-        self.signature = inspect.signature(op.resolve_fn)
+        # Bound for every attribute access, so reuse what the op computed
+        self.signature = op.signature
+        self._input_defaults = op._input_defaults
+        self._cache_policy = op._cache_policy
         self.resolve_fn = op.resolve_fn
         self._on_output_handler = op._on_output_handler
 
@@ -196,7 +220,7 @@ def op(*args: Any, **kwargs: Any) -> Callable[[Callable[P, R]], Callable[P, R]]:
         return op(*args, **kwargs)
 
     def wrap(f: Callable[P, R]) -> Callable[P, R]:
-        op = Op(f)
+        op = Op(f, cache=kwargs.get("cache"))
         functools.update_wrapper(op, f)
         return op  # type: ignore
 
@@ -206,17 +230,91 @@ def op(*args: Any, **kwargs: Any) -> Callable[[Callable[P, R]], Callable[P, R]]:
     return wrap
 
 
-def _apply_fn_defaults_to_inputs(
-    fn: typing.Callable, inputs: Mapping[str, typing.Any]
+def _call_sampled_out(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Calls `fn` without tracing the ops it calls.
+
+    Coroutines and generators it returns run their body when awaited or
+    iterated, so they are wrapped to run it untraced too.
+    """
+    with run_context.sampled_out():
+        res = fn(*args, **kwargs)
+    if inspect.iscoroutine(res):
+
+        async def _run_async() -> Any:
+            with run_context.sampled_out():
+                return await res
+
+        return _run_async()
+    elif inspect.isgenerator(res):
+        return _iter_sampled_out(res)
+    elif inspect.isasyncgen(res):
+        return _aiter_sampled_out(res)
+    return res
+
+
+def _iter_sampled_out(gen: typing.Generator) -> typing.Generator:
+    # Each step runs in the context of whoever iterates, so the flag is set
+    # around every step rather than once
+    try:
+        while True:
+            with run_context.sampled_out():
+                try:
+                    item = next(gen)
+                except StopIteration as e:
+                    return e.value
+            yield item
+    finally:
+        with run_context.sampled_out():
+            gen.close()
+
+
+async def _aiter_sampled_out(gen: typing.AsyncGenerator) -> typing.AsyncGenerator:
+    try:
+        while True:
+            with run_context.sampled_out():
+                try:
+                    item = await gen.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        with run_context.sampled_out():
+            await gen.aclose()
+
+
+async def _async_value(val: Any) -> Any:
+    return val
+
+
+# The parameters that get an input when they aren't passed, as
+# (name, kind, default)
+InputDefaults = list[tuple[str, inspect._ParameterKind, Any]]
+
+
+def _fn_input_defaults(sig: inspect.Signature) -> InputDefaults:
+    defaults = []
+    for param_name, param in sig.parameters.items():
+        has_default = (
+            param.default != inspect.Parameter.empty and param.default is not None
+        )
+        if has_default or param.kind in (
+            inspect.Parameter.VAR_POSITIONAL,
+            inspect.Parameter.VAR_KEYWORD,
+        ):
+            defaults.append((param_name, param.kind, param.default))
+    return defaults
+
+
+def _apply_input_defaults(
+    inputs: Mapping[str, typing.Any], input_defaults: InputDefaults
 ) -> dict[str, typing.Any]:
     inputs = {**inputs}
-    sig = inspect.signature(fn)
-    for param_name, param in sig.parameters.items():
+    for param_name, kind, default in input_defaults:
         if param_name not in inputs:
-            if param.default != inspect.Parameter.empty and param.default is not None:
-                inputs[param_name] = param.default
-            if param.kind == inspect.Parameter.VAR_POSITIONAL:
+            if kind == inspect.Parameter.VAR_POSITIONAL:
                 inputs[param_name] = tuple()
-            elif param.kind == inspect.Parameter.VAR_KEYWORD:
+            elif kind == inspect.Parameter.VAR_KEYWORD:
                 inputs[param_name] = dict()
+            else:
+                inputs[param_name] = default
     return inputs
@@ -0,0 +1,138 @@
+"""Memoization of op results, opted into with `@weave.op(cache=True)`.
+
+Before running, a cached op looks for the output of an earlier successful
+call with the same cache key: the digest of the op's version and of its
+inputs as logged (so objects are identified by the digests of their refs).
+Outputs are looked up in the object cache first (in memory, and on disk if
+`WEAVE_CLIENT_CACHE_DIR` is set), then on the trace server, where calls of
+cached ops record their key in their attributes, and servers index it. A hit
+is still logged as a call of the op, with the cached output and
+`CACHE_HIT_ATTRIBUTE` set.
+"""
+
+import dataclasses
+import datetime
+import json
+import time
+import typing
+
+from weave.trace import object_cache
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.trace_server_interface_util import str_digest
+
+CACHE_KEY_ATTRIBUTE = "weave_cache_key"
+CACHE_HIT_ATTRIBUTE = "weave_cache_hit"
+
+
+@dataclasses.dataclass
+class OpCachePolicy:
+    # Seconds an output is reused for after its call ended, forever if None
+    ttl_seconds: typing.Optional[float] = None
+
+    def __post_init__(self) -> None:
+        if self.ttl_seconds is not None and self.ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be positive")
+
+
+OpCache = typing.Union[bool, OpCachePolicy, None]
+
+
+def cache_policy(cache: OpCache) -> typing.Optional[OpCachePolicy]:
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return OpCachePolicy()
+    if isinstance(cache, OpCachePolicy):
+        return cache
+    raise TypeError(f"cache must be a bool or an OpCachePolicy, got {cache!r}")
+
+
+def cache_key(op_digest: str, inputs_json: dict) -> str:
+    return str_digest(
+        json.dumps({"op": op_digest, "inputs": inputs_json}, sort_keys=True)
+    )
+
+
+@dataclasses.dataclass
+class CachedOutput:
+    # JSON of the output, as sent to the server
+    output: typing.Any
+    # Unix time the call that produced it ended
+    ended_at: float
+
+    def is_fresh(self, policy: OpCachePolicy) -> bool:
+        if policy.ttl_seconds is None:
+            return True
+        return time.time() - self.ended_at < policy.ttl_seconds
+
+
+def get_cached_output(project_id: str, key: str) -> typing.Optional[CachedOutput]:
+    cached = object_cache.get_object_cache().get(("op_output", project_id, key))
+    if cached is None:
+        return None
+    return CachedOutput(**json.loads(cached))
+
+
+def cache_output(project_id: str, key: str, cached: CachedOutput) -> None:
+    object_cache.get_object_cache().put(
+        ("op_output", project_id, key),
+        json.dumps(dataclasses.asdict(cached)).encode("utf-8"),
+    )
+
+
+def find_cached_output(
+    server: tsi.TraceServerInterface, project_id: str, op_name: str, key: str
+) -> typing.Optional[CachedOutput]:
+    """Returns the output of the latest successful call with the cache key."""
+    res = server.calls_query(
+        tsi.CallsQueryReq(
+            project_id=project_id,
+            # The filter finds the calls through the servers' index on the
+            # key, the query checks it on servers that don't have one
+            filter=tsi._CallsFilter(op_names=[op_name], cache_keys=[key]),
+            query=tsi.Query(
+                **{
+                    "$expr": {
+                        "$and": [
+                            {
+                                "$eq": [
+                                    {"$getField": f"attributes.{CACHE_KEY_ATTRIBUTE}"},
+                                    {"$literal": key},
+                                ]
+                            },
+                            {
+                                "$eq": [
+                                    {"$getField": "status"},
+                                    {"$literal": "success"},
+                                ]
+                            },
+                        ]
+                    }
+                }
+            ),
+            sort_by=[tsi._SortBy(field="started_at", direction="desc")],
+            limit=1,
+        )
+    )
+    if not res.calls:
+        return None
+    call = res.calls[0]
+    ended_at = call.ended_at or datetime.datetime.now(tz=datetime.timezone.utc)
+    return CachedOutput(call.output, ended_at.timestamp())
+
+
+def read_cached_output(
+    server: tsi.TraceServerInterface,
+    project_id: str,
+    op_name: str,
+    key: str,
+    policy: OpCachePolicy,
+) -> typing.Optional[CachedOutput]:
+    """Returns the fresh cached output for the key, if any."""
+    cached = get_cached_output(project_id, key)
+    if cached is None or not cached.is_fresh(policy):
+        cached = find_cached_output(server, project_id, op_name, key)
+        if cached is None:
+            return None
+        cache_output(project_id, key, cached)
+    return cached if cached.is_fresh(policy) else None
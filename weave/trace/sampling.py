@@ -0,0 +1,102 @@
+"""Sampling of traces, to record only part of the traffic of a busy service.
+
+When the root call of a trace starts, a `SamplingPolicy` decides whether the
+trace is recorded: it is sampled with probability `sample_rate`, and then has
+to fit in the rate limit of its op. Calls inside a trace that isn't recorded,
+and calls of rate limited ops inside one that is (with their descendants),
+run untraced.
+
+With tail rules (`keep_errors`, `slow_call_seconds`) the traces that aren't
+sampled are buffered instead (without uploading their files), and sent as
+soon as one of their calls fails or is slow. Otherwise they are discarded
+when their root call finishes.
+"""
+
+import dataclasses
+import random
+import threading
+import time
+import typing
+
+SampleDecision = typing.Literal["record", "buffer", "drop"]
+
+
+@dataclasses.dataclass
+class SamplingPolicy:
+    # Probability of recording a trace, decided at its root call
+    sample_rate: float = 1.0
+    # Maximum calls per second of ops, by op name
+    op_rate_limits: dict[str, float] = dataclasses.field(default_factory=dict)
+    # Keep the traces that aren't sampled if any of their calls raised
+    keep_errors: bool = False
+    # Keep the traces that aren't sampled if any of their calls took as long
+    slow_call_seconds: typing.Optional[float] = None
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        for op_name, rate in self.op_rate_limits.items():
+            if rate <= 0:
+                raise ValueError(f"Rate limit of {op_name} must be positive")
+
+    @property
+    def has_tail_rules(self) -> bool:
+        return self.keep_errors or self.slow_call_seconds is not None
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, in bursts of up to
+    `capacity` events."""
+
+    def __init__(self, rate: float, capacity: typing.Optional[float] = None):
+        self.rate = rate
+        self.capacity = max(1.0, rate) if capacity is None else capacity
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Sampler:
+    """Applies a `SamplingPolicy` to the calls of a client."""
+
+    def __init__(
+        self,
+        policy: SamplingPolicy,
+        random_fn: typing.Callable[[], float] = random.random,
+    ):
+        self.policy = policy
+        self._random_fn = random_fn
+        self._buckets = {
+            op_name: TokenBucket(rate)
+            for op_name, rate in policy.op_rate_limits.items()
+        }
+
+    def sample_trace(self, op_name: str) -> SampleDecision:
+        """Decides what to do with a trace, given the op of its root call."""
+        if self.policy.sample_rate >= 1 or self._random_fn() < self.policy.sample_rate:
+            if self.allow_call(op_name):
+                return "record"
+        return "buffer" if self.policy.has_tail_rules else "drop"
+
+    def allow_call(self, op_name: str) -> bool:
+        bucket = self._buckets.get(op_name)
+        return bucket is None or bucket.try_acquire()
+
+    def keep_buffered_call(self, failed: bool, duration: float) -> bool:
+        """Whether a finished call makes its buffered trace worth keeping."""
+        if failed and self.policy.keep_errors:
+            return True
+        slow_call_seconds = self.policy.slow_call_seconds
+        return slow_call_seconds is not None and duration >= slow_call_seconds
@@ -1,18 +1,25 @@
+from concurrent.futures import Future
 from typing import Any
 import typing
 
 from weave import box
-from weave.trace import custom_objs
+from weave.trace import custom_objs, digest_dedupe, offload
 from weave.trace.refs import ObjectRef, TableRef, parse_uri
 from weave.trace.object_record import ObjectRecord
-from weave.trace_server.trace_server_interface import (
-    TraceServerInterface,
-    FileContentReadReq,
-    FileCreateReq,
-)
+from weave.trace_server.trace_server_interface import TraceServerInterface
 
 
-def to_json(obj: Any, project_id: str, server: TraceServerInterface) -> Any:
+def to_json(
+    obj: Any,
+    project_id: str,
+    server: TraceServerInterface,
+    pending_uploads: typing.Optional[typing.List[Future]] = None,
+) -> Any:
+    """Encodes a value as JSON, uploading the files of any custom objects.
+
+    If `pending_uploads` is given the files are uploaded in the background,
+    and their uploads are added to it.
+    """
     if isinstance(obj, TableRef):
         return obj.uri()
     elif isinstance(obj, ObjectRef):
@@ -20,14 +27,19 @@ def to_json(obj: Any, project_id: str, server: TraceServerInterface) -> Any:
     elif isinstance(obj, ObjectRecord):
         res = {"_type": obj._class_name}
         for k, v in obj.__dict__.items():
-            res[k] = to_json(v, project_id, server)
+            res[k] = to_json(v, project_id, server, pending_uploads)
         return res
     elif isinstance_namedtuple(obj):
-        return {k: to_json(v, project_id, server) for k, v in obj._asdict().items()}
+        return {
+            k: to_json(v, project_id, server, pending_uploads)
+            for k, v in obj._asdict().items()
+        }
     elif isinstance(obj, (list, tuple)):
-        return [to_json(v, project_id, server) for v in obj]
+        return [to_json(v, project_id, server, pending_uploads) for v in obj]
     elif isinstance(obj, dict):
-        return {k: to_json(v, project_id, server) for k, v in obj.items()}
+        return {
+            k: to_json(v, project_id, server, pending_uploads) for k, v in obj.items()
+        }
 
     if isinstance(obj, (int, float, str, bool, box.BoxedNone)) or obj is None:
         return obj
@@ -35,12 +47,9 @@ def to_json(obj: Any, project_id: str, server: TraceServerInterface) -> Any:
     encoded = custom_objs.encode_custom_obj(obj)
     if encoded is None:
         return fallback_encode(obj)
-    file_digests = {}
-    for name, val in encoded["files"].items():
-        file_response = server.file_create(
-            FileCreateReq(project_id=project_id, name=name, content=val)
-        )
-        file_digests[name] = file_response.digest
+    file_digests = digest_dedupe.create_files(
+        server, project_id, encoded["files"], pending_uploads
+    )
     result = {
         "_type": encoded["_type"],
         "weave_type": encoded["weave_type"],
@@ -78,14 +87,12 @@ def isinstance_namedtuple(obj: Any) -> bool:
 
 def _load_custom_obj_files(
     project_id: str, server: TraceServerInterface, file_digests: dict
-) -> typing.Dict[str, bytes]:
-    loaded_files: typing.Dict[str, bytes] = {}
-    for name, digest in file_digests.items():
-        file_response = server.file_content_read(
-            FileContentReadReq(project_id=project_id, digest=digest)
-        )
-        loaded_files[name] = file_response.content
-    return loaded_files
+) -> typing.Dict[str, custom_objs.ServerFile]:
+    # Files are only read when the object's loader opens them
+    return {
+        name: custom_objs.ServerFile(server, project_id, digest)
+        for name, digest in file_digests.items()
+    }
 
 
 def from_json(obj: Any, project_id: str, server: TraceServerInterface) -> Any:
@@ -99,6 +106,10 @@ def from_json(obj: Any, project_id: str, server: TraceServerInterface) -> Any:
                 return ObjectRecord(
                     {k: from_json(v, project_id, server) for k, v in obj.items()}
                 )
+            elif val_type == offload.OFFLOADED_VALUE_TYPE:
+                return offload.offloaded_value_from_json(
+                    obj, project_id, server, decode=True
+                )
             elif val_type == "CustomWeaveType":
                 files = _load_custom_obj_files(project_id, server, obj["files"])
                 return custom_objs.decode_custom_obj(
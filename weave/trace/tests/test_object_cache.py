@@ -0,0 +1,56 @@
+import weave
+from weave.trace import object_cache
+from weave.trace.object_cache import ObjectCache
+
+
+def test_lru_eviction_by_size():
+    cache = ObjectCache(max_bytes=10)
+    cache.put(("a",), b"12345")
+    cache.put(("b",), b"12345")
+    assert cache.get(("a",)) == b"12345"
+    # "b" is now the least recently used entry
+    cache.put(("c",), b"12345")
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == b"12345"
+    assert cache.get(("c",)) == b"12345"
+
+
+def test_disk_persistence_and_pruning(tmp_path):
+    cache = ObjectCache(max_bytes=100, cache_dir=str(tmp_path), max_disk_bytes=12)
+    cache.put(("a",), b"12345")
+    # A new process reads what an earlier one wrote
+    assert ObjectCache(max_bytes=100, cache_dir=str(tmp_path)).get(("a",)) == b"12345"
+
+    cache.put(("b",), b"12345")
+    cache.put(("c",), b"12345")
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 12
+
+
+def test_overwrite_replaces_size(tmp_path):
+    cache = ObjectCache(max_bytes=10, cache_dir=str(tmp_path), max_disk_bytes=12)
+    for value in (b"1234", b"123456", b"12"):
+        cache.put(("a",), value)
+    assert cache.get(("a",)) == b"12"
+    assert cache._size == 2
+    assert cache._disk_size == 2
+    assert [f.stat().st_size for f in tmp_path.iterdir()] == [2]
+
+
+def test_get_by_digest_skips_the_server(client, monkeypatch):
+    monkeypatch.setattr(object_cache, "_cache", None)
+    ref = weave.publish({"a": [1, 2, 3]}, name="cached")
+
+    calls = []
+    obj_read = client.server.obj_read
+
+    def counting_obj_read(req):
+        calls.append(req.digest)
+        return obj_read(req)
+
+    monkeypatch.setattr(client.server, "obj_read", counting_obj_read)
+    for _ in range(3):
+        assert client.get(ref)["a"] == [1, 2, 3]
+    latest = weave.ref("cached:latest").get()
+    assert latest["a"] == [1, 2, 3]
+    # The digest is only read once, aliases are always resolved by the server
+    assert calls == [ref.digest, "latest"]
@@ -0,0 +1,93 @@
+import json
+
+import weave
+from weave.trace import offload
+from weave.trace.env import WEAVE_CALL_VALUE_OFFLOAD_BYTES
+from weave.trace_server import trace_server_interface as tsi
+
+
+@weave.op()
+def echo(small: int, big: list) -> dict:
+    return {"small": small, "big": big}
+
+
+def server_call(client):
+    # Call events wait for the uploads of their files
+    client.flush()
+    res = client.server.calls_query(tsi.CallsQueryReq(project_id=client._project_id()))
+    assert len(res.calls) == 1
+    return res.calls[0]
+
+
+def test_offload_large_values_keeps_small_parts(client):
+    big = ["x" * 100] * 10
+    val = {"small": 1, "nested": {"big": big, "tag": "a"}}
+    res = offload.offload_large_values(
+        val, client._project_id(), client.server, max_bytes=400
+    )
+    assert res["small"] == 1
+    assert res["nested"]["tag"] == "a"
+    placeholder = res["nested"]["big"]
+    assert offload.is_offloaded_value(placeholder)
+    assert placeholder["size"] == len(json.dumps(big))
+    assert placeholder["preview"] == json.dumps(big)[:100]
+    # The original value is left as is
+    assert val["nested"]["big"] is big
+
+
+def test_offload_large_values_under_limit(client):
+    val = {"a": ["x" * 10]}
+    assert (
+        offload.offload_large_values(
+            val, client._project_id(), client.server, max_bytes=1000
+        )
+        is val
+    )
+    assert (
+        offload.offload_large_values(val, client._project_id(), client.server, 0) is val
+    )
+
+
+def test_offload_large_values_keeps_refs(client):
+    ref = "weave:///shawn/test-project/object/obj:abc"
+    val = [ref] * 20
+    res = offload.offload_large_values(
+        val, client._project_id(), client.server, max_bytes=100
+    )
+    assert res == val
+
+
+def test_json_size_estimate():
+    val = {"a": [1, 2.5, None, True, "x" * 10], "b": {"c": False}}
+    size = len(json.dumps(val))
+    assert offload._json_size_over(val, size - 1)
+    assert not offload._json_size_over(val, size + 10)
+
+
+def test_call_values_offloaded(client, monkeypatch):
+    monkeypatch.setenv(WEAVE_CALL_VALUE_OFFLOAD_BYTES, "500")
+    big = [f"item-{i}" for i in range(200)]
+    echo(1, big)
+
+    stored = server_call(client)
+    assert stored.inputs["small"] == 1
+    assert offload.is_offloaded_value(stored.inputs["big"])
+    assert stored.output["small"] == 1
+    assert offload.is_offloaded_value(stored.output["big"])
+    # The input and output hold the same value, stored once
+    assert stored.output["big"]["file"] == stored.inputs["big"]["file"]
+
+    call = list(client.calls())[0]
+    assert call.inputs["small"] == 1
+    assert call.inputs["big"] == big
+    assert call.output["big"] == big
+
+
+def test_call_values_not_offloaded_when_disabled(client, monkeypatch):
+    monkeypatch.setenv(WEAVE_CALL_VALUE_OFFLOAD_BYTES, "0")
+    big = [f"item-{i}" for i in range(200)]
+    echo(1, big)
+
+    stored = server_call(client)
+    assert stored.inputs["big"] == big
+    assert stored.output["big"] == big
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+import weave
+from weave.trace import object_cache, op_cache
+from weave.trace_server import trace_server_interface as tsi
+
+runs: list = []
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Cached outputs outlive the client of each test
+    object_cache.get_object_cache().clear()
+    runs.clear()
+    yield
+    object_cache.get_object_cache().clear()
+
+
+@weave.op(cache=True)
+def predict(prompt: str) -> dict:
+    runs.append(prompt)
+    return {"answer": prompt.upper(), "tokens": [1, 2]}
+
+
+@weave.op(cache=weave.OpCachePolicy(ttl_seconds=60))
+def predict_with_ttl(prompt: str) -> str:
+    runs.append(prompt)
+    return prompt.upper()
+
+
+@weave.op(cache=True)
+def flaky(x: int) -> int:
+    runs.append(x)
+    if len(runs) == 1:
+        raise ValueError("boom")
+    return x
+
+
+@weave.op(cache=True)
+async def apredict(prompt: str) -> str:
+    runs.append(prompt)
+    return prompt.upper()
+
+
+def cache_attributes(client):
+    client.flush()
+    calls = client.server.calls_query(
+        tsi.CallsQueryReq(project_id=client._project_id())
+    ).calls
+    return [
+        (
+            c.attributes.get(op_cache.CACHE_KEY_ATTRIBUTE),
+            c.attributes.get(op_cache.CACHE_HIT_ATTRIBUTE, False),
+        )
+        for c in calls
+    ]
+
+
+def test_op_cache_hit(client):
+    assert predict("hi") == {"answer": "HI", "tokens": [1, 2]}
+    assert predict("hi") == {"answer": "HI", "tokens": [1, 2]}
+    assert predict("ho") == {"answer": "HO", "tokens": [1, 2]}
+    assert runs == ["hi", "ho"]
+
+    # Hits are logged as calls of the op too
+    calls = list(client.calls())
+    assert len(calls) == 3
+    assert [c.output["answer"] for c in calls] == ["HI", "HI", "HO"]
+    attributes = cache_attributes(client)
+    assert [hit for _, hit in attributes] == [False, True, False]
+    assert attributes[0][0] == attributes[1][0] != attributes[2][0]
+
+
+def test_op_cache_server_lookup(client):
+    predict("hi")
+    client.flush()
+    # Without the local cache, the output is found on the server
+    object_cache.get_object_cache().clear()
+    assert predict("hi") == {"answer": "HI", "tokens": [1, 2]}
+    assert runs == ["hi"]
+
+
+def test_op_cache_ttl(client, monkeypatch):
+    assert predict_with_ttl("hi") == "HI"
+    assert predict_with_ttl("hi") == "HI"
+    assert runs == ["hi"]
+
+    now = op_cache.time.time()
+    monkeypatch.setattr(op_cache.time, "time", lambda: now + 120)
+    assert predict_with_ttl("hi") == "HI"
+    assert runs == ["hi", "hi"]
+
+
+def test_op_cache_skips_errors(client):
+    with pytest.raises(ValueError):
+        flaky(1)
+    assert flaky(1) == 1
+    assert flaky(1) == 1
+    assert runs == [1, 1]
+
+
+def test_op_cache_async(client):
+    assert asyncio.run(apredict("hi")) == "HI"
+    assert asyncio.run(apredict("hi")) == "HI"
+    assert runs == ["hi"]
+
+
+def test_op_cache_method(client):
+    class Model(weave.Model):
+        prefix: str
+
+        @weave.op(cache=True)
+        def predict(self, prompt: str) -> str:
+            runs.append(prompt)
+            return self.prefix + prompt
+
+    assert Model(prefix="a").predict("x") == "ax"
+    assert Model(prefix="a").predict("x") == "ax"
+    # The model is part of the inputs, by the digest of its ref
+    assert Model(prefix="b").predict("x") == "bx"
+    assert runs == ["x", "x"]
+
+
+def test_op_cache_policy_validation():
+    with pytest.raises(ValueError):
+        weave.OpCachePolicy(ttl_seconds=0)
+    with pytest.raises(TypeError):
+        weave.op(cache="yes")(lambda: None)
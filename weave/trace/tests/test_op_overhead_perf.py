@@ -0,0 +1,110 @@
+# Microbenchmarks of the overhead tracing adds to each op call. These are
+# performance tests, run them with `-s` after removing the skip to see the
+# per-call times, e.g. to compare the primitive-input fast path against
+# inputs that hold objects.
+import asyncio
+import time
+import typing
+
+import pytest
+from pydantic import BaseModel
+
+import weave
+
+CALLS = 2000
+
+
+def per_call_us(run: typing.Callable[[], None], calls: int = CALLS) -> float:
+    start = time.perf_counter()
+    run()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def report(name: str, traced_us: float, untraced_us: float) -> None:
+    print(
+        f"{name}: {traced_us:.1f}us traced, {untraced_us:.2f}us untraced, "
+        f"{traced_us - untraced_us:.1f}us overhead per call"
+    )
+
+
+def add(a: int, b: int = 1) -> int:
+    return a + b
+
+
+async def add_async(a: int, b: int = 1) -> int:
+    return a + b
+
+
+def count_to(n: int) -> typing.Iterator[int]:
+    yield from range(n)
+
+
+class Point(BaseModel):
+    x: int
+    y: int
+
+
+def norm(p: Point) -> int:
+    return abs(p.x) + abs(p.y)
+
+
+class Adder:
+    @weave.op()
+    def add(self, a: int, b: int = 1) -> int:
+        return a + b
+
+
+@pytest.mark.skip(reason="Performance test")
+def test_sync_op_overhead(client):
+    traced = weave.op()(add)
+    report(
+        "sync",
+        per_call_us(lambda: [traced(i) for i in range(CALLS)]),
+        per_call_us(lambda: [add(i) for i in range(CALLS)]),
+    )
+
+
+@pytest.mark.skip(reason="Performance test")
+def test_object_input_op_overhead(client):
+    traced = weave.op()(norm)
+    points = [Point(x=i, y=-i) for i in range(CALLS)]
+    report(
+        "object inputs",
+        per_call_us(lambda: [traced(p) for p in points]),
+        per_call_us(lambda: [norm(p) for p in points]),
+    )
+
+
+@pytest.mark.skip(reason="Performance test")
+def test_async_op_overhead(client):
+    traced = weave.op()(add_async)
+
+    def run(fn: typing.Callable) -> typing.Callable[[], None]:
+        async def calls() -> None:
+            for i in range(CALLS):
+                await fn(i)
+
+        return lambda: asyncio.run(calls())
+
+    report("async", per_call_us(run(traced)), per_call_us(run(add_async)))
+
+
+@pytest.mark.skip(reason="Performance test")
+def test_generator_op_overhead(client):
+    traced = weave.op()(count_to)
+    report(
+        "generator",
+        per_call_us(lambda: [list(traced(3)) for _ in range(CALLS)]),
+        per_call_us(lambda: [list(count_to(3)) for _ in range(CALLS)]),
+    )
+
+
+@pytest.mark.skip(reason="Performance test")
+def test_bound_op_overhead(client):
+    adder = Adder()
+    untraced = Adder.add.resolve_fn
+    report(
+        "bound",
+        per_call_us(lambda: [adder.add(i) for i in range(CALLS)]),
+        per_call_us(lambda: [untraced(adder, i) for i in range(CALLS)]),
+    )
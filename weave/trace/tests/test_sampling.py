@@ -0,0 +1,183 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import weave
+from weave import weave_client
+from weave.trace.env import WEAVE_CALL_VALUE_OFFLOAD_BYTES
+from weave.trace.errors import OpCallError
+from weave.trace.sampling import Sampler, SamplingPolicy, TokenBucket
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.trace_server_interface_util import bytes_digest
+
+
+def set_policy(client, policy, randoms=None):
+    client.set_sampling_policy(policy)
+    if randoms is not None:
+        client._sampler = Sampler(policy, random_fn=iter(randoms).__next__)
+
+
+def op_names(client):
+    return sorted(c.op_name.split("/")[-1].split(":")[0] for c in client.calls())
+
+
+@weave.op()
+def leaf(x: int) -> int:
+    return x
+
+
+@weave.op()
+def root(n: int) -> int:
+    return sum(leaf(i) for i in range(n))
+
+
+@weave.op()
+def failing_leaf() -> None:
+    raise ValueError("boom")
+
+
+@weave.op()
+def root_catching_failure() -> str:
+    try:
+        failing_leaf()
+    except ValueError:
+        pass
+    return "ok"
+
+
+@weave.op()
+async def async_root() -> int:
+    return leaf(1)
+
+
+@weave.op()
+def gen_root(n: int):
+    for i in range(n):
+        yield leaf(i)
+
+
+@weave.op()
+async def async_gen_root(n: int):
+    for i in range(n):
+        yield leaf(i)
+
+
+@weave.op()
+def root_with_big_input(big: list, fail: bool) -> None:
+    if fail:
+        failing_leaf()
+
+
+def test_traces_are_sampled_at_their_root(client):
+    set_policy(client, SamplingPolicy(sample_rate=0.5), randoms=[0.1, 0.9])
+    assert root(2) == 1
+    assert root(3) == 3
+    assert op_names(client) == ["leaf", "leaf", "root"]
+
+
+def test_sampled_out_async_calls_are_not_traced(client):
+    set_policy(client, SamplingPolicy(sample_rate=0.0))
+    assert asyncio.run(async_root()) == 1
+    assert op_names(client) == []
+
+
+def test_sampled_out_generator_calls_are_not_traced(client):
+    async def collect():
+        return [x async for x in async_gen_root(3)]
+
+    set_policy(client, SamplingPolicy(sample_rate=0.0))
+    assert list(gen_root(3)) == [0, 1, 2]
+    assert asyncio.run(collect()) == [0, 1, 2]
+    assert op_names(client) == []
+
+
+def test_sampled_out_calls_check_their_arguments(client):
+    set_policy(client, SamplingPolicy(sample_rate=0.0))
+    with pytest.raises(OpCallError):
+        root()
+
+
+def test_rate_limited_ops_are_not_traced(client):
+    set_policy(client, SamplingPolicy(op_rate_limits={"leaf": 1}))
+    assert root(3) == 3
+    assert op_names(client) == ["leaf", "root"]
+
+
+def test_failed_traces_are_kept(client):
+    set_policy(client, SamplingPolicy(sample_rate=0.0, keep_errors=True))
+    assert root(2) == 1
+    assert op_names(client) == []
+    assert root_catching_failure() == "ok"
+    assert op_names(client) == ["failing_leaf", "root_catching_failure"]
+
+
+def test_slow_traces_are_kept(client):
+    @weave.op()
+    def slow_leaf() -> None:
+        time.sleep(0.05)
+
+    @weave.op()
+    def slow_root() -> None:
+        slow_leaf()
+
+    set_policy(client, SamplingPolicy(sample_rate=0.0, slow_call_seconds=0.05))
+    assert root(2) == 1
+    slow_root()
+    assert op_names(client) == ["slow_leaf", "slow_root"]
+
+
+def test_discarded_traces_upload_no_files(client, monkeypatch):
+    monkeypatch.setenv(WEAVE_CALL_VALUE_OFFLOAD_BYTES, "500")
+    set_policy(client, SamplingPolicy(sample_rate=0.0, keep_errors=True))
+
+    def file_exists(big):
+        client.flush()
+        digest = bytes_digest(json.dumps(big).encode("utf-8"))
+        res = client.server.digests_exist(
+            tsi.DigestsExistReq(project_id=client._project_id(), files=[digest])
+        )
+        return res.files == [digest]
+
+    discarded = [f"discarded-{i}" for i in range(200)]
+    root_with_big_input(discarded, False)
+    assert not file_exists(discarded)
+
+    kept = [f"kept-{i}" for i in range(200)]
+    with pytest.raises(ValueError):
+        root_with_big_input(kept, True)
+    assert file_exists(kept)
+    assert op_names(client) == ["failing_leaf", "root_with_big_input"]
+
+
+def test_buffered_traces_are_bounded(client, monkeypatch):
+    monkeypatch.setattr(weave_client, "MAX_BUFFERED_TRACE_EVENTS", 3)
+
+    @weave.op()
+    def root_failing_late() -> None:
+        root(2)
+        root_catching_failure()
+
+    set_policy(client, SamplingPolicy(sample_rate=0.0, keep_errors=True))
+    # Too large to buffer until its failure
+    root_failing_late()
+    assert op_names(client) == []
+    assert root_catching_failure() == "ok"
+    assert op_names(client) == ["failing_leaf", "root_catching_failure"]
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1000, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    time.sleep(0.01)
+    assert bucket.try_acquire()
+
+
+def test_invalid_policies():
+    with pytest.raises(ValueError):
+        SamplingPolicy(sample_rate=2)
+    with pytest.raises(ValueError):
+        SamplingPolicy(op_rate_limits={"leaf": 0})
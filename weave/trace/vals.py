@@ -1,4 +1,5 @@
 import inspect
+from collections import OrderedDict
 from typing import Iterator, Literal, Any, Union, Optional, Generator, SupportsIndex
 import dataclasses
 import operator
@@ -6,6 +7,7 @@ import typing
 from pydantic import BaseModel
 from pydantic import v1 as pydantic_v1
 
+from weave.trace import object_cache
 from weave.trace.op import Op
 from weave.trace.refs import (
     RefWithExtra,
@@ -19,14 +21,13 @@ from weave.trace.refs import (
 from weave import box
 from weave.table import Table
 from weave.trace.serialize import from_json
+from weave.trace.offload import OffloadedValue
 from weave.trace.errors import InternalError
 from weave.trace.object_record import ObjectRecord
 from weave.graph_client_context import get_graph_client
 from weave.trace_server.trace_server_interface import (
     TraceServerInterface,
     _TableRowFilter,
-    TableQueryReq,
-    ObjReadReq,
 )
 
 
@@ -205,7 +206,18 @@ class TraceObject(Tracable):
 
 
 class TraceTable(Tracable):
+    """A lazily loaded table of a trace server.
+
+    Rows are read a page at a time, and only the pages that are actually
+    accessed are read, so indexing into or iterating over a large dataset
+    never holds more than a few pages in memory.
+    """
+
     filter: _TableRowFilter
+    # Number of rows read from the server at a time
+    page_size = 100
+    # Number of recently read pages kept by each table
+    max_cached_pages = 4
 
     def __init__(
         self,
@@ -214,72 +226,108 @@ class TraceTable(Tracable):
         server: TraceServerInterface,
         filter: _TableRowFilter,
         root: typing.Optional[Tracable],
+        columns: typing.Optional[typing.List[str]] = None,
     ) -> None:
         self.table_ref = table_ref
         self.filter = filter
+        self.columns = columns
         self.ref = ref  # type: ignore
         self.server: TraceServerInterface = server
         if root is None:
             root = self
         self.root = root
-        self._loaded_rows: typing.Optional[typing.List[typing.Dict]] = None
-
-    def __len__(self) -> int:
-        return len(self._all_rows())
-
-    def _all_rows(self) -> typing.List[typing.Dict]:
-        # TODO: This is not an efficient way to do this - we essentially
-        # load the entire set of rows the first time we need anything. However
-        # the previous implementation loaded the entire set of rows for every action
-        # so this is still better.
-        if self._loaded_rows == None:
-            self._loaded_rows = [row for row in self._remote_iter()]
+        self._len: typing.Optional[int] = None
+        self._pages: OrderedDict[
+            int, typing.List[typing.Tuple[str, typing.Any]]
+        ] = OrderedDict()
 
-        return typing.cast(typing.List[typing.Dict], self._loaded_rows)
+    @property
+    def _project_id(self) -> str:
+        return f"{self.table_ref.entity}/{self.table_ref.project}"
 
-    def _remote_iter(self) -> Generator[typing.Dict, None, None]:
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = object_cache.read_table_len(
+                self.server, self._project_id, self.table_ref.digest, self.filter
+            )
+        return self._len
+
+    def _page(self, page_index: int) -> typing.List[typing.Tuple[str, typing.Any]]:
+        page = self._pages.get(page_index)
+        if page is not None:
+            self._pages.move_to_end(page_index)
+            return page
+        # Tables are immutable, so their pages are shared through the object cache
+        page = object_cache.read_table_page(
+            self.server,
+            self._project_id,
+            self.table_ref.digest,
+            offset=page_index * self.page_size,
+            limit=self.page_size,
+            filter=self.filter,
+            columns=self.columns,
+        )
+        self._pages[page_index] = page
+        if len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def _make_row(self, row_digest: str, row_val: Any) -> Any:
+        new_ref = self.ref.with_item(row_digest)
+        return make_trace_obj(row_val, new_ref, self.server, self.root)
+
+    def _row(self, index: int) -> Any:
+        page_index, page_offset = divmod(index, self.page_size)
+        page = self._page(page_index)
+        if page_offset >= len(page):
+            raise IndexError("table index out of range")
+        return self._make_row(*page[page_offset])
+
+    def _remote_iter(self) -> Generator[typing.Any, None, None]:
         page_index = 0
-        page_size = 1000
-        i = 0
         while True:
-            response = self.server.table_query(
-                TableQueryReq(
-                    project_id=f"{self.table_ref.entity}/{self.table_ref.project}",
-                    digest=self.table_ref.digest,
-                    offset=page_index * page_size,
-                    limit=page_size,
-                    # filter=self.filter,
-                )
-            )
-            for item in response.rows:
-                new_ref = self.ref.with_item(item.digest)
-                yield make_trace_obj(
-                    item.val,
-                    new_ref,
-                    self.server,
-                    self.root,
-                )
-                i += 1
-            if len(response.rows) < page_size:
-                break
+            page = self._page(page_index)
+            for row_digest, row_val in page:
+                yield self._make_row(row_digest, row_val)
+            if len(page) < self.page_size:
+                return
             page_index += 1
 
     def __getitem__(self, key: Union[int, slice, str]) -> Any:
-        rows = self._all_rows()
         if isinstance(key, slice):
-            return rows[key]
+            return [self._row(i) for i in range(*key.indices(len(self)))]
         elif isinstance(key, int):
-            return rows[key]
+            if key < 0:
+                key += len(self)
+                if key < 0:
+                    raise IndexError("table index out of range")
+            return self._row(key)
         else:
-            for row in rows:
-                if row.ref.extra[-1] == key:  # type: ignore
-                    return row
-            else:
+            if self.filter.row_digests is not None and key not in (
+                self.filter.row_digests
+            ):
+                raise KeyError(f"Row ID not found: {key}")
+            rows = object_cache.read_table_page(
+                self.server,
+                self._project_id,
+                self.table_ref.digest,
+                offset=0,
+                limit=1,
+                filter=_TableRowFilter(row_digests=[key]),
+                columns=self.columns,
+            )
+            if not rows:
                 raise KeyError(f"Row ID not found: {key}")
+            return self._make_row(*rows[0])
 
     def __iter__(self) -> Generator[Any, None, None]:
-        for row in self._all_rows():
-            yield row
+        return self._remote_iter()
+
+    def select(self, columns: typing.List[str]) -> "TraceTable":
+        """Returns a view of this table that only reads the given columns."""
+        return TraceTable(
+            self.table_ref, self.ref, self.server, self.filter, self.root, columns
+        )
 
     def append(self, val: Any) -> None:
         if not isinstance(self.ref, ObjectRef):
@@ -387,19 +435,18 @@ def make_trace_obj(
         # directly attach a ref, or to our Boxed classes. We should use Tracable
         # for all of these, but for now we need to check for the ref attribute.
         return val
+    if isinstance(val, OffloadedValue):
+        loaded = val.load()
+        val = from_json(loaded, val.project_id, server) if val.decode else loaded
     # Derefence val and create the appropriate wrapper object
     extra: list[str] = []
     if isinstance(val, ObjectRef):
         new_ref = val
         extra = val.extra
-        read_res = server.obj_read(
-            ObjReadReq(
-                project_id=f"{val.entity}/{val.project}",
-                object_id=val.name,
-                digest=val.digest,
-            )
+        _, obj_val = object_cache.read_obj_val(
+            server, f"{val.entity}/{val.project}", val.name, val.digest
         )
-        val = from_json(read_res.obj.val, val.entity + "/" + val.project, server)
+        val = from_json(obj_val, val.entity + "/" + val.project, server)
 
     if isinstance(val, Table):
         val_ref = val.ref
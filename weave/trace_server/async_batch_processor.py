@@ -1,15 +1,272 @@
-from typing import Callable, Generic, List, TypeVar
-from threading import Thread, Lock, Event
-from queue import Queue
-import time
+from typing import (
+    Callable,
+    Deque,
+    Generic,
+    Hashable,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+from collections import deque
+from dataclasses import dataclass
+from threading import Thread, Lock, Event, Condition
 import atexit
+import logging
+import os
+import pickle
+import tempfile
+import time
 
 T = TypeVar("T")
 
+logger = logging.getLogger(__name__)
+
+# What to do with new items when the in-memory queue is full:
+# - "block": the caller waits until the worker makes room
+# - "drop_oldest": the oldest queued item is discarded to make room
+# - "spill": the item is written to a temporary file on disk and picked up by
+#   the worker once the in-memory queue has drained
+BackpressurePolicy = Literal["block", "drop_oldest", "spill"]
+
+
+class _SpillFile(Generic[T]):
+    """A FIFO of pickled items backed by a temporary file."""
+
+    def __init__(self, spill_dir: Optional[str] = None) -> None:
+        fd, self.path = tempfile.mkstemp(
+            prefix="weave-spill-", suffix=".bin", dir=spill_dir
+        )
+        os.close(fd)
+        self._lock = Lock()
+        self._read_offset = 0
+        self._write_offset = 0
+        self.count = 0
+
+    def write(self, item: T) -> None:
+        data = pickle.dumps(item)
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(len(data).to_bytes(8, "little"))
+                f.write(data)
+                self._write_offset = f.tell()
+            self.count += 1
+
+    def read(self, max_items: int) -> List[T]:
+        items: List[T] = []
+        with self._lock:
+            if self.count == 0:
+                return items
+            with open(self.path, "rb") as f:
+                f.seek(self._read_offset)
+                while self.count > 0 and len(items) < max_items:
+                    size = int.from_bytes(f.read(8), "little")
+                    items.append(pickle.loads(f.read(size)))
+                    self.count -= 1
+                self._read_offset = f.tell()
+            if self.count == 0:
+                # Everything has been read back, reclaim the disk space
+                open(self.path, "wb").close()
+                self._read_offset = 0
+                self._write_offset = 0
+        return items
+
+    def close(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+@dataclass
+class BatchProcessorMetrics:
+    """A point-in-time snapshot of an `AsyncBatchProcessor`."""
+
+    # Items waiting in memory or on disk (excludes items being processed)
+    queue_depth: int
+    queued_bytes: int
+    in_flight: int
+    num_processed: int
+    num_dropped: int
+    num_failed: int
+    num_batches: int
+    last_flush_latency: float
+    max_flush_latency: float
+    avg_flush_latency: float
+
+
+class _Lane(Generic[T]):
+    """An ordered queue with its own worker thread.
+
+    Items that share a partition key always land in the same lane, so they are
+    processed in the order they were enqueued, while different lanes flush
+    concurrently.
+
+    Every item gets the next sequence number of its lane. Because a lane is
+    FIFO, `done_seq` (the highest sequence number up to which every item has
+    been processed or dropped) is enough to tell whether a given item is done.
+    """
+
+    def __init__(self, owner: "AsyncBatchProcessor[T]", index: int) -> None:
+        self.owner = owner
+        # (item, size in bytes, enqueue time, sequence number)
+        self.items: Deque[Tuple[T, int, float, int]] = deque()
+        self.bytes = 0
+        self.cond = Condition()
+        self.last_seq = 0
+        # Guarded by the owner's `_done_cond`
+        self.done_seq = 0
+        # Items up to this sequence number are sent without lingering
+        self.flush_seq = 0
+        # The last sequence number of the batch being processed, if any
+        self.in_flight_seq: Optional[int] = None
+        # The last item dropped while a batch was in flight
+        self.dropped_seq = 0
+        self.spill: Optional[_SpillFile[Tuple[T, int, int]]] = None
+        if owner.backpressure_policy == "spill":
+            self.spill = _SpillFile(owner.spill_dir)
+        self.thread = Thread(
+            target=self._run, name=f"weave-batch-processor-{index}", daemon=True
+        )
+        self.thread.start()
+
+    def depth(self) -> int:
+        return len(self.items) + (self.spill.count if self.spill is not None else 0)
+
+    def _is_full(self) -> bool:
+        return 0 < self.owner.max_queue_size <= len(self.items)
+
+    def _is_ready(self) -> bool:
+        owner = self.owner
+        if self.spill is not None and self.spill.count > 0:
+            return True
+        if self.items and self.items[0][3] <= self.flush_seq:
+            return True
+        if len(self.items) >= owner.max_batch_size:
+            return True
+        return owner.max_batch_bytes is not None and self.bytes >= owner.max_batch_bytes
+
+    def put(self, item: T, size: int) -> None:
+        owner = self.owner
+        with self.cond:
+            if owner.backpressure_policy == "block":
+                while self._is_full() and self.thread.is_alive():
+                    self.cond.wait()
+            elif owner.backpressure_policy == "drop_oldest":
+                while self._is_full():
+                    _, dropped_size, _, dropped_seq = self.items.popleft()
+                    self.bytes -= dropped_size
+                    owner._record_dropped()
+                    if self.in_flight_seq is None:
+                        self._mark_done(dropped_seq)
+                    else:
+                        # Only done once the older batch in flight is
+                        self.dropped_seq = dropped_seq
+            self.last_seq += 1
+            seq = self.last_seq
+            if self.spill is not None and (self.spill.count > 0 or self._is_full()):
+                # Preserve ordering: once we have started spilling, keep
+                # spilling until the worker catches up.
+                self.spill.write((item, size, seq))
+                self.cond.notify_all()
+                return
+            self.items.append((item, size, time.monotonic(), seq))
+            self.bytes += size
+            # Wake the worker if a batch is ready, or if this is the first item
+            # so it can start the linger countdown.
+            if len(self.items) == 1 or self._is_ready():
+                self.cond.notify_all()
+
+    def _take_batch(self) -> List[T]:
+        owner = self.owner
+        batch: List[T] = []
+        batch_bytes = 0
+        while self.items and len(batch) < owner.max_batch_size:
+            item, size, _, seq = self.items[0]
+            if (
+                batch
+                and owner.max_batch_bytes is not None
+                and batch_bytes + size > owner.max_batch_bytes
+            ):
+                break
+            self.items.popleft()
+            self.bytes -= size
+            batch_bytes += size
+            batch.append(item)
+            self.in_flight_seq = seq
+        if not batch and self.spill is not None:
+            for item, _, seq in self.spill.read(owner.max_batch_size):
+                batch.append(item)
+                self.in_flight_seq = seq
+        return batch
+
+    def _wait_for_batch(self) -> Optional[List[T]]:
+        """Blocks until a batch should be sent. Returns None once stopped and drained."""
+        owner = self.owner
+        with self.cond:
+            while True:
+                if self.depth() == 0:
+                    if owner.stop_event.is_set():
+                        return None
+                    self.cond.wait()
+                    continue
+                if self._is_ready() or owner.stop_event.is_set():
+                    break
+                if not self.items:
+                    break
+                linger_deadline = self.items[0][2] + owner.min_batch_interval
+                remaining = linger_deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = self._take_batch()
+            # Make room for producers blocked on a full queue
+            self.cond.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._wait_for_batch()
+            if batch is None:
+                return
+            if batch:
+                self.owner._process(batch)
+                with self.cond:
+                    done_seq = max(self.in_flight_seq or 0, self.dropped_seq)
+                    self.in_flight_seq = None
+                    self._mark_done(done_seq)
+
+    def _mark_done(self, seq: int) -> None:
+        done_cond = self.owner._done_cond
+        with done_cond:
+            self.done_seq = max(self.done_seq, seq)
+            done_cond.notify_all()
+
+    def request_flush(self) -> int:
+        """Sends every queued item without lingering. Returns the sequence
+        number to wait for."""
+        with self.cond:
+            self.flush_seq = self.last_seq
+            self.cond.notify_all()
+            return self.flush_seq
+
+    def wake(self) -> None:
+        with self.cond:
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
+
 
 class AsyncBatchProcessor(Generic[T]):
     """
     A class that asynchronously processes batches of items using a provided processor function.
+
+    A batch is sent as soon as it reaches `max_batch_size` items or
+    `max_batch_bytes` bytes, or once its oldest item has waited
+    `min_batch_interval` seconds, whichever comes first.
     """
 
     def __init__(
@@ -17,6 +274,13 @@ class AsyncBatchProcessor(Generic[T]):
         processor_fn: Callable[[List[T]], None],
         max_batch_size: int = 100,
         min_batch_interval: float = 1.0,
+        max_queue_size: int = 0,
+        backpressure_policy: BackpressurePolicy = "block",
+        spill_dir: Optional[str] = None,
+        max_batch_bytes: Optional[int] = None,
+        item_size_fn: Optional[Callable[[T], int]] = None,
+        num_workers: int = 1,
+        partition_key_fn: Optional[Callable[[T], Optional[Hashable]]] = None,
     ) -> None:
         """
         Initializes an instance of AsyncBatchProcessor.
@@ -24,17 +288,44 @@ class AsyncBatchProcessor(Generic[T]):
         Args:
             processor_fn (Callable[[List[T]], None]): The function to process the batches of items.
             max_batch_size (int, optional): The maximum size of each batch. Defaults to 100.
-            min_batch_interval (float, optional): The minimum interval between processing batches. Defaults to 1.0.
+            min_batch_interval (float, optional): The longest an item may wait for its batch to fill up before it is sent. Defaults to 1.0.
+            max_queue_size (int, optional): The maximum number of items held in memory per worker. 0 means unbounded. Defaults to 0.
+            backpressure_policy (BackpressurePolicy, optional): What to do when the queue is full. Defaults to "block".
+            spill_dir (Optional[str], optional): Directory for the spill file when using the "spill" policy. Defaults to the system temp dir.
+            max_batch_bytes (Optional[int], optional): Send a batch once its items add up to this many bytes. Requires `item_size_fn`. Defaults to None.
+            item_size_fn (Optional[Callable[[T], int]], optional): Estimates the size of an item in bytes. Defaults to None.
+            num_workers (int, optional): Number of batches that may be in flight at once. Defaults to 1.
+            partition_key_fn (Optional[Callable[[T], Optional[Hashable]]], optional): Items with the same key are processed in order by the same worker. Defaults to None.
         """
+        if backpressure_policy not in ("block", "drop_oldest", "spill"):
+            raise ValueError(f"Unknown backpressure policy: {backpressure_policy}")
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be at least 1, got {num_workers}")
+        if max_batch_bytes is not None and item_size_fn is None:
+            raise ValueError("max_batch_bytes requires an item_size_fn")
         self.processor_fn = processor_fn
         self.max_batch_size = max_batch_size
         self.min_batch_interval = min_batch_interval
-        self.queue: Queue[T] = Queue()
+        self.max_queue_size = max_queue_size
+        self.backpressure_policy = backpressure_policy
+        self.spill_dir = spill_dir
+        self.max_batch_bytes = max_batch_bytes
+        self.item_size_fn = item_size_fn
+        self.partition_key_fn = partition_key_fn
         self.lock = Lock()
+        self._next_lane = 0
+        # Notified whenever a lane's `done_seq` advances
+        self._done_cond = Condition()
+        self._in_flight = 0
+        self.num_processed = 0
+        self.num_dropped = 0
+        self.num_failed = 0
+        self._num_batches = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
         self.stop_event = Event()  # Use an event to signal stopping
-        self.processing_thread = Thread(target=self._process_batches)
-        self.processing_thread.daemon = True
-        self.processing_thread.start()
+        self._lanes: List[_Lane[T]] = [_Lane(self, i) for i in range(num_workers)]
         atexit.register(self.wait_until_all_processed)  # Register cleanup function
 
     def enqueue(self, items: List[T]) -> None:
@@ -44,32 +335,112 @@ class AsyncBatchProcessor(Generic[T]):
         Args:
             items (List[T]): The items to be processed.
         """
+        if self.stop_event.is_set():
+            # The workers are gone (eg. after interpreter shutdown started), so
+            # process synchronously rather than silently losing the items.
+            self.processor_fn(list(items))
+            return
+        for item in items:
+            size = self.item_size_fn(item) if self.item_size_fn is not None else 0
+            self._lane_for(item).put(item, size)
+
+    def _lane_for(self, item: T) -> _Lane[T]:
+        if len(self._lanes) == 1:
+            return self._lanes[0]
+        key = self.partition_key_fn(item) if self.partition_key_fn else None
+        if key is None:
+            # No ordering requirement, spread the load
+            with self.lock:
+                self._next_lane = (self._next_lane + 1) % len(self._lanes)
+                return self._lanes[self._next_lane]
+        return self._lanes[hash(key) % len(self._lanes)]
+
+    def _process(self, batch: List[T]) -> None:
+        with self.lock:
+            self._in_flight += len(batch)
+        start = time.monotonic()
+        failed = False
+        try:
+            self.processor_fn(batch)
+        except Exception:
+            # Never let a failing batch kill the worker thread, otherwise
+            # every subsequent item would silently pile up in the queue.
+            failed = True
+            logger.exception(
+                "async_batch_processor_failed",
+                extra={"batch_size": len(batch)},
+            )
+        latency = time.monotonic() - start
         with self.lock:
-            for item in items:
-                self.queue.put(item)
+            self._in_flight -= len(batch)
+            self._num_batches += 1
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            self._total_flush_latency += latency
+            if failed:
+                self.num_failed += len(batch)
+            else:
+                self.num_processed += len(batch)
 
-    def _process_batches(self) -> None:
-        """
-        Internal method that continuously processes batches of items from the queue.
+    def _record_dropped(self) -> None:
+        with self.lock:
+            self.num_dropped += 1
+
+    def metrics(self) -> BatchProcessorMetrics:
+        """Returns queue depth, throughput and flush latency counters."""
+        queue_depth = 0
+        queued_bytes = 0
+        for lane in self._lanes:
+            with lane.cond:
+                queue_depth += lane.depth()
+                queued_bytes += lane.bytes
+        with self.lock:
+            return BatchProcessorMetrics(
+                queue_depth=queue_depth,
+                queued_bytes=queued_bytes,
+                in_flight=self._in_flight,
+                num_processed=self.num_processed,
+                num_dropped=self.num_dropped,
+                num_failed=self.num_failed,
+                num_batches=self._num_batches,
+                last_flush_latency=self._last_flush_latency,
+                max_flush_latency=self._max_flush_latency,
+                avg_flush_latency=(
+                    self._total_flush_latency / self._num_batches
+                    if self._num_batches
+                    else 0.0
+                ),
+            )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
         """
-        while True:
-            current_batch: List[T] = []
-            while not self.queue.empty() and len(current_batch) < self.max_batch_size:
-                current_batch.append(self.queue.get())
+        Blocks until every item enqueued before this call has been processed.
+        Items enqueued while waiting are not waited for, so a busy producer
+        can't keep a flush from returning.
+        Unlike `wait_until_all_processed`, the processor keeps running afterwards.
 
-            if current_batch:
-                self.processor_fn(current_batch)
+        Returns:
+            bool: False if the timeout expired before everything was processed.
+        """
+        targets = [(lane, lane.request_flush()) for lane in self._lanes]
 
-            if self.stop_event.is_set() and self.queue.empty():
-                break
+        def is_done() -> bool:
+            return all(lane.done_seq >= seq for lane, seq in targets)
 
-            # Unless we are stopping, sleep for a the min_batch_interval
-            if not self.stop_event.is_set():
-                time.sleep(self.min_batch_interval)
+        with self._done_cond:
+            if not any(lane.thread.is_alive() for lane in self._lanes):
+                return is_done()
+            return self._done_cond.wait_for(is_done, timeout)
 
     def wait_until_all_processed(self) -> None:
         """
         Waits until all enqueued items have been processed.
         """
         self.stop_event.set()
-        self.processing_thread.join()
+        for lane in self._lanes:
+            lane.wake()
+        for lane in self._lanes:
+            lane.thread.join()
+            lane.close()
+
+    close = wait_until_all_processed
@@ -0,0 +1,463 @@
+import asyncio
+import json
+import logging
+import typing as t
+
+import aiohttp
+import requests
+import tenacity
+from pydantic import BaseModel
+
+from . import trace_server_interface as tsi
+from .remote_http_trace_server import (
+    FILE_CONTENT_CHUNK_BYTES,
+    REMOTE_REQUEST_RETRY_DURATION,
+    REMOTE_REQUEST_RETRY_MAX_INTERVAL,
+    REQUEST_COMPRESSION_MIN_BYTES,
+    RemoteHTTPTraceServer,
+    ServerInfoRes,
+    _is_retryable_exception,
+    _log_failure,
+    _log_retry,
+    compress_request_body,
+    select_request_encoding,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _to_requests_response(url: str, status: int, body: bytes) -> requests.Response:
+    # Errors are surfaced as `requests.HTTPError`s so callers (and the retry
+    # policy) handle both the sync and async servers the same way.
+    r = requests.Response()
+    r.status_code = status
+    r.url = url
+    r._content = body
+    return r
+
+
+def _file_content_req_body(req: tsi.FileContentReadReq) -> bytes:
+    req_body: t.Dict[str, t.Any] = {"project_id": req.project_id, "digest": req.digest}
+    if req.offset:
+        req_body["offset"] = req.offset
+    if req.length is not None:
+        req_body["length"] = req.length
+    return json.dumps(req_body).encode("utf-8")
+
+
+_retry = tenacity.retry(
+    stop=tenacity.stop_after_delay(REMOTE_REQUEST_RETRY_DURATION),
+    wait=tenacity.wait_exponential_jitter(
+        initial=1, max=REMOTE_REQUEST_RETRY_MAX_INTERVAL
+    ),
+    retry=tenacity.retry_if_exception(_is_retryable_exception),
+    before_sleep=_log_retry,
+    retry_error_callback=_log_failure,
+    reraise=True,
+)
+
+
+class AsyncRemoteHTTPTraceServer(tsi.AsyncTraceServerInterface):
+    """An aiohttp based client for the trace server HTTP API.
+
+    Requests are sent on a pooled keep-alive `aiohttp.ClientSession` so that
+    many concurrent coroutines can trace without blocking the event loop.
+    Call starts and ends are handed to the background batcher of a
+    `RemoteHTTPTraceServer` (`sync_server`); enqueueing never does network
+    I/O, so it is safe to call from the event loop.
+    """
+
+    trace_server_url: str
+
+    def __init__(
+        self,
+        trace_server_url: str,
+        should_batch: bool = False,
+        *,
+        sync_server: t.Optional[RemoteHTTPTraceServer] = None,
+        max_connections: int = 100,
+    ):
+        """
+        Args:
+            trace_server_url: The base url of the trace server.
+            should_batch: Batch call starts and ends. Ignored if `sync_server`
+                is given.
+            sync_server: A server to share call batching, auth and request
+                compression settings with.
+            max_connections: The maximum number of concurrent connections.
+        """
+        self.trace_server_url = trace_server_url
+        if sync_server is None:
+            sync_server = RemoteHTTPTraceServer(trace_server_url, should_batch)
+        self.sync_server = sync_server
+        self.max_connections = max_connections
+        # aiohttp sessions are bound to the loop they were created on
+        self._session: t.Optional[aiohttp.ClientSession] = None
+        self._session_loop: t.Optional[asyncio.AbstractEventLoop] = None
+        self._request_encoding: t.Optional[str] = None
+        self._request_encoding_negotiated = sync_server.compression != "auto"
+        if sync_server.compression in ("gzip", "zstd"):
+            self._request_encoding = sync_server.compression
+
+    @classmethod
+    def from_sync_server(
+        cls, sync_server: RemoteHTTPTraceServer
+    ) -> "AsyncRemoteHTTPTraceServer":
+        return cls(sync_server.trace_server_url, sync_server=sync_server)
+
+    def set_auth(self, auth: t.Tuple[str, str]) -> None:
+        self.sync_server.set_auth(auth)
+
+    @property
+    def _auth(self) -> t.Optional[aiohttp.BasicAuth]:
+        auth = self.sync_server._auth
+        if auth is None:
+            return None
+        return aiohttp.BasicAuth(*auth)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop != loop:
+            if (
+                self._session is not None
+                and not self._session.closed
+                and self._session_loop is not None
+            ):
+                self._close_stale_session(self._session, self._session_loop)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+            self._session_loop = loop
+        return self._session
+
+    def _close_stale_session(
+        self, session: aiohttp.ClientSession, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        # A session can only be closed on the loop it was created on
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # The loop is stopped, so drop the pooled connections without it
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            try:
+                connector._close()
+            except RuntimeError:
+                # The loop is closed, and its transports with it
+                pass
+
+    async def flush(self, timeout: t.Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self.sync_server.flush, timeout)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # Transport
+
+    async def _negotiate_request_encoding(self) -> t.Optional[str]:
+        if self._request_encoding_negotiated:
+            return self._request_encoding
+        self._request_encoding_negotiated = True
+        try:
+            info = await self._server_info()
+        except Exception:
+            # Older servers, or not reachable right now: send uncompressed
+            logger.debug("request_encoding_negotiation_failed", exc_info=True)
+            return None
+        self._request_encoding = select_request_encoding(
+            info.accepted_request_encodings
+        )
+        return self._request_encoding
+
+    async def _post(
+        self,
+        url: str,
+        data: t.Any,
+        raw: bool = False,
+        headers: t.Optional[t.Dict[str, str]] = None,
+    ) -> bytes:
+        headers = dict(headers or {})
+        if (
+            not raw
+            and isinstance(data, bytes)
+            and len(data) >= REQUEST_COMPRESSION_MIN_BYTES
+        ):
+            data, encoding_headers = compress_request_body(
+                data, await self._negotiate_request_encoding()
+            )
+            headers.update(encoding_headers)
+        session = await self._get_session()
+        full_url = self.trace_server_url + url
+        async with session.post(
+            full_url, data=data, auth=self._auth, headers=headers
+        ) as r:
+            body = await r.read()
+            status = r.status
+        response = _to_requests_response(full_url, status, body)
+        if status == 413 and "obj/create" in url:
+            raise requests.HTTPError(
+                "413 Client Error. Request too large. Try using a weave.Dataset() object.",
+                response=response,
+            )
+        if status == 500:
+            reason_val = body.decode("utf-8", errors="replace")
+            try:
+                reason_val = json.dumps(json.loads(reason_val), indent=2)
+            except json.JSONDecodeError:
+                reason_val = f"Reason: {reason_val}"
+            raise requests.HTTPError(
+                f"500 Server Error: Internal Server Error for url: {url}. {reason_val}",
+                response=response,
+            )
+        response.raise_for_status()
+        return body
+
+    @_retry
+    async def _generic_request(
+        self,
+        url: str,
+        req: t.Union[BaseModel, t.Dict[str, t.Any]],
+        req_model: t.Type[BaseModel],
+        res_model: t.Type[BaseModel],
+    ) -> t.Any:
+        if isinstance(req, dict):
+            req = req_model.model_validate(req)
+        body = await self._post(url, req.model_dump_json(by_alias=True).encode("utf-8"))
+        return res_model.model_validate_json(body)
+
+    @_retry
+    async def server_info(self) -> ServerInfoRes:
+        return await self._server_info()
+
+    async def _server_info(self) -> ServerInfoRes:
+        session = await self._get_session()
+        async with session.get(self.trace_server_url + "/server_info") as r:
+            body = await r.read()
+            _to_requests_response(
+                self.trace_server_url + "/server_info", r.status, body
+            ).raise_for_status()
+        return ServerInfoRes.model_validate_json(body)
+
+    # Call API
+    async def call_start(
+        self, req: t.Union[tsi.CallStartReq, t.Dict[str, t.Any]]
+    ) -> tsi.CallStartRes:
+        if self.sync_server.should_batch:
+            return self.sync_server.call_start(req)
+        return await self._generic_request(
+            "/call/start", req, tsi.CallStartReq, tsi.CallStartRes
+        )
+
+    async def call_end(
+        self, req: t.Union[tsi.CallEndReq, t.Dict[str, t.Any]]
+    ) -> tsi.CallEndRes:
+        if self.sync_server.should_batch:
+            return self.sync_server.call_end(req)
+        return await self._generic_request(
+            "/call/end", req, tsi.CallEndReq, tsi.CallEndRes
+        )
+
+    async def call_read(
+        self, req: t.Union[tsi.CallReadReq, t.Dict[str, t.Any]]
+    ) -> tsi.CallReadRes:
+        return await self._generic_request(
+            "/call/read", req, tsi.CallReadReq, tsi.CallReadRes
+        )
+
+    async def calls_query(
+        self, req: t.Union[tsi.CallsQueryReq, t.Dict[str, t.Any]]
+    ) -> tsi.CallsQueryRes:
+        return await self._generic_request(
+            "/calls/query", req, tsi.CallsQueryReq, tsi.CallsQueryRes
+        )
+
+    async def calls_query_stats(
+        self, req: t.Union[tsi.CallsQueryStatsReq, t.Dict[str, t.Any]]
+    ) -> tsi.CallsQueryStatsRes:
+        return await self._generic_request(
+            "/calls/query_stats", req, tsi.CallsQueryStatsReq, tsi.CallsQueryStatsRes
+        )
+
+    async def trace_tree_read(
+        self, req: t.Union[tsi.TraceTreeReadReq, t.Dict[str, t.Any]]
+    ) -> tsi.TraceTreeReadRes:
+        return await self._generic_request(
+            "/trace/tree", req, tsi.TraceTreeReadReq, tsi.TraceTreeReadRes
+        )
+
+    async def calls_delete(
+        self, req: t.Union[tsi.CallsDeleteReq, t.Dict[str, t.Any]]
+    ) -> tsi.CallsDeleteRes:
+        return await self._generic_request(
+            "/calls/delete", req, tsi.CallsDeleteReq, tsi.CallsDeleteRes
+        )
+
+    # Op API
+
+    async def op_create(
+        self, req: t.Union[tsi.OpCreateReq, t.Dict[str, t.Any]]
+    ) -> tsi.OpCreateRes:
+        return await self._generic_request(
+            "/op/create", req, tsi.OpCreateReq, tsi.OpCreateRes
+        )
+
+    async def op_read(
+        self, req: t.Union[tsi.OpReadReq, t.Dict[str, t.Any]]
+    ) -> tsi.OpReadRes:
+        return await self._generic_request(
+            "/op/read", req, tsi.OpReadReq, tsi.OpReadRes
+        )
+
+    async def ops_query(
+        self, req: t.Union[tsi.OpQueryReq, t.Dict[str, t.Any]]
+    ) -> tsi.OpQueryRes:
+        return await self._generic_request(
+            "/ops/query", req, tsi.OpQueryReq, tsi.OpQueryRes
+        )
+
+    # Obj API
+
+    async def obj_create(
+        self, req: t.Union[tsi.ObjCreateReq, t.Dict[str, t.Any]]
+    ) -> tsi.ObjCreateRes:
+        return await self._generic_request(
+            "/obj/create", req, tsi.ObjCreateReq, tsi.ObjCreateRes
+        )
+
+    async def obj_read(
+        self, req: t.Union[tsi.ObjReadReq, t.Dict[str, t.Any]]
+    ) -> tsi.ObjReadRes:
+        return await self._generic_request(
+            "/obj/read", req, tsi.ObjReadReq, tsi.ObjReadRes
+        )
+
+    async def objs_query(
+        self, req: t.Union[tsi.ObjQueryReq, t.Dict[str, t.Any]]
+    ) -> tsi.ObjQueryRes:
+        return await self._generic_request(
+            "/objs/query", req, tsi.ObjQueryReq, tsi.ObjQueryRes
+        )
+
+    async def table_create(
+        self, req: t.Union[tsi.TableCreateReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableCreateRes:
+        return await self._generic_request(
+            "/table/create", req, tsi.TableCreateReq, tsi.TableCreateRes
+        )
+
+    async def table_rows_create(
+        self, req: t.Union[tsi.TableRowsCreateReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableRowsCreateRes:
+        return await self._generic_request(
+            "/table/rows_create", req, tsi.TableRowsCreateReq, tsi.TableRowsCreateRes
+        )
+
+    async def table_create_from_digests(
+        self, req: t.Union[tsi.TableCreateFromDigestsReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableCreateRes:
+        return await self._generic_request(
+            "/table/create_from_digests",
+            req,
+            tsi.TableCreateFromDigestsReq,
+            tsi.TableCreateRes,
+        )
+
+    async def table_query(
+        self, req: t.Union[tsi.TableQueryReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableQueryRes:
+        return await self._generic_request(
+            "/table/query", req, tsi.TableQueryReq, tsi.TableQueryRes
+        )
+
+    async def table_query_stats(
+        self, req: t.Union[tsi.TableQueryStatsReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableQueryStatsRes:
+        return await self._generic_request(
+            "/table/query_stats",
+            req,
+            tsi.TableQueryStatsReq,
+            tsi.TableQueryStatsRes,
+        )
+
+    async def refs_read_batch(
+        self, req: t.Union[tsi.RefsReadBatchReq, t.Dict[str, t.Any]]
+    ) -> tsi.RefsReadBatchRes:
+        return await self._generic_request(
+            "/refs/read_batch", req, tsi.RefsReadBatchReq, tsi.RefsReadBatchRes
+        )
+
+    async def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
+        return await self._file_create(req)
+
+    @_retry
+    async def _file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
+        form = aiohttp.FormData()
+        form.add_field("project_id", req.project_id)
+        form.add_field("file", req.content, filename=req.name)
+        body = await self._post("/files/create", form, raw=True)
+        return tsi.FileCreateRes.model_validate_json(body)
+
+    async def file_content_read(
+        self, req: tsi.FileContentReadReq
+    ) -> tsi.FileContentReadRes:
+        return await self._file_content_read(req)
+
+    @_retry
+    async def _file_content_read(
+        self, req: tsi.FileContentReadReq
+    ) -> tsi.FileContentReadRes:
+        body = await self._post(
+            "/files/content",
+            _file_content_req_body(req),
+            raw=True,
+            headers={"Content-Type": "application/json"},
+        )
+        return tsi.FileContentReadRes(content=body)
+
+    async def file_content_stream(
+        self, req: tsi.FileContentReadReq
+    ) -> t.AsyncIterator[bytes]:
+        session = await self._get_session()
+        full_url = self.trace_server_url + "/files/content"
+        async with session.post(
+            full_url,
+            data=_file_content_req_body(req),
+            auth=self._auth,
+            headers={"Content-Type": "application/json"},
+        ) as r:
+            if r.status >= 400:
+                body = await r.read()
+                _to_requests_response(full_url, r.status, body).raise_for_status()
+            async for chunk in r.content.iter_chunked(FILE_CONTENT_CHUNK_BYTES):
+                yield chunk
+
+    async def digests_exist(
+        self, req: t.Union[tsi.DigestsExistReq, t.Dict[str, t.Any]]
+    ) -> tsi.DigestsExistRes:
+        return await self._generic_request(
+            "/digests/exist", req, tsi.DigestsExistReq, tsi.DigestsExistRes
+        )
+
+    async def feedback_create(
+        self, req: t.Union[tsi.FeedbackCreateReq, t.Dict[str, t.Any]]
+    ) -> tsi.FeedbackCreateRes:
+        return await self._generic_request(
+            "/feedback/create", req, tsi.FeedbackCreateReq, tsi.FeedbackCreateRes
+        )
+
+    async def feedback_query(
+        self, req: t.Union[tsi.FeedbackQueryReq, t.Dict[str, t.Any]]
+    ) -> tsi.FeedbackQueryRes:
+        return await self._generic_request(
+            "/feedback/query", req, tsi.FeedbackQueryReq, tsi.FeedbackQueryRes
+        )
+
+    async def feedback_purge(
+        self, req: t.Union[tsi.FeedbackPurgeReq, t.Dict[str, t.Any]]
+    ) -> tsi.FeedbackPurgeRes:
+        return await self._generic_request(
+            "/feedback/purge", req, tsi.FeedbackPurgeReq, tsi.FeedbackPurgeRes
+        )
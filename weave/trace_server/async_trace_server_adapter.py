@@ -0,0 +1,132 @@
+import asyncio
+import typing
+
+from . import trace_server_interface as tsi
+
+
+class AsyncTraceServerAdapter(tsi.AsyncTraceServerInterface):
+    """Exposes a blocking `TraceServerInterface` as an `AsyncTraceServerInterface`.
+
+    Every request runs in the default executor via `asyncio.to_thread`, so the
+    event loop stays responsive while the underlying server does I/O. This is
+    how local (sqlite, clickhouse) servers are used from async code.
+    """
+
+    def __init__(self, server: tsi.TraceServerInterface) -> None:
+        self.server = server
+
+    async def ensure_project_exists(self, entity: str, project: str) -> None:
+        await asyncio.to_thread(self.server.ensure_project_exists, entity, project)
+
+    async def flush(self, timeout: typing.Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self.server.flush, timeout)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.server.close)
+
+    async def call_start(self, req: tsi.CallStartReq) -> tsi.CallStartRes:
+        return await asyncio.to_thread(self.server.call_start, req)
+
+    async def call_end(self, req: tsi.CallEndReq) -> tsi.CallEndRes:
+        return await asyncio.to_thread(self.server.call_end, req)
+
+    async def call_read(self, req: tsi.CallReadReq) -> tsi.CallReadRes:
+        return await asyncio.to_thread(self.server.call_read, req)
+
+    async def calls_query(self, req: tsi.CallsQueryReq) -> tsi.CallsQueryRes:
+        return await asyncio.to_thread(self.server.calls_query, req)
+
+    async def calls_delete(self, req: tsi.CallsDeleteReq) -> tsi.CallsDeleteRes:
+        return await asyncio.to_thread(self.server.calls_delete, req)
+
+    async def calls_query_stats(
+        self, req: tsi.CallsQueryStatsReq
+    ) -> tsi.CallsQueryStatsRes:
+        return await asyncio.to_thread(self.server.calls_query_stats, req)
+
+    async def trace_tree_read(self, req: tsi.TraceTreeReadReq) -> tsi.TraceTreeReadRes:
+        return await asyncio.to_thread(self.server.trace_tree_read, req)
+
+    async def op_create(self, req: tsi.OpCreateReq) -> tsi.OpCreateRes:
+        return await asyncio.to_thread(self.server.op_create, req)
+
+    async def op_read(self, req: tsi.OpReadReq) -> tsi.OpReadRes:
+        return await asyncio.to_thread(self.server.op_read, req)
+
+    async def ops_query(self, req: tsi.OpQueryReq) -> tsi.OpQueryRes:
+        return await asyncio.to_thread(self.server.ops_query, req)
+
+    async def obj_create(self, req: tsi.ObjCreateReq) -> tsi.ObjCreateRes:
+        return await asyncio.to_thread(self.server.obj_create, req)
+
+    async def obj_read(self, req: tsi.ObjReadReq) -> tsi.ObjReadRes:
+        return await asyncio.to_thread(self.server.obj_read, req)
+
+    async def objs_query(self, req: tsi.ObjQueryReq) -> tsi.ObjQueryRes:
+        return await asyncio.to_thread(self.server.objs_query, req)
+
+    async def table_create(self, req: tsi.TableCreateReq) -> tsi.TableCreateRes:
+        return await asyncio.to_thread(self.server.table_create, req)
+
+    async def table_rows_create(
+        self, req: tsi.TableRowsCreateReq
+    ) -> tsi.TableRowsCreateRes:
+        return await asyncio.to_thread(self.server.table_rows_create, req)
+
+    async def table_create_from_digests(
+        self, req: tsi.TableCreateFromDigestsReq
+    ) -> tsi.TableCreateRes:
+        return await asyncio.to_thread(self.server.table_create_from_digests, req)
+
+    async def table_query(self, req: tsi.TableQueryReq) -> tsi.TableQueryRes:
+        return await asyncio.to_thread(self.server.table_query, req)
+
+    async def table_query_stats(
+        self, req: tsi.TableQueryStatsReq
+    ) -> tsi.TableQueryStatsRes:
+        return await asyncio.to_thread(self.server.table_query_stats, req)
+
+    async def refs_read_batch(self, req: tsi.RefsReadBatchReq) -> tsi.RefsReadBatchRes:
+        return await asyncio.to_thread(self.server.refs_read_batch, req)
+
+    async def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
+        return await asyncio.to_thread(self.server.file_create, req)
+
+    async def file_content_read(
+        self, req: tsi.FileContentReadReq
+    ) -> tsi.FileContentReadRes:
+        return await asyncio.to_thread(self.server.file_content_read, req)
+
+    async def file_content_stream(
+        self, req: tsi.FileContentReadReq
+    ) -> typing.AsyncIterator[bytes]:
+        # Each chunk is read in a worker thread, as it may wait on I/O
+        chunks = iter(self.server.file_content_stream(req))
+        try:
+            while True:
+                chunk = await asyncio.to_thread(_next_chunk, chunks)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                await asyncio.to_thread(close)
+
+    async def digests_exist(self, req: tsi.DigestsExistReq) -> tsi.DigestsExistRes:
+        return await asyncio.to_thread(self.server.digests_exist, req)
+
+    async def feedback_create(
+        self, req: tsi.FeedbackCreateReq
+    ) -> tsi.FeedbackCreateRes:
+        return await asyncio.to_thread(self.server.feedback_create, req)
+
+    async def feedback_query(self, req: tsi.FeedbackQueryReq) -> tsi.FeedbackQueryRes:
+        return await asyncio.to_thread(self.server.feedback_query, req)
+
+    async def feedback_purge(self, req: tsi.FeedbackPurgeReq) -> tsi.FeedbackPurgeRes:
+        return await asyncio.to_thread(self.server.feedback_purge, req)
+
+
+def _next_chunk(chunks: typing.Iterator[bytes]) -> typing.Optional[bytes]:
+    return next(chunks, None)
@@ -0,0 +1,145 @@
+"""Columnar encoding of calls for `TraceServerInterface.calls_export`.
+
+Calls are exported page by page, ordered by (started_at, id), as either an
+Arrow IPC stream (one record batch per page) or a Parquet file (one row group
+per page). Dictionary valued fields (`attributes`, `inputs`, `output` and
+`summary`) are exported as JSON strings, so backends can pass their stored
+dumps through without decoding them.
+"""
+
+import datetime
+import io
+import typing
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from weave.trace_server.errors import InvalidRequest
+
+# Number of calls fetched from the database (and encoded) at a time
+CALLS_EXPORT_PAGE_SIZE = 10000
+
+CALLS_EXPORT_COLUMN_TYPES: typing.Dict[str, pa.DataType] = {
+    "project_id": pa.string(),
+    "id": pa.string(),
+    "op_name": pa.string(),
+    "trace_id": pa.string(),
+    "parent_id": pa.string(),
+    "started_at": pa.timestamp("us", tz="UTC"),
+    "ended_at": pa.timestamp("us", tz="UTC"),
+    "exception": pa.string(),
+    "attributes": pa.string(),
+    "inputs": pa.string(),
+    "output": pa.string(),
+    "summary": pa.string(),
+    "wb_user_id": pa.string(),
+    "wb_run_id": pa.string(),
+}
+
+CallsExportRow = typing.Dict[str, typing.Any]
+
+
+def export_columns(columns: typing.Optional[typing.List[str]]) -> typing.List[str]:
+    if not columns:
+        return list(CALLS_EXPORT_COLUMN_TYPES)
+    invalid = [c for c in columns if c not in CALLS_EXPORT_COLUMN_TYPES]
+    if invalid:
+        raise InvalidRequest(f"Invalid export columns: {invalid}")
+    return list(dict.fromkeys(columns))
+
+
+def export_schema(columns: typing.List[str]) -> pa.Schema:
+    return pa.schema([(c, CALLS_EXPORT_COLUMN_TYPES[c]) for c in columns])
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def encode_calls_export(
+    pages: typing.Iterable[typing.List[CallsExportRow]],
+    columns: typing.List[str],
+    format: str,
+) -> typing.Iterator[bytes]:
+    """Encodes pages of export rows, yielding the output as each page is written."""
+    schema = export_schema(columns)
+    buffer = io.BytesIO()
+    writer: typing.Union[pa.ipc.RecordBatchStreamWriter, pq.ParquetWriter]
+    if format == "arrow":
+        writer = pa.ipc.new_stream(buffer, schema)
+    elif format == "parquet":
+        writer = pq.ParquetWriter(buffer, schema)
+    else:
+        raise InvalidRequest(f"Invalid export format: {format}")
+    try:
+        for page in pages:
+            if not page:
+                continue
+            writer.write_batch(pa.RecordBatch.from_pylist(page, schema=schema))
+            yield _drain(buffer)
+    finally:
+        writer.close()
+    yield _drain(buffer)
+
+
+def paginate_calls_export(
+    read_page: typing.Callable[
+        [typing.Optional[typing.Tuple[datetime.datetime, str]], int],
+        typing.List[CallsExportRow],
+    ],
+    limit: typing.Optional[int] = None,
+    page_size: typing.Optional[int] = None,
+) -> typing.Iterator[typing.List[CallsExportRow]]:
+    """Pages through calls with a keyset on (started_at, id).
+
+    `read_page(after, n)` must return the first `n` calls (ordered by
+    started_at, id) that sort after the `after` key, or from the start when it
+    is None. Rows must include `started_at` and `id`.
+    """
+    page_size = page_size or CALLS_EXPORT_PAGE_SIZE
+    after = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        n = page_size if remaining is None else min(page_size, remaining)
+        page = read_page(after, n)
+        if page:
+            yield page
+        if len(page) < n:
+            return
+        if remaining is not None:
+            remaining -= len(page)
+        after = (page[-1]["started_at"], page[-1]["id"])
+
+
+class _ChunksReader(io.RawIOBase):
+    """Exposes an iterator of byte chunks as a readable file."""
+
+    def __init__(self, chunks: typing.Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: typing.Any) -> int:
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def read_calls_export(chunks: typing.Iterable[bytes], format: str) -> pa.Table:
+    """Decodes the output of `calls_export` into a table."""
+    if format == "arrow":
+        with pa.ipc.open_stream(io.BufferedReader(_ChunksReader(chunks))) as reader:
+            return reader.read_all()
+    # Parquet keeps its metadata in a footer, so the file has to be complete
+    return pq.read_table(pa.BufferReader(b"".join(chunks)))
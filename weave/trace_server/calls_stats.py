@@ -0,0 +1,115 @@
+"""Validation shared by the backends of grouped `calls_query_stats`.
+
+Calls are grouped by any of `CALLS_STATS_GROUP_COLUMNS`, dot-notation paths
+into their JSON fields, the start of a fixed size time bucket, and the models
+of their `summary.usage`. Each group gets the requested aggregations of
+numeric derived fields (like `latency_ms`), numeric JSON values or, when
+grouping by model, its token usage.
+The backends compile these to SQL, so only the groups leave the database.
+"""
+
+import datetime
+import typing
+
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.errors import InvalidRequest
+
+CALLS_STATS_GROUP_COLUMNS = (
+    "op_name",
+    "trace_id",
+    "parent_id",
+    "wb_user_id",
+    "wb_run_id",
+    "status",
+    "model",
+)
+CALLS_STATS_JSON_COLUMNS = ("attributes", "inputs", "output", "summary")
+
+# Group key holding the start of the time bucket of `time_bucket_seconds`
+TIME_BUCKET_KEY = "time_bucket"
+# Group key that splits each call by the models (keys) of `summary.usage`
+USAGE_MODEL_KEY = "usage_model"
+# Aggregation fields, besides JSON paths
+NUMERIC_DERIVED_FIELDS = (
+    "latency_ms",
+    "total_tokens",
+    "prompt_tokens",
+    "completion_tokens",
+)
+USAGE_FIELD_PREFIX = "usage."
+
+FIELD_AGGREGATIONS = ("sum", "avg", "min", "max", "quantile")
+
+
+def is_json_path(field: str) -> bool:
+    return any(field.startswith(col + ".") for col in CALLS_STATS_JSON_COLUMNS)
+
+
+def stats_requested(req: tsi.CallsQueryStatsReq) -> bool:
+    return bool(req.group_by or req.aggregations or req.time_bucket_seconds is not None)
+
+
+def group_keys(req: tsi.CallsQueryStatsReq) -> typing.List[str]:
+    """Returns the validated group keys, ending with the time bucket if any."""
+    keys = list(dict.fromkeys(req.group_by or []))
+    for key in keys:
+        if not (
+            key in CALLS_STATS_GROUP_COLUMNS
+            or key == USAGE_MODEL_KEY
+            or is_json_path(key)
+        ):
+            raise InvalidRequest(f"Invalid group by key: {key}")
+    if req.time_bucket_seconds is not None:
+        if req.time_bucket_seconds <= 0:
+            raise InvalidRequest("time_bucket_seconds must be positive")
+        keys.append(TIME_BUCKET_KEY)
+    return keys
+
+
+def aggregation_name(agg: tsi.CallsStatsAggregation) -> str:
+    if agg.name:
+        return agg.name
+    if agg.fn in ("count", "count_exceptions"):
+        return agg.fn
+    if agg.fn == "quantile":
+        return f"quantile({agg.quantile})({agg.field})"
+    return f"{agg.fn}({agg.field})"
+
+
+def aggregations(
+    req: tsi.CallsQueryStatsReq, keys: typing.List[str]
+) -> typing.List[typing.Tuple[str, tsi.CallsStatsAggregation]]:
+    """Returns the validated, named aggregations, counting calls by default."""
+    aggs = req.aggregations or [tsi.CallsStatsAggregation(fn="count")]
+    named: typing.List[typing.Tuple[str, tsi.CallsStatsAggregation]] = []
+    for agg in aggs:
+        if agg.fn in FIELD_AGGREGATIONS:
+            field = agg.field or ""
+            if field.startswith(USAGE_FIELD_PREFIX):
+                if USAGE_MODEL_KEY not in keys:
+                    raise InvalidRequest(
+                        f"{field} can only be aggregated when grouping by {USAGE_MODEL_KEY}"
+                    )
+            elif not (field in NUMERIC_DERIVED_FIELDS or is_json_path(field)):
+                raise InvalidRequest(f"Invalid aggregation field: {agg.field}")
+        elif agg.field is not None:
+            raise InvalidRequest(f"{agg.fn} does not take a field")
+        if agg.fn == "quantile":
+            if agg.quantile is None or not 0 <= agg.quantile <= 1:
+                raise InvalidRequest("quantile must be between 0 and 1")
+        elif agg.quantile is not None:
+            raise InvalidRequest(f"{agg.fn} does not take a quantile")
+        name = aggregation_name(agg)
+        if name in keys or name in (n for n, _ in named):
+            raise InvalidRequest(f"Duplicate stats name: {name}")
+        named.append((name, agg))
+    return named
+
+
+def bucket_start(value: typing.Union[int, datetime.datetime]) -> datetime.datetime:
+    """Returns a time bucket as a UTC datetime, given it or its epoch seconds."""
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=datetime.timezone.utc)
+        return value
+    return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
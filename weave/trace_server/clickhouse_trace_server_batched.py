@@ -22,13 +22,11 @@
 # the problem.
 
 
-from collections import defaultdict
 import threading
 from contextlib import contextmanager
 import datetime
 import json
 import typing
-import hashlib
 import dataclasses
 import logging
 from zoneinfo import ZoneInfo
@@ -41,6 +39,8 @@ from clickhouse_connect.driver.summary import QuerySummary
 import clickhouse_connect
 from pydantic import BaseModel, ValidationError
 
+from . import calls_export
+from . import calls_stats
 from . import environment as wf_env
 from . import clickhouse_trace_server_migrator as wf_migrator
 from .errors import InvalidRequest, RequestTooLarge
@@ -54,10 +54,17 @@ from .orm import Table, Column, ParamBuilder, Row
 
 
 from .trace_server_interface_util import (
+    CALLS_CURSOR_SORT_FIELDS,
+    call_tree_preorder,
+    calls_cursor_sort_by,
+    decode_calls_cursor,
+    encode_calls_cursor,
     extract_refs_from_values,
     generate_id,
     str_digest,
     bytes_digest,
+    table_digest,
+    trace_tree_columns,
     WILDCARD_ARTIFACT_VERSION_AND_PATH,
 )
 from . import trace_server_interface as tsi
@@ -75,6 +82,9 @@ FILE_CHUNK_SIZE = 100000
 
 MAX_DELETE_CALLS_COUNT = 100
 
+# Number of keys resolved per query by `refs_read_batch`
+REFS_READ_BATCH_CHUNK_SIZE = 1000
+
 
 class NotFoundError(Exception):
     pass
@@ -152,6 +162,14 @@ class SelectableCHCallSchema(BaseModel):
 
     deleted_at: typing.Optional[datetime.datetime] = None
 
+    # Derived columns, see `CALL_DERIVED_FIELDS`
+    latency_ms: typing.Optional[int] = None
+    status: typing.Optional[str] = None
+    total_tokens: typing.Optional[int] = None
+    prompt_tokens: typing.Optional[int] = None
+    completion_tokens: typing.Optional[int] = None
+    model: typing.Optional[str] = None
+
 
 all_call_insert_columns = list(
     CallStartCHInsertable.model_fields.keys()
@@ -163,8 +181,30 @@ all_call_select_columns = list(SelectableCHCallSchema.model_fields.keys())
 all_call_json_columns = ("inputs", "output", "attributes", "summary")
 
 
-# Let's just make everything required for now ... can optimize when we implement column selection
-required_call_columns = list(set(all_call_select_columns) - set([]))
+# `started_at` is required since it is the default sort key
+required_call_columns = ["project_id", "id", "started_at"]
+
+# Derived columns that need both the start and the end of a call are computed
+# from its merged columns. The others are stored in `calls_merged` when the end
+# of the call is written (see migration 005).
+_CALL_COMPUTED_COLUMN_EXPRS = {
+    "latency_ms": "toUnixTimestamp64Milli(any(ended_at)) - toUnixTimestamp64Milli(any(started_at))",
+    "status": "multiIf(isNotNull(any(exception)), 'error', isNull(any(ended_at)), 'running', 'success')",
+}
+_CALL_STORED_DERIVED_COLUMNS = (
+    "total_tokens",
+    "prompt_tokens",
+    "completion_tokens",
+    "model",
+)
+
+# Export columns that are stored as JSON dumps
+_CALLS_EXPORT_CH_COLUMNS = {
+    "attributes": "attributes_dump",
+    "inputs": "inputs_dump",
+    "output": "output_dump",
+    "summary": "summary_dump",
+}
 
 
 class ObjCHInsertable(BaseModel):
@@ -233,6 +273,8 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
     @contextmanager
     def call_batch(self) -> typing.Iterator[None]:
         # Not thread safe - do not use across threads
+        # Calls that both start and end inside the batch are written as a
+        # single complete `call_parts` row (see `_merge_call_parts_rows`).
         self._flush_immediately = False
         try:
             yield
@@ -277,7 +319,12 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
 
     def calls_query(self, req: tsi.CallsQueryReq) -> tsi.CallsQueryRes:
         stream = self.calls_query_stream(req)
-        return tsi.CallsQueryRes(calls=list(stream))
+        calls = list(stream)
+        next_cursor = None
+        cursor_sort_by = calls_cursor_sort_by(req.sort_by)
+        if cursor_sort_by and req.limit and len(calls) == req.limit:
+            next_cursor = encode_calls_cursor(cursor_sort_by, calls[-1])
+        return tsi.CallsQueryRes(calls=calls, next_cursor=next_cursor)
 
     def calls_query_stats(self, req: tsi.CallsQueryStatsReq) -> tsi.CallsQueryStatsRes:
         """Returns a stats object for the given query. This is useful for counts or other
@@ -316,9 +363,36 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             having_conditions=having_conditions,
             parameters=param_builder.get_params(),
         )
-
-        # Return the marshaled response
-        return tsi.CallsQueryStatsRes(count=stats["count"])
+        if not calls_stats.stats_requested(req):
+            # Return the marshaled response
+            return tsi.CallsQueryStatsRes(count=stats["count"])
+
+        # Then aggregate the same calls by group
+        keys = calls_stats.group_keys(req)
+        aggs = calls_stats.aggregations(req, keys)
+        key_exprs, agg_exprs, array_join, stats_fields_used = _calls_stats_exprs(
+            req, keys, aggs, param_builder
+        )
+        grouped = self._calls_query_stats_raw(
+            req.project_id,
+            columns=list(raw_fields_used | stats_fields_used),
+            start_event_conditions=start_event_conditions,
+            end_event_conditions=end_event_conditions,
+            having_conditions=having_conditions,
+            parameters=param_builder.get_params(),
+            key_exprs=key_exprs,
+            agg_exprs=agg_exprs,
+            array_join=array_join,
+        )
+        groups = []
+        for row in grouped["rows"]:
+            group = dict(zip(keys + [name for name, _ in aggs], row))
+            if calls_stats.TIME_BUCKET_KEY in group:
+                group[calls_stats.TIME_BUCKET_KEY] = calls_stats.bucket_start(
+                    group[calls_stats.TIME_BUCKET_KEY]
+                )
+            groups.append(group)
+        return tsi.CallsQueryStatsRes(count=stats["count"], groups=groups)
 
     def calls_query_stream(
         self, req: tsi.CallsQueryReq
@@ -345,6 +419,29 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             )
             having_conditions.extend(having_query_conds)
 
+        # This order-by clause creation should probably be moved into this function
+        # and passed down as a processed object. It will follow the same patterns as
+        # the filters and queries.
+        order_by: typing.Optional[typing.List[typing.Tuple[str, str]]] = (
+            None if not req.sort_by else [(s.field, s.direction) for s in req.sort_by]
+        )
+        cursor_sort_by = calls_cursor_sort_by(req.sort_by)
+        if cursor_sort_by is not None:
+            # Break ties by id so that pages are stable
+            order_by = cursor_sort_by
+        if req.cursor is not None:
+            if cursor_sort_by is None:
+                raise InvalidRequest(
+                    f"Cursors are only supported when sorting by {CALLS_CURSOR_SORT_FIELDS}"
+                )
+            start_event_conditions.append(
+                _make_calls_cursor_condition(
+                    cursor_sort_by,
+                    decode_calls_cursor(req.cursor, cursor_sort_by),
+                    param_builder,
+                )
+            )
+
         # Perform the query against the database
         ch_call_dicts = self._select_calls_query_raw(
             req.project_id,
@@ -354,14 +451,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             parameters=param_builder.get_params(),
             limit=req.limit,
             offset=req.offset,
-            # This order-by clause creation should probably be moved into this function
-            # and passed down as a processed object. It will follow the same patterns as
-            # the filters and queries.
-            order_by=(
-                None
-                if not req.sort_by
-                else [(s.field, s.direction) for s in req.sort_by]
-            ),
+            order_by=order_by,
         )
 
         # Yield the marshaled response
@@ -370,40 +460,87 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                 _ch_call_dict_to_call_schema_dict(ch_dict)
             )
 
+    def calls_export(self, req: tsi.CallsExportReq) -> typing.Iterator[bytes]:
+        columns = calls_export.export_columns(req.columns)
+        ch_columns = [_CALLS_EXPORT_CH_COLUMNS.get(c, c) for c in columns]
+        having_conditions = []
+        start_event_conditions = []
+        end_event_conditions = []
+        param_builder = ParamBuilder()
+
+        # First, apply the application filter
+        if req.filter:
+            filter_to_conditions = _process_calls_filter_to_conditions(
+                req.filter, param_builder
+            )
+            having_conditions.extend(filter_to_conditions.having_conditions)
+            start_event_conditions.extend(filter_to_conditions.start_event_conditions)
+            end_event_conditions.extend(filter_to_conditions.end_event_conditions)
+
+        # Next, apply the query filter
+        if req.query:
+            having_query_conds, fields_used = _process_query_to_conditions(
+                req.query, all_call_select_columns, all_call_json_columns, param_builder
+            )
+            having_conditions.extend(having_query_conds)
+            # The conditions refer to the merged columns by name
+            ch_columns += [c for c in fields_used if c not in ch_columns]
+
+        def read_page(
+            after: typing.Optional[typing.Tuple[datetime.datetime, str]], limit: int
+        ) -> typing.List[calls_export.CallsExportRow]:
+            page_start_event_conditions = list(start_event_conditions)
+            parameters = dict(param_builder.get_params())
+            if after is not None:
+                # Keyset pagination, so every page is as cheap as the first
+                page_start_event_conditions.append(
+                    "(started_at, id) > (fromUnixTimestamp64Micro({export_after_started_at: Int64}), {export_after_id: String})"
+                )
+                parameters["export_after_started_at"] = _datetime_to_unix_micros(
+                    after[0]
+                )
+                parameters["export_after_id"] = after[1]
+            ch_call_dicts = self._select_calls_query_raw(
+                req.project_id,
+                columns=ch_columns,
+                start_event_conditions=page_start_event_conditions,
+                end_event_conditions=end_event_conditions,
+                having_conditions=having_conditions,
+                parameters=parameters,
+                limit=limit,
+                order_by=[("started_at", "asc"), ("id", "asc")],
+            )
+            return [
+                _ch_call_dict_to_export_row(ch_dict, columns)
+                for ch_dict in ch_call_dicts
+            ]
+
+        return calls_export.encode_calls_export(
+            calls_export.paginate_calls_export(read_page, limit=req.limit),
+            columns,
+            req.format,
+        )
+
     def calls_delete(self, req: tsi.CallsDeleteReq) -> tsi.CallsDeleteRes:
         if len(req.call_ids) > MAX_DELETE_CALLS_COUNT:
             raise RequestTooLarge(
                 f"Cannot delete more than {MAX_DELETE_CALLS_COUNT} calls at once"
             )
 
-        # Note: i think this project condition is redundant
-        proj_cond = "calls_merged.project_id = {project_id: String}"
-        proj_params = {"project_id": req.project_id}
-
-        # get all parents
-        parents = self._select_calls_query(
+        # The calls and their descendants, from the traces of the calls
+        trace_calls = self._select_trace_calls_raw(
             req.project_id,
-            start_event_conditions=[
-                proj_cond,
-                "calls_merged.id IN {ids: Array(String)}",
-            ],
-            parameters=proj_params | {"ids": req.call_ids},
-        )
-
-        # get all calls with trace_ids matching parents
-        all_calls = self._select_calls_query(
-            req.project_id,
-            start_event_conditions=[
-                proj_cond,
-                "calls_merged.trace_id IN {trace_ids: Array(String)}",
-            ],
-            parameters=proj_params | {"trace_ids": [p.trace_id for p in parents]},
-        )
-
-        all_descendants = find_call_descendants(
-            root_ids=req.call_ids,
-            all_calls=all_calls,
+            columns=["id", "parent_id"],
+            trace_condition="trace_id IN (SELECT trace_id FROM calls_merged WHERE project_id = {project_id: String} AND id IN {ids: Array(String)} AND isNotNull(trace_id))",
+            parameters={"ids": req.call_ids},
         )
+        all_descendants = [
+            call_id
+            for call_id, _ in call_tree_preorder(
+                ((c["id"], c["parent_id"], c["started_at"]) for c in trace_calls),
+                root_ids=req.call_ids,
+            )
+        ]
 
         deleted_at = datetime.datetime.now()
         insertables = [
@@ -423,18 +560,57 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
 
         return tsi.CallsDeleteRes()
 
+    def trace_tree_read(self, req: tsi.TraceTreeReadReq) -> tsi.TraceTreeReadRes:
+        columns = trace_tree_columns(req)
+        parameters: typing.Dict[str, typing.Any]
+        if req.trace_id is not None:
+            trace_condition = "trace_id = {trace_id: String}"
+            parameters = {"trace_id": req.trace_id}
+            root_ids = None
+        else:
+            trace_condition = "trace_id IN (SELECT trace_id FROM calls_merged WHERE project_id = {project_id: String} AND id = {root_call_id: String} AND isNotNull(trace_id))"
+            parameters = {"root_call_id": req.root_call_id}
+            root_ids = [typing.cast(str, req.root_call_id)]
+        trace_calls = {
+            c["id"]: c
+            for c in self._select_trace_calls_raw(
+                req.project_id,
+                columns=[_CALLS_EXPORT_CH_COLUMNS.get(c, c) for c in columns],
+                trace_condition=trace_condition,
+                parameters=parameters,
+            )
+        }
+        order = call_tree_preorder(
+            ((c["id"], c["parent_id"], c["started_at"]) for c in trace_calls.values()),
+            root_ids=root_ids,
+            max_depth=req.max_depth,
+        )
+        calls = []
+        for call_id, _ in order:
+            ch_dict = trace_calls.get(call_id)
+            if ch_dict is None:
+                continue
+            # Left out by the projection
+            ch_dict.setdefault("attributes_dump", "{}")
+            ch_dict.setdefault("inputs_dump", "{}")
+            calls.append(
+                tsi.CallSchema.model_validate(
+                    _ch_call_dict_to_call_schema_dict(ch_dict)
+                )
+            )
+        return tsi.TraceTreeReadRes(calls=calls)
+
     def op_create(self, req: tsi.OpCreateReq) -> tsi.OpCreateRes:
         raise NotImplementedError()
 
     def op_read(self, req: tsi.OpReadReq) -> tsi.OpReadRes:
-        conds = [
-            "object_id = {name: String}",
-            "digest = {version_hash: String}",
-            "is_op = 1",
-        ]
+        conds = ["digest = {digest: String}", "is_op = 1"]
         parameters = {"name": req.name, "digest": req.digest}
         objs = self._select_objs_query(
-            req.project_id, conditions=conds, parameters=parameters
+            req.project_id,
+            conditions=conds,
+            object_id_conditions=["object_id = {name: String}"],
+            parameters=parameters,
         )
         if len(objs) == 0:
             raise NotFoundError(f"Obj {req.name}:{req.digest} not found")
@@ -444,9 +620,10 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
     def ops_query(self, req: tsi.OpQueryReq) -> tsi.OpQueryRes:
         parameters = {}
         conds: typing.List[str] = ["is_op = 1"]
+        object_id_conds: typing.List[str] = []
         if req.filter:
             if req.filter.op_names:
-                conds.append("object_id IN {op_names: Array(String)}")
+                object_id_conds.append("object_id IN {op_names: Array(String)}")
                 parameters["op_names"] = req.filter.op_names
 
             if req.filter.latest_only:
@@ -455,6 +632,8 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         ch_objs = self._select_objs_query(
             req.project_id,
             conditions=conds,
+            object_id_conditions=object_id_conds,
+            parameters=parameters,
         )
         objs = [_ch_obj_to_obj_schema(call) for call in ch_objs]
         return tsi.OpQueryRes(op_objs=objs)
@@ -479,10 +658,11 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             data=[list(ch_obj.model_dump().values())],
             column_names=list(ch_obj.model_fields.keys()),
         )
+        # `object_versions_index_view` adds the version to the index
         return tsi.ObjCreateRes(digest=digest)
 
     def obj_read(self, req: tsi.ObjReadReq) -> tsi.ObjReadRes:
-        conds = ["object_id = {object_id: String}"]
+        conds: typing.List[str] = []
         parameters: typing.Dict[str, typing.Union[str, int]] = {
             "object_id": req.object_id
         }
@@ -497,7 +677,10 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                 conds.append("digest = {version_digest: String}")
                 parameters["version_digest"] = req.digest
         objs = self._select_objs_query(
-            req.project_id, conditions=conds, parameters=parameters
+            req.project_id,
+            conditions=conds,
+            object_id_conditions=["object_id = {object_id: String}"],
+            parameters=parameters,
         )
         if len(objs) == 0:
             raise NotFoundError(f"Obj {req.object_id}:{req.digest} not found")
@@ -506,6 +689,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
 
     def objs_query(self, req: tsi.ObjQueryReq) -> tsi.ObjQueryRes:
         conds: list[str] = []
+        object_id_conds: list[str] = []
         parameters = {}
         if req.filter:
             if req.filter.is_op is not None:
@@ -514,7 +698,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                 else:
                     conds.append("is_op = 0")
             if req.filter.object_ids:
-                conds.append("object_id IN {object_ids: Array(String)}")
+                object_id_conds.append("object_id IN {object_ids: Array(String)}")
                 parameters["object_ids"] = req.filter.object_ids
             if req.filter.latest_only:
                 conds.append("is_latest = 1")
@@ -527,15 +711,61 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         objs = self._select_objs_query(
             req.project_id,
             conditions=conds,
+            object_id_conditions=object_id_conds,
             parameters=parameters,
         )
 
         return tsi.ObjQueryRes(objs=[_ch_obj_to_obj_schema(obj) for obj in objs])
 
     def table_create(self, req: tsi.TableCreateReq) -> tsi.TableCreateRes:
+        row_digests = self._insert_table_rows(req.table.project_id, req.table.rows)
+        digest = self._insert_table(req.table.project_id, row_digests)
+        return tsi.TableCreateRes(digest=digest)
+
+    def table_rows_create(self, req: tsi.TableRowsCreateReq) -> tsi.TableRowsCreateRes:
+        row_digests = self._insert_table_rows(req.project_id, req.rows)
+        return tsi.TableRowsCreateRes(digests=row_digests)
+
+    def table_create_from_digests(
+        self, req: tsi.TableCreateFromDigestsReq
+    ) -> tsi.TableCreateRes:
+        row_digests: typing.List[str] = []
+        if req.base_digest is not None:
+            query_result = self._query_stream(
+                """
+                SELECT row_digests
+                FROM tables
+                WHERE project_id = {project_id: String} AND digest = {digest: String}
+                LIMIT 1
+                """,
+                {"project_id": req.project_id, "digest": req.base_digest},
+            )
+            base_rows = [row[0] for row in query_result]
+            if not base_rows:
+                raise NotFoundError(f"Table {req.base_digest} not found")
+            row_digests = base_rows[0]
+        if req.remove_row_digests:
+            removed = set(req.remove_row_digests)
+            row_digests = [d for d in row_digests if d not in removed]
+        missing = set(req.row_digests) - set(
+            self.digests_exist(
+                tsi.DigestsExistReq(
+                    project_id=req.project_id,
+                    table_rows=list(set(req.row_digests)),
+                )
+            ).table_rows
+        )
+        if missing:
+            raise InvalidRequest(f"Unknown table row digests: {sorted(missing)}")
+        row_digests.extend(req.row_digests)
+        digest = self._insert_table(req.project_id, row_digests)
+        return tsi.TableCreateRes(digest=digest)
 
+    def _insert_table_rows(
+        self, project_id: str, rows: typing.List[typing.Any]
+    ) -> typing.List[str]:
         insert_rows = []
-        for r in req.table.rows:
+        for r in rows:
             if not isinstance(r, dict):
                 raise ValueError(
                     f"""Validation Error: Encountered a non-dictionary row when creating a table. Please ensure that all rows are dictionaries. Violating row:\n{r}."""
@@ -544,7 +774,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             row_digest = str_digest(row_json)
             insert_rows.append(
                 (
-                    req.table.project_id,
+                    project_id,
                     row_digest,
                     extract_refs_from_values(r),
                     row_json,
@@ -556,119 +786,134 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             data=insert_rows,
             column_names=["project_id", "digest", "refs", "val_dump"],
         )
+        return [r[1] for r in insert_rows]
 
-        row_digests = [r[1] for r in insert_rows]
-
-        table_hasher = hashlib.sha256()
-        for row_digest in row_digests:
-            table_hasher.update(row_digest.encode())
-        digest = table_hasher.hexdigest()
-
+    def _insert_table(self, project_id: str, row_digests: typing.List[str]) -> str:
+        digest = table_digest(row_digests)
         self._insert(
             "tables",
-            data=[(req.table.project_id, digest, row_digests)],
+            data=[(project_id, digest, row_digests)],
             column_names=["project_id", "digest", "row_digests"],
         )
-        return tsi.TableCreateRes(digest=digest)
+        return digest
 
     def table_query(self, req: tsi.TableQueryReq) -> tsi.TableQueryRes:
-        conds = []
-        parameters = {}
-        if req.filter:
-            if req.filter.row_digests:
-                conds.append("tr.digest IN {row_digets: Array(String)}")
-                parameters["row_digests"] = req.filter.row_digests
-        else:
-            conds.append("1 = 1")
         rows = self._table_query(
             req.project_id,
             req.digest,
-            conditions=conds,
+            row_digests=req.filter.row_digests if req.filter else None,
             limit=req.limit,
             offset=req.offset,
+            columns=req.columns,
         )
         return tsi.TableQueryRes(rows=rows)
 
+    def table_query_stats(self, req: tsi.TableQueryStatsReq) -> tsi.TableQueryStatsRes:
+        count_part = "length(row_digests)"
+        parameters: typing.Dict[str, typing.Any] = {
+            "project_id": req.project_id,
+            "digest": req.digest,
+        }
+        if req.filter and req.filter.row_digests:
+            count_part = (
+                "arrayCount(d -> has({row_digests: Array(String)}, d), row_digests)"
+            )
+            parameters["row_digests"] = req.filter.row_digests
+        query_result = self._query_stream(
+            f"""
+            SELECT {count_part}
+            FROM tables
+            WHERE project_id = {{project_id: String}} AND digest = {{digest: String}}
+            LIMIT 1
+            """,
+            parameters,
+        )
+        counts = [row[0] for row in query_result]
+        if not counts:
+            raise NotFoundError(f"Table {req.digest} not found")
+        return tsi.TableQueryStatsRes(count=counts[0])
+
     def _table_query(
         self,
         project_id: str,
         digest: str,
-        conditions: typing.Optional[typing.List[str]] = None,
+        row_digests: typing.Optional[typing.List[str]] = None,
         limit: typing.Optional[int] = None,
         offset: typing.Optional[int] = None,
-        parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        columns: typing.Optional[typing.List[str]] = None,
     ) -> typing.List[tsi.TableRowSchema]:
-        conds = ["project_id = {project_id: String}"]
-        if conditions:
-            conds.extend(conditions)
-
-        predicate = _combine_conditions(conds, "AND")
-        # The subqueries are for deduplication of table rows and tables by digest.
-        # It might be more efficient to do deduplication of table rows
-        # in the outer query instead of the right side of the JOIN clause here,
-        # that hasn't been tested yet.
-        query = f"""
-                SELECT tr.digest, tr.val_dump
-                FROM (
-                    SELECT project_id, row_digest
-                    FROM (
-                        SELECT *
-                        FROM (
-                                SELECT *,
-                                    row_number() OVER (PARTITION BY project_id, digest) AS rn
-                                FROM tables
-                                WHERE project_id = {{project_id:String}} AND digest = {{digest:String}}
-                            )
-                        WHERE rn = 1
-                        ORDER BY project_id, digest
-                    )
-                    ARRAY JOIN row_digests AS row_digest
-                    WHERE digest = {{digest:String}}
-                ) AS t
-                JOIN (
-                    SELECT project_id, digest, val_dump
-                    FROM (
-                            SELECT *,
-                                row_number() OVER (PARTITION BY project_id, digest) AS rn
-                            FROM table_rows
-                            WHERE project_id = {{project_id:String}}
-                        )
-                    WHERE rn = 1
-                    ORDER BY project_id, digest
-                ) tr ON t.project_id = tr.project_id AND t.row_digest = tr.digest
-                WHERE {predicate}
-            """
-        if parameters is None:
-            parameters = {}
-        if limit:
-            query += " LIMIT {limit: UInt64}"
+        """Reads rows of a table in order.
+
+        The row digests of the table are filtered by `row_digests` and sliced
+        to the page before any row values are read, so a page only reads its
+        own rows. Dictionary rows are narrowed to `columns`, if given, before
+        they are sent back.
+        """
+        parameters: typing.Dict[str, typing.Any] = {
+            "project_id": project_id,
+            "digest": digest,
+        }
+        digests_part = "row_digests"
+        if row_digests:
+            digests_part = (
+                "arrayFilter(d -> has({row_digests: Array(String)}, d), row_digests)"
+            )
+            parameters["row_digests"] = row_digests
+        parameters["offset"] = (offset or 0) + 1
+        if limit is not None:
+            page_digests_part = (
+                f"arraySlice({digests_part}, {{offset: UInt64}}, {{limit: UInt64}})"
+            )
             parameters["limit"] = limit
-        if offset:
-            query += " OFFSET {offset: UInt64}"
-            parameters["offset"] = offset
+        else:
+            page_digests_part = f"arraySlice({digests_part}, {{offset: UInt64}})"
+
+        val_part = "tr.val_dump"
+        if columns is not None:
+            val_part = """if(
+                JSONType(tr.val_dump) = 'Object',
+                concat('{', arrayStringConcat(arrayMap(
+                    k -> concat(toJSONString(k), ':', JSONExtractRaw(tr.val_dump, k)),
+                    arrayFilter(k -> JSONHas(tr.val_dump, k), {columns: Array(String)})
+                ), ','), '}'),
+                tr.val_dump
+            )"""
+            parameters["columns"] = list(dict.fromkeys(columns))
 
-        query_result = self.ch_client.query(
-            query,
-            parameters={
-                "project_id": project_id,
-                "digest": digest,
-                **parameters,
-            },
-        )
+        # Every copy of a table has the same rows, so any one of them will do.
+        # The page is computed once, as a scalar, and used for both the order
+        # of the rows and the lookup of their values.
+        query = f"""
+            WITH (
+                SELECT {page_digests_part}
+                FROM tables
+                WHERE project_id = {{project_id: String}} AND digest = {{digest: String}}
+                LIMIT 1
+            ) AS page_digests
+            SELECT t.row_digest, {val_part}
+            FROM (
+                SELECT row_digest, row_index
+                FROM system.one
+                ARRAY JOIN page_digests AS row_digest,
+                    arrayEnumerate(page_digests) AS row_index
+            ) AS t
+            JOIN (
+                SELECT digest, any(val_dump) AS val_dump
+                FROM table_rows
+                WHERE project_id = {{project_id: String}}
+                    AND has(page_digests, digest)
+                GROUP BY digest
+            ) AS tr ON t.row_digest = tr.digest
+            ORDER BY t.row_index
+        """
+
+        query_result = self._query_stream(query, parameters)
 
         return [
-            tsi.TableRowSchema(digest=r[0], val=json.loads(r[1]))
-            for r in query_result.result_rows
+            tsi.TableRowSchema(digest=r[0], val=json.loads(r[1])) for r in query_result
         ]
 
     def refs_read_batch(self, req: tsi.RefsReadBatchReq) -> tsi.RefsReadBatchRes:
-        # TODO: This reads one ref at a time, it should read them in batches
-        # where it can. Like it should group by object that we need to read.
-        # And it should also batch into table refs (like when we are reading a bunch
-        # of rows from a single Dataset)
-        if len(req.refs) > 1000:
-            raise ValueError("Too many refs")
-
         parsed_raw_refs = [refs_internal.parse_internal_uri(r) for r in req.refs]
         if any(isinstance(r, refs_internal.InternalTableRef) for r in parsed_raw_refs):
             raise ValueError("Table refs not supported")
@@ -676,45 +921,33 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             typing.List[refs_internal.InternalObjectRef], parsed_raw_refs
         )
 
-        root_val_cache: typing.Dict[str, typing.Any] = {}
-
-        def make_ref_cache_key(ref: refs_internal.InternalObjectRef) -> str:
-            return f"{ref.project_id}/{ref.name}/{ref.version}"
-
-        def make_obj_cache_key(obj: SelectableCHObjSchema) -> str:
-            return f"{obj.project_id}/{obj.object_id}/{obj.digest}"
+        root_val_cache: typing.Dict[typing.Tuple[str, str, str], typing.Any] = {}
 
         def get_object_refs_root_val(
             refs: list[refs_internal.InternalObjectRef],
         ) -> typing.Any:
-            conds = []
-            parameters = {}
-            for ref_index, ref in enumerate(refs):
+            # Group the refs that still need reading by project so each
+            # project is resolved with a single keyed lookup.
+            needed: typing.Dict[str, typing.Set[typing.Tuple[str, str]]] = {}
+            for ref in refs:
                 if ref.version == "latest":
                     raise ValueError("Reading refs with `latest` is not supported")
-
-                cache_key = make_ref_cache_key(ref)
-
-                if cache_key in root_val_cache:
-                    continue
-
-                object_id_param_key = "object_id_" + str(ref_index)
-                version_param_key = "version_" + str(ref_index)
-                conds.append(
-                    f"object_id = {{{object_id_param_key}: String}} AND digest = {{{version_param_key}: String}}"
-                )
-                parameters[object_id_param_key] = ref.name
-                parameters[version_param_key] = ref.version
-
-            if len(conds) > 0:
-                conditions = [_combine_conditions(conds, "OR")]
-                objs = self._select_objs_query(
-                    ref.project_id, conditions=conditions, parameters=parameters
-                )
-                for obj in objs:
-                    root_val_cache[make_obj_cache_key(obj)] = json.loads(obj.val_dump)
-
-            return [root_val_cache[make_ref_cache_key(ref)] for ref in refs]
+                if (ref.project_id, ref.name, ref.version) not in root_val_cache:
+                    needed.setdefault(ref.project_id, set()).add(
+                        (ref.name, ref.version)
+                    )
+            for project_id, keys in needed.items():
+                vals = self._read_obj_vals_by_digest(project_id, list(keys))
+                for (object_id, digest), val in vals.items():
+                    root_val_cache[(project_id, object_id, digest)] = val
+
+            result = []
+            for ref in refs:
+                key = (ref.project_id, ref.name, ref.version)
+                if key not in root_val_cache:
+                    raise NotFoundError(f"Obj {ref.name}:{ref.version} not found")
+                result.append(root_val_cache[key])
+            return result
 
         # Represents work left to do for resolving a ref
         @dataclasses.dataclass
@@ -811,11 +1044,10 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                         unresolved_table_ref=None,
                     )
 
-            # Resolve any unresolved table refs
-            # First batch the table queries by project_id and table digest
-            table_queries: dict[
-                typing.Tuple[str, str], list[typing.Tuple[int, str]]
-            ] = {}
+            # Resolve any unresolved table refs. Row digests are content
+            # addressed, so rows are looked up directly by digest, batched per
+            # project across all tables.
+            row_queries: dict[str, list[typing.Tuple[int, str]]] = {}
             for i, extra_result in enumerate(extra_results):
                 if extra_result.unresolved_table_ref is not None:
                     table_ref = extra_result.unresolved_table_ref
@@ -827,21 +1059,18 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                     )
                     if op != refs_internal.TABLE_ROW_ID_EDGE_NAME:
                         raise ValueError("Table refs must have id extra")
-                    table_queries.setdefault(
-                        (table_ref.project_id, table_ref.digest), []
-                    ).append((i, row_digest))
+                    row_queries.setdefault(table_ref.project_id, []).append(
+                        (i, row_digest)
+                    )
             # Make the queries
-            for (project_id, digest), index_digests in table_queries.items():
-                row_digests = [d for i, d in index_digests]
-                rows = self._table_query(
-                    project_id=project_id,
-                    digest=digest,
-                    conditions=["digest IN {digests: Array(String)}"],
-                    parameters={"digests": row_digests},
+            for project_id, index_digests in row_queries.items():
+                row_digest_vals = self._read_table_row_vals_by_digest(
+                    project_id, list({d for _, d in index_digests})
                 )
                 # Unpack the results into the target rows
-                row_digest_vals = {r.digest: r.val for r in rows}
                 for index, row_digest in index_digests:
+                    if row_digest not in row_digest_vals:
+                        raise NotFoundError(f"Table row {row_digest} not found")
                     extra_results[index] = PartialRefResult(
                         remaining_extra=extra_results[index].remaining_extra[2:],
                         val=row_digest_vals[row_digest],
@@ -858,6 +1087,56 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
 
         return tsi.RefsReadBatchRes(vals=[r.val for r in extra_results])
 
+    def _read_obj_vals_by_digest(
+        self, project_id: str, keys: typing.List[typing.Tuple[str, str]]
+    ) -> typing.Dict[typing.Tuple[str, str], typing.Any]:
+        """Reads object values by (object_id, digest).
+
+        Unlike `_select_objs_query`, this is a keyed lookup on the primary key
+        and does not compute version indices over every version in the project.
+        """
+        result: typing.Dict[typing.Tuple[str, str], typing.Any] = {}
+        for chunk_start in range(0, len(keys), REFS_READ_BATCH_CHUNK_SIZE):
+            chunk = keys[chunk_start : chunk_start + REFS_READ_BATCH_CHUNK_SIZE]
+            query_result = self._query_stream(
+                """
+                SELECT object_id, digest, any(val_dump)
+                FROM object_versions
+                WHERE project_id = {project_id: String}
+                    AND object_id IN {object_ids: Array(String)}
+                    AND (object_id, digest) IN {keys: Array(Tuple(String, String))}
+                GROUP BY object_id, digest
+                """,
+                {
+                    "project_id": project_id,
+                    "object_ids": list({object_id for object_id, _ in chunk}),
+                    "keys": chunk,
+                },
+            )
+            for object_id, digest, val_dump in query_result:
+                result[(object_id, digest)] = json.loads(val_dump)
+        return result
+
+    def _read_table_row_vals_by_digest(
+        self, project_id: str, row_digests: typing.List[str]
+    ) -> typing.Dict[str, typing.Any]:
+        result: typing.Dict[str, typing.Any] = {}
+        for chunk_start in range(0, len(row_digests), REFS_READ_BATCH_CHUNK_SIZE):
+            chunk = row_digests[chunk_start : chunk_start + REFS_READ_BATCH_CHUNK_SIZE]
+            query_result = self._query_stream(
+                """
+                SELECT digest, any(val_dump)
+                FROM table_rows
+                WHERE project_id = {project_id: String}
+                    AND digest IN {digests: Array(String)}
+                GROUP BY digest
+                """,
+                {"project_id": project_id, "digests": chunk},
+            )
+            for digest, val_dump in query_result:
+                result[digest] = json.loads(val_dump)
+        return result
+
     def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
         digest = bytes_digest(req.content)
         chunks = [
@@ -889,30 +1168,132 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         return tsi.FileCreateRes(digest=digest)
 
     def file_content_read(self, req: tsi.FileContentReadReq) -> tsi.FileContentReadRes:
-        # The subquery is responsible for deduplication of file chunks by digest
-        query_result = self.ch_client.query(
-            """
-            SELECT n_chunks, val_bytes
-            FROM (
-                SELECT *
-                FROM (
-                        SELECT *,
-                            row_number() OVER (PARTITION BY project_id, digest, chunk_index) AS rn
-                        FROM files
-                        WHERE project_id = {project_id:String} AND digest = {digest:String}
-                    )
-                WHERE rn = 1
-                ORDER BY project_id, digest, chunk_index
-            )
-            WHERE project_id = {project_id:String} AND digest = {digest:String}""",
-            parameters={"project_id": req.project_id, "digest": req.digest},
+        return tsi.FileContentReadRes(content=b"".join(self.file_content_stream(req)))
+
+    def file_content_stream(
+        self, req: tsi.FileContentReadReq
+    ) -> typing.Iterator[bytes]:
+        # Only the chunks that overlap the requested range are read
+        first_chunk = req.offset // FILE_CHUNK_SIZE
+        conds = [
+            "project_id = {project_id: String}",
+            "digest = {digest: String}",
+            "chunk_index >= {first_chunk: UInt32}",
+        ]
+        parameters: typing.Dict[str, typing.Any] = {
+            "project_id": req.project_id,
+            "digest": req.digest,
+            "first_chunk": first_chunk,
+        }
+        end = None
+        last_chunk = None
+        if req.length is not None:
+            if req.length <= 0:
+                return
+            end = req.offset + req.length
+            last_chunk = (end - 1) // FILE_CHUNK_SIZE
+            conds.append("chunk_index <= {last_chunk: UInt32}")
+            parameters["last_chunk"] = last_chunk
+
+        # LIMIT BY deduplicates chunks that were inserted more than once
+        query_result = self._query_stream(
+            f"""
+            SELECT n_chunks, chunk_index, val_bytes
+            FROM files
+            WHERE {_combine_conditions(conds, "AND")}
+            ORDER BY chunk_index
+            LIMIT 1 BY chunk_index
+            """,
+            parameters,
             column_formats={"val_bytes": "bytes"},
         )
-        n_chunks = query_result.result_rows[0][0]
-        chunks = [r[1] for r in query_result.result_rows]
-        if len(chunks) != n_chunks:
+        n_chunks = None
+        next_chunk = first_chunk
+        for n_chunks, chunk_index, val_bytes in query_result:
+            if chunk_index != next_chunk:
+                raise ValueError("Missing chunks")
+            chunk_start = chunk_index * FILE_CHUNK_SIZE
+            start = max(req.offset - chunk_start, 0)
+            stop = (
+                len(val_bytes)
+                if end is None
+                else min(end - chunk_start, len(val_bytes))
+            )
+            if start < stop:
+                yield val_bytes[start:stop]
+            next_chunk += 1
+
+        if n_chunks is None:
+            # Either the file doesn't exist or the range starts past its end
+            if not self.digests_exist(
+                tsi.DigestsExistReq(project_id=req.project_id, files=[req.digest])
+            ).files:
+                raise NotFoundError(f"File {req.digest} not found")
+        elif next_chunk < n_chunks and (last_chunk is None or next_chunk <= last_chunk):
             raise ValueError("Missing chunks")
-        return tsi.FileContentReadRes(content=b"".join(chunks))
+
+    def digests_exist(self, req: tsi.DigestsExistReq) -> tsi.DigestsExistRes:
+        parameters = {"project_id": req.project_id}
+
+        def existing(query: str, digests: typing.List[str]) -> typing.List[str]:
+            if not digests:
+                return []
+            found = {
+                row[0]
+                for row in self._query_stream(query, {**parameters, "digests": digests})
+            }
+            return [d for d in digests if d in found]
+
+        files = existing(
+            """
+            SELECT digest
+            FROM files
+            WHERE project_id = {project_id: String}
+                AND digest IN {digests: Array(String)}
+            GROUP BY digest
+            HAVING uniqExact(chunk_index) = any(n_chunks)
+            """,
+            req.files,
+        )
+        tables = existing(
+            """
+            SELECT DISTINCT digest
+            FROM tables
+            WHERE project_id = {project_id: String}
+                AND digest IN {digests: Array(String)}
+            """,
+            req.tables,
+        )
+        table_rows = existing(
+            """
+            SELECT DISTINCT digest
+            FROM table_rows
+            WHERE project_id = {project_id: String}
+                AND digest IN {digests: Array(String)}
+            """,
+            req.table_rows,
+        )
+        objs = []
+        if req.objs:
+            query_result = self._query_stream(
+                """
+                SELECT DISTINCT object_id, digest
+                FROM object_versions
+                WHERE project_id = {project_id: String}
+                    AND object_id IN {object_ids: Array(String)}
+                    AND digest IN {digests: Array(String)}
+                """,
+                {
+                    **parameters,
+                    "object_ids": list({o.object_id for o in req.objs}),
+                    "digests": list({o.digest for o in req.objs}),
+                },
+            )
+            found = {(row[0], row[1]) for row in query_result}
+            objs = [o for o in req.objs if (o.object_id, o.digest) in found]
+        return tsi.DigestsExistRes(
+            files=files, tables=tables, table_rows=table_rows, objs=objs
+        )
 
     def feedback_create(
         self, req: tsi.FeedbackCreateReqForInsert
@@ -1087,15 +1468,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         assert (
             set(columns) - set(all_call_select_columns) == set()
         ), f"Invalid columns: {columns}"
-        merged_cols = []
-        for col in columns:
-            if col in ["project_id", "id"]:
-                merged_cols.append(f"{col} AS {col}")
-            elif col in ["input_refs", "output_refs"]:
-                merged_cols.append(f"array_concat_agg({col}) AS {col}")
-            else:
-                merged_cols.append(f"any({col}) AS {col}")
-        select_columns_part = ", ".join(merged_cols)
+        select_columns_part = ", ".join(_merged_call_column(col) for col in columns)
 
         having_conditions_part = None
         if having_conditions:
@@ -1151,6 +1524,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                     "summary",
                     "output",
                     "output_refs",
+                    *_CALL_STORED_DERIVED_COLUMNS,
                 )
 
                 if (
@@ -1165,6 +1539,9 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
                     or field.startswith("summary.")
                 ):
                     order_by_events.add("END")
+                elif field in _CALL_COMPUTED_COLUMN_EXPRS:
+                    # Only known once calls are merged, so never the fast path
+                    order_by_events.update(["START", "END"])
                 else:
                     raise ValueError(f"Invalid order_by field: {field}")
 
@@ -1254,6 +1631,27 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         for row in raw_res:
             yield dict(zip(columns, row))
 
+    def _select_trace_calls_raw(
+        self,
+        project_id: str,
+        columns: typing.List[str],
+        trace_condition: str,
+        parameters: typing.Dict[str, typing.Any],
+    ) -> typing.List[typing.Dict]:
+        """Selects the calls of the traces matching `trace_condition`.
+
+        The condition is applied to the start of each call, before merging, so
+        reading a trace is a single pass over the calls of its project.
+        """
+        return list(
+            self._select_calls_query_raw(
+                project_id,
+                columns=list(dict.fromkeys(["parent_id", *columns])),
+                start_event_conditions=[trace_condition],
+                parameters=dict(parameters),
+            )
+        )
+
     def _calls_query_stats_raw(
         self,
         project_id: str,
@@ -1262,8 +1660,17 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         end_event_conditions: typing.Optional[typing.List[str]] = None,
         having_conditions: typing.Optional[typing.List[str]] = None,
         parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        key_exprs: typing.Optional[typing.List[str]] = None,
+        agg_exprs: typing.Optional[typing.List[str]] = None,
+        array_join: typing.Optional[str] = None,
     ) -> typing.Dict:
-        """Generates and executes a query to get stats for a calls query."""
+        """Generates and executes a query to get stats for a calls query.
+
+        Without `agg_exprs` this counts the calls. With them, it returns the
+        values of `key_exprs` and `agg_exprs` for each group of calls (after
+        the optional `array_join`) as `rows`, ordered by the keys. The
+        expressions are evaluated over the merged columns of each call.
+        """
         if not parameters:
             parameters = {}
         parameters = typing.cast(typing.Dict[str, typing.Any], parameters)
@@ -1289,26 +1696,42 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         assert (
             set(columns) - set(all_call_select_columns) == set()
         ), f"Invalid columns: {columns}"
-        merged_cols = []
-        for col in columns:
-            if col in ["project_id", "id"]:
-                merged_cols.append(f"{col} AS {col}")
-            elif col in ["input_refs", "output_refs"]:
-                merged_cols.append(f"array_concat_agg({col}) AS {col}")
-            else:
-                merged_cols.append(f"any({col}) AS {col}")
-        select_columns_part = ", ".join(merged_cols)
+        select_columns_part = ", ".join(_merged_call_column(col) for col in columns)
+
+        calls_query_str = f"""
+            SELECT {select_columns_part}
+            FROM calls_merged
+            WHERE project_id = {{project_id: String}}
+                AND {where_conditions_part}
+            GROUP BY project_id, id
+            HAVING {having_conditions_part}
+        """
+
+        if agg_exprs is not None:
+            key_exprs = key_exprs or []
+            key_aliases = [f"key_{i}" for i in range(len(key_exprs))]
+            select_part = ", ".join(
+                [f"{expr} AS {alias}" for expr, alias in zip(key_exprs, key_aliases)]
+                + agg_exprs
+            )
+            group_by_part = ""
+            if key_aliases:
+                group_by_part = f"""
+                GROUP BY {", ".join(key_aliases)}
+                ORDER BY {", ".join(key_aliases)}
+                """
+            query_str = f"""
+                SELECT {select_part}
+                FROM ({calls_query_str})
+                {array_join or ""}
+                {group_by_part}
+            """
+            raw_res = self._query(query_str, parameters)
+            return dict(rows=raw_res.result_rows)
 
         query_str = f"""
             SELECT COUNT(*)
-            FROM (
-                SELECT {select_columns_part}
-                FROM calls_merged
-                WHERE project_id = {{project_id: String}}
-                    AND {where_conditions_part}
-                GROUP BY project_id, id
-                HAVING {having_conditions_part}
-            )
+            FROM ({calls_query_str})
         """
 
         raw_res = self._query(
@@ -1327,11 +1750,23 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         conditions: typing.Optional[typing.List[str]] = None,
         limit: typing.Optional[int] = None,
         parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        object_id_conditions: typing.Optional[typing.List[str]] = None,
     ) -> typing.List[SelectableCHObjSchema]:
+        """Selects object versions using `object_versions_index`.
+
+        `conditions` may refer to `object_id`, `digest`, `kind`, `is_op`,
+        `base_object_class`, `version_index`, `version_count` and `is_latest`.
+        `object_id_conditions` may only refer to `object_id` and are applied
+        before versions are counted, which turns reads of a single object into
+        a lookup on the primary key of the index.
+        """
         if not conditions:
             conditions = ["1 = 1"]
+        if not object_id_conditions:
+            object_id_conditions = ["1 = 1"]
 
         conditions_part = _combine_conditions(conditions, "AND")
+        object_id_conditions_part = _combine_conditions(object_id_conditions, "AND")
 
         limit_part = ""
         if limit != None:
@@ -1339,91 +1774,121 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
 
         if parameters is None:
             parameters = {}
-        # The subquery is for deduplication of object versions by digest
-        query_result = self._query_stream(
-            f"""
-            SELECT
-                project_id,
-                object_id,
-                created_at,
-                kind,
-                base_object_class,
-                refs,
-                val_dump,
-                digest,
-                is_op,
-                _version_index_plus_1,
-                version_index,
-                version_count,
-                is_latest
+        # The index can hold duplicate rows until they are merged away.
+        # Versions are numbered by creation order, ties broken by digest, so
+        # concurrent creates never collide on a number.
+        index_rows = list(
+            self._query_stream(
+                f"""
+            SELECT kind, object_id, digest, version_index, version_count, is_latest
             FROM (
-                SELECT project_id,
+                SELECT kind,
                     object_id,
-                    created_at,
-                    kind,
-                    base_object_class,
-                    refs,
-                    val_dump,
-                    digest,
+                    obj_version.1 AS digest,
+                    obj_version.2 AS base_object_class,
+                    obj_version.3 AS created_at,
                     if (kind = 'op', 1, 0) AS is_op,
-                    row_number() OVER (
-                        PARTITION BY project_id,
-                        kind,
-                        object_id
-                        ORDER BY created_at ASC
-                    ) AS _version_index_plus_1,
-                    _version_index_plus_1 - 1 AS version_index,
-                    count(*) OVER (PARTITION BY project_id, kind, object_id) as version_count,
-                    if(_version_index_plus_1 = version_count, 1, 0) AS is_latest
+                    position - 1 AS version_index,
+                    length(versions) AS version_count,
+                    if(position = version_count, 1, 0) AS is_latest
                 FROM (
-                    SELECT *,
-                        row_number() OVER (
-                            PARTITION BY project_id,
-                            kind,
+                    SELECT kind,
+                        object_id,
+                        arraySort(
+                            v -> (v.3, v.1),
+                            groupArray((digest, base_object_class, created_at))
+                        ) AS versions
+                    FROM (
+                        SELECT kind,
                             object_id,
-                            digest
-                            ORDER BY created_at ASC
-                        ) AS rn
-                    FROM object_versions
-                    WHERE project_id = {{project_id: String}}
+                            digest,
+                            any(base_object_class) AS base_object_class,
+                            min(created_at) AS created_at
+                        FROM object_versions_index
+                        WHERE project_id = {{project_id: String}} AND
+                            {object_id_conditions_part}
+                        GROUP BY kind, object_id, digest
+                    )
+                    GROUP BY kind, object_id
                 )
-                WHERE rn = 1
+                ARRAY JOIN versions AS obj_version, arrayEnumerate(versions) AS position
             )
-            WHERE project_id = {{project_id: String}} AND
-                {conditions_part}
+            WHERE {conditions_part}
+            ORDER BY kind, object_id, version_index
             {limit_part}
         """,
-            {"project_id": project_id, **parameters},
+                {"project_id": project_id, **parameters},
+            )
         )
+        vals = self._read_obj_rows_by_digest(
+            project_id, [(object_id, digest) for _, object_id, digest, *_ in index_rows]
+        )
+
         result: typing.List[SelectableCHObjSchema] = []
-        for row in query_result:
+        for (
+            kind,
+            object_id,
+            digest,
+            version_index,
+            version_count,
+            is_latest,
+        ) in index_rows:
+            if (kind, object_id, digest) not in vals:
+                continue
+            created_at, base_object_class, refs, val_dump = vals[
+                (kind, object_id, digest)
+            ]
             result.append(
-                SelectableCHObjSchema.model_validate(
-                    dict(
-                        zip(
-                            [
-                                "project_id",
-                                "object_id",
-                                "created_at",
-                                "kind",
-                                "base_object_class",
-                                "refs",
-                                "val_dump",
-                                "digest",
-                                "is_op",
-                                "_version_index_plus_1",
-                                "version_index",
-                                "version_count",
-                                "is_latest",
-                            ],
-                            row,
-                        )
-                    )
+                SelectableCHObjSchema(
+                    project_id=project_id,
+                    object_id=object_id,
+                    created_at=created_at,
+                    kind=kind,
+                    base_object_class=base_object_class,
+                    refs=refs,
+                    val_dump=val_dump,
+                    digest=digest,
+                    version_index=version_index,
+                    is_latest=is_latest,
                 )
             )
 
         return result
 
+    def _read_obj_rows_by_digest(
+        self, project_id: str, keys: typing.List[typing.Tuple[str, str]]
+    ) -> typing.Dict[typing.Tuple[str, str, str], typing.Tuple[typing.Any, ...]]:
+        """Reads full object rows by (object_id, digest), keyed by (kind, object_id, digest)."""
+        result: typing.Dict[
+            typing.Tuple[str, str, str], typing.Tuple[typing.Any, ...]
+        ] = {}
+        for chunk_start in range(0, len(keys), REFS_READ_BATCH_CHUNK_SIZE):
+            chunk = keys[chunk_start : chunk_start + REFS_READ_BATCH_CHUNK_SIZE]
+            query_result = self._query_stream(
+                """
+                SELECT kind,
+                    object_id,
+                    digest,
+                    min(created_at),
+                    any(base_object_class),
+                    any(refs),
+                    any(val_dump)
+                FROM object_versions
+                WHERE project_id = {project_id: String}
+                    AND object_id IN {object_ids: Array(String)}
+                    AND (object_id, digest) IN {versions: Array(Tuple(String, String))}
+                GROUP BY kind, object_id, digest
+                """,
+                {
+                    "project_id": project_id,
+                    "object_ids": list({object_id for object_id, _ in chunk}),
+                    "versions": chunk,
+                },
+            )
+            for kind, object_id, digest, *row in query_result:
+                result[(kind, object_id, digest)] = tuple(row)
+        return result
+
     def _run_migrations(self) -> None:
         logger.info("Running migrations")
         migrator = wf_migrator.ClickHouseTraceServerMigrator(self._mint_client())
@@ -1434,7 +1899,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
         query: str,
         parameters: typing.Dict[str, typing.Any],
         column_formats: typing.Optional[typing.Dict[str, typing.Any]] = None,
-    ) -> typing.Iterator[QueryResult]:
+    ) -> typing.Iterator[typing.Tuple[typing.Any, ...]]:
         """Streams the results of a query from the database."""
         summary = None
         parameters = _process_parameters(parameters)
@@ -1507,10 +1972,71 @@ class ClickHouseTraceServer(tsi.TraceServerInterfacePostAuth):
             self._flush_calls()
 
     def _flush_calls(self) -> None:
-        self._insert_call_batch(self._call_batch)
+        self._insert_call_batch(_merge_call_parts_rows(self._call_batch))
         self._call_batch = []
 
 
+def _merge_call_parts_rows(
+    batch: typing.List[typing.List[typing.Any]],
+) -> typing.List[typing.List[typing.Any]]:
+    """Collapses the start and end rows of a call into one `call_parts` row.
+
+    `calls_merged` aggregates parts with `any` / `array_concat_agg`, so a row
+    carrying both the start and end columns is equivalent to the two separate
+    rows, but halves the number of parts that need to be merged at read time.
+    Rows are only merged when a call has exactly one start and one end row in
+    the batch; anything else (deletes, duplicates) is passed through untouched.
+    """
+    if len(batch) < 2:
+        return batch
+    project_id_ndx = all_call_insert_columns.index("project_id")
+    id_ndx = all_call_insert_columns.index("id")
+    started_at_ndx = all_call_insert_columns.index("started_at")
+    ended_at_ndx = all_call_insert_columns.index("ended_at")
+    deleted_at_ndx = all_call_insert_columns.index("deleted_at")
+
+    rows_by_call: typing.Dict[typing.Tuple[str, str], typing.List[int]] = {}
+    for row_ndx, row in enumerate(batch):
+        rows_by_call.setdefault((row[project_id_ndx], row[id_ndx]), []).append(row_ndx)
+
+    merged_rows: typing.Dict[int, typing.List[typing.Any]] = {}
+    skipped_rows: typing.Set[int] = set()
+    for row_ndxs in rows_by_call.values():
+        if len(row_ndxs) != 2:
+            continue
+        first, second = batch[row_ndxs[0]], batch[row_ndxs[1]]
+        if first[deleted_at_ndx] is not None or second[deleted_at_ndx] is not None:
+            continue
+        if first[started_at_ndx] is not None and second[ended_at_ndx] is not None:
+            start, end = first, second
+        elif second[started_at_ndx] is not None and first[ended_at_ndx] is not None:
+            start, end = second, first
+        else:
+            continue
+        if start[ended_at_ndx] is not None or end[started_at_ndx] is not None:
+            continue
+        merged = []
+        for col_ndx, col in enumerate(all_call_insert_columns):
+            if col == "input_refs":
+                merged.append(start[col_ndx])
+            elif col == "output_refs":
+                merged.append(end[col_ndx])
+            elif start[col_ndx] is not None:
+                merged.append(start[col_ndx])
+            else:
+                merged.append(end[col_ndx])
+        merged_rows[row_ndxs[0]] = merged
+        skipped_rows.add(row_ndxs[1])
+
+    if not merged_rows:
+        return batch
+    return [
+        merged_rows.get(row_ndx, row)
+        for row_ndx, row in enumerate(batch)
+        if row_ndx not in skipped_rows
+    ]
+
+
 def _dict_value_to_dump(
     value: dict,
 ) -> str:
@@ -1573,6 +2099,17 @@ def _raw_call_dict_to_ch_call(
     return SelectableCHCallSchema.model_validate(call)
 
 
+def _merged_call_column(col: str) -> str:
+    """Returns the select expression of a column of the calls grouped by id."""
+    if col in ["project_id", "id"]:
+        return f"{col} AS {col}"
+    elif col in ["input_refs", "output_refs"]:
+        return f"array_concat_agg({col}) AS {col}"
+    elif col in _CALL_COMPUTED_COLUMN_EXPRS:
+        return f"{_CALL_COMPUTED_COLUMN_EXPRS[col]} AS {col}"
+    return f"any({col}) AS {col}"
+
+
 def _ch_call_to_call_schema(ch_call: SelectableCHCallSchema) -> tsi.CallSchema:
     return tsi.CallSchema(
         project_id=ch_call.project_id,
@@ -1612,6 +2149,55 @@ def _ch_call_dict_to_call_schema_dict(ch_call_dict: typing.Dict) -> typing.Dict:
     )
 
 
+def _datetime_to_unix_micros(dt: datetime.datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return (dt - epoch) // datetime.timedelta(microseconds=1)
+
+
+def _make_calls_cursor_condition(
+    sort_by: typing.List[typing.Tuple[str, str]],
+    values: typing.List[typing.Any],
+    param_builder: ParamBuilder,
+) -> str:
+    """Matches the start events of calls that sort after the cursor.
+
+    For a sort by (a, b) this is `a > x OR (a = x AND b > y)`, with the
+    comparison flipped for descending fields.
+    """
+    keys = []
+    for (field, _), value in zip(sort_by, values):
+        if field == "started_at":
+            micros = _datetime_to_unix_micros(datetime.datetime.fromisoformat(value))
+            param_name = param_builder.add_param(micros)
+            keys.append(f"fromUnixTimestamp64Micro({{{param_name}: Int64}})")
+        else:
+            param_name = param_builder.add_param(value)
+            keys.append(f"{{{param_name}: String}}")
+
+    terms = []
+    for i, (field, direction) in enumerate(sort_by):
+        op = ">" if direction == "asc" else "<"
+        equal_prefix = [f"{f} = {key}" for (f, _), key in zip(sort_by[:i], keys[:i])]
+        terms.append(
+            _combine_conditions(equal_prefix + [f"{field} {op} {keys[i]}"], "AND")
+        )
+    return _combine_conditions(terms, "OR")
+
+
+def _ch_call_dict_to_export_row(
+    ch_call_dict: typing.Dict, columns: typing.List[str]
+) -> calls_export.CallsExportRow:
+    row = {c: ch_call_dict[_CALLS_EXPORT_CH_COLUMNS.get(c, c)] for c in columns}
+    # Export rows are also used as pagination keys
+    row["started_at"] = _ensure_datetimes_have_tz(ch_call_dict["started_at"])
+    row["id"] = ch_call_dict["id"]
+    if "ended_at" in row:
+        row["ended_at"] = _ensure_datetimes_have_tz(row["ended_at"])
+    return row
+
+
 def _ch_obj_to_obj_schema(ch_obj: SelectableCHObjSchema) -> tsi.ObjSchema:
     return tsi.ObjSchema(
         project_id=ch_obj.project_id,
@@ -1746,35 +2332,6 @@ def _combine_conditions(conditions: typing.List[str], operator: str) -> str:
     return f"({combined})"
 
 
-def find_call_descendants(
-    root_ids: typing.List[str],
-    all_calls: typing.List[SelectableCHCallSchema],
-) -> typing.List[str]:
-    # make a map of call_id to children list
-    children_map = defaultdict(list)
-    for call in all_calls:
-        if call.parent_id is not None:
-            children_map[call.parent_id].append(call.id)
-
-    # do DFS to get all descendants
-    def find_all_descendants(root_ids: typing.List[str]) -> typing.Set[str]:
-        descendants = set()
-        stack = root_ids
-
-        while stack:
-            current_id = stack.pop()
-            if current_id not in descendants:
-                descendants.add(current_id)
-                stack += children_map.get(current_id, [])
-
-        return descendants
-
-    # Find descendants for each initial id
-    descendants = find_all_descendants(root_ids)
-
-    return list(descendants)
-
-
 def _python_value_to_ch_type(value: typing.Any) -> str:
     """Helper function to convert python types to clickhouse types."""
     if isinstance(value, str):
@@ -1881,6 +2438,80 @@ def _transform_external_field_to_internal_field(
     return field, param_builder, raw_fields_used
 
 
+def _calls_stats_exprs(
+    req: tsi.CallsQueryStatsReq,
+    keys: typing.List[str],
+    aggs: typing.List[typing.Tuple[str, tsi.CallsStatsAggregation]],
+    param_builder: ParamBuilder,
+) -> tuple[typing.List[str], typing.List[str], typing.Optional[str], set[str]]:
+    """Compiles the groups and aggregations of a stats request.
+
+    Returns the key expressions, the aggregate expressions, the ARRAY JOIN
+    clause (when grouping by usage model) and the raw columns used.
+    """
+    fields_used: set[str] = set()
+    # Usage models are the keys of `summary.usage`, each call is repeated once
+    # per model before grouping.
+    usage_json = "ifNull(summary_dump, '{}')"
+    array_join = None
+
+    def json_expr(field: str, cast: typing.Optional[str]) -> str:
+        expr, _, raw_fields = _transform_external_field_to_internal_field(
+            field, all_call_select_columns, all_call_json_columns, cast, param_builder
+        )
+        fields_used.update(raw_fields)
+        return expr
+
+    key_exprs = []
+    for key in keys:
+        if key == calls_stats.TIME_BUCKET_KEY:
+            seconds_param = param_builder.add_param(req.time_bucket_seconds)
+            key_exprs.append(
+                f"toStartOfInterval(started_at, toIntervalSecond({{{seconds_param}:UInt64}}))"
+            )
+            fields_used.add("started_at")
+        elif key == calls_stats.USAGE_MODEL_KEY:
+            array_join = (
+                f"ARRAY JOIN JSONExtractKeys({usage_json}, 'usage') AS usage_model"
+            )
+            key_exprs.append("usage_model")
+            fields_used.add("summary_dump")
+        elif key in calls_stats.CALLS_STATS_GROUP_COLUMNS:
+            key_exprs.append(key)
+            fields_used.add(key)
+        else:
+            # Missing values are grouped together as NULL, like in SQLite
+            key_exprs.append(f"nullIf({json_expr(key, None)}, '')")
+
+    agg_exprs = []
+    for _, agg in aggs:
+        if agg.fn == "count":
+            agg_exprs.append("count()")
+            continue
+        if agg.fn == "count_exceptions":
+            agg_exprs.append("countIf(exception IS NOT NULL)")
+            fields_used.add("exception")
+            continue
+        field = typing.cast(str, agg.field)
+        if field in calls_stats.NUMERIC_DERIVED_FIELDS:
+            value_expr = field
+            fields_used.add(field)
+        elif field.startswith(calls_stats.USAGE_FIELD_PREFIX):
+            usage_key_param = param_builder.add_param(
+                field[len(calls_stats.USAGE_FIELD_PREFIX) :]
+            )
+            value_expr = f"JSONExtract({usage_json}, 'usage', usage_model, {{{usage_key_param}:String}}, 'Nullable(Float64)')"
+        else:
+            value_expr = json_expr(field, "float")
+        if agg.fn == "quantile":
+            # The level of a parametric aggregate has to be a literal
+            level = float(typing.cast(float, agg.quantile))
+            agg_exprs.append(f"quantile({level!r})({value_expr})")
+        else:
+            agg_exprs.append(f"{agg.fn}({value_expr})")
+    return key_exprs, agg_exprs, array_join, fields_used
+
+
 class FilterToConditions(BaseModel):
     having_conditions: list[str]
     start_event_conditions: list[str]
@@ -1976,6 +2607,13 @@ def _process_calls_filter_to_conditions(
         )
         raw_fields_used.add("wb_run_id")
 
+    if filter.cache_keys:
+        # `cache_key` is only used in the conditions of the start event, so
+        # it isn't a field of the calls that are read
+        start_event_conditions.append(
+            f"calls_merged.cache_key IN {_param_slot(param_builder.add_param(filter.cache_keys), 'Array(String)')}"
+        )
+
     return FilterToConditions(
         having_conditions=having_conditions,
         start_event_conditions=start_event_conditions,
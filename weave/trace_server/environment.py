@@ -1,4 +1,5 @@
 import os
+import typing
 
 
 def wf_clickhouse_host() -> str:
@@ -29,3 +30,38 @@ def wf_clickhouse_database() -> str:
 def wf_trace_server_url() -> str:
     """The url of the web server exposing the trace interface endpoints"""
     return os.environ.get("WF_TRACE_SERVER_URL", "https://trace.wandb.ai")
+
+
+def wf_trace_server_batch_interval() -> float:
+    """The maximum time (in seconds) a call event waits in the client before being sent"""
+    return float(os.environ.get("WF_TRACE_SERVER_BATCH_INTERVAL", 1.0))
+
+
+def wf_trace_server_max_queue_size() -> int:
+    """The maximum number of call events buffered in the client. 0 means unbounded."""
+    return int(os.environ.get("WF_TRACE_SERVER_MAX_QUEUE_SIZE", 0))
+
+
+def wf_trace_server_batch_workers() -> int:
+    """The number of call event batches the client may have in flight at once"""
+    return int(os.environ.get("WF_TRACE_SERVER_BATCH_WORKERS", 1))
+
+
+def wf_trace_server_spool_dir() -> typing.Optional[str]:
+    """Directory of the client write-ahead spool. Unset disables spooling."""
+    return os.environ.get("WF_TRACE_SERVER_SPOOL_DIR") or None
+
+
+def wf_trace_server_spool_max_bytes() -> int:
+    """The maximum size (in bytes) of the client write-ahead spool"""
+    return int(os.environ.get("WF_TRACE_SERVER_SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+
+
+def wf_trace_server_request_compression() -> str:
+    """Compression of request bodies: `auto` (negotiated with the server), `none`, `gzip` or `zstd`"""
+    return os.environ.get("WF_TRACE_SERVER_REQUEST_COMPRESSION", "auto")
+
+
+def wf_trace_server_backpressure_policy() -> str:
+    """What to do when the client buffer is full: `block`, `drop_oldest` or `spill`"""
+    return os.environ.get("WF_TRACE_SERVER_BACKPRESSURE_POLICY", "block")
@@ -0,0 +1 @@
+DROP TABLE object_versions_index;
@@ -0,0 +1,59 @@
+/*
+`object_versions_index` assigns each (project_id, kind, object_id, digest) its
+version number when the object is created, so resolving `latest` or `v12`
+does not need to number every version of every object in the project.
+It deliberately does not hold `val_dump` so that scanning all versions of an
+object stays cheap.
+*/
+CREATE TABLE object_versions_index (
+    project_id String,
+    kind Enum('op', 'object'),
+    object_id String,
+    digest String,
+    base_object_class String NULL,
+    /*
+    `version_index`: 0-based position of the digest among the versions of
+    the object, in creation order.
+    */
+    version_index UInt64,
+    created_at DateTime64(3) DEFAULT now64(3)
+) ENGINE = ReplacingMergeTree()
+ORDER BY (project_id, kind, object_id, digest);
+
+/*
+Backfill the index for objects created before this migration.
+*/
+INSERT INTO object_versions_index (
+    project_id,
+    kind,
+    object_id,
+    digest,
+    base_object_class,
+    version_index,
+    created_at
+)
+SELECT project_id,
+    kind,
+    object_id,
+    digest,
+    base_object_class,
+    row_number() OVER (
+        PARTITION BY project_id,
+        kind,
+        object_id
+        ORDER BY created_at ASC
+    ) - 1 AS version_index,
+    created_at
+FROM (
+        SELECT project_id,
+            kind,
+            object_id,
+            digest,
+            any(base_object_class) AS base_object_class,
+            min(created_at) AS created_at
+        FROM object_versions
+        GROUP BY project_id,
+            kind,
+            object_id,
+            digest
+    );
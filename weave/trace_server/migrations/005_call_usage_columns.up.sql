@@ -0,0 +1,66 @@
+/*
+This migration adds token usage columns to calls_merged, extracted from
+`summary.usage` when the end of a call is written, so that calls can be sorted
+and filtered by them without parsing `summary_dump`:
+    * `total_tokens`, `prompt_tokens`, `completion_tokens`: summed over the
+      models in `summary.usage`
+    * `model`: the first model in `summary.usage`
+(`latency_ms` and `status` need both the start and the end of a call, so they
+are computed from the merged columns when queried.)
+*/
+
+ALTER TABLE calls_merged
+    ADD COLUMN total_tokens SimpleAggregateFunction(any, Nullable(Int64)),
+    ADD COLUMN prompt_tokens SimpleAggregateFunction(any, Nullable(Int64)),
+    ADD COLUMN completion_tokens SimpleAggregateFunction(any, Nullable(Int64)),
+    ADD COLUMN model SimpleAggregateFunction(any, Nullable(String));
+
+ALTER TABLE calls_merged_view MODIFY QUERY
+    SELECT project_id,
+        id,
+        anySimpleState(wb_run_id) as wb_run_id,
+        anySimpleStateIf(wb_user_id, isNotNull(call_parts.started_at)) as wb_user_id,
+        anySimpleState(trace_id) as trace_id,
+        anySimpleState(parent_id) as parent_id,
+        anySimpleState(op_name) as op_name,
+        anySimpleState(started_at) as started_at,
+        anySimpleState(attributes_dump) as attributes_dump,
+        anySimpleState(inputs_dump) as inputs_dump,
+        array_concat_aggSimpleState(input_refs) as input_refs,
+        anySimpleState(ended_at) as ended_at,
+        anySimpleState(output_dump) as output_dump,
+        anySimpleState(summary_dump) as summary_dump,
+        anySimpleState(exception) as exception,
+        array_concat_aggSimpleState(output_refs) as output_refs,
+        anySimpleState(deleted_at) as deleted_at,
+        -- **** Add the usage columns to the view ****
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'total_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as total_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'prompt_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as prompt_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'completion_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as completion_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, nullIf(
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage')[1], ''))) as model
+    FROM call_parts
+    GROUP BY project_id,
+        id;
+
+/*
+Backfill the usage columns of calls that ended before this migration.
+*/
+ALTER TABLE calls_merged UPDATE
+    total_tokens = arraySum(arrayMap(
+        m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'total_tokens'),
+        JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))),
+    prompt_tokens = arraySum(arrayMap(
+        m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'prompt_tokens'),
+        JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))),
+    completion_tokens = arraySum(arrayMap(
+        m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'completion_tokens'),
+        JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))),
+    model = nullIf(JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage')[1], '')
+WHERE isNotNull(summary_dump);
@@ -0,0 +1,3 @@
+DROP VIEW object_versions_index_view;
+
+ALTER TABLE object_versions_index ADD COLUMN version_index UInt64 DEFAULT 0;
@@ -0,0 +1,16 @@
+/*
+Version numbers are derived from creation order when objects are read, so
+`object_versions_index` no longer stores them. This means two objects created
+at the same time can't be given the same number, and lets the index be filled
+by a materialized view, so creating an object is a single insert.
+*/
+ALTER TABLE object_versions_index DROP COLUMN version_index;
+
+CREATE MATERIALIZED VIEW object_versions_index_view TO object_versions_index AS
+SELECT project_id,
+    kind,
+    object_id,
+    digest,
+    base_object_class,
+    created_at
+FROM object_versions;
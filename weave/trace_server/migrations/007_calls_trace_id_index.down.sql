@@ -0,0 +1 @@
+ALTER TABLE calls_merged DROP INDEX idx_trace_id;
@@ -0,0 +1,9 @@
+/*
+`calls_merged` is ordered by (project_id, id), so reading the calls of a trace
+(`trace_tree_read`) otherwise scans every call of the project. The bloom
+filter lets ClickHouse skip the granules that can't hold the trace.
+*/
+ALTER TABLE calls_merged
+    ADD INDEX idx_trace_id trace_id TYPE bloom_filter GRANULARITY 1;
+
+ALTER TABLE calls_merged MATERIALIZE INDEX idx_trace_id;
@@ -0,0 +1,37 @@
+ALTER TABLE calls_merged DROP INDEX idx_cache_key;
+
+ALTER TABLE calls_merged_view MODIFY QUERY
+    SELECT project_id,
+        id,
+        anySimpleState(wb_run_id) as wb_run_id,
+        anySimpleStateIf(wb_user_id, isNotNull(call_parts.started_at)) as wb_user_id,
+        anySimpleState(trace_id) as trace_id,
+        anySimpleState(parent_id) as parent_id,
+        anySimpleState(op_name) as op_name,
+        anySimpleState(started_at) as started_at,
+        anySimpleState(attributes_dump) as attributes_dump,
+        anySimpleState(inputs_dump) as inputs_dump,
+        array_concat_aggSimpleState(input_refs) as input_refs,
+        anySimpleState(ended_at) as ended_at,
+        anySimpleState(output_dump) as output_dump,
+        anySimpleState(summary_dump) as summary_dump,
+        anySimpleState(exception) as exception,
+        array_concat_aggSimpleState(output_refs) as output_refs,
+        anySimpleState(deleted_at) as deleted_at,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'total_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as total_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'prompt_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as prompt_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'completion_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as completion_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, nullIf(
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage')[1], ''))) as model
+        -- **** remove the cache key from the view ****
+    FROM call_parts
+    GROUP BY project_id,
+        id;
+
+ALTER TABLE calls_merged DROP COLUMN cache_key;
@@ -0,0 +1,58 @@
+/*
+This migration adds a `cache_key` column to calls_merged, extracted from the
+`weave_cache_key` attribute that calls of cached ops (`@weave.op(cache=...)`)
+record when they start. Looking up a cached output otherwise parses the
+attributes of every call of the project. The bloom filter lets ClickHouse skip
+the granules that can't hold the key.
+*/
+
+ALTER TABLE calls_merged
+    ADD COLUMN cache_key SimpleAggregateFunction(any, Nullable(String));
+
+ALTER TABLE calls_merged_view MODIFY QUERY
+    SELECT project_id,
+        id,
+        anySimpleState(wb_run_id) as wb_run_id,
+        anySimpleStateIf(wb_user_id, isNotNull(call_parts.started_at)) as wb_user_id,
+        anySimpleState(trace_id) as trace_id,
+        anySimpleState(parent_id) as parent_id,
+        anySimpleState(op_name) as op_name,
+        anySimpleState(started_at) as started_at,
+        anySimpleState(attributes_dump) as attributes_dump,
+        anySimpleState(inputs_dump) as inputs_dump,
+        array_concat_aggSimpleState(input_refs) as input_refs,
+        anySimpleState(ended_at) as ended_at,
+        anySimpleState(output_dump) as output_dump,
+        anySimpleState(summary_dump) as summary_dump,
+        anySimpleState(exception) as exception,
+        array_concat_aggSimpleState(output_refs) as output_refs,
+        anySimpleState(deleted_at) as deleted_at,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'total_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as total_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'prompt_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as prompt_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, arraySum(arrayMap(
+            m -> JSONExtractInt(ifNull(summary_dump, '{}'), 'usage', m, 'completion_tokens'),
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage'))))) as completion_tokens,
+        anySimpleState(if(isNull(summary_dump), NULL, nullIf(
+            JSONExtractKeys(ifNull(summary_dump, '{}'), 'usage')[1], ''))) as model,
+        -- **** Add the cache key to the view ****
+        anySimpleState(JSONExtract(
+            ifNull(attributes_dump, '{}'), 'weave_cache_key', 'Nullable(String)')) as cache_key
+    FROM call_parts
+    GROUP BY project_id,
+        id;
+
+/*
+Backfill the cache keys of calls that started before this migration.
+*/
+ALTER TABLE calls_merged UPDATE
+    cache_key = JSONExtract(ifNull(attributes_dump, '{}'), 'weave_cache_key', 'Nullable(String)')
+WHERE isNotNull(attributes_dump) AND JSONHas(attributes_dump, 'weave_cache_key');
+
+ALTER TABLE calls_merged
+    ADD INDEX idx_cache_key cache_key TYPE bloom_filter GRANULARITY 1;
+
+ALTER TABLE calls_merged MATERIALIZE INDEX idx_cache_key;
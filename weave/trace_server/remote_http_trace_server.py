@@ -1,9 +1,12 @@
-import io
+from collections import OrderedDict
+import gzip
 import json
 import sys
+import threading
 import typing as t
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, PrivateAttr, ValidationError
 import requests
+from requests.adapters import HTTPAdapter
 import tenacity
 import logging
 
@@ -11,20 +14,32 @@ from weave.trace_server import environment as wf_env
 
 
 from weave.wandb_interface import project_creator
-from .async_batch_processor import AsyncBatchProcessor
+from .async_batch_processor import AsyncBatchProcessor, BackpressurePolicy
+from .write_ahead_spool import SpoolRecord, WriteAheadSpool
 from . import trace_server_interface as tsi
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
 logger = logging.getLogger(__name__)
 
 
 class StartBatchItem(BaseModel):
     mode: str = "start"
     req: tsi.CallStartReq
+    # Id of the write-ahead spool record holding this item, if spooling
+    _spool_id: t.Optional[int] = PrivateAttr(default=None)
+    # JSON of this item, if it was already serialized for the spool
+    _json: t.Optional[str] = PrivateAttr(default=None)
 
 
 class EndBatchItem(BaseModel):
     mode: str = "end"
     req: tsi.CallEndReq
+    _spool_id: t.Optional[int] = PrivateAttr(default=None)
+    _json: t.Optional[str] = PrivateAttr(default=None)
 
 
 class Batch(BaseModel):
@@ -33,12 +48,38 @@ class Batch(BaseModel):
 
 class ServerInfoRes(BaseModel):
     min_required_weave_python_version: str
+    # Content-Encodings the server can decode in request bodies
+    accepted_request_encodings: t.List[str] = []
+
+
+# "auto" uses the best encoding advertised by `/server_info`
+RequestCompression = t.Literal["auto", "none", "gzip", "zstd"]
+
+# Bodies smaller than this are not worth compressing
+REQUEST_COMPRESSION_MIN_BYTES = 1024
+
+# Size of the chunks in which `calls_export` responses are read
+CALLS_EXPORT_CHUNK_BYTES = 1024 * 1024
+
+# Size of the chunks in which `file_content_stream` responses are read
+FILE_CONTENT_CHUNK_BYTES = 1024 * 1024
 
 
 REMOTE_REQUEST_BYTES_LIMIT = (
     (32 - 1) * 1024 * 1024
 )  # 32 MiB (real limit) - 1 MiB (buffer)
 
+# Requests that are written to the write-ahead spool (when enabled) before
+# being sent, so they can be replayed if they never make it to the server.
+SPOOLED_REQUESTS: t.Dict[str, t.Tuple[t.Type[BaseModel], t.Type[BaseModel]]] = {
+    "/obj/create": (tsi.ObjCreateReq, tsi.ObjCreateRes),
+    "/table/create": (tsi.TableCreateReq, tsi.TableCreateRes),
+    "/table/create_from_digests": (tsi.TableCreateFromDigestsReq, tsi.TableCreateRes),
+}
+
+# Calls whose trace is remembered until they end, to route their end event
+OPEN_CALLS_TRACKED_MAX = 100000
+
 REMOTE_REQUEST_RETRY_DURATION = 60 * 60 * 36  # 36 hours
 REMOTE_REQUEST_RETRY_MAX_INTERVAL = 60 * 5  # 5 minutes
 
@@ -90,16 +131,170 @@ def _log_failure(retry_state: tenacity.RetryCallState) -> t.Any:
     return retry_state.outcome.result()
 
 
+def select_request_encoding(accepted: t.List[str]) -> t.Optional[str]:
+    """Picks the best request Content-Encoding out of those a server accepts."""
+    if "zstd" in accepted and zstandard is not None:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_request_body(
+    data: bytes, encoding: t.Optional[str]
+) -> t.Tuple[bytes, t.Dict[str, str]]:
+    """Returns the encoded body and the headers to send along with it."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(data), {"Content-Encoding": "zstd"}
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6), {"Content-Encoding": "gzip"}
+    return data, {}
+
+
+def _call_event_id(item: t.Union[StartBatchItem, EndBatchItem]) -> t.Optional[str]:
+    if isinstance(item, StartBatchItem):
+        return item.req.start.id
+    return item.req.end.id
+
+
+def _group_call_events(
+    batch: t.List[t.Union[StartBatchItem, EndBatchItem]],
+) -> t.List[t.Union[StartBatchItem, EndBatchItem]]:
+    """Moves each end event directly after the start event of the same call.
+
+    The server collapses a start and end that arrive in the same upsert batch
+    into a single call row, so keeping them adjacent means they are never
+    separated when a batch has to be split to fit the request size limit.
+    """
+    ends_by_id: t.Dict[str, EndBatchItem] = {}
+    start_ids = set()
+    for item in batch:
+        call_id = _call_event_id(item)
+        if call_id is None:
+            continue
+        if isinstance(item, StartBatchItem):
+            start_ids.add(call_id)
+        elif call_id in start_ids and call_id not in ends_by_id:
+            ends_by_id[call_id] = item
+    if not ends_by_id:
+        return batch
+
+    moved = set(id(end) for end in ends_by_id.values())
+    grouped: t.List[t.Union[StartBatchItem, EndBatchItem]] = []
+    for item in batch:
+        if id(item) in moved:
+            continue
+        grouped.append(item)
+        if isinstance(item, StartBatchItem):
+            end = ends_by_id.pop(item.req.start.id or "", None)
+            if end is not None:
+                grouped.append(end)
+    return grouped
+
+
+def _split_index(batch: t.List[t.Union[StartBatchItem, EndBatchItem]]) -> int:
+    split_idx = int(len(batch) // 2)
+    before, after = batch[split_idx - 1], batch[split_idx]
+    if (
+        isinstance(before, StartBatchItem)
+        and isinstance(after, EndBatchItem)
+        and before.req.start.id == after.req.end.id
+        and len(batch) > 2
+    ):
+        # Don't separate a call's start from its end
+        split_idx += 1 if split_idx + 1 < len(batch) else -1
+    return split_idx
+
+
 class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     trace_server_url: str
 
-    # My current batching is not safe in notebooks, disable it for now
-    def __init__(self, trace_server_url: str, should_batch: bool = False):
+    def __init__(
+        self,
+        trace_server_url: str,
+        should_batch: bool = False,
+        *,
+        batch_interval: float = 1.0,
+        max_queue_size: int = 0,
+        backpressure_policy: BackpressurePolicy = "block",
+        remote_request_bytes_limit: int = REMOTE_REQUEST_BYTES_LIMIT,
+        batch_workers: int = 1,
+        spool_dir: t.Optional[str] = None,
+        spool_max_bytes: int = 1024 * 1024 * 1024,
+        compression: RequestCompression = "auto",
+        max_connections: int = 10,
+    ):
+        """
+        Args:
+            trace_server_url: The base url of the trace server.
+            should_batch: Send call starts and ends from a background thread
+                via `/call/upsert_batch` instead of one request per event.
+            batch_interval: The maximum time an event waits before being sent.
+            max_queue_size: The maximum number of buffered events (0 is unbounded).
+            backpressure_policy: What to do when the buffer is full.
+            remote_request_bytes_limit: The maximum size of a single batch request.
+            batch_workers: The number of batch requests that may be in flight
+                at once. Events of the same trace are always sent in order.
+            spool_dir: If set, call events, objects, tables and files are
+                written to a write-ahead spool in this directory before being
+                sent, and anything unsent (eg. after a crash or an outage that
+                outlasted the retries) is replayed on the next startup.
+            spool_max_bytes: The maximum size of the spool on disk.
+            compression: Content-Encoding for request bodies. "auto" picks the
+                best encoding the server advertises in `/server_info`.
+            max_connections: The number of keep-alive connections to pool.
+        """
         super().__init__()
         self.trace_server_url = trace_server_url
         self.should_batch = should_batch
+        self.remote_request_bytes_limit = remote_request_bytes_limit
+        self.compression = compression
+        self._request_encoding: t.Optional[str] = None
+        self._request_encoding_negotiated = compression != "auto"
+        if compression in ("gzip", "zstd"):
+            self._request_encoding = compression
+        if self._request_encoding == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the `zstandard` package")
+        # A single keep-alive session per server, sized so that every batch
+        # worker and a few foreground requests can each hold a connection.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(max_connections, batch_workers + 1),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # trace_id of calls that have started but not ended, so that a call's
+        # end is routed to the same batch worker as its start. Only needed
+        # with several workers, and bounded since some calls never end.
+        self._open_call_trace_ids: "OrderedDict[str, str]" = OrderedDict()
+        self._open_call_trace_ids_lock = threading.Lock()
+        self._batch_workers = batch_workers
+        self.spool: t.Optional[WriteAheadSpool] = None
+        # Spool records that are currently queued or being sent, and so must
+        # not be replayed.
+        self._spool_in_flight: t.Set[int] = set()
+        self._spool_lock = threading.Lock()
+        self._spool_replay_lock = threading.Lock()
+        if spool_dir is not None:
+            self.spool = WriteAheadSpool(spool_dir, max_bytes=spool_max_bytes)
         if self.should_batch:
-            self.call_processor = AsyncBatchProcessor(self._flush_calls)
+            # Batches are bounded by count here, and split to fit
+            # `remote_request_bytes_limit` once serialized for sending, so that
+            # events are only serialized once, off the caller's thread.
+            flush_fn: t.Callable[[t.List[t.Union[StartBatchItem, EndBatchItem]]], None]
+            if self.spool is not None:
+                flush_fn = self._flush_spooled_calls
+            else:
+                flush_fn = self._flush_calls
+            self.call_processor = AsyncBatchProcessor(
+                flush_fn,
+                min_batch_interval=batch_interval,
+                max_queue_size=max_queue_size,
+                backpressure_policy=backpressure_policy,
+                num_workers=batch_workers,
+                partition_key_fn=self._batch_item_trace_id,
+            )
         self._auth: t.Optional[t.Tuple[str, str]] = None
 
     def ensure_project_exists(self, entity: str, project: str) -> None:
@@ -109,10 +304,216 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
 
     @classmethod
     def from_env(cls, should_batch: bool = False) -> "RemoteHTTPTraceServer":
-        return cls(wf_env.wf_trace_server_url(), should_batch)
+        return cls(
+            wf_env.wf_trace_server_url(),
+            should_batch,
+            batch_interval=wf_env.wf_trace_server_batch_interval(),
+            max_queue_size=wf_env.wf_trace_server_max_queue_size(),
+            backpressure_policy=t.cast(
+                BackpressurePolicy, wf_env.wf_trace_server_backpressure_policy()
+            ),
+            batch_workers=wf_env.wf_trace_server_batch_workers(),
+            spool_dir=wf_env.wf_trace_server_spool_dir(),
+            spool_max_bytes=wf_env.wf_trace_server_spool_max_bytes(),
+            compression=t.cast(
+                RequestCompression, wf_env.wf_trace_server_request_compression()
+            ),
+        )
+
+    def _batch_item_trace_id(
+        self, item: t.Union[StartBatchItem, EndBatchItem]
+    ) -> t.Optional[str]:
+        if isinstance(item, StartBatchItem):
+            return item.req.start.trace_id
+        with self._open_call_trace_ids_lock:
+            return self._open_call_trace_ids.pop(item.req.end.id, item.req.end.id)
+
+    def _track_open_call(self, call_id: str, trace_id: str) -> None:
+        if self._batch_workers < 2:
+            return
+        with self._open_call_trace_ids_lock:
+            self._open_call_trace_ids[call_id] = trace_id
+            if len(self._open_call_trace_ids) > OPEN_CALLS_TRACKED_MAX:
+                # Forget the oldest, most likely a call that will never end
+                self._open_call_trace_ids.popitem(last=False)
 
     def set_auth(self, auth: t.Tuple[str, str]) -> None:
         self._auth = auth
+        # Records adopted from a previous process can only be sent once we
+        # are authenticated.
+        self._schedule_spool_replay()
+
+    def flush(self, timeout: t.Optional[float] = None) -> bool:
+        if self.should_batch:
+            return self.call_processor.flush(timeout)
+        return True
+
+    def close(self) -> None:
+        if self.should_batch:
+            self.call_processor.close()
+        if self.spool is not None:
+            self.spool.close()
+        self.session.close()
+
+    # Transport
+
+    def _negotiate_request_encoding(self) -> t.Optional[str]:
+        if self._request_encoding_negotiated:
+            return self._request_encoding
+        self._request_encoding_negotiated = True
+        try:
+            r = self.session.get(self.trace_server_url + "/server_info", timeout=10)
+            r.raise_for_status()
+            accepted = ServerInfoRes.model_validate(r.json()).accepted_request_encodings
+        except Exception:
+            # Older servers, or not reachable right now: send uncompressed
+            logger.debug("request_encoding_negotiation_failed", exc_info=True)
+            return None
+        self._request_encoding = select_request_encoding(accepted)
+        return self._request_encoding
+
+    def _post(self, url: str, data: bytes) -> requests.Response:
+        headers: t.Dict[str, str] = {}
+        if len(data) >= REQUEST_COMPRESSION_MIN_BYTES:
+            data, headers = compress_request_body(
+                data, self._negotiate_request_encoding()
+            )
+        return self.session.post(
+            self.trace_server_url + url,
+            data=data,
+            auth=self._auth,
+            headers=headers,
+        )
+
+    # Write-ahead spool
+
+    def _spool_append(self, kind: str, meta: t.Dict[str, t.Any], body: bytes) -> int:
+        assert self.spool is not None
+        record_id = self.spool.append(kind, meta, body)
+        with self._spool_lock:
+            self._spool_in_flight.add(record_id)
+        return record_id
+
+    def _spool_settle(self, record_ids: t.List[int], e: t.Optional[Exception]) -> None:
+        """Acks records after a send attempt, unless they are worth retrying later."""
+        assert self.spool is not None
+        if e is None or not _is_retryable_exception(e):
+            self.spool.ack(record_ids)
+        with self._spool_lock:
+            self._spool_in_flight.difference_update(record_ids)
+        if e is None:
+            # The server is reachable, so send anything left over from
+            # earlier failures.
+            if len(self.spool.pending_ids()) > len(self._spool_in_flight):
+                self._schedule_spool_replay()
+
+    def _spooled(
+        self,
+        kind: str,
+        meta: t.Dict[str, t.Any],
+        body: bytes,
+        send: t.Callable[[], t.Any],
+    ) -> t.Any:
+        if self.spool is None:
+            return send()
+        record_id = self._spool_append(kind, meta, body)
+        try:
+            res = send()
+        except Exception as e:
+            self._spool_settle([record_id], e)
+            raise
+        self._spool_settle([record_id], None)
+        return res
+
+    def _flush_spooled_calls(self, batch: t.List) -> None:
+        record_ids = [item._spool_id for item in batch if item._spool_id is not None]
+        try:
+            self._flush_calls(batch)
+        except Exception as e:
+            self._spool_settle(record_ids, e)
+            raise
+        self._spool_settle(record_ids, None)
+
+    def _schedule_spool_replay(self) -> None:
+        if self.spool is None or self._spool_replay_lock.locked():
+            return
+        threading.Thread(target=self.replay_spool, daemon=True).start()
+
+    def replay_spool(self) -> None:
+        """Sends every spooled record that is not already queued or in flight."""
+        if self.spool is None or not self._spool_replay_lock.acquire(blocking=False):
+            return
+        try:
+            with self._spool_lock:
+                exclude = set(self._spool_in_flight)
+            calls: t.List[SpoolRecord] = []
+            for record in self.spool.records(exclude=exclude):
+                if record.kind == "call":
+                    calls.append(record)
+                    if len(calls) >= 100:
+                        self._replay_records(calls)
+                        calls = []
+                else:
+                    self._replay_records([record])
+            self._replay_records(calls)
+        except Exception:
+            logger.exception("spool_replay_failed")
+        finally:
+            self._spool_replay_lock.release()
+
+    def _replay_records(self, records: t.List[SpoolRecord]) -> None:
+        if not records:
+            return
+        assert self.spool is not None
+        record_ids = [record.id for record in records]
+        kind = records[0].kind
+        if kind == "request" and records[0].meta.get("url") not in SPOOLED_REQUESTS:
+            kind = "unknown"
+        if kind not in ("call", "file", "request"):
+            # Written by another version of the client, and would otherwise
+            # hold up every record after it
+            logger.error(
+                f"Dropping spooled record {records[0].id} of unknown kind: "
+                f"{records[0].kind} {records[0].meta}"
+            )
+            self.spool.ack(record_ids)
+            return
+        with self._spool_lock:
+            self._spool_in_flight.update(record_ids)
+        try:
+            if kind == "call":
+                self._flush_calls(
+                    [
+                        (
+                            StartBatchItem
+                            if r.meta["mode"] == "start"
+                            else EndBatchItem
+                        ).model_validate_json(r.body)
+                        for r in records
+                    ]
+                )
+            elif kind == "file":
+                record = records[0]
+                self._send_file(
+                    tsi.FileCreateReq(
+                        project_id=record.meta["project_id"],
+                        name=record.meta["name"],
+                        content=record.body,
+                    )
+                )
+            else:
+                url = records[0].meta["url"]
+                req_model, res_model = SPOOLED_REQUESTS[url]
+                self._generic_request(
+                    url,
+                    req_model.model_validate_json(records[0].body),
+                    req_model,
+                    res_model,
+                )
+        except Exception as e:
+            self._spool_settle(record_ids, e)
+            raise
+        self._spool_settle(record_ids, None)
 
     @tenacity.retry(
         stop=tenacity.stop_after_delay(REMOTE_REQUEST_RETRY_DURATION),
@@ -128,35 +529,36 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         self,
         batch: t.List,
         *,
-        _should_update_batch_size: bool = True,
+        _group_events: bool = True,
     ) -> None:
         if len(batch) == 0:
             return
 
-        data = Batch(batch=batch).model_dump_json()
-        encoded_data = data.encode("utf-8")
-        encoded_bytes = len(encoded_data)
+        if _group_events:
+            batch = _group_call_events(batch)
+        item_jsons = [
+            item._json if item._json is not None else item.model_dump_json()
+            for item in batch
+        ]
+        self._send_call_batches(batch, item_jsons)
 
-        # Update target batch size (this allows us to have a dynamic batch size based on the size of the data being sent)
-        estimated_bytes_per_item = encoded_bytes / len(batch)
-        if _should_update_batch_size and estimated_bytes_per_item > 0:
-            target_batch_size = int(
-                REMOTE_REQUEST_BYTES_LIMIT // estimated_bytes_per_item
-            )
-            self.call_processor.max_batch_size = max(1, target_batch_size)
+    def _send_call_batches(
+        self,
+        batch: t.List[t.Union[StartBatchItem, EndBatchItem]],
+        item_jsons: t.List[str],
+    ) -> None:
+        # Same as `Batch(batch=batch).model_dump_json()`, from the items
+        # serialized once
+        encoded_data = ('{"batch":[' + ",".join(item_jsons) + "]}").encode("utf-8")
 
         # If the batch is too big, recursively split it in half
-        if encoded_bytes > REMOTE_REQUEST_BYTES_LIMIT and len(batch) > 1:
-            split_idx = int(len(batch) // 2)
-            self._flush_calls(batch[:split_idx], _should_update_batch_size=False)
-            self._flush_calls(batch[split_idx:], _should_update_batch_size=False)
+        if len(encoded_data) > self.remote_request_bytes_limit and len(batch) > 1:
+            split_idx = _split_index(batch)
+            self._send_call_batches(batch[:split_idx], item_jsons[:split_idx])
+            self._send_call_batches(batch[split_idx:], item_jsons[split_idx:])
             return
 
-        r = requests.post(
-            self.trace_server_url + "/call/upsert_batch",
-            data=encoded_data,
-            auth=self._auth,
-        )
+        r = self._post("/call/upsert_batch", encoded_data)
         r.raise_for_status()
 
     @tenacity.retry(
@@ -178,14 +580,13 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     ) -> BaseModel:
         if isinstance(req, dict):
             req = req_model.model_validate(req)
-        r = requests.post(
-            self.trace_server_url + url,
+        r = self._post(
+            url,
             # `by_alias` is required since we have Mongo-style properties in the
             # query models that are aliased to conform to start with `$`. Without
             # this, the model_dump will use the internal property names which are
             # not valid for the `model_validate` step.
-            data=req.model_dump_json(by_alias=True).encode("utf-8"),
-            auth=self._auth,
+            req.model_dump_json(by_alias=True).encode("utf-8"),
         )
         if r.status_code == 413 and "obj/create" in url:
             raise requests.HTTPError(
@@ -204,6 +605,23 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         r.raise_for_status()
         return res_model.model_validate(r.json())
 
+    def _spooled_request(
+        self,
+        url: str,
+        req: t.Union[BaseModel, t.Dict[str, t.Any]],
+        req_model: t.Type[BaseModel],
+        res_model: t.Type[BaseModel],
+    ) -> t.Any:
+        if self.spool is None:
+            return self._generic_request(url, req, req_model, res_model)
+        req_as_obj = req_model.model_validate(req) if isinstance(req, dict) else req
+        return self._spooled(
+            "request",
+            {"url": url},
+            req_as_obj.model_dump_json(by_alias=True).encode("utf-8"),
+            lambda: self._generic_request(url, req_as_obj, req_model, res_model),
+        )
+
     @tenacity.retry(
         stop=tenacity.stop_after_delay(REMOTE_REQUEST_RETRY_DURATION),
         wait=tenacity.wait_exponential_jitter(
@@ -215,10 +633,20 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         reraise=True,
     )
     def server_info(self) -> ServerInfoRes:
-        r = requests.get(self.trace_server_url + "/server_info")
+        r = self.session.get(self.trace_server_url + "/server_info")
         r.raise_for_status()
         return ServerInfoRes.model_validate(r.json())
 
+    def _spool_call(
+        self, item: t.Union[StartBatchItem, EndBatchItem]
+    ) -> t.Union[StartBatchItem, EndBatchItem]:
+        if self.spool is not None:
+            item._json = item.model_dump_json()
+            item._spool_id = self._spool_append(
+                "call", {"mode": item.mode}, item._json.encode("utf-8")
+            )
+        return item
+
     # Call API
     def call_start(
         self, req: t.Union[tsi.CallStartReq, t.Dict[str, t.Any]]
@@ -229,14 +657,17 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
                 req_as_obj = tsi.CallStartReq.model_validate(req)
             else:
                 req_as_obj = req
-            if req_as_obj.start.id == None or req_as_obj.start.trace_id == None:
+            call_id = req_as_obj.start.id
+            trace_id = req_as_obj.start.trace_id
+            if call_id is None or trace_id is None:
                 raise ValueError(
                     "CallStartReq must have id and trace_id when batching."
                 )
-            self.call_processor.enqueue([StartBatchItem(req=req_as_obj)])
-            return tsi.CallStartRes(
-                id=req_as_obj.start.id, trace_id=req_as_obj.start.trace_id
+            self._track_open_call(call_id, trace_id)
+            self.call_processor.enqueue(
+                [self._spool_call(StartBatchItem(req=req_as_obj))]
             )
+            return tsi.CallStartRes(id=call_id, trace_id=trace_id)
         return self._generic_request(
             "/call/start", req, tsi.CallStartReq, tsi.CallStartRes
         )
@@ -250,7 +681,9 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
                 req_as_obj = tsi.CallEndReq.model_validate(req)
             else:
                 req_as_obj = req
-            self.call_processor.enqueue([EndBatchItem(req=req_as_obj)])
+            self.call_processor.enqueue(
+                [self._spool_call(EndBatchItem(req=req_as_obj))]
+            )
             return tsi.CallEndRes()
         return self._generic_request("/call/end", req, tsi.CallEndReq, tsi.CallEndRes)
 
@@ -275,6 +708,27 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
             "/calls/query_stats", req, tsi.CallsQueryStatsReq, tsi.CallsQueryStatsRes
         )
 
+    def trace_tree_read(
+        self, req: t.Union[tsi.TraceTreeReadReq, t.Dict[str, t.Any]]
+    ) -> tsi.TraceTreeReadRes:
+        return self._generic_request(
+            "/trace/tree", req, tsi.TraceTreeReadReq, tsi.TraceTreeReadRes
+        )
+
+    def calls_export(
+        self, req: t.Union[tsi.CallsExportReq, t.Dict[str, t.Any]]
+    ) -> t.Iterator[bytes]:
+        if isinstance(req, dict):
+            req = tsi.CallsExportReq.model_validate(req)
+        r = self.session.post(
+            self.trace_server_url + "/calls/export",
+            data=req.model_dump_json(by_alias=True).encode("utf-8"),
+            auth=self._auth,
+            stream=True,
+        )
+        r.raise_for_status()
+        return r.iter_content(chunk_size=CALLS_EXPORT_CHUNK_BYTES)
+
     def calls_delete(
         self, req: t.Union[tsi.CallsDeleteReq, t.Dict[str, t.Any]]
     ) -> tsi.CallsDeleteRes:
@@ -304,7 +758,7 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     def obj_create(
         self, req: t.Union[tsi.ObjCreateReq, t.Dict[str, t.Any]]
     ) -> tsi.ObjCreateRes:
-        return self._generic_request(
+        return self._spooled_request(
             "/obj/create", req, tsi.ObjCreateReq, tsi.ObjCreateRes
         )
 
@@ -323,10 +777,29 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     def table_create(
         self, req: t.Union[tsi.TableCreateReq, t.Dict[str, t.Any]]
     ) -> tsi.TableCreateRes:
-        return self._generic_request(
+        return self._spooled_request(
             "/table/create", req, tsi.TableCreateReq, tsi.TableCreateRes
         )
 
+    def table_rows_create(
+        self, req: t.Union[tsi.TableRowsCreateReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableRowsCreateRes:
+        # Not spooled: the rows are only referenced by the (spooled) request
+        # that creates their table, which is sent once they are all uploaded
+        return self._generic_request(
+            "/table/rows_create", req, tsi.TableRowsCreateReq, tsi.TableRowsCreateRes
+        )
+
+    def table_create_from_digests(
+        self, req: t.Union[tsi.TableCreateFromDigestsReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableCreateRes:
+        return self._spooled_request(
+            "/table/create_from_digests",
+            req,
+            tsi.TableCreateFromDigestsReq,
+            tsi.TableCreateRes,
+        )
+
     def table_query(
         self, req: t.Union[tsi.TableQueryReq, t.Dict[str, t.Any]]
     ) -> tsi.TableQueryRes:
@@ -334,6 +807,16 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
             "/table/query", req, tsi.TableQueryReq, tsi.TableQueryRes
         )
 
+    def table_query_stats(
+        self, req: t.Union[tsi.TableQueryStatsReq, t.Dict[str, t.Any]]
+    ) -> tsi.TableQueryStatsRes:
+        return self._generic_request(
+            "/table/query_stats",
+            req,
+            tsi.TableQueryStatsReq,
+            tsi.TableQueryStatsRes,
+        )
+
     def refs_read_batch(
         self, req: t.Union[tsi.RefsReadBatchReq, t.Dict[str, t.Any]]
     ) -> tsi.RefsReadBatchRes:
@@ -351,8 +834,8 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         retry_error_callback=_log_failure,
         reraise=True,
     )
-    def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
-        r = requests.post(
+    def _send_file(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
+        r = self.session.post(
             self.trace_server_url + "/files/create",
             auth=self._auth,
             data={"project_id": req.project_id},
@@ -361,6 +844,14 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         r.raise_for_status()
         return tsi.FileCreateRes.model_validate(r.json())
 
+    def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
+        return self._spooled(
+            "file",
+            {"project_id": req.project_id, "name": req.name},
+            req.content,
+            lambda: self._send_file(req),
+        )
+
     @tenacity.retry(
         stop=tenacity.stop_after_delay(REMOTE_REQUEST_RETRY_DURATION),
         wait=tenacity.wait_exponential_jitter(
@@ -372,17 +863,40 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         reraise=True,
     )
     def file_content_read(self, req: tsi.FileContentReadReq) -> tsi.FileContentReadRes:
-        r = requests.post(
+        r = self._file_content_request(req)
+        return tsi.FileContentReadRes(content=r.content)
+
+    def file_content_stream(self, req: tsi.FileContentReadReq) -> t.Iterator[bytes]:
+        r = self._file_content_request(req, stream=True)
+        # Release the connection even if the caller stops reading early
+        try:
+            yield from r.iter_content(chunk_size=FILE_CONTENT_CHUNK_BYTES)
+        finally:
+            r.close()
+
+    def _file_content_request(
+        self, req: tsi.FileContentReadReq, stream: bool = False
+    ) -> requests.Response:
+        body: t.Dict[str, t.Any] = {"project_id": req.project_id, "digest": req.digest}
+        if req.offset:
+            body["offset"] = req.offset
+        if req.length is not None:
+            body["length"] = req.length
+        r = self.session.post(
             self.trace_server_url + "/files/content",
-            json={"project_id": req.project_id, "digest": req.digest},
+            json=body,
             auth=self._auth,
+            stream=stream,
         )
         r.raise_for_status()
-        # TODO: Should stream to disk rather than to memory
-        bytes = io.BytesIO()
-        bytes.writelines(r.iter_content())
-        bytes.seek(0)
-        return tsi.FileContentReadRes(content=bytes.read())
+        return r
+
+    def digests_exist(
+        self, req: t.Union[tsi.DigestsExistReq, t.Dict[str, t.Any]]
+    ) -> tsi.DigestsExistRes:
+        return self._generic_request(
+            "/digests/exist", req, tsi.DigestsExistReq, tsi.DigestsExistRes
+        )
 
     def feedback_create(
         self, req: t.Union[tsi.FeedbackCreateReq, t.Dict[str, t.Any]]
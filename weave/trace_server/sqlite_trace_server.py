@@ -1,14 +1,15 @@
 # Sqlite Trace Server
 
-from typing import cast, Optional, Any, Union
+from typing import cast, Iterator, Optional, Any, Union
 import threading
 
-import contextvars
+import atexit
 import contextlib
 import datetime
+import itertools
 import json
-import hashlib
 import sqlite3
+import weakref
 from zoneinfo import ZoneInfo
 
 import emoji
@@ -17,7 +18,10 @@ from .trace_server_interface_util import (
     extract_refs_from_values,
     str_digest,
     bytes_digest,
+    table_digest,
 )
+from . import calls_export
+from . import calls_stats
 from . import trace_server_interface as tsi
 from .interface import query as tsi_query
 
@@ -30,7 +34,13 @@ from weave.trace_server.feedback import (
     validate_feedback_purge_req,
 )
 from weave.trace_server.trace_server_interface_util import (
+    CALLS_CURSOR_SORT_FIELDS,
+    call_tree_preorder,
+    calls_cursor_sort_by,
+    decode_calls_cursor,
+    encode_calls_cursor,
     generate_id,
+    trace_tree_columns,
     WILDCARD_ARTIFACT_VERSION_AND_PATH,
 )
 from weave.trace_server.refs_internal import (
@@ -41,37 +51,98 @@ from weave.trace_server.refs_internal import (
 )
 from weave.trace_server.orm import Row
 
+# Call writes are buffered and committed in groups. Until a group is
+# committed, other processes reading the database (eg. the UI) don't see its
+# calls, and a crash loses them, so the age is kept short: grouping still
+# saves a commit per call under load, but nothing waits more than a second.
 MAX_FLUSH_COUNT = 10000
-MAX_FLUSH_AGE = 15
+MAX_FLUSH_AGE = 1
 
+# Seconds a connection waits for another one to finish writing
+SQLITE_BUSY_TIMEOUT = 30
 
-class NotFoundError(Exception):
-    pass
-
+# Size of the pieces in which file contents are read
+FILE_STREAM_CHUNK_SIZE = 1024 * 1024
 
-_conn_cursor: contextvars.ContextVar[
-    Optional[tuple[sqlite3.Connection, sqlite3.Cursor]]
-] = contextvars.ContextVar("conn_cursor", default=None)
 
-
-def get_conn_cursor(db_path: str) -> tuple[sqlite3.Connection, sqlite3.Cursor]:
-    # conn_cursor = _conn_cursor.get()
-    conn_cursor = None
-    if conn_cursor is None:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        conn_cursor = (conn, cursor)
-        _conn_cursor.set(conn_cursor)
-    return conn_cursor
+class NotFoundError(Exception):
+    pass
 
 
 class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
     def __init__(self, db_path: str):
         self.lock = threading.Lock()
         self.db_path = db_path
+        # One connection per thread, since a connection can't be shared
+        # across threads
+        self._thread_local = threading.local()
+        self._call_batch: list[tuple[str, tuple]] = []
+        # Commits the buffered writes MAX_FLUSH_AGE seconds after the first
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def _get_conn_cursor(self) -> tuple[sqlite3.Connection, sqlite3.Cursor]:
+        conn = getattr(self._thread_local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT)
+            # Readers don't block the writer, and commits only sync the
+            # write-ahead log at checkpoints
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Connections to a shared-cache database (like the in-memory one
+            # of the tests) lock tables rather than the file, and fail right
+            # away instead of waiting when a table is being written. Writes
+            # are serialized by `self.lock`, and reads skip the table locks.
+            conn.execute("PRAGMA read_uncommitted=true")
+            conn.create_aggregate("quantile", 2, _QuantileAggregate)  # type: ignore
+            self._thread_local.conn = conn
+        return conn, conn.cursor()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        self._flush_calls()
+        return True
+
+    def close(self) -> None:
+        self._flush_calls()
+
+    @contextlib.contextmanager
+    def call_batch(self) -> Iterator[None]:
+        # Calls started and ended inside the batch are committed when it
+        # exits, rather than after MAX_FLUSH_AGE
+        try:
+            yield
+        finally:
+            self._flush_calls()
+
+    def _write_call(self, query: str, parameters: tuple) -> None:
+        # Call writes are committed in groups, every MAX_FLUSH_COUNT writes
+        # or MAX_FLUSH_AGE seconds, and before anything reads the calls
+        with self.lock:
+            self._call_batch.append((query, parameters))
+            flush = len(self._call_batch) >= MAX_FLUSH_COUNT
+            if not flush and self._flush_timer is None:
+                self._flush_timer = threading.Timer(MAX_FLUSH_AGE, self._flush_calls)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if flush:
+            self._flush_calls()
+
+    def _flush_calls(self) -> None:
+        with self.lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._call_batch:
+                return
+        conn, cursor = self._get_conn_cursor()
+        with self.lock, conn:
+            batch, self._call_batch = self._call_batch, []
+            # Consecutive writes of the same kind go in one executemany
+            for query, group in itertools.groupby(batch, key=lambda w: w[0]):
+                cursor.executemany(query, [parameters for _, parameters in group])
 
     def drop_tables(self) -> None:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         cursor.execute(TABLE_FEEDBACK.drop_sql())
         cursor.execute("DROP TABLE IF EXISTS calls")
         cursor.execute("DROP TABLE IF EXISTS objects")
@@ -79,7 +150,7 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         cursor.execute("DROP TABLE IF EXISTS table_rows")
 
     def setup_tables(self) -> None:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS calls (
@@ -145,49 +216,48 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
             """
         )
         cursor.execute(TABLE_FEEDBACK.create_sql())
+        for name, table, columns in _INDEXES:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+            )
 
     # Creates a new call
     def call_start(self, req: tsi.CallStartReq) -> tsi.CallStartRes:
-        conn, cursor = get_conn_cursor(self.db_path)
         if req.start.trace_id is None:
             raise ValueError("trace_id is required")
         if req.start.id is None:
             raise ValueError("id is required")
-        with self.lock:
-            # Converts the user-provided call details into a clickhouse schema.
-            # This does validation and conversion of the input data as well
-            # as enforcing business rules and defaults
-            cursor.execute(
-                """INSERT INTO calls (
-                    project_id,
-                    id,
-                    trace_id,
-                    parent_id,
-                    op_name,
-                    started_at,
-                    attributes,
-                    inputs,
-                    input_refs,
-                    wb_user_id,
-                    wb_run_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    req.start.project_id,
-                    req.start.id,
-                    req.start.trace_id,
-                    req.start.parent_id,
-                    req.start.op_name,
-                    req.start.started_at.isoformat(),
-                    json.dumps(req.start.attributes),
-                    json.dumps(req.start.inputs),
-                    json.dumps(
-                        extract_refs_from_values(list(req.start.inputs.values()))
-                    ),
-                    req.start.wb_user_id,
-                    req.start.wb_run_id,
-                ),
-            )
-            conn.commit()
+        # Converts the user-provided call details into a clickhouse schema.
+        # This does validation and conversion of the input data as well
+        # as enforcing business rules and defaults
+        self._write_call(
+            """INSERT INTO calls (
+                project_id,
+                id,
+                trace_id,
+                parent_id,
+                op_name,
+                started_at,
+                attributes,
+                inputs,
+                input_refs,
+                wb_user_id,
+                wb_run_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                req.start.project_id,
+                req.start.id,
+                req.start.trace_id,
+                req.start.parent_id,
+                req.start.op_name,
+                req.start.started_at.isoformat(),
+                json.dumps(req.start.attributes),
+                json.dumps(req.start.inputs),
+                json.dumps(extract_refs_from_values(list(req.start.inputs.values()))),
+                req.start.wb_user_id,
+                req.start.wb_run_id,
+            ),
+        )
 
         # Returns the id of the newly created call
         return tsi.CallStartRes(
@@ -196,32 +266,27 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         )
 
     def call_end(self, req: tsi.CallEndReq) -> tsi.CallEndRes:
-        conn, cursor = get_conn_cursor(self.db_path)
         parsable_output = req.end.output
         if not isinstance(parsable_output, dict):
             parsable_output = {"output": parsable_output}
         parsable_output = cast(dict, parsable_output)
-        with self.lock:
-            cursor.execute(
-                """UPDATE calls SET
-                    ended_at = ?,
-                    exception = ?,
-                    output = ?,
-                    output_refs = ?,
-                    summary = ?
-                WHERE id = ?""",
-                (
-                    req.end.ended_at.isoformat(),
-                    req.end.exception,
-                    json.dumps(req.end.output),
-                    json.dumps(
-                        extract_refs_from_values(list(parsable_output.values()))
-                    ),
-                    json.dumps(req.end.summary),
-                    req.end.id,
-                ),
-            )
-            conn.commit()
+        self._write_call(
+            """UPDATE calls SET
+                ended_at = ?,
+                exception = ?,
+                output = ?,
+                output_refs = ?,
+                summary = ?
+            WHERE id = ?""",
+            (
+                req.end.ended_at.isoformat(),
+                req.end.exception,
+                json.dumps(req.end.output),
+                json.dumps(extract_refs_from_values(list(parsable_output.values()))),
+                json.dumps(req.end.summary),
+                req.end.id,
+            ),
+        )
         return tsi.CallEndRes()
 
     def call_read(self, req: tsi.CallReadReq) -> tsi.CallReadRes:
@@ -236,253 +301,192 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         )
 
     def calls_query(self, req: tsi.CallsQueryReq) -> tsi.CallsQueryRes:
-        print("REQ", req)
-        conn, cursor = get_conn_cursor(self.db_path)
-        conds = []
-        filter = req.filter
-        if filter:
-            if filter.op_names:
-                or_conditions: list[str] = []
-
-                non_wildcarded_names: list[str] = []
-                wildcarded_names: list[str] = []
-                for name in filter.op_names:
-                    if name.endswith(WILDCARD_ARTIFACT_VERSION_AND_PATH):
-                        wildcarded_names.append(name)
-                    else:
-                        non_wildcarded_names.append(name)
-
-                if non_wildcarded_names:
-                    in_expr = ", ".join((f"'{x}'" for x in non_wildcarded_names))
-                    or_conditions += [f"op_name IN ({', '.join({in_expr})})"]
-
-                for name_ndx, name in enumerate(wildcarded_names):
-                    like_name = name[: -len(WILDCARD_ARTIFACT_VERSION_AND_PATH)] + "%"
-                    or_conditions.append(f"op_name LIKE '{like_name}'")
-
-                if or_conditions:
-                    conds.append("(" + " OR ".join(or_conditions) + ")")
-
-            if filter.input_refs:
-                or_conditions = []
-                for ref in filter.input_refs:
-                    or_conditions.append(f"input_refs LIKE '%{ref}%'")
-                conds.append("(" + " OR ".join(or_conditions) + ")")
-            if filter.output_refs:
-                or_conditions = []
-                for ref in filter.output_refs:
-                    or_conditions.append(f"output_refs LIKE '%{ref}%'")
-                conds.append("(" + " OR ".join(or_conditions) + ")")
-            if filter.parent_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.parent_ids))
-                conds += [f"parent_id IN ({in_expr})"]
-            if filter.trace_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.trace_ids))
-                conds += [f"trace_id IN ({in_expr})"]
-            if filter.call_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.call_ids))
-                conds += [f"id IN ({in_expr})"]
-            if filter.trace_roots_only:
-                conds.append("parent_id IS NULL")
-            if filter.wb_run_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.wb_run_ids))
-                conds += [f"wb_run_id IN ({in_expr})"]
-
-        if req.query:
-            # This is the mongo-style query
-            def process_operation(operation: tsi_query.Operation) -> str:
-                cond = None
-
-                if isinstance(operation, tsi_query.AndOperation):
-                    lhs_part = process_operand(operation.and_[0])
-                    rhs_part = process_operand(operation.and_[1])
-                    cond = f"({lhs_part} AND {rhs_part})"
-                elif isinstance(operation, tsi_query.OrOperation):
-                    lhs_part = process_operand(operation.or_[0])
-                    rhs_part = process_operand(operation.or_[1])
-                    cond = f"({lhs_part} OR {rhs_part})"
-                elif isinstance(operation, tsi_query.NotOperation):
-                    operand_part = process_operand(operation.not_[0])
-                    cond = f"(NOT ({operand_part}))"
-                elif isinstance(operation, tsi_query.EqOperation):
-                    lhs_part = process_operand(operation.eq_[0])
-                    rhs_part = process_operand(operation.eq_[1])
-                    cond = f"({lhs_part} = {rhs_part})"
-                elif isinstance(operation, tsi_query.GtOperation):
-                    lhs_part = process_operand(operation.gt_[0])
-                    rhs_part = process_operand(operation.gt_[1])
-                    cond = f"({lhs_part} > {rhs_part})"
-                elif isinstance(operation, tsi_query.GteOperation):
-                    lhs_part = process_operand(operation.gte_[0])
-                    rhs_part = process_operand(operation.gte_[1])
-                    cond = f"({lhs_part} >= {rhs_part})"
-                elif isinstance(operation, tsi_query.ContainsOperation):
-                    lhs_part = process_operand(operation.contains_.input)
-                    rhs_part = process_operand(operation.contains_.substr)
-                    if operation.contains_.case_insensitive:
-                        lhs_part = f"LOWER({lhs_part})"
-                        rhs_part = f"LOWER({rhs_part})"
-                    cond = f"instr({lhs_part}, {rhs_part})"
-                else:
-                    raise ValueError(f"Unknown operation type: {operation}")
-
-                return cond
-
-            def process_operand(operand: tsi_query.Operand) -> str:
-                if isinstance(operand, tsi_query.LiteralOperation):
-                    return json.dumps(operand.literal_)
-                elif isinstance(operand, tsi_query.GetFieldOperator):
-                    field = _transform_external_calls_field_to_internal_calls_field(
-                        operand.get_field_, None
-                    )
-                    return field
-                elif isinstance(operand, tsi_query.ConvertOperation):
-                    field = process_operand(operand.convert_.input)
-                    convert_to = operand.convert_.to
-                    if convert_to == "int":
-                        sql_type = "INT"
-                    elif convert_to == "double":
-                        sql_type = "FLOAT"
-                    elif convert_to == "bool":
-                        sql_type = "BOOL"
-                    elif convert_to == "string":
-                        sql_type = "TEXT"
-                    else:
-                        raise ValueError(f"Unknown cast: {convert_to}")
-                    return f"CAST({field} AS {sql_type})"
-                elif isinstance(
-                    operand,
-                    (
-                        tsi_query.AndOperation,
-                        tsi_query.OrOperation,
-                        tsi_query.NotOperation,
-                        tsi_query.EqOperation,
-                        tsi_query.GtOperation,
-                        tsi_query.GteOperation,
-                        tsi_query.ContainsOperation,
-                    ),
-                ):
-                    return process_operation(operand)
-                else:
-                    raise ValueError(f"Unknown operand type: {operand}")
-
-            filter_cond = process_operation(req.query.expr_)
-
-            conds.append(filter_cond)
+        self._flush_calls()
+        conn, cursor = self._get_conn_cursor()
+        conds, params = _calls_query_conditions(req.filter, req.query)
 
-        query = f"SELECT * FROM calls WHERE deleted_at IS NULL AND project_id = '{req.project_id}'"
+        query = "SELECT * FROM calls WHERE deleted_at IS NULL AND project_id = ?"
+        params.insert(0, req.project_id)
 
         conditions_part = " AND ".join(conds)
 
         if conditions_part:
             query += f" AND {conditions_part}"
 
-        order_by = (
+        order_by: Optional[list[tuple[str, str]]] = (
             None if not req.sort_by else [(s.field, s.direction) for s in req.sort_by]
         )
+        cursor_sort_by = calls_cursor_sort_by(req.sort_by)
+        if cursor_sort_by is not None:
+            # Break ties by id so that pages are stable
+            order_by = cursor_sort_by
+        if req.cursor is not None:
+            if cursor_sort_by is None:
+                raise InvalidRequest(
+                    f"Cursors are only supported when sorting by {CALLS_CURSOR_SORT_FIELDS}"
+                )
+            values = decode_calls_cursor(req.cursor, cursor_sort_by)
+            # Timestamps are stored with `isoformat`, so compare them as text
+            terms = []
+            for i, (field, direction) in enumerate(cursor_sort_by):
+                op = ">" if direction == "asc" else "<"
+                equal_prefix = [f"{f} = ?" for f, _ in cursor_sort_by[:i]]
+                terms.append(" AND ".join(equal_prefix + [f"{field} {op} ?"]))
+                params += values[: i + 1]
+            query += " AND (" + " OR ".join(f"({t})" for t in terms) + ")"
         if order_by is not None:
             order_parts = []
             for field, direction in order_by:
-                json_path: Optional[str] = None
-                if field.startswith("inputs"):
-                    field = "inputs" + field[len("inputs") :]
-                    if field.startswith("inputs."):
-                        field = "inputs"
-                        json_path = field[len("inputs.") :]
-                elif field.startswith("output"):
-                    field = "output" + field[len("output") :]
-                    if field.startswith("output."):
-                        field = "output"
-                        json_path = field[len("output.") :]
-                elif field.startswith("attributes"):
-                    field = "attributes_dump" + field[len("attributes") :]
-                elif field.startswith("summary"):
-                    field = "summary_dump" + field[len("summary") :]
-
                 assert direction in [
                     "ASC",
                     "DESC",
                     "asc",
                     "desc",
                 ], f"Invalid order_by direction: {direction}"
-                if json_path:
-                    field = f"json_extract({field}, '$.{json_path}')"
+                if field in _CALL_DERIVED_FIELD_EXPRS:
+                    field = f"({_CALL_DERIVED_FIELD_EXPRS[field]})"
+                elif "." in field:
+                    column, json_path = field.split(".", 1)
+                    if column not in _CALLS_JSON_COLUMNS:
+                        raise InvalidRequest(f"Invalid sort field: {field}")
+                    path = _sql_string(_quote_json_path(json_path))
+                    field = f"json_extract({column}, {path})"
+                elif field not in tsi.CallSchema.model_fields:
+                    raise InvalidRequest(f"Invalid sort field: {field}")
                 order_parts.append(f"{field} {direction}")
 
             order_by_part = ", ".join(order_parts)
             query += f" ORDER BY {order_by_part}"
 
-        limit = req.limit or -1
-        if limit:
-            query += f" LIMIT {limit}"
-        if req.offset:
-            query += f" OFFSET {req.offset}"
-        print("QUERY", query)
+        query += " LIMIT ? OFFSET ?"
+        params += [req.limit or -1, req.offset or 0]
 
-        cursor.execute(query)
+        cursor.execute(query, params)
 
         query_result = cursor.fetchall()
-        return tsi.CallsQueryRes(
-            calls=[
-                tsi.CallSchema(
-                    project_id=row[0],
-                    id=row[1],
-                    trace_id=row[2],
-                    parent_id=row[3],
-                    op_name=row[4],
-                    started_at=row[5],
-                    ended_at=row[6],
-                    exception=row[7],
-                    attributes=json.loads(row[8]),
-                    inputs=json.loads(row[9]),
-                    output=None if row[11] is None else json.loads(row[11]),
-                    output_refs=None if row[12] is None else json.loads(row[12]),
-                    summary=json.loads(row[13]) if row[13] else None,
-                    wb_user_id=row[14],
-                    wb_run_id=row[15],
-                )
-                for row in query_result
-            ]
+        calls = [
+            tsi.CallSchema(
+                project_id=row[0],
+                id=row[1],
+                trace_id=row[2],
+                parent_id=row[3],
+                op_name=row[4],
+                started_at=row[5],
+                ended_at=row[6],
+                exception=row[7],
+                attributes=json.loads(row[8]),
+                inputs=json.loads(row[9]),
+                output=None if row[11] is None else json.loads(row[11]),
+                output_refs=None if row[12] is None else json.loads(row[12]),
+                summary=json.loads(row[13]) if row[13] else None,
+                wb_user_id=row[14],
+                wb_run_id=row[15],
+            )
+            for row in query_result
+        ]
+        next_cursor = None
+        if cursor_sort_by and req.limit and len(calls) == req.limit:
+            next_cursor = encode_calls_cursor(cursor_sort_by, calls[-1])
+        return tsi.CallsQueryRes(calls=calls, next_cursor=next_cursor)
+
+    def calls_export(self, req: tsi.CallsExportReq) -> Iterator[bytes]:
+        self._flush_calls()
+        columns = calls_export.export_columns(req.columns)
+        conds, cond_params = _calls_query_conditions(req.filter, req.query)
+        conds.append("deleted_at IS NULL")
+        conds.append("project_id = ?")
+        select_part = ", ".join(["started_at", "id", *columns])
+
+        def read_page(
+            after: Optional[tuple[datetime.datetime, str]], limit: int
+        ) -> list[calls_export.CallsExportRow]:
+            conn, cursor = self._get_conn_cursor()
+            page_conds = list(conds)
+            params: list[Any] = [*cond_params, req.project_id]
+            if after is not None:
+                # Timestamps are stored with `isoformat`, which round-trips
+                page_conds.append("(started_at > ? OR (started_at = ? AND id > ?))")
+                params += [after[0].isoformat(), after[0].isoformat(), after[1]]
+            cursor.execute(
+                f"""
+                SELECT {select_part} FROM calls
+                WHERE {" AND ".join(page_conds)}
+                ORDER BY started_at ASC, id ASC
+                LIMIT ?
+                """,
+                (*params, limit),
+            )
+            page = []
+            for row in cursor.fetchall():
+                export_row = dict(zip(columns, row[2:]))
+                export_row["started_at"] = datetime.datetime.fromisoformat(row[0])
+                export_row["id"] = row[1]
+                if export_row.get("ended_at") is not None:
+                    export_row["ended_at"] = datetime.datetime.fromisoformat(
+                        export_row["ended_at"]
+                    )
+                page.append(export_row)
+            return page
+
+        return calls_export.encode_calls_export(
+            calls_export.paginate_calls_export(read_page, limit=req.limit),
+            columns,
+            req.format,
         )
 
     def calls_query_stats(self, req: tsi.CallsQueryStatsReq) -> tsi.CallsQueryStatsRes:
-        calls = self.calls_query(
-            tsi.CallsQueryReq(
-                project_id=req.project_id,
-                filter=req.filter,
-                query=req.query,
+        self._flush_calls()
+        conds, cond_params = _calls_query_conditions(req.filter, req.query)
+        conds.append("deleted_at IS NULL")
+        conds.append("project_id = ?")
+        cond_params.append(req.project_id)
+        where_part = " AND ".join(conds)
+        conn, cursor = self._get_conn_cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM calls WHERE {where_part}", cond_params)
+        count = cursor.fetchone()[0]
+        if not calls_stats.stats_requested(req):
+            return tsi.CallsQueryStatsRes(
+                count=count,
             )
-        ).calls
-        return tsi.CallsQueryStatsRes(
-            count=len(calls),
+
+        keys = calls_stats.group_keys(req)
+        aggs = calls_stats.aggregations(req, keys)
+        key_exprs, agg_exprs, params = _calls_stats_exprs(req, keys, aggs)
+        from_part = f"(SELECT * FROM calls WHERE {where_part}) AS calls"
+        if calls_stats.USAGE_MODEL_KEY in keys:
+            # One row per model (key) of `summary.usage`
+            from_part += ", json_each(calls.summary, '$.usage') AS usage"
+        key_aliases = [f"key_{i}" for i in range(len(key_exprs))]
+        query = "SELECT " + ", ".join(
+            [f"{expr} AS {alias}" for expr, alias in zip(key_exprs, key_aliases)]
+            + agg_exprs
         )
+        query += f" FROM {from_part}"
+        if key_aliases:
+            query += f" GROUP BY {', '.join(key_aliases)}"
+            query += f" ORDER BY {', '.join(key_aliases)}"
+        cursor.execute(query, (*params, *cond_params))
+        groups = []
+        for row in cursor.fetchall():
+            group = dict(zip(keys + [name for name, _ in aggs], row))
+            if group.get(calls_stats.TIME_BUCKET_KEY) is not None:
+                group[calls_stats.TIME_BUCKET_KEY] = calls_stats.bucket_start(
+                    group[calls_stats.TIME_BUCKET_KEY]
+                )
+            groups.append(group)
+        return tsi.CallsQueryStatsRes(count=count, groups=groups)
 
     def calls_delete(self, req: tsi.CallsDeleteReq) -> tsi.CallsDeleteRes:
         # update row with a deleted_at field set to now
-        conn, cursor = get_conn_cursor(self.db_path)
-        with self.lock:
-            recursive_query = """
-                WITH RECURSIVE Descendants AS (
-                    SELECT id
-                    FROM calls
-                    WHERE project_id = ? AND
-                        deleted_at IS NULL AND
-                        parent_id IN (SELECT id FROM calls WHERE id IN ({}))
-
-                    UNION ALL
-
-                    SELECT c.id
-                    FROM calls c
-                    JOIN Descendants d ON c.parent_id = d.id
-                    WHERE c.deleted_at IS NULL
-                )
-                SELECT id FROM Descendants;
-            """.format(
-                ", ".join("?" * len(req.call_ids))
+        self._flush_calls()
+        conn, cursor = self._get_conn_cursor()
+        with self.lock, conn:
+            cursor.execute(
+                _call_tree_query(
+                    ["id"], f"id IN ({', '.join('?' * len(req.call_ids))})"
+                ),
+                [req.project_id, *req.call_ids, req.project_id],
             )
-
-            params = [req.project_id] + req.call_ids
-            cursor.execute(recursive_query, params)
             all_ids = [x[0] for x in cursor.fetchall()] + req.call_ids
 
             # set deleted_at for all children and parents
@@ -494,12 +498,50 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
             """.format(
                 ", ".join("?" * len(all_ids))
             )
-            print("MUTATION", delete_query)
             cursor.execute(delete_query, all_ids)
-            conn.commit()
 
         return tsi.CallsDeleteRes()
 
+    def trace_tree_read(self, req: tsi.TraceTreeReadReq) -> tsi.TraceTreeReadRes:
+        columns = trace_tree_columns(req)
+        self._flush_calls()
+        if req.trace_id is not None:
+            # The roots of the trace are the calls without a parent in it
+            root_condition = """trace_id = ? AND (parent_id IS NULL OR parent_id NOT IN (
+                SELECT id FROM calls WHERE project_id = ? AND trace_id = ?
+            ))"""
+            root_params = [req.trace_id, req.project_id, req.trace_id]
+            root_ids = None
+        else:
+            root_condition = "id = ?"
+            root_ids = [cast(str, req.root_call_id)]
+            root_params = root_ids
+        conn, cursor = self._get_conn_cursor()
+        cursor.execute(
+            _call_tree_query(columns, root_condition, req.max_depth),
+            [req.project_id, *root_params, req.project_id],
+        )
+        rows = {
+            row["id"]: row
+            for row in (dict(zip(columns, values)) for values in cursor.fetchall())
+        }
+        order = call_tree_preorder(
+            ((r["id"], r["parent_id"], r["started_at"]) for r in rows.values()),
+            root_ids=root_ids,
+        )
+        calls = []
+        for call_id, _ in order:
+            row = rows.get(call_id)
+            if row is None:
+                continue
+            for col in ("attributes", "inputs", "output", "summary"):
+                if row.get(col) is not None:
+                    row[col] = json.loads(row[col])
+            row.setdefault("attributes", {})
+            row.setdefault("inputs", {})
+            calls.append(tsi.CallSchema.model_validate(row))
+        return tsi.TraceTreeReadRes(calls=calls)
+
     def op_create(self, req: tsi.OpCreateReq) -> tsi.OpCreateRes:
         raise NotImplementedError()
 
@@ -510,13 +552,13 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         raise NotImplementedError()
 
     def obj_create(self, req: tsi.ObjCreateReq) -> tsi.ObjCreateRes:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         json_val = json.dumps(req.obj.val)
         digest = str_digest(json_val)
 
         req_obj = req.obj
         # TODO: version index isn't right here, what if we delete stuff?
-        with self.lock:
+        with self.lock, conn:
             cursor.execute("BEGIN TRANSACTION")
             # first get version count
             cursor.execute(
@@ -551,18 +593,20 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
                     1,
                 ),
             )
-            conn.commit()
         return tsi.ObjCreateRes(digest=digest)
 
     def obj_read(self, req: tsi.ObjReadReq) -> tsi.ObjReadRes:
-        conds = [f"object_id = '{req.object_id}'"]
+        conds = ["object_id = ?"]
+        parameters: list[Any] = [req.object_id]
         if req.digest == "latest":
             conds.append("is_latest = 1")
         else:
-            conds.append(f"digest = '{req.digest}'")
+            conds.append("digest = ?")
+            parameters.append(req.digest)
         objs = self._select_objs_query(
             req.project_id,
             conditions=conds,
+            parameters=parameters,
         )
         if len(objs) == 0:
             raise NotFoundError(f"Obj {req.object_id}:{req.digest} not found")
@@ -571,6 +615,7 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
 
     def objs_query(self, req: tsi.ObjQueryReq) -> tsi.ObjQueryRes:
         conds: list[str] = []
+        parameters: list[Any] = []
         if req.filter:
             if req.filter.is_op is not None:
                 if req.filter.is_op:
@@ -578,61 +623,116 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
                 else:
                     conds.append("kind != 'op'")
             if req.filter.object_ids:
-                in_list = ", ".join([f"'{n}'" for n in req.filter.object_ids])
+                in_list = ", ".join("?" for _ in req.filter.object_ids)
                 conds.append(f"object_id IN ({in_list})")
+                parameters.extend(req.filter.object_ids)
             if req.filter.latest_only:
                 conds.append("is_latest = 1")
             if req.filter.base_object_classes:
-                in_list = ", ".join([f"'{t}'" for t in req.filter.base_object_classes])
+                in_list = ", ".join("?" for _ in req.filter.base_object_classes)
                 conds.append(f"base_object_class IN ({in_list})")
+                parameters.extend(req.filter.base_object_classes)
 
         objs = self._select_objs_query(
             req.project_id,
             conditions=conds,
+            parameters=parameters,
         )
 
         return tsi.ObjQueryRes(objs=objs)
 
     def table_create(self, req: tsi.TableCreateReq) -> tsi.TableCreateRes:
-        conn, cursor = get_conn_cursor(self.db_path)
+        row_digests = self._insert_table_rows(req.table.project_id, req.table.rows)
+        digest = self._insert_table(req.table.project_id, row_digests)
+        return tsi.TableCreateRes(digest=digest)
+
+    def table_rows_create(self, req: tsi.TableRowsCreateReq) -> tsi.TableRowsCreateRes:
+        row_digests = self._insert_table_rows(req.project_id, req.rows)
+        return tsi.TableRowsCreateRes(digests=row_digests)
+
+    def table_create_from_digests(
+        self, req: tsi.TableCreateFromDigestsReq
+    ) -> tsi.TableCreateRes:
+        conn, cursor = self._get_conn_cursor()
+        row_digests: list[str] = []
+        if req.base_digest is not None:
+            cursor.execute(
+                "SELECT row_digests FROM tables WHERE project_id = ? AND digest = ?",
+                (req.project_id, req.base_digest),
+            )
+            base_row = cursor.fetchone()
+            if base_row is None:
+                raise NotFoundError(f"Table {req.base_digest} not found")
+            row_digests = json.loads(base_row[0])
+        if req.remove_row_digests:
+            removed = set(req.remove_row_digests)
+            row_digests = [d for d in row_digests if d not in removed]
+        missing = set(req.row_digests) - set(
+            self.digests_exist(
+                tsi.DigestsExistReq(
+                    project_id=req.project_id,
+                    table_rows=list(set(req.row_digests)),
+                )
+            ).table_rows
+        )
+        if missing:
+            raise InvalidRequest(f"Unknown table row digests: {sorted(missing)}")
+        row_digests.extend(req.row_digests)
+        digest = self._insert_table(req.project_id, row_digests)
+        return tsi.TableCreateRes(digest=digest)
+
+    def _insert_table_rows(self, project_id: str, rows: list[Any]) -> list[str]:
+        conn, cursor = self._get_conn_cursor()
         insert_rows = []
-        for r in req.table.rows:
+        for r in rows:
             if not isinstance(r, dict):
                 raise ValueError("All rows must be dictionaries")
             row_json = json.dumps(r)
             row_digest = str_digest(row_json)
-            insert_rows.append((req.table.project_id, row_digest, row_json))
-        with self.lock:
+            insert_rows.append((project_id, row_digest, row_json))
+        with self.lock, conn:
             cursor.executemany(
                 "INSERT OR IGNORE INTO table_rows (project_id, digest, val) VALUES (?, ?, ?)",
                 insert_rows,
             )
+        return [r[1] for r in insert_rows]
 
-            row_digests = [r[1] for r in insert_rows]
-
-            table_hasher = hashlib.sha256()
-            for row_digest in row_digests:
-                table_hasher.update(row_digest.encode())
-            digest = table_hasher.hexdigest()
-
+    def _insert_table(self, project_id: str, row_digests: list[str]) -> str:
+        conn, cursor = self._get_conn_cursor()
+        digest = table_digest(row_digests)
+        with self.lock, conn:
             cursor.execute(
                 "INSERT OR IGNORE INTO tables (project_id, digest, row_digests) VALUES (?, ?, ?)",
-                (req.table.project_id, digest, json.dumps(row_digests)),
+                (project_id, digest, json.dumps(row_digests)),
             )
-            conn.commit()
-
-        return tsi.TableCreateRes(digest=digest)
+        return digest
 
     def table_query(self, req: tsi.TableQueryReq) -> tsi.TableQueryRes:
-        conds = []
-        if req.filter:
-            raise NotImplementedError("Table filter not implemented")
-        else:
-            conds.append("1 = 1")
-        rows = self._table_query(req.project_id, req.digest, conditions=conds)
-
+        rows = self._table_query(
+            req.project_id,
+            req.digest,
+            row_digests=req.filter.row_digests if req.filter else None,
+            limit=req.limit,
+            offset=req.offset,
+            columns=req.columns,
+        )
         return tsi.TableQueryRes(rows=rows)
 
+    def table_query_stats(self, req: tsi.TableQueryStatsReq) -> tsi.TableQueryStatsRes:
+        conn, cursor = self._get_conn_cursor()
+        conds = ["tables.project_id = ?", "tables.digest = ?"]
+        parameters: list[Any] = [req.project_id, req.digest]
+        if req.filter and req.filter.row_digests:
+            placeholders = ", ".join("?" for _ in req.filter.row_digests)
+            conds.append(f"json_each.value IN ({placeholders})")
+            parameters.extend(req.filter.row_digests)
+        cursor.execute(
+            "SELECT COUNT(*) FROM tables, json_each(tables.row_digests) WHERE "
+            + " AND ".join(conds),
+            parameters,
+        )
+        return tsi.TableQueryStatsRes(count=cursor.fetchone()[0])
+
     def refs_read_batch(self, req: tsi.RefsReadBatchReq) -> tsi.RefsReadBatchRes:
         # TODO: This reads one ref at a time, it should read them in batches
         # where it can. Like it should group by object that we need to read.
@@ -647,13 +747,10 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         parsed_obj_refs = cast(list[refs.ObjectRef], parsed_refs)
 
         def read_ref(r: refs.ObjectRef) -> Any:
-            conds = [
-                f"object_id = '{r.name}'",
-                f"digest = '{r.digest}'",
-            ]
             objs = self._select_objs_query(
                 f"{r.entity}/{r.project}",
-                conditions=conds,
+                conditions=["object_id = ?", "digest = ?"],
+                parameters=[r.name, r.digest],
             )
             if len(objs) == 0:
                 raise NotFoundError(f"Obj {r.name}:{r.digest} not found")
@@ -691,9 +788,9 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         return tsi.RefsReadBatchRes(vals=[read_ref(r) for r in parsed_obj_refs])
 
     def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         digest = bytes_digest(req.content)
-        with self.lock:
+        with self.lock, conn:
             cursor.execute(
                 "INSERT OR IGNORE INTO files (project_id, digest, val) VALUES (?, ?, ?)",
                 (
@@ -702,19 +799,65 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
                     req.content,
                 ),
             )
-            conn.commit()
         return tsi.FileCreateRes(digest=digest)
 
+    def digests_exist(self, req: tsi.DigestsExistReq) -> tsi.DigestsExistRes:
+        conn, cursor = self._get_conn_cursor()
+
+        def existing(table: str, digests: list[str]) -> list[str]:
+            if not digests:
+                return []
+            placeholders = ", ".join("?" for _ in digests)
+            cursor.execute(
+                f"SELECT digest FROM {table} WHERE project_id = ? AND digest IN ({placeholders})",
+                [req.project_id, *digests],
+            )
+            found = {row[0] for row in cursor.fetchall()}
+            return [d for d in digests if d in found]
+
+        objs = []
+        if req.objs:
+            placeholders = ", ".join("?" for _ in req.objs)
+            cursor.execute(
+                f"SELECT object_id, digest FROM objects WHERE project_id = ? AND digest IN ({placeholders})",
+                [req.project_id, *(o.digest for o in req.objs)],
+            )
+            found = {(row[0], row[1]) for row in cursor.fetchall()}
+            objs = [o for o in req.objs if (o.object_id, o.digest) in found]
+        return tsi.DigestsExistRes(
+            files=existing("files", req.files),
+            tables=existing("tables", req.tables),
+            table_rows=existing("table_rows", req.table_rows),
+            objs=objs,
+        )
+
     def file_content_read(self, req: tsi.FileContentReadReq) -> tsi.FileContentReadRes:
-        conn, cursor = get_conn_cursor(self.db_path)
+        return tsi.FileContentReadRes(content=b"".join(self.file_content_stream(req)))
+
+    def file_content_stream(self, req: tsi.FileContentReadReq) -> Iterator[bytes]:
+        conn, cursor = self._get_conn_cursor()
         cursor.execute(
-            "SELECT val FROM files WHERE project_id = ? AND digest = ?",
+            "SELECT length(val) FROM files WHERE project_id = ? AND digest = ?",
             (req.project_id, req.digest),
         )
         query_result = cursor.fetchone()
         if query_result is None:
             raise NotFoundError(f"File {req.digest} not found")
-        return tsi.FileContentReadRes(content=query_result[0])
+        size = query_result[0]
+        end = size if req.length is None else min(size, req.offset + req.length)
+        for start in range(req.offset, end, FILE_STREAM_CHUNK_SIZE):
+            # substr is 1-indexed, and returns a slice of the blob without
+            # reading the rest of it
+            cursor.execute(
+                "SELECT substr(val, ?, ?) FROM files WHERE project_id = ? AND digest = ?",
+                (
+                    start + 1,
+                    min(FILE_STREAM_CHUNK_SIZE, end - start),
+                    req.project_id,
+                    req.digest,
+                ),
+            )
+            yield cursor.fetchone()[0]
 
     def feedback_create(
         self, req: tsi.FeedbackCreateReqForInsert
@@ -752,10 +895,9 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
             "payload": payload,
             "created_at": created_at,
         }
-        conn, cursor = get_conn_cursor(self.db_path)
-        with self.lock:
+        conn, cursor = self._get_conn_cursor()
+        with self.lock, conn:
             TABLE_FEEDBACK.insert(row).execute(cursor)
-            conn.commit()
         return tsi.FeedbackCreateRes(
             id=feedback_id,
             created_at=created_at,
@@ -764,7 +906,7 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         )
 
     def feedback_query(self, req: tsi.FeedbackQueryReq) -> tsi.FeedbackQueryRes:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         query = TABLE_FEEDBACK.select()
         query = query.project_id(req.project_id)
         query = query.fields(req.fields)
@@ -780,52 +922,82 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         #       This would allow us to return the number of rows deleted, and complain
         #       if too many things would be deleted.
         validate_feedback_purge_req(req)
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         query = TABLE_FEEDBACK.purge()
         query = query.project_id(req.project_id)
         query = query.where(req.query)
-        with self.lock:
+        with self.lock, conn:
             query.execute(cursor)
-            conn.commit()
         return tsi.FeedbackPurgeRes()
 
     def _table_query(
         self,
         project_id: str,
         digest: str,
-        conditions: Optional[list[str]] = None,
+        row_digests: Optional[list[str]] = None,
         limit: Optional[int] = None,
-        parameters: Optional[dict[str, Any]] = None,
+        offset: Optional[int] = None,
+        columns: Optional[list[str]] = None,
     ) -> list[tsi.TableRowSchema]:
-        conn, cursor = get_conn_cursor(self.db_path)
-        conds = ["project_id = {project_id: String}"]
-        if conditions:
-            conds.extend(conditions)
-
+        conn, cursor = self._get_conn_cursor()
+        conds = ["tables.project_id = ?", "tables.digest = ?"]
+        parameters: list[Any] = [project_id, digest]
+        page_part = ""
+        if row_digests:
+            placeholders = ", ".join("?" for _ in row_digests)
+            conds.append(f"json_each.value IN ({placeholders})")
+            parameters.extend(row_digests)
+            if limit is not None or offset:
+                # SQLite only supports OFFSET together with LIMIT
+                page_part = "LIMIT ? OFFSET ?"
+                parameters.extend([-1 if limit is None else limit, offset or 0])
+        else:
+            # Without a filter, the page is a range of positions in the table
+            if offset:
+                conds.append("json_each.key >= ?")
+                parameters.append(offset)
+            if limit is not None:
+                conds.append("json_each.key < ?")
+                parameters.append((offset or 0) + limit)
+                page_part = "LIMIT ?"
+                parameters.append(limit)
         predicate = " AND ".join(conds)
-        # First get the row IDs by querying tables
+
+        val_part = "table_rows.val"
+        if columns is not None:
+            placeholders = ", ".join("?" for _ in columns)
+            val_part = f"""CASE WHEN json_type(table_rows.val) = 'object' THEN (
+                    SELECT json_group_object(key, value)
+                    FROM json_each(table_rows.val)
+                    WHERE key IN ({placeholders})
+                ) ELSE table_rows.val END"""
+
+        # The rows are paged by their position in the table before they are
+        # joined, so a page only reads its own rows. json_each yields the
+        # digests in order, so the page ends the scan of the table early.
         cursor.execute(
-            """
+            f"""
             WITH OrderedDigests AS (
                 SELECT
-                    json_each.value AS digest
+                    json_each.value AS digest,
+                    json_each.id AS row_index
                 FROM
                     tables,
                     json_each(tables.row_digests)
                 WHERE
-                    tables.project_id = ? AND
-                    tables.digest = ?
-                ORDER BY
-                    json_each.id
+                    {predicate}
+                {page_part}
             )
             SELECT
                 table_rows.digest,
-                table_rows.val
+                {val_part}
             FROM
                 OrderedDigests
                 JOIN table_rows ON OrderedDigests.digest = table_rows.digest
+            ORDER BY
+                OrderedDigests.row_index
             """,
-            (project_id, digest),
+            [*parameters, *(columns or [])],
         )
         query_result = cursor.fetchall()
         return [
@@ -833,7 +1005,7 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         ]
 
     def _table_row_read(self, project_id: str, row_digest: str) -> tsi.TableRowSchema:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         # Now get the rows
         cursor.execute(
             """
@@ -854,13 +1026,14 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         project_id: str,
         conditions: Optional[list[str]] = None,
         limit: Optional[int] = None,
+        parameters: Optional[list[Any]] = None,
     ) -> list[tsi.ObjSchema]:
-        conn, cursor = get_conn_cursor(self.db_path)
+        conn, cursor = self._get_conn_cursor()
         pred = " AND ".join(conditions or ["1 = 1"])
         cursor.execute(
             """SELECT * FROM objects WHERE deleted_at IS NULL AND project_id = ? AND """
             + pred,
-            (project_id,),
+            (project_id, *(parameters or [])),
         )
         query_result = cursor.fetchall()
         result: list[tsi.ObjSchema] = []
@@ -882,6 +1055,183 @@ class SqliteTraceServer(tsi.TraceServerInterfacePostAuth):
         return result
 
 
+def _call_tree_query(
+    columns: list[str], root_condition: str, max_depth: Optional[int] = None
+) -> str:
+    """Selects `columns` of the calls matching `root_condition` and of their
+    descendants, in one recursive query.
+
+    Its parameters are the project id, those of `root_condition`, and the
+    project id again.
+    """
+    depth_condition = ""
+    if max_depth is not None:
+        depth_condition = f"AND call_tree.depth < {int(max_depth)}"
+    select_part = ", ".join(f"calls.{col}" for col in columns)
+    return f"""
+        WITH RECURSIVE call_tree(id, depth) AS (
+            SELECT id, 0
+            FROM calls
+            WHERE project_id = ? AND deleted_at IS NULL AND ({root_condition})
+
+            UNION
+
+            SELECT c.id, call_tree.depth + 1
+            FROM calls c
+            JOIN call_tree ON c.parent_id = call_tree.id
+            WHERE c.project_id = ? AND c.deleted_at IS NULL {depth_condition}
+        )
+        SELECT {select_part}
+        FROM call_tree JOIN calls ON calls.id = call_tree.id
+    """
+
+
+def _calls_query_conditions(
+    filter: Optional[tsi._CallsFilter], query: Optional[tsi_query.Query]
+) -> tuple[list[str], list[Any]]:
+    """Returns the conditions of a calls filter and query, and the parameters
+    they use, in order."""
+    conds = []
+    params: list[Any] = []
+
+    def in_condition(column: str, values: list[str]) -> str:
+        params.extend(values)
+        return f"{column} IN ({', '.join('?' for _ in values)})"
+
+    if filter:
+        if filter.op_names:
+            or_conditions: list[str] = []
+
+            non_wildcarded_names: list[str] = []
+            wildcarded_names: list[str] = []
+            for name in filter.op_names:
+                if name.endswith(WILDCARD_ARTIFACT_VERSION_AND_PATH):
+                    wildcarded_names.append(name)
+                else:
+                    non_wildcarded_names.append(name)
+
+            if non_wildcarded_names:
+                or_conditions.append(in_condition("op_name", non_wildcarded_names))
+
+            for name in wildcarded_names:
+                like_name = name[: -len(WILDCARD_ARTIFACT_VERSION_AND_PATH)] + "%"
+                or_conditions.append("op_name LIKE ?")
+                params.append(like_name)
+
+            if or_conditions:
+                conds.append("(" + " OR ".join(or_conditions) + ")")
+
+        if filter.input_refs:
+            conds.append(
+                "(" + " OR ".join("input_refs LIKE ?" for _ in filter.input_refs) + ")"
+            )
+            params.extend(f"%{ref}%" for ref in filter.input_refs)
+        if filter.output_refs:
+            conds.append(
+                "("
+                + " OR ".join("output_refs LIKE ?" for _ in filter.output_refs)
+                + ")"
+            )
+            params.extend(f"%{ref}%" for ref in filter.output_refs)
+        if filter.parent_ids:
+            conds.append(in_condition("parent_id", filter.parent_ids))
+        if filter.trace_ids:
+            conds.append(in_condition("trace_id", filter.trace_ids))
+        if filter.call_ids:
+            conds.append(in_condition("id", filter.call_ids))
+        if filter.trace_roots_only:
+            conds.append("parent_id IS NULL")
+        if filter.wb_run_ids:
+            conds.append(in_condition("wb_run_id", filter.wb_run_ids))
+        if filter.cache_keys:
+            conds.append(in_condition(_CALL_CACHE_KEY_EXPR, filter.cache_keys))
+
+    if query:
+        # This is the mongo-style query
+        def process_operation(operation: tsi_query.Operation) -> str:
+            cond = None
+
+            if isinstance(operation, tsi_query.AndOperation):
+                lhs_part = process_operand(operation.and_[0])
+                rhs_part = process_operand(operation.and_[1])
+                cond = f"({lhs_part} AND {rhs_part})"
+            elif isinstance(operation, tsi_query.OrOperation):
+                lhs_part = process_operand(operation.or_[0])
+                rhs_part = process_operand(operation.or_[1])
+                cond = f"({lhs_part} OR {rhs_part})"
+            elif isinstance(operation, tsi_query.NotOperation):
+                operand_part = process_operand(operation.not_[0])
+                cond = f"(NOT ({operand_part}))"
+            elif isinstance(operation, tsi_query.EqOperation):
+                lhs_part = process_operand(operation.eq_[0])
+                rhs_part = process_operand(operation.eq_[1])
+                cond = f"({lhs_part} = {rhs_part})"
+            elif isinstance(operation, tsi_query.GtOperation):
+                lhs_part = process_operand(operation.gt_[0])
+                rhs_part = process_operand(operation.gt_[1])
+                cond = f"({lhs_part} > {rhs_part})"
+            elif isinstance(operation, tsi_query.GteOperation):
+                lhs_part = process_operand(operation.gte_[0])
+                rhs_part = process_operand(operation.gte_[1])
+                cond = f"({lhs_part} >= {rhs_part})"
+            elif isinstance(operation, tsi_query.ContainsOperation):
+                lhs_part = process_operand(operation.contains_.input)
+                rhs_part = process_operand(operation.contains_.substr)
+                if operation.contains_.case_insensitive:
+                    lhs_part = f"LOWER({lhs_part})"
+                    rhs_part = f"LOWER({rhs_part})"
+                cond = f"instr({lhs_part}, {rhs_part})"
+            else:
+                raise ValueError(f"Unknown operation type: {operation}")
+
+            return cond
+
+        def process_operand(operand: tsi_query.Operand) -> str:
+            if isinstance(operand, tsi_query.LiteralOperation):
+                params.append(operand.literal_)
+                return "?"
+            elif isinstance(operand, tsi_query.GetFieldOperator):
+                field = _transform_external_calls_field_to_internal_calls_field(
+                    operand.get_field_, None
+                )
+                return field
+            elif isinstance(operand, tsi_query.ConvertOperation):
+                field = process_operand(operand.convert_.input)
+                convert_to = operand.convert_.to
+                if convert_to == "int":
+                    sql_type = "INT"
+                elif convert_to == "double":
+                    sql_type = "FLOAT"
+                elif convert_to == "bool":
+                    sql_type = "BOOL"
+                elif convert_to == "string":
+                    sql_type = "TEXT"
+                else:
+                    raise ValueError(f"Unknown cast: {convert_to}")
+                return f"CAST({field} AS {sql_type})"
+            elif isinstance(
+                operand,
+                (
+                    tsi_query.AndOperation,
+                    tsi_query.OrOperation,
+                    tsi_query.NotOperation,
+                    tsi_query.EqOperation,
+                    tsi_query.GtOperation,
+                    tsi_query.GteOperation,
+                    tsi_query.ContainsOperation,
+                ),
+            ):
+                return process_operation(operand)
+            else:
+                raise ValueError(f"Unknown operand type: {operand}")
+
+        filter_cond = process_operation(query.expr_)
+
+        conds.append(filter_cond)
+
+    return conds, params
+
+
 def get_type(val: Any) -> str:
     if val == None:
         return "none"
@@ -917,6 +1267,98 @@ def get_base_object_class(val: Any) -> Optional[str]:
     return None
 
 
+def _calls_stats_exprs(
+    req: tsi.CallsQueryStatsReq,
+    keys: list[str],
+    aggs: list[tuple[str, tsi.CallsStatsAggregation]],
+) -> tuple[list[str], list[str], list[Any]]:
+    """Compiles the groups and aggregations of a stats request.
+
+    Returns the key expressions, the aggregate expressions and the parameters
+    they use, in order.
+    """
+    params: list[Any] = []
+    key_exprs = []
+    for key in keys:
+        if key == calls_stats.TIME_BUCKET_KEY:
+            # `group_keys` checked that this is a positive int
+            seconds = int(cast(int, req.time_bucket_seconds))
+            key_exprs.append(
+                f"(CAST(strftime('%s', started_at) AS INTEGER) / {seconds}) * {seconds}"
+            )
+        elif key == calls_stats.USAGE_MODEL_KEY:
+            key_exprs.append("usage.key")
+        else:
+            key_exprs.append(
+                _transform_external_calls_field_to_internal_calls_field(key)
+            )
+
+    agg_exprs = []
+    for _, agg in aggs:
+        if agg.fn == "count":
+            agg_exprs.append("COUNT(*)")
+            continue
+        if agg.fn == "count_exceptions":
+            agg_exprs.append("COUNT(exception)")
+            continue
+        field = cast(str, agg.field)
+        if field.startswith(calls_stats.USAGE_FIELD_PREFIX):
+            value_expr = "CAST(json_extract(usage.value, ?) AS FLOAT)"
+            params.append(
+                _quote_json_path(field[len(calls_stats.USAGE_FIELD_PREFIX) :])
+            )
+        else:
+            value_expr = _transform_external_calls_field_to_internal_calls_field(
+                field, "float"
+            )
+        if agg.fn == "quantile":
+            agg_exprs.append(f"quantile({value_expr}, ?)")
+            params.append(agg.quantile)
+        else:
+            agg_exprs.append(f"{agg.fn.upper()}({value_expr})")
+    return key_exprs, agg_exprs, params
+
+
+def _flush_at_exit(server_ref: "weakref.ref[SqliteTraceServer]") -> None:
+    server = server_ref()
+    if server is not None:
+        server._flush_calls()
+
+
+class _QuantileAggregate:
+    """The `quantile(value, level)` aggregate, interpolating between values."""
+
+    def __init__(self) -> None:
+        self.values: list[float] = []
+        self.level = 0.5
+
+    def step(self, value: Optional[float], level: float) -> None:
+        self.level = level
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self) -> Optional[float]:
+        if not self.values:
+            return None
+        values = sorted(self.values)
+        pos = (len(values) - 1) * self.level
+        lower = int(pos)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+
+_CALLS_JSON_COLUMNS = ("attributes", "inputs", "output", "summary")
+
+
+def _sql_string(value: str) -> str:
+    """Quotes a string as an SQL literal.
+
+    Used for JSON paths, which are inlined rather than bound so that the
+    expression indexes on them can be used.
+    """
+    return "'" + value.replace("'", "''") + "'"
+
+
 def _quote_json_path(path: str) -> str:
     parts = path.split(".")
     parts_final = []
@@ -929,10 +1371,51 @@ def _quote_json_path(path: str) -> str:
     return "$" + "".join(parts_final)
 
 
+# Expressions of `CALL_DERIVED_FIELDS` over the columns of the calls table
+_CALL_DERIVED_FIELD_EXPRS = {
+    # Whole milliseconds, like ClickHouse (julianday is only that exact)
+    "latency_ms": "CAST(ROUND((julianday(ended_at) - julianday(started_at)) * 86400000.0) AS INTEGER)",
+    "status": "CASE WHEN exception IS NOT NULL THEN 'error' WHEN ended_at IS NULL THEN 'running' ELSE 'success' END",
+    **{
+        tokens: f"CASE WHEN summary IS NULL THEN NULL ELSE (SELECT COALESCE(SUM(json_extract(value, '$.{tokens}')), 0) FROM json_each(summary, '$.usage')) END"
+        for tokens in ("total_tokens", "prompt_tokens", "completion_tokens")
+    },
+    "model": "(SELECT key FROM json_each(summary, '$.usage') LIMIT 1)",
+}
+
+# Key of the calls of cached ops, filtered on with the same expression as the
+# index on it
+_CALL_CACHE_KEY_EXPR = (
+    """CAST(json_extract("attributes", '$."weave_cache_key"') AS TEXT)"""
+)
+
+# Secondary indexes, as (name, table, columns or expressions). Calls are
+# always read within a project; sorting and filtering by latency and status
+# can use their expression indexes, as the queries use the same expressions.
+_INDEXES = [
+    ("calls_started_at_idx", "calls", ["project_id", "started_at"]),
+    ("calls_trace_id_idx", "calls", ["project_id", "trace_id"]),
+    ("calls_parent_id_idx", "calls", ["project_id", "parent_id"]),
+    ("calls_op_name_idx", "calls", ["project_id", "op_name", "started_at"]),
+    ("calls_wb_run_id_idx", "calls", ["project_id", "wb_run_id"]),
+    (
+        "calls_latency_ms_idx",
+        "calls",
+        ["project_id", _CALL_DERIVED_FIELD_EXPRS["latency_ms"]],
+    ),
+    ("calls_status_idx", "calls", ["project_id", _CALL_DERIVED_FIELD_EXPRS["status"]]),
+    # Lookups of memoized op outputs filter on the `weave_cache_key` attribute
+    ("calls_cache_key_idx", "calls", ["project_id", _CALL_CACHE_KEY_EXPR]),
+    ("objects_object_id_idx", "objects", ["project_id", "object_id"]),
+]
+
+
 def _transform_external_calls_field_to_internal_calls_field(
     field: str,
     cast: Optional[str] = None,
 ) -> str:
+    if field in _CALL_DERIVED_FIELD_EXPRS:
+        return "(" + _CALL_DERIVED_FIELD_EXPRS[field] + ")"
     json_path = None
     if field == "inputs" or field.startswith("inputs."):
         if field == "inputs":
@@ -975,9 +1458,9 @@ def _transform_external_calls_field_to_internal_calls_field(
         field = (
             "CAST(json_extract("
             + json.dumps(field)
-            + ", '"
-            + json_path
-            + "') AS "
+            + ", "
+            + _sql_string(json_path)
+            + ") AS "
             + sql_type
             + ")"
         )
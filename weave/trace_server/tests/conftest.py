@@ -0,0 +1,38 @@
+import types
+
+import pytest
+
+from weave.trace_server import clickhouse_trace_server_batched as chts
+
+
+class FakeClickHouseTraceServer(chts.ClickHouseTraceServer):
+    """A ClickHouse trace server that records its queries and inserts instead
+    of sending them to a database.
+
+    Queries are answered by `respond(query, parameters)`, which tests replace
+    to return the rows they need. By default every query returns no rows.
+    """
+
+    def __init__(self):
+        super().__init__(host="localhost")
+        self.queries = []
+        self.inserts = []
+
+    def respond(self, query, parameters):
+        return []
+
+    def _query_stream(self, query, parameters, column_formats=None):
+        self.queries.append((query, parameters))
+        return iter(self.respond(query, parameters))
+
+    def _query(self, query, parameters, column_formats=None):
+        self.queries.append((query, parameters))
+        return types.SimpleNamespace(result_rows=list(self.respond(query, parameters)))
+
+    def _insert(self, table, data, column_names, settings=None):
+        self.inserts.append((table, [dict(zip(column_names, row)) for row in data]))
+
+
+@pytest.fixture
+def ch_server():
+    return FakeClickHouseTraceServer()
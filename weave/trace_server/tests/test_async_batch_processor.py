@@ -0,0 +1,193 @@
+import threading
+import time
+
+from weave.trace_server.async_batch_processor import AsyncBatchProcessor
+
+
+def test_flush_processes_everything_without_stopping():
+    processed = []
+    processor = AsyncBatchProcessor(processed.extend, min_batch_interval=60)
+    processor.enqueue([1, 2, 3])
+    assert processor.flush(timeout=5)
+    assert processed == [1, 2, 3]
+
+    # The processor is still usable after a flush
+    processor.enqueue([4])
+    assert processor.flush(timeout=5)
+    assert processed == [1, 2, 3, 4]
+    processor.close()
+
+
+def test_flush_does_not_wait_for_items_enqueued_after_it():
+    processed = []
+
+    def processor_fn(batch):
+        # Slower than the producer, so the queue never drains
+        time.sleep(0.01)
+        processed.extend(batch)
+
+    processor = AsyncBatchProcessor(
+        processor_fn, max_batch_size=10, min_batch_interval=60
+    )
+    processor.enqueue(list(range(100)))
+    stop = threading.Event()
+
+    def produce():
+        while not stop.is_set():
+            processor.enqueue([-1])
+            time.sleep(0.0001)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    try:
+        assert processor.flush(timeout=5)
+        assert processed[:100] == list(range(100))
+    finally:
+        stop.set()
+        producer.join()
+        processor.close()
+
+
+def test_worker_survives_processor_errors():
+    processed = []
+
+    def processor_fn(batch):
+        if 0 in batch:
+            raise ValueError("boom")
+        processed.extend(batch)
+
+    processor = AsyncBatchProcessor(processor_fn, min_batch_interval=60)
+    processor.enqueue([0])
+    assert processor.flush(timeout=5)
+    processor.enqueue([1])
+    assert processor.flush(timeout=5)
+    assert processed == [1]
+    processor.close()
+
+
+def test_drop_oldest_backpressure():
+    release = threading.Event()
+    processed = []
+
+    def processor_fn(batch):
+        release.wait()
+        processed.extend(batch)
+
+    processor = AsyncBatchProcessor(
+        processor_fn,
+        max_batch_size=1,
+        min_batch_interval=0.01,
+        max_queue_size=2,
+        backpressure_policy="drop_oldest",
+    )
+    # Let the worker pick up the first item and block on it
+    processor.enqueue([0])
+    while processor.metrics().queue_depth > 0:
+        pass
+    processor.enqueue([1, 2, 3, 4])
+    release.set()
+    assert processor.flush(timeout=5)
+    assert processor.num_dropped == 2
+    assert processed == [0, 3, 4]
+    processor.close()
+
+
+def test_spill_backpressure_keeps_order():
+    release = threading.Event()
+    processed = []
+
+    def processor_fn(batch):
+        release.wait()
+        processed.extend(batch)
+
+    processor = AsyncBatchProcessor(
+        processor_fn,
+        max_batch_size=2,
+        min_batch_interval=0.01,
+        max_queue_size=2,
+        backpressure_policy="spill",
+    )
+    items = list(range(10))
+    processor.enqueue(items)
+    release.set()
+    assert processor.flush(timeout=5)
+    assert processed == items
+    assert processor.num_dropped == 0
+    processor.close()
+
+
+def test_enqueue_after_close_is_processed_synchronously():
+    processed = []
+    processor = AsyncBatchProcessor(processed.extend, min_batch_interval=60)
+    processor.close()
+    processor.enqueue([1])
+    assert processed == [1]
+
+
+def test_full_batch_is_sent_without_waiting_for_the_interval():
+    sent = threading.Event()
+    processor = AsyncBatchProcessor(
+        lambda batch: sent.set(), max_batch_size=3, min_batch_interval=60
+    )
+    processor.enqueue([1, 2])
+    assert not sent.wait(0.1)
+    processor.enqueue([3])
+    assert sent.wait(5)
+    processor.close()
+
+
+def test_byte_budget_triggers_and_splits_batches():
+    batches = []
+    processor = AsyncBatchProcessor(
+        batches.append,
+        min_batch_interval=60,
+        max_batch_bytes=10,
+        item_size_fn=len,
+    )
+    processor.enqueue(["aaaa", "bbbb", "cccc"])
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [["aaaa", "bbbb"]]
+    assert processor.flush(timeout=5)
+    assert batches == [["aaaa", "bbbb"], ["cccc"]]
+    processor.close()
+
+
+def test_linger_deadline_sends_partial_batch():
+    sent = threading.Event()
+    processor = AsyncBatchProcessor(lambda batch: sent.set(), min_batch_interval=0.05)
+    processor.enqueue([1])
+    assert sent.wait(5)
+    processor.close()
+
+
+def test_workers_keep_order_per_partition_and_report_metrics():
+    processed = []
+    lock = threading.Lock()
+
+    def processor_fn(batch):
+        time.sleep(0.001)
+        with lock:
+            processed.extend(batch)
+
+    processor = AsyncBatchProcessor(
+        processor_fn,
+        max_batch_size=3,
+        min_batch_interval=0.01,
+        num_workers=4,
+        partition_key_fn=lambda item: item[0],
+    )
+    items = [(trace, i) for i in range(20) for trace in "abcdef"]
+    processor.enqueue(items)
+    assert processor.flush(timeout=5)
+    for trace in "abcdef":
+        assert [i for t, i in processed if t == trace] == list(range(20))
+
+    metrics = processor.metrics()
+    assert metrics.num_processed == len(items)
+    assert metrics.queue_depth == 0
+    assert metrics.in_flight == 0
+    assert metrics.num_batches >= len(items) // 3
+    assert metrics.max_flush_latency >= metrics.avg_flush_latency > 0
+    processor.close()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import pytest
+import requests
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.async_remote_http_trace_server import (
+    AsyncRemoteHTTPTraceServer,
+)
+
+
+def _run_against_app(handlers, fn):
+    async def main():
+        app = web.Application()
+        for method, path, handler in handlers:
+            app.router.add_route(method, path, handler)
+        async with TestServer(app) as test_server:
+            server = AsyncRemoteHTTPTraceServer(str(test_server.make_url("")))
+            server.set_auth(("api", "key"))
+            try:
+                return await fn(server)
+            finally:
+                await server.close()
+
+    return asyncio.run(main())
+
+
+def test_requests_are_sent_concurrently_on_one_session():
+    seen = []
+
+    async def obj_read(request):
+        body = await request.json()
+        seen.append((request.headers.get("Authorization"), body["object_id"]))
+        await asyncio.sleep(0.05)
+        return web.json_response(
+            {
+                "obj": {
+                    "project_id": body["project_id"],
+                    "object_id": body["object_id"],
+                    "created_at": "2024-01-01T00:00:00Z",
+                    "digest": "abc",
+                    "version_index": 0,
+                    "is_latest": 1,
+                    "kind": "object",
+                    "base_object_class": None,
+                    "val": {"a": 1},
+                }
+            }
+        )
+
+    async def fn(server):
+        reqs = [
+            tsi.ObjReadReq(project_id="e/p", object_id=f"o{i}", digest="latest")
+            for i in range(20)
+        ]
+        return await asyncio.gather(*[server.obj_read(req) for req in reqs])
+
+    results = _run_against_app([("POST", "/obj/read", obj_read)], fn)
+    assert [r.obj.object_id for r in results] == [f"o{i}" for i in range(20)]
+    assert len(seen) == 20
+    assert all(auth is not None and auth.startswith("Basic ") for auth, _ in seen)
+
+
+def test_errors_and_compression():
+    received = []
+
+    async def server_info(request):
+        return web.json_response(
+            {
+                "min_required_weave_python_version": "0.0.0",
+                "accepted_request_encodings": ["gzip"],
+            }
+        )
+
+    async def obj_create(request):
+        raw = await request.read()
+        received.append((request.headers.get("Content-Encoding"), raw))
+        return web.json_response({"digest": "abc"})
+
+    async def obj_read(request):
+        return web.json_response({"reason": "not found"}, status=404)
+
+    async def fn(server):
+        req = tsi.ObjCreateReq(
+            obj=tsi.ObjSchemaForInsert(
+                project_id="e/p", object_id="o", val={"doc": "lorem " * 1000}
+            )
+        )
+        res = await server.obj_create(req)
+        with pytest.raises(requests.HTTPError) as e:
+            await server.obj_read(
+                tsi.ObjReadReq(project_id="e/p", object_id="o", digest="latest")
+            )
+        return req, res, e.value.response.status_code
+
+    req, res, status = _run_against_app(
+        [
+            ("GET", "/server_info", server_info),
+            ("POST", "/obj/create", obj_create),
+            ("POST", "/obj/read", obj_read),
+        ],
+        fn,
+    )
+    assert res.digest == "abc"
+    assert status == 404
+    # aiohttp transparently decodes the gzipped request body
+    encoding, raw = received[0]
+    assert encoding == "gzip"
+    assert json.loads(raw) == json.loads(req.model_dump_json(by_alias=True))
+
+
+def test_session_is_replaced_when_the_loop_changes():
+    server = AsyncRemoteHTTPTraceServer("http://localhost:1")
+
+    async def get_session():
+        return await server._get_session()
+
+    first = asyncio.run(get_session())
+    second = asyncio.run(get_session())
+    assert second is not first
+    # The session of the finished loop is closed, not leaked
+    assert first.closed
+    assert not second.closed
+    second.detach()
+
+
+def test_file_content_stream():
+    content = b"0123456789" * 1000
+
+    async def file_content(request):
+        body = await request.json()
+        if body["digest"] != "abc":
+            return web.json_response({"reason": "not found"}, status=404)
+        return web.Response(body=content)
+
+    async def fn(server):
+        req = tsi.FileContentReadReq(project_id="e/p", digest="abc")
+        chunks = [chunk async for chunk in server.file_content_stream(req)]
+        with pytest.raises(requests.HTTPError):
+            missing = tsi.FileContentReadReq(project_id="e/p", digest="missing")
+            [chunk async for chunk in server.file_content_stream(missing)]
+        return chunks
+
+    chunks = _run_against_app([("POST", "/files/content", file_content)], fn)
+    assert b"".join(chunks) == content
@@ -0,0 +1,75 @@
+import datetime
+
+from weave.trace_server.clickhouse_trace_server_batched import (
+    CallDeleteCHInsertable,
+    CallEndCHInsertable,
+    CallStartCHInsertable,
+    _merge_call_parts_rows,
+    all_call_insert_columns,
+)
+
+
+def _row(insertable):
+    params = insertable.model_dump()
+    return [params.get(key, None) for key in all_call_insert_columns]
+
+
+def _start(call_id):
+    return _row(
+        CallStartCHInsertable(
+            project_id="proj",
+            id=call_id,
+            trace_id="trace",
+            op_name="op",
+            started_at=datetime.datetime(2024, 1, 1),
+            attributes_dump="{}",
+            inputs_dump="{}",
+            input_refs=["weave:///a/b/object/c:d"],
+            wb_user_id="user",
+        )
+    )
+
+
+def _end(call_id):
+    return _row(
+        CallEndCHInsertable(
+            project_id="proj",
+            id=call_id,
+            ended_at=datetime.datetime(2024, 1, 2),
+            summary_dump="{}",
+            output_dump="1",
+            output_refs=["weave:///a/b/object/e:f"],
+        )
+    )
+
+
+def _get(row, col):
+    return row[all_call_insert_columns.index(col)]
+
+
+def test_merge_start_and_end_into_one_row():
+    rows = _merge_call_parts_rows([_start("a"), _start("b"), _end("a")])
+    assert len(rows) == 2
+    merged = rows[0]
+    assert _get(merged, "id") == "a"
+    assert _get(merged, "started_at") == datetime.datetime(2024, 1, 1)
+    assert _get(merged, "ended_at") == datetime.datetime(2024, 1, 2)
+    assert _get(merged, "output_dump") == "1"
+    assert _get(merged, "wb_user_id") == "user"
+    assert _get(merged, "input_refs") == ["weave:///a/b/object/c:d"]
+    assert _get(merged, "output_refs") == ["weave:///a/b/object/e:f"]
+    assert _get(rows[1], "id") == "b"
+    assert _get(rows[1], "ended_at") is None
+
+
+def test_merge_leaves_partial_and_deleted_calls_alone():
+    delete = _row(
+        CallDeleteCHInsertable(
+            project_id="proj",
+            id="a",
+            deleted_at=datetime.datetime(2024, 1, 3),
+            wb_user_id="user",
+        )
+    )
+    batch = [_end("x"), _start("a"), delete]
+    assert _merge_call_parts_rows(batch) == batch
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.errors import InvalidRequest
+
+
+def _respond_with(group_rows):
+    def respond(query, parameters):
+        if "COUNT(*)" in query:
+            return [(3,)]
+        return group_rows
+
+    return respond
+
+
+def test_grouped_stats_are_aggregated_in_clickhouse(ch_server):
+    bucket = datetime.datetime(2024, 1, 1)
+    ch_server.respond = _respond_with([("a", bucket, 3, 1, 250.0)])
+    res = ch_server.calls_query_stats(
+        tsi.CallsQueryStatsReq(
+            project_id="p",
+            group_by=["op_name"],
+            time_bucket_seconds=60,
+            aggregations=[
+                tsi.CallsStatsAggregation(fn="count"),
+                tsi.CallsStatsAggregation(fn="count_exceptions"),
+                tsi.CallsStatsAggregation(
+                    fn="quantile", field="latency_ms", quantile=0.95, name="p95"
+                ),
+            ],
+        )
+    )
+    assert res.count == 3
+    assert res.groups == [
+        {
+            "op_name": "a",
+            "time_bucket": bucket.replace(tzinfo=datetime.timezone.utc),
+            "count": 3,
+            "count_exceptions": 1,
+            "p95": 250.0,
+        }
+    ]
+    query, parameters = ch_server.queries[-1]
+    assert "toStartOfInterval(started_at" in query
+    assert "countIf(exception IS NOT NULL)" in query
+    assert "quantile(0.95)(" in query
+    assert "GROUP BY key_0, key_1" in query
+    assert 60 in parameters.values()
+
+
+def test_usage_is_grouped_by_model(ch_server):
+    ch_server.respond = _respond_with([("gpt-4", 60.0)])
+    res = ch_server.calls_query_stats(
+        tsi.CallsQueryStatsReq(
+            project_id="p",
+            group_by=["usage_model"],
+            aggregations=[
+                tsi.CallsStatsAggregation(
+                    fn="sum", field="usage.total_tokens", name="tokens"
+                )
+            ],
+        )
+    )
+    assert res.groups == [{"usage_model": "gpt-4", "tokens": 60.0}]
+    query, parameters = ch_server.queries[-1]
+    assert "ARRAY JOIN JSONExtractKeys(" in query
+    assert "total_tokens" in parameters.values()
+
+
+def test_invalid_stats_requests(ch_server):
+    for req in [
+        tsi.CallsQueryStatsReq(project_id="p", group_by=["inputs"]),
+        tsi.CallsQueryStatsReq(project_id="p", time_bucket_seconds=0),
+        tsi.CallsQueryStatsReq(
+            project_id="p",
+            aggregations=[tsi.CallsStatsAggregation(fn="avg", field="id")],
+        ),
+        tsi.CallsQueryStatsReq(
+            project_id="p",
+            aggregations=[tsi.CallsStatsAggregation(fn="quantile", field="latency_ms")],
+        ),
+    ]:
+        with pytest.raises(InvalidRequest):
+            ch_server.calls_query_stats(req)
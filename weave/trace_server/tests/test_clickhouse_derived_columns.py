@@ -0,0 +1,36 @@
+from weave.trace_server import trace_server_interface as tsi
+
+
+def _query(server, **kwargs):
+    server.calls_query(tsi.CallsQueryReq.model_validate(dict(project_id="p", **kwargs)))
+    return server.queries[-1][0]
+
+
+def test_stored_derived_columns_use_the_fast_path(ch_server):
+    query = _query(ch_server, sort_by=[{"field": "total_tokens", "direction": "desc"}])
+    assert "isNotNull(ended_at)" in query
+    assert "ORDER BY total_tokens desc" in query
+    assert "JSON_VALUE" not in query
+
+
+def test_computed_derived_columns_are_merged_first(ch_server):
+    query = _query(
+        ch_server,
+        sort_by=[{"field": "latency_ms", "direction": "desc"}],
+        query={"$expr": {"$eq": [{"$getField": "status"}, {"$literal": "error"}]}},
+    )
+    assert (
+        "toUnixTimestamp64Milli(any(ended_at)) - toUnixTimestamp64Milli(any(started_at)) AS latency_ms"
+        in query
+    )
+    assert "HAVING" in query and "status" in query
+    assert "ORDER BY latency_ms desc" in query
+
+
+def test_cache_keys_filter_the_start_events(ch_server):
+    query = _query(ch_server, filter={"cache_keys": ["k"]})
+    assert (
+        "calls_merged.id IN (SELECT id FROM calls_merged WHERE ((project_id = {project_id: String}) AND (isNotNull(started_at)) AND (calls_merged.cache_key IN"
+        in query
+    )
+    assert "JSON_VALUE" not in query
@@ -0,0 +1,66 @@
+import pytest
+
+from weave.trace_server import clickhouse_trace_server_batched as chts
+from weave.trace_server import trace_server_interface as tsi
+
+
+def _file_rows(server):
+    return [row for table, rows in server.inserts if table == "files" for row in rows]
+
+
+def _respond_from_inserts(server):
+    def respond(query, parameters):
+        if "n_chunks, chunk_index, val_bytes" in query:
+            last_chunk = parameters.get("last_chunk", float("inf"))
+            return [
+                (row["n_chunks"], row["chunk_index"], row["val_bytes"])
+                for row in _file_rows(server)
+                if row["digest"] == parameters["digest"]
+                and parameters["first_chunk"] <= row["chunk_index"] <= last_chunk
+            ]
+        # digests_exist
+        return [
+            (digest,)
+            for digest in {row["digest"] for row in _file_rows(server)}
+            if digest in parameters["digests"]
+        ]
+
+    return respond
+
+
+def test_file_ranges_only_read_overlapping_chunks(monkeypatch, ch_server):
+    monkeypatch.setattr(chts, "FILE_CHUNK_SIZE", 4)
+    ch_server.respond = _respond_from_inserts(ch_server)
+    content = bytes(range(10))
+    digest = ch_server.file_create(
+        tsi.FileCreateReq(project_id="p", name="f", content=content)
+    ).digest
+
+    def read(offset=0, length=None):
+        return ch_server.file_content_read(
+            tsi.FileContentReadReq(
+                project_id="p", digest=digest, offset=offset, length=length
+            )
+        ).content
+
+    assert read() == content
+    assert read(offset=3, length=4) == content[3:7]
+    assert ch_server.queries[-1][1]["first_chunk"] == 0
+    assert ch_server.queries[-1][1]["last_chunk"] == 1
+    assert read(offset=9) == content[9:]
+    assert read(offset=12) == b""
+    assert list(
+        ch_server.file_content_stream(
+            tsi.FileContentReadReq(project_id="p", digest=digest, offset=2)
+        )
+    ) == [content[2:4], content[4:8], content[8:]]
+
+    with pytest.raises(chts.NotFoundError):
+        ch_server.file_content_read(tsi.FileContentReadReq(project_id="p", digest="x"))
+
+    ch_server.inserts = [
+        (table, [row for row in rows if row["chunk_index"] != 1])
+        for table, rows in ch_server.inserts
+    ]
+    with pytest.raises(ValueError):
+        read()
@@ -0,0 +1,45 @@
+import datetime
+
+from weave.trace_server import trace_server_interface as tsi
+
+
+def _respond_with(index_rows, obj_rows):
+    def respond(query, parameters):
+        if "FROM object_versions_index" in query:
+            return index_rows
+        return [row for row in obj_rows if (row[1], row[2]) in parameters["versions"]]
+
+    return respond
+
+
+def test_obj_create_is_a_single_insert(ch_server):
+    ch_server.obj_create(
+        tsi.ObjCreateReq(
+            obj=tsi.ObjSchemaForInsert(project_id="p", object_id="o", val={"a": 1})
+        )
+    )
+    # The index is filled by a materialized view, and numbers are not stored
+    assert ch_server.queries == []
+    assert [table for table, _ in ch_server.inserts] == ["object_versions"]
+
+
+def test_obj_read_is_a_keyed_lookup_without_window_functions(ch_server):
+    created_at = datetime.datetime(2024, 1, 1)
+    ch_server.respond = _respond_with(
+        index_rows=[("object", "o", "d2", 1, 2, 1)],
+        obj_rows=[
+            ("object", "o", "d1", created_at, None, [], '{"a": 1}'),
+            ("object", "o", "d2", created_at, None, [], '{"a": 2}'),
+        ],
+    )
+    res = ch_server.obj_read(tsi.ObjReadReq(project_id="p", object_id="o", digest="v1"))
+    assert res.obj.digest == "d2"
+    assert res.obj.val == {"a": 2}
+    assert res.obj.version_index == 1
+    assert res.obj.is_latest == 1
+
+    index_query, parameters = ch_server.queries[0]
+    assert "OVER" not in index_query
+    assert "object_id = {object_id: String}" in index_query
+    assert parameters["version_index"] == 1
+    assert ch_server.queries[1][1]["versions"] == [("o", "d2")]
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from weave.trace_server import clickhouse_trace_server_batched as chts
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.refs_internal import TABLE_ROW_ID_EDGE_NAME
+
+
+def _respond_with(objs, rows):
+    def respond(query, parameters):
+        project_id = parameters["project_id"]
+        if "keys" in parameters:
+            for object_id, digest in parameters["keys"]:
+                if (project_id, object_id, digest) in objs:
+                    val = objs[(project_id, object_id, digest)]
+                    yield object_id, digest, json.dumps(val)
+        else:
+            for digest in parameters["digests"]:
+                if (project_id, digest) in rows:
+                    yield digest, json.dumps(rows[(project_id, digest)])
+
+    return respond
+
+
+def _uri(project_id, name, digest, *extra):
+    return "/".join(
+        [f"weave-trace-internal:///{project_id}/object/{name}:{digest}", *extra]
+    )
+
+
+def test_refs_are_resolved_per_project(ch_server):
+    ch_server.respond = _respond_with(
+        objs={
+            ("p1", "a", "d1"): {"x": 1},
+            ("p2", "b", "d2"): {"rows": "weave-trace-internal:///p2/table/t1"},
+        },
+        rows={("p2", "r1"): {"y": 2}},
+    )
+    res = ch_server.refs_read_batch(
+        tsi.RefsReadBatchReq(
+            refs=[
+                _uri("p1", "a", "d1"),
+                _uri("p2", "b", "d2", "attr", "rows", TABLE_ROW_ID_EDGE_NAME, "r1"),
+                _uri("p1", "a", "d1", "key", "x"),
+            ]
+        )
+    )
+    assert res.vals == [{"x": 1}, {"y": 2}, 1]
+    # One lookup per project for objects, plus one for the table rows
+    project_ids = [parameters["project_id"] for _, parameters in ch_server.queries]
+    assert sorted(project_ids) == ["p1", "p2", "p2"]
+
+
+def test_refs_read_batch_is_not_capped(ch_server):
+    n = 2500
+    ch_server.respond = _respond_with(
+        objs={("p", f"o{i}", "d"): i for i in range(n)}, rows={}
+    )
+    res = ch_server.refs_read_batch(
+        tsi.RefsReadBatchReq(refs=[_uri("p", f"o{i}", "d") for i in range(n)])
+    )
+    assert res.vals == list(range(n))
+    assert len(ch_server.queries) == 3
+
+    with pytest.raises(chts.NotFoundError):
+        ch_server.refs_read_batch(
+            tsi.RefsReadBatchReq(refs=[_uri("p", "missing", "d")])
+        )
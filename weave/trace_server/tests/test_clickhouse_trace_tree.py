@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.errors import InvalidRequest
+
+
+def _ch_call(id, parent_id, started_at):
+    return {
+        "project_id": "p",
+        "id": id,
+        "trace_id": "t",
+        "parent_id": parent_id,
+        "op_name": "op",
+        "started_at": datetime.datetime(2024, 1, 1, second=started_at),
+        "output_dump": f'"{id}"',
+    }
+
+
+@pytest.fixture
+def server(ch_server):
+    # Inserted out of order: a -> (b -> d, c)
+    ch_calls = [
+        _ch_call("d", "b", 3),
+        _ch_call("c", "a", 4),
+        _ch_call("a", None, 0),
+        _ch_call("b", "a", 1),
+    ]
+    ch_server.selects = []
+
+    def select_calls(project_id, columns, **kwargs):
+        ch_server.selects.append(kwargs)
+        for ch_call in ch_calls:
+            yield {col: ch_call[col] for col in columns}
+
+    ch_server._select_calls_query_raw = select_calls
+    return ch_server
+
+
+def test_trace_is_read_in_one_query(server):
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(project_id="p", trace_id="t", columns=["output"])
+    )
+    assert [c.id for c in res.calls] == ["a", "b", "d", "c"]
+    assert [c.output for c in res.calls] == ["a", "b", "d", "c"]
+    assert len(server.selects) == 1
+    assert server.selects[0]["start_event_conditions"] == [
+        "trace_id = {trace_id: String}"
+    ]
+
+
+def test_subtree_is_resolved_on_the_server(server):
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(
+            project_id="p", root_call_id="b", max_depth=1, columns=["output"]
+        )
+    )
+    assert [c.id for c in res.calls] == ["b", "d"]
+    assert len(server.selects) == 1
+    assert server.selects[0]["parameters"] == {"root_call_id": "b"}
+
+    res = server.trace_tree_read(
+        tsi.TraceTreeReadReq(
+            project_id="p", trace_id="t", max_depth=0, columns=["output"]
+        )
+    )
+    assert [c.id for c in res.calls] == ["a"]
+
+
+def test_invalid_trace_tree_requests(server):
+    for req in [
+        tsi.TraceTreeReadReq(project_id="p"),
+        tsi.TraceTreeReadReq(project_id="p", trace_id="t", root_call_id="a"),
+        tsi.TraceTreeReadReq(project_id="p", trace_id="t", max_depth=-1),
+        tsi.TraceTreeReadReq(project_id="p", trace_id="t", columns=["nope"]),
+    ]:
+        with pytest.raises(InvalidRequest):
+            server.trace_tree_read(req)
@@ -1,11 +1,19 @@
 import datetime
+import gzip
+import json
 import unittest
 from unittest.mock import patch
 import uuid
 
 from pydantic import ValidationError
 import requests
-from weave.trace_server.remote_http_trace_server import RemoteHTTPTraceServer
+from weave.trace_server.remote_http_trace_server import (
+    EndBatchItem,
+    RemoteHTTPTraceServer,
+    StartBatchItem,
+    _group_call_events,
+    _split_index,
+)
 from weave.trace_server import trace_server_interface as tsi
 
 
@@ -27,12 +35,43 @@ def generate_start(id) -> tsi.StartedCallSchemaForInsert:
     )
 
 
+def generate_end(id) -> tsi.EndedCallSchemaForInsert:
+    return tsi.EndedCallSchemaForInsert(
+        project_id="test",
+        id=id,
+        ended_at=datetime.datetime.now(tz=datetime.timezone.utc),
+        output={"c": 5},
+        summary={},
+    )
+
+
+def test_group_call_events_keeps_start_and_end_adjacent():
+    a, b = generate_id(), generate_id()
+    batch = [
+        StartBatchItem(req=tsi.CallStartReq(start=generate_start(a))),
+        StartBatchItem(req=tsi.CallStartReq(start=generate_start(b))),
+        EndBatchItem(req=tsi.CallEndReq(end=generate_end(b))),
+        EndBatchItem(req=tsi.CallEndReq(end=generate_end(a))),
+    ]
+    grouped = _group_call_events(batch)
+    assert [(item.mode, item.req.model_dump()) for item in grouped] == [
+        (item.mode, item.req.model_dump())
+        for item in [batch[0], batch[3], batch[1], batch[2]]
+    ]
+    # The midpoint falls between two complete calls
+    assert _split_index(grouped) == 2
+
+    # An end whose start was sent in an earlier batch stays where it is
+    orphan = [EndBatchItem(req=tsi.CallEndReq(end=generate_end(a))), batch[1]]
+    assert _group_call_events(orphan) == orphan
+
+
 class TestRemoteHTTPTraceServer(unittest.TestCase):
     def setUp(self):
         self.trace_server_url = "http://example.com"
         self.server = RemoteHTTPTraceServer(self.trace_server_url)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_ok(self, mock_post):
         call_id = generate_id()
         mock_post.return_value = requests.Response()
@@ -44,7 +83,7 @@ class TestRemoteHTTPTraceServer(unittest.TestCase):
         self.server.call_start(tsi.CallStartReq(start=start))
         mock_post.assert_called_once()
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_400_500_no_retry(self, mock_post):
         call_id = generate_id()
         resp1 = requests.Response()
@@ -72,7 +111,7 @@ class TestRemoteHTTPTraceServer(unittest.TestCase):
         with self.assertRaises(ValidationError):
             self.server.call_start(tsi.CallStartReq(start={"invalid": "broken"}))
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_502_503_504_429_retry(self, mock_post):
         call_id = generate_id()
 
@@ -98,7 +137,7 @@ class TestRemoteHTTPTraceServer(unittest.TestCase):
         start = generate_start(call_id)
         self.server.call_start(tsi.CallStartReq(start=start))
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_other_error_retry(self, mock_post):
         call_id = generate_id()
 
@@ -119,5 +158,62 @@ class TestRemoteHTTPTraceServer(unittest.TestCase):
         self.server.call_start(tsi.CallStartReq(start=start))
 
 
+def _ok_response(body):
+    r = requests.Response()
+    r.status_code = 200
+    r.json = lambda: body
+    return r
+
+
+def _large_obj_create_req():
+    return tsi.ObjCreateReq(
+        obj=tsi.ObjSchemaForInsert(
+            project_id="e/p", object_id="o", val={"doc": "lorem ipsum " * 1000}
+        )
+    )
+
+
+@patch("requests.Session.get")
+@patch("requests.Session.post")
+def test_request_compression_is_negotiated(mock_post, mock_get):
+    mock_get.return_value = _ok_response(
+        {
+            "min_required_weave_python_version": "0.0.0",
+            "accepted_request_encodings": ["gzip"],
+        }
+    )
+    mock_post.return_value = _ok_response({"digest": "abc"})
+    server = RemoteHTTPTraceServer("http://example.com", compression="auto")
+    req = _large_obj_create_req()
+    server.obj_create(req)
+    server.obj_create(req)
+
+    # Negotiated once, then reused
+    mock_get.assert_called_once()
+    kwargs = mock_post.call_args.kwargs
+    assert kwargs["headers"] == {"Content-Encoding": "gzip"}
+    assert len(kwargs["data"]) < len(req.model_dump_json()) / 10
+    assert json.loads(gzip.decompress(kwargs["data"])) == json.loads(
+        req.model_dump_json(by_alias=True)
+    )
+
+
+@patch("requests.Session.get")
+@patch("requests.Session.post")
+def test_request_compression_falls_back_for_old_servers(mock_post, mock_get):
+    mock_get.return_value = _ok_response({"min_required_weave_python_version": "0"})
+    mock_post.return_value = _ok_response({"digest": "abc"})
+    server = RemoteHTTPTraceServer("http://example.com")
+    server.obj_create(_large_obj_create_req())
+    assert mock_post.call_args.kwargs["headers"] == {}
+
+    # Explicitly disabled: the server is never asked
+    mock_get.reset_mock()
+    server = RemoteHTTPTraceServer("http://example.com", compression="none")
+    server.obj_create(_large_obj_create_req())
+    mock_get.assert_not_called()
+    assert mock_post.call_args.kwargs["headers"] == {}
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,190 @@
+import datetime
+import sqlite3
+import threading
+
+import pytest
+
+from weave.trace_server import sqlite_trace_server
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.sqlite_trace_server import SqliteTraceServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = SqliteTraceServer(str(tmp_path / "trace.db"))
+    server.setup_tables()
+    return server
+
+
+def _start(server, id, op_name="op", parent_id=None, attributes=None):
+    server.call_start(
+        tsi.CallStartReq(
+            start=tsi.StartedCallSchemaForInsert(
+                project_id="p",
+                id=id,
+                op_name=op_name,
+                trace_id="t",
+                parent_id=parent_id,
+                started_at=datetime.datetime.now(tz=datetime.timezone.utc),
+                attributes=attributes or {},
+                inputs={"name": op_name},
+            )
+        )
+    )
+
+
+def test_connections_are_pooled_per_thread(server):
+    conn, _ = server._get_conn_cursor()
+    assert server._get_conn_cursor()[0] is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(server._get_conn_cursor()[0]))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_call_batch_is_written_together(server):
+    with server.call_batch():
+        for i in range(3):
+            _start(server, f"c{i}")
+        assert len(server._call_batch) == 3
+        # Reads see the calls of the batch
+        res = server.calls_query_stats(tsi.CallsQueryStatsReq(project_id="p"))
+        assert res.count == 3
+        assert server._call_batch == []
+        _start(server, "c3")
+    assert server._call_batch == []
+    res = server.calls_query_stats(tsi.CallsQueryStatsReq(project_id="p"))
+    assert res.count == 4
+
+
+def _committed_count(server):
+    # Counts the calls another connection sees, without flushing
+    return (
+        sqlite3.connect(server.db_path)
+        .execute("SELECT COUNT(*) FROM calls")
+        .fetchone()[0]
+    )
+
+
+def test_call_writes_are_committed_in_groups(server, monkeypatch):
+    monkeypatch.setattr(sqlite_trace_server, "MAX_FLUSH_COUNT", 3)
+    _start(server, "c0")
+    _start(server, "c1")
+    assert len(server._call_batch) == 2
+    assert _committed_count(server) == 0
+    _start(server, "c2")
+    assert server._call_batch == []
+    assert _committed_count(server) == 3
+
+    _start(server, "c3")
+    assert server.flush()
+    assert _committed_count(server) == 4
+
+
+def test_call_writes_are_committed_after_max_age(server, monkeypatch):
+    monkeypatch.setattr(sqlite_trace_server, "MAX_FLUSH_AGE", 0.01)
+    _start(server, "c0")
+    timer = server._flush_timer
+    timer.join()
+    assert server._call_batch == []
+    assert _committed_count(server) == 1
+
+
+def test_other_connections_see_calls_within_a_second(server):
+    _start(server, "c0")
+    assert _committed_count(server) == 0
+    server._flush_timer.join(timeout=2)
+    assert _committed_count(server) == 1
+
+
+def test_filters_are_parameterized(server):
+    _start(server, "a", op_name="it's")
+    _start(server, "b", op_name='"quoted"')
+    res = server.calls_query(
+        tsi.CallsQueryReq(project_id="p", filter=tsi._CallsFilter(op_names=["it's"]))
+    )
+    assert [c.id for c in res.calls] == ["a"]
+    res = server.calls_query(
+        tsi.CallsQueryReq.model_validate(
+            dict(
+                project_id="p",
+                query={
+                    "$expr": {
+                        "$eq": [
+                            {"$getField": "inputs.name"},
+                            {"$literal": '"quoted"'},
+                        ]
+                    }
+                },
+            )
+        )
+    )
+    assert [c.id for c in res.calls] == ["b"]
+
+
+def test_calls_queries_use_indexes(server):
+    _, cursor = server._get_conn_cursor()
+
+    def plan(query):
+        cursor.execute("EXPLAIN QUERY PLAN " + query, ["p"])
+        return " ".join(row[-1] for row in cursor.fetchall())
+
+    assert "calls_trace_id_idx" in plan(
+        "SELECT * FROM calls WHERE project_id = ? AND trace_id = 't'"
+    )
+    assert "calls_cache_key_idx" in plan(
+        "SELECT * FROM calls WHERE project_id = ? AND "
+        + sqlite_trace_server._CALL_CACHE_KEY_EXPR
+        + " = 'k'"
+    )
+    assert "calls_latency_ms_idx" in plan(
+        "SELECT * FROM calls WHERE project_id = ? ORDER BY "
+        "CAST(ROUND((julianday(ended_at) - julianday(started_at)) * 86400000.0) AS INTEGER)"
+    )
+
+
+def test_cache_keys_filter(server):
+    _start(server, "a", attributes={"weave_cache_key": "k1"})
+    _start(server, "b", attributes={"weave_cache_key": "k2"})
+    _start(server, "c")
+    res = server.calls_query(
+        tsi.CallsQueryReq(project_id="p", filter=tsi._CallsFilter(cache_keys=["k2"]))
+    )
+    assert [c.id for c in res.calls] == ["b"]
+
+
+def test_shared_cache_reads_dont_fail_during_writes():
+    server = SqliteTraceServer("file:shared_cache_test?mode=memory&cache=shared")
+    server.setup_tables()
+    errors = []
+
+    def run(fn):
+        try:
+            fn()
+        except Exception as e:
+            errors.append(e)
+
+    def write():
+        for i in range(100):
+            rows = [{"i": i, "j": j} for j in range(20)]
+            server.table_create(
+                tsi.TableCreateReq(
+                    table=tsi.TableSchemaForInsert(project_id="p", rows=rows)
+                )
+            )
+
+    def read():
+        for i in range(500):
+            server.digests_exist(
+                tsi.DigestsExistReq(project_id="p", table_rows=[f"missing-{i}"])
+            )
+
+    threads = [threading.Thread(target=run, args=(fn,)) for fn in [write, read, read]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
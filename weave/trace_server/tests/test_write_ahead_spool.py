@@ -0,0 +1,141 @@
+import os
+from unittest.mock import patch
+
+import requests
+
+from weave.trace_server import trace_server_interface as tsi
+from weave.trace_server.remote_http_trace_server import RemoteHTTPTraceServer
+from weave.trace_server.write_ahead_spool import WriteAheadSpool
+
+
+def _bodies(spool, **kwargs):
+    return [record.body for record in spool.records(**kwargs)]
+
+
+def test_append_ack_and_records(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path))
+    a = spool.append("request", {"url": "/obj/create"}, b"a")
+    b = spool.append("request", {"url": "/obj/create"}, b"b")
+    c = spool.append("request", {"url": "/obj/create"}, b"c")
+    spool.ack([b])
+    assert _bodies(spool) == [b"a", b"c"]
+    assert _bodies(spool, exclude={a}) == [b"c"]
+    spool.ack([a, c])
+    assert _bodies(spool) == []
+    spool.close()
+    # Nothing left to deliver, so the directory is cleaned up
+    assert os.listdir(tmp_path) == []
+
+
+def test_orphaned_records_are_adopted(tmp_path):
+    # A spool still held by a live process is left alone
+    live = WriteAheadSpool(str(tmp_path))
+    live.append("call", {"mode": "start"}, b"live")
+
+    crashed = WriteAheadSpool(str(tmp_path))
+    sent = crashed.append("call", {"mode": "start"}, b"sent")
+    crashed.append("call", {"mode": "end"}, b"unsent")
+    crashed.ack([sent])
+    # Simulate a torn write from the process being killed mid-append
+    with open(crashed._segments[-1].path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+    crashed._lock_file.close()
+
+    spool = WriteAheadSpool(str(tmp_path))
+    records = list(spool.records())
+    assert [(r.kind, r.meta, r.body) for r in records] == [
+        ("call", {"mode": "end"}, b"unsent")
+    ]
+    assert not os.path.exists(crashed.directory)
+    assert _bodies(live) == [b"live"]
+    spool.close()
+    live.close()
+
+
+def test_spool_being_created_is_not_adopted(tmp_path):
+    # Another process has created its directory but not locked it yet
+    creating = tmp_path / ".tmp-abc"
+    creating.mkdir()
+
+    spool = WriteAheadSpool(str(tmp_path))
+    assert creating.exists()
+    assert os.path.basename(spool.directory) in os.listdir(tmp_path)
+    spool.close()
+
+
+def test_size_cap_discards_oldest_segments(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path), max_bytes=300, max_segment_bytes=100)
+    for i in range(10):
+        spool.append("request", {}, str(i).encode() * 40)
+    assert spool.size() <= 300
+    assert spool.num_discarded > 0
+    assert _bodies(spool)[-1] == b"9" * 40
+    spool.close()
+
+
+def _response(status_code, json_body=None):
+    r = requests.Response()
+    r.status_code = status_code
+    r.json = lambda: json_body
+    return r
+
+
+def test_remote_server_replays_failed_requests(tmp_path):
+    server = RemoteHTTPTraceServer("http://example.com", spool_dir=str(tmp_path))
+    req = tsi.ObjCreateReq(
+        obj=tsi.ObjSchemaForInsert(project_id="e/p", object_id="o", val={"a": 1})
+    )
+    with patch("requests.Session.post", side_effect=ConnectionError()):
+        with patch.object(
+            RemoteHTTPTraceServer._generic_request.retry, "stop", lambda state: True
+        ):
+            try:
+                server.obj_create(req)
+            except ConnectionError:
+                pass
+    assert len(server.spool.pending_ids()) == 1
+
+    with patch(
+        "requests.Session.post", return_value=_response(200, {"digest": "abc"})
+    ) as mock_post:
+        server.replay_spool()
+        mock_post.assert_called_once()
+        assert mock_post.call_args.args[0] == "http://example.com/obj/create"
+    assert server.spool.pending_ids() == set()
+    server.close()
+
+
+def test_remote_server_replays_chunked_tables(tmp_path):
+    server = RemoteHTTPTraceServer("http://example.com", spool_dir=str(tmp_path))
+    table_req = tsi.TableCreateFromDigestsReq(
+        project_id="e/p", row_digests=["r1", "r2"]
+    )
+    obj_req = tsi.ObjCreateReq(
+        obj=tsi.ObjSchemaForInsert(project_id="e/p", object_id="o", val={"a": 1})
+    )
+    with patch("requests.Session.post", side_effect=ConnectionError()):
+        with patch.object(
+            RemoteHTTPTraceServer._generic_request.retry, "stop", lambda state: True
+        ):
+            for create, req in [
+                (server.table_create_from_digests, table_req),
+                (server.obj_create, obj_req),
+            ]:
+                try:
+                    create(req)
+                except ConnectionError:
+                    pass
+    # Records this client can't send don't hold up the others
+    server.spool.append("request", {"url": "/unknown"}, b"{}")
+    assert len(server.spool.pending_ids()) == 3
+
+    with patch(
+        "requests.Session.post", return_value=_response(200, {"digest": "abc"})
+    ) as mock_post:
+        server.replay_spool()
+        assert [call.args[0] for call in mock_post.call_args_list] == [
+            "http://example.com/table/create_from_digests",
+            "http://example.com/obj/create",
+        ]
+    assert server.spool.pending_ids() == set()
+    server.close()
@@ -162,12 +162,15 @@ class _CallsFilter(BaseModel):
     trace_roots_only: typing.Optional[bool] = None
     wb_user_ids: typing.Optional[typing.List[str]] = None
     wb_run_ids: typing.Optional[typing.List[str]] = None
+    # Calls of cached ops with one of these keys (their `weave_cache_key`
+    # attribute), looked up through an index
+    cache_keys: typing.Optional[typing.List[str]] = None
 
 
 class _SortBy(BaseModel):
-    # Field should be a key of `CallSchema`. For dictionary fields
-    # (`attributes`, `inputs`, `outputs`, `summary`), the field can be
-    # dot-separated.
+    # Field should be a key of `CallSchema` or one of `CALL_DERIVED_FIELDS`
+    # (eg. `latency_ms`). For dictionary fields (`attributes`, `inputs`,
+    # `outputs`, `summary`), the field can be dot-separated.
     field: str  # Consider changing this to _FieldSelect
     # Direction should be either 'asc' or 'desc'
     direction: typing.Literal["asc", "desc"]
@@ -181,20 +184,84 @@ class CallsQueryReq(BaseModel):
     # Sort by multiple fields
     sort_by: typing.Optional[typing.List[_SortBy]] = None
     query: typing.Optional[Query] = None
+    # Opaque `next_cursor` of a previous page. Only supported when sorting by
+    # fields in `CALLS_CURSOR_SORT_FIELDS` (which includes the default sort).
+    cursor: typing.Optional[str] = None
 
 
 class CallsQueryRes(BaseModel):
     calls: typing.List[CallSchema]
+    # Set when `limit` calls were returned and the sort supports cursors
+    next_cursor: typing.Optional[str] = None
+
+
+class CallsExportReq(BaseModel):
+    project_id: str
+    filter: typing.Optional[_CallsFilter] = None
+    query: typing.Optional[Query] = None
+    limit: typing.Optional[int] = None
+    # Top-level fields of `CallSchema` to export, all of them by default.
+    # Dictionary fields are exported as JSON strings.
+    columns: typing.Optional[typing.List[str]] = None
+    format: typing.Literal["arrow", "parquet"] = "arrow"
+
+
+class CallsStatsAggregation(BaseModel):
+    # "count" counts calls and "count_exceptions" the calls that raised, the
+    # others aggregate the numeric values of `field`.
+    fn: typing.Literal[
+        "count", "count_exceptions", "sum", "avg", "min", "max", "quantile"
+    ]
+    # "latency_ms", "total_tokens", "prompt_tokens", "completion_tokens", a
+    # dot-notation path into `attributes`, `inputs`, `output` or `summary`, or
+    # "usage.<key>" (eg. "usage.total_tokens") when grouping by "usage_model".
+    field: typing.Optional[str] = None
+    # Between 0 and 1, for "quantile"
+    quantile: typing.Optional[float] = None
+    # Key of the value in each group, eg. "avg(latency_ms)" by default
+    name: typing.Optional[str] = None
 
 
 class CallsQueryStatsReq(BaseModel):
     project_id: str
     filter: typing.Optional[_CallsFilter] = None
     query: typing.Optional[Query] = None
+    # Keys to group calls by: "op_name", "trace_id", "parent_id", "wb_user_id",
+    # "wb_run_id", "status", "model", a dot-notation path into `attributes`,
+    # `inputs`, `output` or `summary`, or "usage_model", which counts each call
+    # once per model in its `summary.usage` (and skips calls without usage).
+    group_by: typing.Optional[typing.List[str]] = None
+    # Also groups calls by the start of the interval of this many seconds
+    # that they started in, under the "time_bucket" key.
+    time_bucket_seconds: typing.Optional[int] = None
+    # Aggregations of each group, a count by default
+    aggregations: typing.Optional[typing.List[CallsStatsAggregation]] = None
 
 
 class CallsQueryStatsRes(BaseModel):
     count: int
+    # Set when grouping or aggregating, one dict of the group keys and the
+    # named aggregations per group, ordered by the group keys.
+    groups: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None
+
+
+class TraceTreeReadReq(BaseModel):
+    project_id: str
+    # Either the trace to read, or the call to read the subtree of
+    trace_id: typing.Optional[str] = None
+    root_call_id: typing.Optional[str] = None
+    # Levels of descendants to read below the root(s), all of them by default
+    max_depth: typing.Optional[int] = None
+    # Top-level fields of `CallSchema` to read besides `project_id`, `id`,
+    # `trace_id`, `parent_id`, `op_name` and `started_at`, all of them by
+    # default. The others are left empty.
+    columns: typing.Optional[typing.List[str]] = None
+
+
+class TraceTreeReadRes(BaseModel):
+    # In pre-order: each call is followed by its descendants, and siblings are
+    # ordered by `started_at`.
+    calls: typing.List[CallSchema]
 
 
 class OpCreateReq(BaseModel):
@@ -267,6 +334,28 @@ class TableCreateReq(BaseModel):
     table: TableSchemaForInsert
 
 
+class TableRowsCreateReq(BaseModel):
+    project_id: str
+    rows: list[typing.Any]
+
+
+class TableRowsCreateRes(BaseModel):
+    digests: typing.List[str]
+
+
+class TableCreateFromDigestsReq(BaseModel):
+    """Creates a table from rows that the server already has.
+
+    The rows of the new table are those of `base_digest` (if given) without
+    any of `remove_row_digests`, followed by `row_digests`.
+    """
+
+    project_id: str
+    row_digests: typing.List[str]
+    base_digest: typing.Optional[str] = None
+    remove_row_digests: typing.Optional[typing.List[str]] = None
+
+
 class TableRowSchema(BaseModel):
     digest: str
     val: typing.Any
@@ -286,12 +375,24 @@ class TableQueryReq(BaseModel):
     filter: typing.Optional[_TableRowFilter] = None
     limit: typing.Optional[int] = None
     offset: typing.Optional[int] = None
+    # Keys of the row dictionaries to return, all of them by default
+    columns: typing.Optional[typing.List[str]] = None
 
 
 class TableQueryRes(BaseModel):
     rows: typing.List[TableRowSchema]
 
 
+class TableQueryStatsReq(BaseModel):
+    project_id: str
+    digest: str
+    filter: typing.Optional[_TableRowFilter] = None
+
+
+class TableQueryStatsRes(BaseModel):
+    count: int
+
+
 class RefsReadBatchReq(BaseModel):
     refs: typing.List[str]
 
@@ -313,12 +414,36 @@ class FileCreateRes(BaseModel):
 class FileContentReadReq(BaseModel):
     project_id: str
     digest: str
+    # Byte range of the file to read, the whole file by default
+    offset: int = 0
+    length: typing.Optional[int] = None
 
 
 class FileContentReadRes(BaseModel):
     content: bytes
 
 
+class ObjDigest(BaseModel):
+    object_id: str
+    digest: str
+
+
+class DigestsExistReq(BaseModel):
+    project_id: str
+    files: typing.List[str] = []
+    tables: typing.List[str] = []
+    table_rows: typing.List[str] = []
+    objs: typing.List[ObjDigest] = []
+
+
+class DigestsExistRes(BaseModel):
+    # The subset of the requested digests that the server already has
+    files: typing.List[str]
+    tables: typing.List[str]
+    table_rows: typing.List[str]
+    objs: typing.List[ObjDigest]
+
+
 class FeedbackPayloadReactionReq(BaseModel):
     emoji: str
 
@@ -391,6 +516,14 @@ class TraceServerInterface:
     def ensure_project_exists(self, entity: str, project: str) -> None:
         pass
 
+    # Servers that buffer writes in the background override these. `flush`
+    # returns False if the timeout expired before the buffer was drained.
+    def flush(self, timeout: typing.Optional[float] = None) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
     # Call API
     @abc.abstractmethod
     def call_start(self, req: CallStartReq) -> CallStartRes:
@@ -416,6 +549,17 @@ class TraceServerInterface:
     def calls_query_stats(self, req: CallsQueryStatsReq) -> CallsQueryStatsRes:
         ...
 
+    @abc.abstractmethod
+    def trace_tree_read(self, req: TraceTreeReadReq) -> TraceTreeReadRes:
+        """Reads a trace, or the subtree of a call, in a single query."""
+        ...
+
+    @abc.abstractmethod
+    def calls_export(self, req: CallsExportReq) -> typing.Iterator[bytes]:
+        """Streams the matching calls, ordered by (started_at, id), encoded as
+        an Arrow IPC stream or a Parquet file according to `req.format`."""
+        ...
+
     # Op API
     @abc.abstractmethod
     def op_create(self, req: OpCreateReq) -> OpCreateRes:
@@ -446,10 +590,24 @@ class TraceServerInterface:
     def table_create(self, req: TableCreateReq) -> TableCreateRes:
         raise NotImplementedError()
 
+    @abc.abstractmethod
+    def table_rows_create(self, req: TableRowsCreateReq) -> TableRowsCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def table_create_from_digests(
+        self, req: TableCreateFromDigestsReq
+    ) -> TableCreateRes:
+        raise NotImplementedError()
+
     @abc.abstractmethod
     def table_query(self, req: TableQueryReq) -> TableQueryRes:
         raise NotImplementedError()
 
+    @abc.abstractmethod
+    def table_query_stats(self, req: TableQueryStatsReq) -> TableQueryStatsRes:
+        raise NotImplementedError()
+
     @abc.abstractmethod
     def refs_read_batch(self, req: RefsReadBatchReq) -> RefsReadBatchRes:
         raise NotImplementedError()
@@ -462,6 +620,15 @@ class TraceServerInterface:
     def file_content_read(self, req: FileContentReadReq) -> FileContentReadRes:
         raise NotImplementedError()
 
+    @abc.abstractmethod
+    def file_content_stream(self, req: FileContentReadReq) -> typing.Iterator[bytes]:
+        """Yields the content of a file in chunks, without buffering all of it."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def digests_exist(self, req: DigestsExistReq) -> DigestsExistRes:
+        raise NotImplementedError()
+
     @abc.abstractmethod
     def feedback_create(self, req: FeedbackCreateReq) -> FeedbackCreateRes:
         raise NotImplementedError()
@@ -475,6 +642,135 @@ class TraceServerInterface:
         raise NotImplementedError()
 
 
+class AsyncTraceServerInterface:
+    """The asyncio counterpart of `TraceServerInterface`.
+
+    Implementations must never block the event loop. `AsyncTraceServerAdapter`
+    turns any `TraceServerInterface` into one by running it in worker threads.
+    """
+
+    async def ensure_project_exists(self, entity: str, project: str) -> None:
+        pass
+
+    async def flush(self, timeout: typing.Optional[float] = None) -> bool:
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    # Call API
+    @abc.abstractmethod
+    async def call_start(self, req: CallStartReq) -> CallStartRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def call_end(self, req: CallEndReq) -> CallEndRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def call_read(self, req: CallReadReq) -> CallReadRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def calls_query(self, req: CallsQueryReq) -> CallsQueryRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def calls_delete(self, req: CallsDeleteReq) -> CallsDeleteRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def calls_query_stats(self, req: CallsQueryStatsReq) -> CallsQueryStatsRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def trace_tree_read(self, req: TraceTreeReadReq) -> TraceTreeReadRes:
+        raise NotImplementedError()
+
+    # Op API
+    @abc.abstractmethod
+    async def op_create(self, req: OpCreateReq) -> OpCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def op_read(self, req: OpReadReq) -> OpReadRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def ops_query(self, req: OpQueryReq) -> OpQueryRes:
+        raise NotImplementedError()
+
+    # Obj API
+    @abc.abstractmethod
+    async def obj_create(self, req: ObjCreateReq) -> ObjCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def obj_read(self, req: ObjReadReq) -> ObjReadRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def objs_query(self, req: ObjQueryReq) -> ObjQueryRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def table_create(self, req: TableCreateReq) -> TableCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def table_rows_create(self, req: TableRowsCreateReq) -> TableRowsCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def table_create_from_digests(
+        self, req: TableCreateFromDigestsReq
+    ) -> TableCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def table_query(self, req: TableQueryReq) -> TableQueryRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def table_query_stats(self, req: TableQueryStatsReq) -> TableQueryStatsRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def refs_read_batch(self, req: RefsReadBatchReq) -> RefsReadBatchRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def file_create(self, req: FileCreateReq) -> FileCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def file_content_read(self, req: FileContentReadReq) -> FileContentReadRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def file_content_stream(
+        self, req: FileContentReadReq
+    ) -> typing.AsyncIterator[bytes]:
+        """Yields the content of a file in chunks, without buffering all of it."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def digests_exist(self, req: DigestsExistReq) -> DigestsExistRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def feedback_create(self, req: FeedbackCreateReq) -> FeedbackCreateRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def feedback_query(self, req: FeedbackQueryReq) -> FeedbackQueryRes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def feedback_purge(self, req: FeedbackPurgeReq) -> FeedbackPurgeRes:
+        raise NotImplementedError()
+
+
 class TraceServerInterfacePostAuth(TraceServerInterface):
     @abc.abstractmethod
     def feedback_create(self, req: FeedbackCreateReqForInsert) -> FeedbackCreateRes:
@@ -1,4 +1,6 @@
 import base64
+import binascii
+import datetime
 import hashlib
 import json
 import typing
@@ -6,12 +8,35 @@ import uuid
 
 from . import trace_server_interface as tsi
 from . import refs_internal
+from .errors import InvalidRequest
 
 TRACE_REF_SCHEME = "weave"
 ARTIFACT_REF_SCHEME = "wandb-artifact"
 WILDCARD_ARTIFACT_VERSION_AND_PATH = ":*"
 
 
+# Fields that calls can be paged through with a cursor: they are never null and
+# are known when the call starts.
+CALLS_CURSOR_SORT_FIELDS = ("started_at", "op_name", "trace_id", "id")
+
+# Fields derived from the stored fields of calls, which calls can be sorted and
+# filtered by like any other field:
+#   * `latency_ms`: milliseconds from the start to the end of the call
+#   * `status`: one of CALL_STATUSES
+#   * `total_tokens`, `prompt_tokens`, `completion_tokens`: token usage,
+#     summed over the models in `summary.usage`
+#   * `model`: the first model in `summary.usage`
+CALL_DERIVED_FIELDS = (
+    "latency_ms",
+    "status",
+    "total_tokens",
+    "prompt_tokens",
+    "completion_tokens",
+    "model",
+)
+CALL_STATUSES = ("running", "success", "error")
+
+
 def generate_id() -> str:
     return str(uuid.uuid4())
 
@@ -28,6 +53,13 @@ def str_digest(json_val: str) -> str:
     return bytes_digest(json_val.encode())
 
 
+def table_digest(row_digests: typing.Iterable[str]) -> str:
+    table_hasher = hashlib.sha256()
+    for row_digest in row_digests:
+        table_hasher.update(row_digest.encode())
+    return table_hasher.hexdigest()
+
+
 def _order_dict(dictionary: typing.Dict) -> typing.Dict:
     return {
         k: _order_dict(v) if isinstance(v, dict) else v
@@ -81,3 +113,119 @@ def extract_refs_from_values(
 
     _visit(vals)
     return refs
+
+
+def calls_cursor_sort_by(
+    sort_by: typing.Optional[typing.List[tsi._SortBy]],
+) -> typing.Optional[typing.List[typing.Tuple[str, str]]]:
+    """Returns the sort order used for cursor pagination, with `id` as the
+    tie-breaker, or None if `sort_by` cannot be paged through with a cursor."""
+    if not sort_by:
+        order = [("started_at", "asc")]
+    else:
+        order = [(s.field, s.direction.lower()) for s in sort_by]
+    if any(field not in CALLS_CURSOR_SORT_FIELDS for field, _ in order):
+        return None
+    if all(field != "id" for field, _ in order):
+        order.append(("id", "asc"))
+    return order
+
+
+def encode_calls_cursor(
+    sort_by: typing.List[typing.Tuple[str, str]], call: tsi.CallSchema
+) -> str:
+    values = []
+    for field, _ in sort_by:
+        value = getattr(call, field)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        values.append(value)
+    payload = json.dumps({"sort_by": sort_by, "values": values})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("utf-8")
+
+
+def decode_calls_cursor(
+    cursor: str, sort_by: typing.List[typing.Tuple[str, str]]
+) -> typing.List[typing.Any]:
+    """Returns the sort key values of the last call of the previous page."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor))
+        cursor_sort_by = [tuple(s) for s in payload["sort_by"]]
+        values = payload["values"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidRequest(f"Invalid cursor: {cursor}")
+    if cursor_sort_by != [tuple(s) for s in sort_by] or len(values) != len(sort_by):
+        raise InvalidRequest("Cursor does not match the sort order of the query")
+    return values
+
+
+# Fields that trace tree reads always return, they are enough to render a tree
+TRACE_TREE_REQUIRED_COLUMNS = (
+    "project_id",
+    "id",
+    "trace_id",
+    "parent_id",
+    "op_name",
+    "started_at",
+)
+
+
+def trace_tree_columns(req: tsi.TraceTreeReadReq) -> typing.List[str]:
+    """Validates a trace tree read, returns the `CallSchema` fields to read."""
+    if (req.trace_id is None) == (req.root_call_id is None):
+        raise InvalidRequest("Exactly one of trace_id and root_call_id is required")
+    if req.max_depth is not None and req.max_depth < 0:
+        raise InvalidRequest("max_depth must not be negative")
+    if req.columns is None:
+        return list(tsi.CallSchema.model_fields)
+    invalid = [c for c in req.columns if c not in tsi.CallSchema.model_fields]
+    if invalid:
+        raise InvalidRequest(f"Invalid trace tree columns: {invalid}")
+    return list(dict.fromkeys([*TRACE_TREE_REQUIRED_COLUMNS, *req.columns]))
+
+
+def call_tree_preorder(
+    calls: typing.Iterable[typing.Tuple[str, typing.Optional[str], typing.Any]],
+    root_ids: typing.Optional[typing.Iterable[str]] = None,
+    max_depth: typing.Optional[int] = None,
+) -> typing.List[typing.Tuple[str, int]]:
+    """Returns the ids and depths of the roots and their descendants in pre-order.
+
+    `calls` are (id, parent_id, sort_key) tuples, siblings are visited in
+    `sort_key` order. The roots default to the calls whose parent is not in
+    `calls`. Roots that are not in `calls` are still returned.
+    """
+    calls = list(calls)
+    call_ids = {call_id for call_id, _, _ in calls}
+
+    def key(sibling: typing.Tuple[typing.Any, str]) -> typing.Any:
+        return (sibling[0] is None, sibling)
+
+    children: typing.Dict[typing.Optional[str], typing.List[typing.Any]] = {}
+    for call_id, parent_id, sort_key in calls:
+        children.setdefault(parent_id, []).append((sort_key, call_id))
+    for siblings in children.values():
+        siblings.sort(key=key)
+    if root_ids is None:
+        roots = [
+            (sort_key, call_id)
+            for call_id, parent_id, sort_key in calls
+            if parent_id is None or parent_id not in call_ids
+        ]
+        root_ids = [call_id for _, call_id in sorted(roots, key=key)]
+
+    visited = set()
+    order = []
+    # Iterative, since agent traces can be deeper than the recursion limit
+    stack = [(root_id, 0) for root_id in reversed(list(root_ids))]
+    while stack:
+        call_id, depth = stack.pop()
+        if call_id in visited:
+            continue
+        visited.add(call_id)
+        order.append((call_id, depth))
+        if max_depth is not None and depth >= max_depth:
+            continue
+        for _, child_id in reversed(children.get(call_id, [])):
+            stack.append((child_id, depth + 1))
+    return order
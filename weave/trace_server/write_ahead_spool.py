@@ -0,0 +1,343 @@
+"""An append-only, checksummed on-disk log of requests that have not yet been
+acknowledged by the trace server.
+
+Layout of a spool directory::
+
+    <root>/<instance id>/lock            held (flock) for the life of the process
+    <root>/<instance id>/000000000001.seg  records, rotated at `max_segment_bytes`
+    <root>/<instance id>/acks.log        ids of records that no longer need sending
+
+Every record and every ack entry is framed as `<u32 length><u32 crc32><payload>`
+so a torn write at the end of a file (eg. the process was killed mid-append) is
+detected and ignored on recovery. When a process starts it adopts the
+directories of instances whose lock is no longer held, so anything a crashed
+process did not manage to send is replayed.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import uuid
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None  # type: ignore
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".seg"
+_ACKS_FILE = "acks.log"
+_LOCK_FILE = "lock"
+_TMP_PREFIX = ".tmp-"
+
+
+@dataclass
+class SpoolRecord:
+    id: int
+    kind: str
+    meta: Dict[str, Any]
+    body: bytes
+
+
+@dataclass
+class _Segment:
+    seq: int
+    path: str
+    size: int = 0
+    live_ids: Set[int] = field(default_factory=set)
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(path: str) -> Iterator[bytes]:
+    """Yields valid frames, stopping at the first truncated or corrupt one."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        while True:
+            header = f.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                return
+            length, checksum = _FRAME_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                logger.warning("spool_corrupt_record", extra={"path": path})
+                return
+            yield payload
+
+
+def _encode_record(
+    record_id: int, kind: str, meta: Dict[str, Any], body: bytes
+) -> bytes:
+    header = json.dumps({"id": record_id, "kind": kind, "meta": meta}).encode("utf-8")
+    return header + b"\n" + body
+
+
+def _decode_record(payload: bytes) -> SpoolRecord:
+    header, _, body = payload.partition(b"\n")
+    parsed = json.loads(header)
+    return SpoolRecord(
+        id=parsed["id"], kind=parsed["kind"], meta=parsed["meta"], body=body
+    )
+
+
+def _try_lock(path: str) -> Optional[BinaryIO]:
+    """Takes an exclusive, non-blocking lock that the OS drops when the process dies."""
+    f = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _read_acks(directory: str) -> Set[int]:
+    acked: Set[int] = set()
+    for payload in _read_frames(os.path.join(directory, _ACKS_FILE)):
+        acked.update(json.loads(payload))
+    return acked
+
+
+def _segment_paths(directory: str) -> List[str]:
+    names = sorted(n for n in os.listdir(directory) if n.endswith(_SEGMENT_SUFFIX))
+    return [os.path.join(directory, n) for n in names]
+
+
+class WriteAheadSpool:
+    """
+    A durable FIFO of payloads that still need to be delivered.
+
+    Callers `append` a payload before sending it and `ack` it once the server has
+    accepted it. `records` returns everything that is still unacknowledged, in
+    append order, including records adopted from crashed processes.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False,
+    ) -> None:
+        """
+        Args:
+            root: Directory shared by all spools on this machine.
+            max_bytes: Once the spool is larger than this, the oldest segments
+                are discarded (and their records lost) to make room.
+            max_segment_bytes: Size at which the active segment is rotated.
+            fsync: Fsync after every write, to also survive power loss.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        self.num_discarded = 0
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._segments: List[_Segment] = []
+        self._segment_by_id: Dict[int, _Segment] = {}
+        self._acks_since_compaction = 0
+
+        os.makedirs(root, exist_ok=True)
+        # The directory is locked before it gets its final name, so that other
+        # processes never see it unlocked and adopt it
+        instance_id = uuid.uuid4().hex
+        tmp_directory = os.path.join(root, _TMP_PREFIX + instance_id)
+        os.makedirs(tmp_directory)
+        lock = _try_lock(os.path.join(tmp_directory, _LOCK_FILE))
+        if lock is None:
+            raise RuntimeError(f"Could not lock spool directory {tmp_directory}")
+        self.directory = os.path.join(root, instance_id)
+        os.rename(tmp_directory, self.directory)
+        self._lock_file = lock
+        self._acks_file = open(os.path.join(self.directory, _ACKS_FILE), "ab")
+        self._active: Optional[BinaryIO] = None
+        self._rotate()
+        self._adopt_orphans()
+
+    # Writing
+
+    def append(self, kind: str, meta: Dict[str, Any], body: bytes) -> int:
+        """Durably records a payload and returns its id."""
+        with self._lock:
+            record_id = self._next_id
+            self._next_id += 1
+            frame = _frame(_encode_record(record_id, kind, meta, body))
+            segment = self._segments[-1]
+            if segment.size > 0 and segment.size + len(frame) > self.max_segment_bytes:
+                self._rotate()
+                segment = self._segments[-1]
+            assert self._active is not None
+            self._active.write(frame)
+            self._sync(self._active)
+            segment.size += len(frame)
+            segment.live_ids.add(record_id)
+            self._segment_by_id[record_id] = segment
+            self._enforce_size_cap()
+            return record_id
+
+    def ack(self, record_ids: Iterable[int]) -> None:
+        """Marks records as delivered so they are never replayed."""
+        with self._lock:
+            acked = [i for i in record_ids if i in self._segment_by_id]
+            if not acked:
+                return
+            self._acks_file.write(_frame(json.dumps(acked).encode("utf-8")))
+            self._sync(self._acks_file)
+            for record_id in acked:
+                segment = self._segment_by_id.pop(record_id)
+                segment.live_ids.discard(record_id)
+            self._acks_since_compaction += len(acked)
+            self._compact()
+
+    # Reading
+
+    def pending_ids(self) -> Set[int]:
+        with self._lock:
+            return set(self._segment_by_id)
+
+    def records(self, exclude: Optional[Set[int]] = None) -> Iterator[SpoolRecord]:
+        """Yields unacknowledged records in append order."""
+        with self._lock:
+            paths = [s.path for s in self._segments if s.live_ids]
+            if self._active is not None:
+                self._active.flush()
+        for path in paths:
+            for payload in _read_frames(path):
+                record = _decode_record(payload)
+                if exclude and record.id in exclude:
+                    continue
+                with self._lock:
+                    if record.id not in self._segment_by_id:
+                        continue
+                yield record
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(s.size for s in self._segments)
+
+    def close(self) -> None:
+        """Releases the spool. Unacknowledged records are kept for the next process."""
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+            self._acks_file.close()
+            self._lock_file.close()
+            if not self._segment_by_id:
+                shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Internals
+
+    def _sync(self, f: BinaryIO) -> None:
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _rotate(self) -> None:
+        seq = self._segments[-1].seq + 1 if self._segments else 1
+        path = os.path.join(self.directory, f"{seq:012d}{_SEGMENT_SUFFIX}")
+        if self._active is not None:
+            self._active.close()
+        self._active = open(path, "ab")
+        self._segments.append(_Segment(seq=seq, path=path))
+
+    def _drop_segment(self, segment: _Segment) -> None:
+        for record_id in segment.live_ids:
+            self._segment_by_id.pop(record_id, None)
+        self._segments.remove(segment)
+        try:
+            os.remove(segment.path)
+        except OSError:
+            pass
+
+    def _enforce_size_cap(self) -> None:
+        total = sum(s.size for s in self._segments)
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments[0]
+            total -= oldest.size
+            self.num_discarded += len(oldest.live_ids)
+            logger.warning(
+                "spool_full_discarding_segment",
+                extra={"path": oldest.path, "records": len(oldest.live_ids)},
+            )
+            self._drop_segment(oldest)
+
+    def _compact(self) -> None:
+        # Delete fully acknowledged segments
+        for segment in list(self._segments[:-1]):
+            if not segment.live_ids:
+                self._drop_segment(segment)
+        active = self._segments[-1]
+        if not active.live_ids and active.size >= self.max_segment_bytes:
+            self._rotate()
+            self._drop_segment(active)
+        # Rewrite the ack log once it mostly refers to deleted segments
+        if self._acks_since_compaction >= 10000:
+            self._acks_since_compaction = 0
+            self._acks_file.close()
+            path = os.path.join(self.directory, _ACKS_FILE)
+            stale: List[int] = []
+            for segment in self._segments:
+                for payload in _read_frames(segment.path):
+                    record_id = _decode_record(payload).id
+                    if record_id not in self._segment_by_id:
+                        stale.append(record_id)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                if stale:
+                    f.write(_frame(json.dumps(stale).encode("utf-8")))
+                self._sync(f)
+            os.replace(tmp_path, path)
+            self._acks_file = open(path, "ab")
+
+    def _adopt_orphans(self) -> None:
+        """Copies unacknowledged records of dead processes into this spool."""
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if (
+                directory == self.directory
+                or name.startswith(_TMP_PREFIX)
+                or not os.path.isdir(directory)
+            ):
+                # Directories being created hold no records yet
+                continue
+            try:
+                lock = _try_lock(os.path.join(directory, _LOCK_FILE))
+            except OSError:
+                # Adopted and removed by another process in the meantime
+                continue
+            if lock is None:
+                # Still owned by a live process
+                continue
+            try:
+                acked = _read_acks(directory)
+                for path in _segment_paths(directory):
+                    for payload in _read_frames(path):
+                        record = _decode_record(payload)
+                        if record.id not in acked:
+                            self.append(record.kind, record.meta, record.body)
+            finally:
+                lock.close()
+            shutil.rmtree(directory, ignore_errors=True)
@@ -1,6 +1,13 @@
 from collections import namedtuple
-from typing import Any, Sequence, Union, Optional, TypedDict, Dict
+from typing import Any, Callable, Sequence, Union, Optional, TypedDict, Dict
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import contextlib
+import copy
 import dataclasses
+import logging
+import threading
+import time
 import typing
 import uuid
 import pydantic
@@ -13,6 +20,7 @@ from weave.exception import exception_to_json_str
 from weave.table import Table
 from weave import trace_sentry, urls
 from weave import run_context
+from weave.trace import digest_dedupe, env, object_cache, offload, op_cache
 from weave.trace.op import Op
 from weave.trace.object_record import (
     ObjectRecord,
@@ -21,9 +29,13 @@ from weave.trace.object_record import (
     pydantic_asdict_one_level,
 )
 from weave.trace.serialize import to_json, from_json, isinstance_namedtuple
+from weave.trace.sampling import SampleDecision, Sampler, SamplingPolicy
 from weave import graph_client_context
+from weave.trace_server.async_trace_server_adapter import AsyncTraceServerAdapter
 from weave.trace_server.trace_server_interface import (
+    AsyncTraceServerInterface,
     CallsDeleteReq,
+    CallsExportReq,
     ObjSchema,
     RefsReadBatchReq,
     TraceServerInterface,
@@ -33,14 +45,14 @@ from weave.trace_server.trace_server_interface import (
     StartedCallSchemaForInsert,
     CallStartReq,
     CallsQueryReq,
+    CallsQueryStatsReq,
     CallEndReq,
     EndedCallSchemaForInsert,
     CallSchema,
     ObjQueryReq,
     ObjQueryRes,
-    TableCreateReq,
-    TableSchemaForInsert,
     TableQueryReq,
+    TraceTreeReadReq,
     _TableRowFilter,
     _CallsFilter,
     _ObjectVersionFilter,
@@ -56,8 +68,13 @@ from weave.trace.refs import (
 from weave.trace.vals import TraceObject, TraceTable, make_trace_obj
 
 if typing.TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
     from . import ref_base
 
+logger = logging.getLogger(__name__)
+
 
 def generate_id() -> str:
     return str(uuid.uuid4())
@@ -104,6 +121,41 @@ def _get_direct_ref(obj: Any) -> Optional[Ref]:
     return getattr(obj, "ref", None)
 
 
+_NOT_PRIMITIVE = object()
+
+
+def _copy_primitive(obj: Any) -> Any:
+    """Copies a value made only of scalars, lists and dicts without refs.
+
+    Such a value has no objects to save, and is its own JSON encoding, so it
+    can skip `save_nested_objects`, `map_to_refs` and `to_json`. Returns
+    `_NOT_PRIMITIVE` for any other value.
+    """
+    if isinstance(obj, (int, float, str)) or obj is None:
+        return obj if getattr(obj, "ref", None) is None else _NOT_PRIMITIVE
+    if isinstance(obj, list):
+        if getattr(obj, "ref", None) is not None:
+            return _NOT_PRIMITIVE
+        list_copy = []
+        for v in obj:
+            v = _copy_primitive(v)
+            if v is _NOT_PRIMITIVE:
+                return v
+            list_copy.append(v)
+        return list_copy
+    if isinstance(obj, dict):
+        if getattr(obj, "ref", None) is not None:
+            return _NOT_PRIMITIVE
+        dict_copy = {}
+        for k, v in obj.items():
+            v = _copy_primitive(v)
+            if v is _NOT_PRIMITIVE:
+                return v
+            dict_copy[k] = v
+        return dict_copy
+    return _NOT_PRIMITIVE
+
+
 def map_to_refs(obj: Any) -> Any:
     ref = _get_direct_ref(obj)
     if ref:
@@ -144,6 +196,11 @@ class Call:
     summary: Optional[dict] = None
     # These are the live children during logging
     _children: list["Call"] = dataclasses.field(default_factory=list)
+    # Set for calls of cached ops, with the output to reuse on a cache hit
+    _cache_key: Optional[str] = None
+    _cached_output: Optional[op_cache.CachedOutput] = None
+    # Set for the calls of a trace that isn't sampled, see `_TraceBuffer`
+    _trace_buffer: Optional["_TraceBuffer"] = None
 
     @property
     def ui_url(self) -> str:
@@ -160,17 +217,20 @@ class Call:
         client = graph_client_context.require_graph_client()
         if not self.id:
             raise ValueError("Can't get children of call without ID")
-        return CallsIter(
-            client.server,
-            self.project_id,
-            _CallsFilter(parent_ids=[self.id]),
-        )
+        return CallChildrenIter(client, self.project_id, self.id)
 
     def delete(self) -> bool:
         client = graph_client_context.require_graph_client()
         return client.delete_call(call=self)
 
 
+# Call starts and ends a trace that isn't sampled holds before it is discarded
+MAX_BUFFERED_TRACE_EVENTS = 10000
+
+CALLS_ITER_MIN_PAGE_SIZE = 10
+CALLS_ITER_MAX_PAGE_SIZE = 1000
+
+
 class CallsIter:
     server: TraceServerInterface
     filter: _CallsFilter
@@ -182,24 +242,78 @@ class CallsIter:
         self.project_id = project_id
         self.filter = filter
 
-    def __getitem__(self, key: Union[slice, int]) -> TraceObject:
+    @typing.overload
+    def __getitem__(self, key: int) -> TraceObject:
+        ...
+
+    @typing.overload
+    def __getitem__(self, key: slice) -> list[TraceObject]:
+        ...
+
+    def __getitem__(
+        self, key: Union[slice, int]
+    ) -> Union[TraceObject, list[TraceObject]]:
         if isinstance(key, slice):
-            raise NotImplementedError("Slicing not supported")
-        for i, call in enumerate(self):
-            if i == key:
-                return call
-        raise IndexError(f"Index {key} out of range")
+            start, stop, step = key.start, key.stop, key.step
+            if any(i is not None and i < 0 for i in (start, stop, step)):
+                start, stop, step = key.indices(len(self))
+                if step < 0:
+                    # Fetch the range in order, then walk it backwards
+                    if stop + 1 > start:
+                        return []
+                    calls = self._query_page(offset=stop + 1, limit=start - stop)
+                    return calls[::-1][::-step]
+            start = start or 0
+            if stop is not None and stop <= start:
+                return []
+            calls = self._query_page(
+                offset=start, limit=None if stop is None else stop - start
+            )
+            return calls[:: step or 1]
+        if key < 0:
+            key += len(self)
+        calls = self._query_page(offset=key, limit=1) if key >= 0 else []
+        if not calls:
+            raise IndexError(f"Index {key} out of range")
+        return calls[0]
+
+    def __len__(self) -> int:
+        response = self.server.calls_query_stats(
+            CallsQueryStatsReq(project_id=self.project_id, filter=self.filter)
+        )
+        return response.count
+
+    def _query_page(
+        self, offset: int, limit: typing.Optional[int]
+    ) -> list[TraceObject]:
+        entity, project = self.project_id.split("/")
+        response = self.server.calls_query(
+            CallsQueryReq(
+                project_id=self.project_id,
+                filter=self.filter,
+                offset=offset,
+                limit=limit,
+            )
+        )
+        return [
+            make_client_call(entity, project, call, self.server)
+            for call in response.calls
+        ]
 
     def __iter__(self) -> typing.Iterator[TraceObject]:
-        page_index = 0
-        page_size = 10
         entity, project = self.project_id.split("/")
+        # Start small so the first calls arrive quickly, then grow the pages
+        page_size = CALLS_ITER_MIN_PAGE_SIZE
+        cursor = None
+        offset = 0
         while True:
             response = self.server.calls_query(
                 CallsQueryReq(
                     project_id=self.project_id,
                     filter=self.filter,
-                    offset=page_index * page_size,
+                    cursor=cursor,
+                    # Servers without cursor support page with offsets
+                    offset=None if cursor else offset,
                     limit=page_size,
                 )
             )
@@ -211,13 +325,71 @@ class CallsIter:
                 # yield make_trace_obj(call, ValRef(call.id), self.server, None)
             if len(page_data) < page_size:
                 break
-            page_index += 1
+            cursor = response.next_cursor
+            offset += len(page_data)
+            page_size = min(page_size * 2, CALLS_ITER_MAX_PAGE_SIZE)
+
+    def to_arrow(self, columns: Optional[list[str]] = None) -> "pa.Table":
+        """Fetches all matching calls as an Arrow table, in one streamed request.
+
+        `attributes`, `inputs`, `output` and `summary` are JSON strings.
+        """
+        from weave.trace_server.calls_export import read_calls_export
+
+        chunks = self.server.calls_export(
+            CallsExportReq(
+                project_id=self.project_id,
+                filter=self.filter,
+                columns=columns,
+                format="arrow",
+            )
+        )
+        return read_calls_export(chunks, "arrow")
+
+    def to_pandas(self, columns: Optional[list[str]] = None) -> "pd.DataFrame":
+        return self.to_arrow(columns).to_pandas()
+
+
+class CallChildrenIter(CallsIter):
+    """The children of a call, like a `CallsIter` of them.
+
+    They are read with `trace_tree_read`, one level below the call, each time
+    they are iterated over, counted or indexed.
+    """
+
+    def __init__(self, client: "WeaveClient", project_id: str, call_id: str) -> None:
+        super().__init__(client.server, project_id, _CallsFilter(parent_ids=[call_id]))
+        self.client = client
+        self.call_id = call_id
+
+    def _read(self) -> list[TraceObject]:
+        calls = self.client._read_trace_tree(
+            TraceTreeReadReq(
+                project_id=self.project_id, root_call_id=self.call_id, max_depth=1
+            )
+        )
+        # The subtree starts with the call itself
+        return calls[1:]
+
+    def __len__(self) -> int:
+        return len(self._read())
+
+    def _query_page(
+        self, offset: int, limit: typing.Optional[int]
+    ) -> list[TraceObject]:
+        calls = self._read()[offset:]
+        return calls if limit is None else calls[:limit]
+
+    def __iter__(self) -> typing.Iterator[TraceObject]:
+        return iter(self._read())
 
 
 def make_client_call(
     entity: str, project: str, server_call: CallSchema, server: TraceServerInterface
 ) -> TraceObject:
-    output = server_call.output
+    output = offload.decode_offloaded_values(
+        server_call.output, server_call.project_id, server
+    )
     call = Call(
         op_name=server_call.op_name,
         project_id=server_call.project_id,
@@ -233,6 +405,16 @@ def make_client_call(
     return TraceObject(call, CallRef(entity, project, call.id), server, None)
 
 
+@contextlib.contextmanager
+def _raise_not_found_for(ref: ObjectRef) -> typing.Iterator[None]:
+    try:
+        yield
+    except HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            raise ValueError(f"Unable to find object for ref uri: {ref.uri()}")
+        raise
+
+
 def sum_dict_leaves(dicts: list[dict]) -> dict:
     # dicts is a list of dictionaries, that may or may not
     # have nested dictionaries. Sum all the leaves that match
@@ -257,6 +439,8 @@ class WeaveClient:
         project: The project name.
         server: The server to use for communication.
         ensure_project_exists: Whether to ensure the project exists on the server.
+        async_server: The server used by the async (`a`-prefixed) methods.
+            Defaults to running `server` in worker threads.
     """
 
     def __init__(
@@ -265,16 +449,48 @@ class WeaveClient:
         project: str,
         server: TraceServerInterface,
         ensure_project_exists: bool = True,
+        async_server: Optional[AsyncTraceServerInterface] = None,
+        sampling_policy: Optional[SamplingPolicy] = None,
     ):
         self.entity = entity
         self.project = project
         self.server = server
+        if async_server is None:
+            async_server = AsyncTraceServerAdapter(server)
+        self.async_server = async_server
         self._anonymous_ops: dict[str, Op] = {}
         self.ensure_project_exists = ensure_project_exists
+        # Call starts and ends whose files are still uploading are sent from
+        # this thread once the uploads are done. Every later call event is
+        # queued behind them, so events are always sent in order.
+        self._call_event_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="weave-call-events"
+        )
+        self._call_events_lock = threading.Lock()
+        self._num_queued_call_events = 0
+        self._call_event_executor_closed = False
+        self._sampler: Optional[Sampler] = None
+        if sampling_policy is not None:
+            self.set_sampling_policy(sampling_policy)
 
         if ensure_project_exists:
             self.server.ensure_project_exists(entity, project)
 
+    def set_sampling_policy(self, policy: Optional[SamplingPolicy]) -> None:
+        """Sets which calls are traced, tracing all of them if `policy` is None."""
+        self._sampler = None if policy is None else Sampler(policy)
+
+    def _sample_call(self, op_name: str, parent: Optional[Call]) -> SampleDecision:
+        sampler = self._sampler
+        if sampler is None:
+            return "record"
+        if parent is None:
+            return sampler.sample_trace(op_name)
+        if parent._trace_buffer is not None:
+            # Everything in a buffered trace is kept if the trace is
+            return "record"
+        return "record" if sampler.allow_call(op_name) else "drop"
+
     def ref_is_own(self, ref: Ref) -> bool:
         return isinstance(ref, Ref)
 
@@ -295,20 +511,26 @@ class WeaveClient:
             return val
         json_val = to_json(val, self._project_id(), self.server)
 
-        response = self.server.obj_create(
-            ObjCreateReq(
-                obj=ObjSchemaForInsert(
-                    project_id=self.entity + "/" + self.project,
-                    object_id=name,
-                    val=json_val,
-                )
+        digest = digest_dedupe.create_obj(
+            self.server, self._obj_create_req(json_val, name)
+        )
+        return self._obj_ref(is_opdef, name, digest)
+
+    def _obj_create_req(self, json_val: Any, name: str) -> ObjCreateReq:
+        return ObjCreateReq(
+            obj=ObjSchemaForInsert(
+                project_id=self.entity + "/" + self.project,
+                object_id=name,
+                val=json_val,
             )
         )
+
+    def _obj_ref(self, is_opdef: bool, name: str, digest: str) -> ObjectRef:
         ref: Ref
         if is_opdef:
-            ref = OpRef(self.entity, self.project, name, response.digest)
+            ref = OpRef(self.entity, self.project, name, digest)
         else:
-            ref = ObjectRef(self.entity, self.project, name, response.digest)
+            ref = ObjectRef(self.entity, self.project, name, digest)
         # TODO: Try to put a ref onto val? Or should user code use a style like
         # save instead?
         return ref
@@ -323,18 +545,10 @@ class WeaveClient:
     @trace_sentry.global_trace_sentry.watch()
     def get(self, ref: ObjectRef) -> Any:
         project_id = f"{ref.entity}/{ref.project}"
-        try:
-            read_res = self.server.obj_read(
-                ObjReadReq(
-                    project_id=project_id,
-                    object_id=ref.name,
-                    digest=ref.digest,
-                )
+        with _raise_not_found_for(ref):
+            digest, data = object_cache.read_obj_val(
+                self.server, project_id, ref.name, ref.digest
             )
-        except HTTPError as e:
-            if e.response is not None and e.response.status_code == 404:
-                raise ValueError(f"Unable to find object for ref uri: {ref.uri()}")
-            raise
 
         # Probably bad form to mutate the ref here
         # At this point, `ref.digest` is one of three things:
@@ -344,22 +558,16 @@ class WeaveClient:
         #
         # However, we always want to resolve the ref to the digest. So
         # here, we just directly assign the digest.
-        ref.digest = read_res.obj.digest
-
-        data = read_res.obj.val
+        ref.digest = digest
 
         # If there is a ref-extra, we should resolve it. Rather than walking
         # the object, it is more efficient to directly query for the data and
         # let the server resolve it.
         if ref.extra:
-            try:
+            with _raise_not_found_for(ref):
                 ref_read_res = self.server.refs_read_batch(
                     RefsReadBatchReq(refs=[ref.uri()])
                 )
-            except HTTPError as e:
-                if e.response is not None and e.response.status_code == 404:
-                    raise ValueError(f"Unable to find object for ref uri: {ref.uri()}")
-                raise
             if not ref_read_res.vals:
                 raise ValueError(f"Unable to find object for ref uri: {ref.uri()}")
             data = ref_read_res.vals[0]
@@ -368,21 +576,137 @@ class WeaveClient:
 
         return make_trace_obj(val, ref, self.server, None)
 
-    @trace_sentry.global_trace_sentry.watch()
-    def save_table(self, table: Table) -> TableRef:
-        response = self.server.table_create(
-            TableCreateReq(
-                table=TableSchemaForInsert(
-                    project_id=self._project_id(), rows=table.rows
+    # Async variants. Network requests go through `async_server`; decoding of
+    # values that may need further (sync) server reads, like custom objects
+    # stored as files, runs in a worker thread so the event loop never blocks.
+
+    async def aget(self, ref: ObjectRef) -> Any:
+        project_id = f"{ref.entity}/{ref.project}"
+        data = object_cache.get_cached_obj_val(project_id, ref.name, ref.digest)
+        if data is None:
+            with _raise_not_found_for(ref):
+                read_res = await self.async_server.obj_read(
+                    ObjReadReq(
+                        project_id=project_id,
+                        object_id=ref.name,
+                        digest=ref.digest,
+                    )
+                )
+            # See `get` for why the ref is mutated
+            ref.digest = read_res.obj.digest
+            data = read_res.obj.val
+            object_cache.cache_obj_val(project_id, ref.name, ref.digest, data)
+        if ref.extra:
+            with _raise_not_found_for(ref):
+                ref_read_res = await self.async_server.refs_read_batch(
+                    RefsReadBatchReq(refs=[ref.uri()])
                 )
+            if not ref_read_res.vals:
+                raise ValueError(f"Unable to find object for ref uri: {ref.uri()}")
+            data = ref_read_res.vals[0]
+
+        def decode() -> Any:
+            val = from_json(data, project_id, self.server)
+            return make_trace_obj(val, ref, self.server, None)
+
+        return await asyncio.to_thread(decode)
+
+    async def asave(self, val: Any, name: str, branch: str = "latest") -> Any:
+        # Nested objects, tables and files are saved through the sync server in
+        # a worker thread; the top level object is created asynchronously.
+        await asyncio.to_thread(self.save_nested_objects, val, name=name)
+        is_opdef = isinstance(val, Op)
+        val = map_to_refs(val)
+        if isinstance(val, ObjectRef):
+            ref = val
+        else:
+            json_val = await asyncio.to_thread(
+                to_json, val, self._project_id(), self.server
+            )
+            response = await self.async_server.obj_create(
+                self._obj_create_req(json_val, name)
+            )
+            ref = self._obj_ref(is_opdef, name, response.digest)
+        return await self.aget(ref)
+
+    async def acall(self, call_id: str) -> TraceObject:
+        response = await self.async_server.calls_query(
+            CallsQueryReq(
+                project_id=self._project_id(),
+                filter=_CallsFilter(call_ids=[call_id]),
             )
         )
-        return TableRef(
-            entity=self.entity, project=self.project, digest=response.digest
+        if not response.calls:
+            raise ValueError(f"Call not found: {call_id}")
+        return await asyncio.to_thread(
+            make_client_call, self.entity, self.project, response.calls[0], self.server
         )
 
+    async def acalls(
+        self, filter: Optional[_CallsFilter] = None
+    ) -> typing.AsyncIterator[TraceObject]:
+        if filter is None:
+            filter = _CallsFilter()
+        # Paged like `CallsIter`
+        page_size = CALLS_ITER_MIN_PAGE_SIZE
+        cursor = None
+        offset = 0
+        while True:
+            response = await self.async_server.calls_query(
+                CallsQueryReq(
+                    project_id=self._project_id(),
+                    filter=filter,
+                    cursor=cursor,
+                    # Servers without cursor support page with offsets
+                    offset=None if cursor else offset,
+                    limit=page_size,
+                )
+            )
+            page_data = response.calls
+            for call in page_data:
+                yield await asyncio.to_thread(
+                    make_client_call, self.entity, self.project, call, self.server
+                )
+            if len(page_data) < page_size:
+                break
+            cursor = response.next_cursor
+            offset += len(page_data)
+            page_size = min(page_size * 2, CALLS_ITER_MAX_PAGE_SIZE)
+
+    @trace_sentry.global_trace_sentry.watch()
+    def save_table(self, table: Table) -> TableRef:
+        digest = digest_dedupe.create_table(self.server, self._project_id(), table.rows)
+        return TableRef(entity=self.entity, project=self.project, digest=digest)
+
+    def save_table_version(
+        self,
+        base: TableRef,
+        append_rows: Optional[list[Any]] = None,
+        remove_row_digests: Optional[list[str]] = None,
+    ) -> TableRef:
+        """Saves a new version of a table without re-sending its unchanged rows.
+
+        The new table has the rows of `base`, except those whose digest is in
+        `remove_row_digests`, followed by `append_rows`.
+        """
+        row_digests: list[str] = []
+        if append_rows:
+            row_digests = digest_dedupe.create_table_rows(
+                self.server, self._project_id(), append_rows
+            )
+        digest = digest_dedupe.create_table_from_digests(
+            self.server,
+            self._project_id(),
+            row_digests,
+            base_digest=base.digest,
+            remove_row_digests=remove_row_digests,
+        )
+        return TableRef(entity=self.entity, project=self.project, digest=digest)
+
     @trace_sentry.global_trace_sentry.watch()
     def calls(self, filter: Optional[_CallsFilter] = None) -> CallsIter:
+        # Make calls that are waiting on uploads visible
+        self._flush_call_events()
         if filter is None:
             filter = _CallsFilter()
 
@@ -390,6 +714,7 @@ class WeaveClient:
 
     @trace_sentry.global_trace_sentry.watch()
     def call(self, call_id: str) -> TraceObject:
+        self._flush_call_events()
         response = self.server.calls_query(
             CallsQueryReq(
                 project_id=self._project_id(),
@@ -401,6 +726,21 @@ class WeaveClient:
         response_call = response.calls[0]
         return make_client_call(self.entity, self.project, response_call, self.server)
 
+    @trace_sentry.global_trace_sentry.watch()
+    def trace(self, trace_id: str) -> list[TraceObject]:
+        """Returns the calls of a trace, each followed by its descendants."""
+        return self._read_trace_tree(
+            TraceTreeReadReq(project_id=self._project_id(), trace_id=trace_id)
+        )
+
+    def _read_trace_tree(self, req: TraceTreeReadReq) -> list[TraceObject]:
+        self._flush_call_events()
+        response = self.server.trace_tree_read(req)
+        return [
+            make_client_call(self.entity, self.project, call, self.server)
+            for call in response.calls
+        ]
+
     @trace_sentry.global_trace_sentry.watch()
     def op_calls(self, op: Op) -> CallsIter:
         op_ref = get_ref(op)
@@ -441,6 +781,8 @@ class WeaveClient:
         parent: Optional[Call],
         inputs: dict,
         attributes: dict = {},
+        buffer_trace: bool = False,
+        cache: Optional[op_cache.OpCachePolicy] = None,
     ) -> Call:
         if isinstance(op, str):
             if op not in self._anonymous_ops:
@@ -452,13 +794,39 @@ class WeaveClient:
         else:
             op_str = op
 
-        self.save_nested_objects(inputs)
-        inputs_with_refs = map_to_refs(inputs)
-        call_id = generate_id()
-
         if parent is None:
             parent = run_context.get_current_run()
 
+        call_id = generate_id()
+        if parent is not None:
+            trace_buffer = parent._trace_buffer
+        elif buffer_trace:
+            trace_buffer = _TraceBuffer(root_id=call_id)
+        else:
+            trace_buffer = None
+
+        uploads = _call_event_uploads(trace_buffer)
+        offload_bytes = env.get_weave_call_value_offload_bytes()
+        inputs_with_refs = {}
+        inputs_json = {}
+        for k, v in inputs.items():
+            inputs_with_refs[k], inputs_json[k] = self._capture_value(
+                v, uploads, offload_bytes
+            )
+
+        cache_key = None
+        cached_output = None
+        if cache is not None:
+            cache_key = op_cache.cache_key(
+                typing.cast(ObjectRef, op_def_ref).digest, inputs_json
+            )
+            cached_output = op_cache.read_cached_output(
+                self.server, self._project_id(), op_str, cache_key, cache
+            )
+            attributes = {**attributes, op_cache.CACHE_KEY_ATTRIBUTE: cache_key}
+            if cached_output is not None:
+                attributes[op_cache.CACHE_HIT_ATTRIBUTE] = True
+
         if parent:
             trace_id = parent.trace_id
             parent_id = parent.id
@@ -472,9 +840,15 @@ class WeaveClient:
             parent_id=parent_id,
             id=call_id,
             inputs=inputs_with_refs,
+            _cache_key=cache_key,
+            _cached_output=cached_output,
+            _trace_buffer=trace_buffer,
         )
         if parent is not None:
             parent._children.append(call)
+        if trace_buffer is not None:
+            with trace_buffer.lock:
+                trace_buffer.started_at[call_id] = time.monotonic()
 
         current_wb_run_id = safe_current_wb_run_id()
         check_wandb_run_matches(current_wb_run_id, self.entity, self.project)
@@ -485,11 +859,15 @@ class WeaveClient:
             trace_id=trace_id,
             started_at=datetime.datetime.now(tz=datetime.timezone.utc),
             parent_id=parent_id,
-            inputs=to_json(inputs_with_refs, self._project_id(), self.server),
+            inputs=inputs_json,
             attributes=attributes,
             wb_run_id=current_wb_run_id,
         )
-        self.server.call_start(CallStartReq(start=start))
+        self._send_call_event(
+            uploads,
+            lambda: self.server.call_start(CallStartReq(start=start)),
+            trace_buffer,
+        )
         run_context.push_call(call)
         return call
 
@@ -497,9 +875,11 @@ class WeaveClient:
     def finish_call(
         self, call: Call, output: Any = None, exception: Optional[BaseException] = None
     ) -> None:
-        self.save_nested_objects(output)
+        uploads = _call_event_uploads(call._trace_buffer)
         original_output = output
-        output = map_to_refs(original_output)
+        output, output_json = self._capture_value(
+            original_output, uploads, env.get_weave_call_value_offload_bytes()
+        )
         call.output = output
 
         # Summary handling
@@ -526,18 +906,30 @@ class WeaveClient:
             exception_str = exception_to_json_str(exception)
             call.exception = exception_str
 
-        self.server.call_end(
-            CallEndReq(
-                end=EndedCallSchemaForInsert(
-                    project_id=self._project_id(),
-                    id=call.id,  # type: ignore
-                    ended_at=datetime.datetime.now(tz=datetime.timezone.utc),
-                    output=to_json(output, self._project_id(), self.server),
-                    summary=summary,
-                    exception=exception_str,
-                )
+        end = EndedCallSchemaForInsert(
+            project_id=self._project_id(),
+            id=call.id,  # type: ignore
+            ended_at=datetime.datetime.now(tz=datetime.timezone.utc),
+            output=output_json,
+            summary=summary,
+            exception=exception_str,
+        )
+        if (
+            call._cache_key is not None
+            and call._cached_output is None
+            and not exception
+        ):
+            op_cache.cache_output(
+                self._project_id(),
+                call._cache_key,
+                op_cache.CachedOutput(output_json, end.ended_at.timestamp()),
             )
+        trace_buffer = call._trace_buffer
+        self._send_call_event(
+            uploads, lambda: self.server.call_end(CallEndReq(end=end)), trace_buffer
         )
+        if trace_buffer is not None:
+            self._finish_buffered_call(trace_buffer, call, exception is not None)
 
         # Descendent error tracking disabled til we fix UI
         # Add this call's summary after logging the call, so that only
@@ -562,6 +954,43 @@ class WeaveClient:
             )
         )
 
+    def _capture_value(
+        self, val: Any, uploads: list[Future], offload_bytes: int
+    ) -> tuple[Any, Any]:
+        """Saves the objects in a call input or output.
+
+        Returns the value with its objects replaced by refs, and its JSON,
+        with its parts over `offload_bytes` offloaded to files.
+        """
+        primitive = _copy_primitive(val)
+        if primitive is not _NOT_PRIMITIVE:
+            val_with_refs, json_val = primitive, primitive
+        else:
+            self.save_nested_objects(val)
+            val_with_refs = map_to_refs(val)
+            json_val = to_json(val_with_refs, self._project_id(), self.server, uploads)
+        return val_with_refs, offload.offload_large_values(
+            json_val, self._project_id(), self.server, uploads, offload_bytes
+        )
+
+    def _cached_call_output(self, cached: op_cache.CachedOutput) -> Any:
+        """Decodes a cached op output, with its refs and offloaded parts read."""
+
+        def resolve(val: Any) -> Any:
+            if isinstance(val, offload.OffloadedValue):
+                return resolve(from_json(val.load(), val.project_id, self.server))
+            elif isinstance(val, ObjectRef):
+                return self.get(val)
+            elif isinstance(val, list):
+                return [resolve(v) for v in val]
+            elif isinstance(val, dict):
+                return {k: resolve(v) for k, v in val.items()}
+            return val
+
+        return resolve(
+            from_json(copy.deepcopy(cached.output), self._project_id(), self.server)
+        )
+
     def save_nested_objects(self, obj: Any, name: Optional[str] = None) -> Any:
         if get_ref(obj) is not None:
             return
@@ -592,6 +1021,98 @@ class WeaveClient:
         elif isinstance(obj, Op):
             self._save_op(obj)
 
+    def _send_call_event(
+        self,
+        uploads: list[Future],
+        send: Callable[[], Any],
+        trace_buffer: Optional["_TraceBuffer"] = None,
+    ) -> None:
+        """Sends a call start or end once the files it refers to are uploaded.
+
+        Events of buffered traces are held until the trace is kept.
+        """
+        if trace_buffer is not None:
+            with trace_buffer.lock:
+                if not trace_buffer.keep:
+                    trace_buffer.add_event(uploads, send)
+                    return
+        if isinstance(uploads, digest_dedupe.DeferredUploads):
+            uploads = uploads.start()
+        with self._call_events_lock:
+            if self._call_event_executor_closed or (
+                not uploads and self._num_queued_call_events == 0
+            ):
+                queued = False
+            else:
+                queued = True
+                self._num_queued_call_events += 1
+                self._call_event_executor.submit(
+                    self._send_queued_call_event, uploads, send
+                )
+        if not queued:
+            # After `close`, events are sent from the calling thread
+            if _uploads_succeeded(uploads):
+                send()
+
+    def _finish_buffered_call(
+        self, trace_buffer: "_TraceBuffer", call: Call, failed: bool
+    ) -> None:
+        sampler = self._sampler
+        with trace_buffer.lock:
+            duration = time.monotonic() - trace_buffer.started_at.pop(
+                typing.cast(str, call.id)
+            )
+            if (
+                not trace_buffer.keep
+                and not trace_buffer.overflowed
+                and sampler is not None
+                and sampler.keep_buffered_call(failed, duration)
+            ):
+                # The rest of the trace is sent as it happens
+                trace_buffer.keep = True
+                for uploads, send in trace_buffer.events:
+                    self._send_call_event(uploads, send)
+            if trace_buffer.keep or call.id == trace_buffer.root_id:
+                trace_buffer.events = []
+
+    def _send_queued_call_event(
+        self, uploads: list[Future], send: Callable[[], Any]
+    ) -> None:
+        try:
+            if _uploads_succeeded(uploads):
+                send()
+        except Exception:
+            logger.exception("Failed to send call event")
+        finally:
+            with self._call_events_lock:
+                self._num_queued_call_events -= 1
+
+    def _flush_call_events(self, timeout: Optional[float] = None) -> bool:
+        with self._call_events_lock:
+            if self._num_queued_call_events == 0:
+                return True
+            done = self._call_event_executor.submit(lambda: None)
+        return not wait([done], timeout=timeout).not_done
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until all buffered calls have been sent to the server.
+
+        Returns False if the timeout expired before everything was sent.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._flush_call_events(timeout):
+            return False
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        return self.server.flush(remaining)
+
+    def close(self) -> None:
+        """Flush buffered calls and stop the background sender."""
+        with self._call_events_lock:
+            self._call_event_executor_closed = True
+        self._call_event_executor.shutdown()
+        self.server.flush()
+        self.server.close()
+
     def ref_input_to(self, ref: "ref_base.Ref") -> Sequence[Call]:
         raise NotImplementedError()
 
@@ -617,6 +1138,67 @@ class WeaveClient:
         return ""
 
 
+def _uploads_succeeded(uploads: list[Future]) -> bool:
+    """Waits for the uploads of a call event.
+
+    If a file could not be uploaded (after retries), the event is not sent,
+    rather than logging a call that refers to a file the server doesn't have.
+    """
+    for upload in uploads:
+        try:
+            upload.result()
+        except Exception as e:
+            logger.error(f"Failed to upload a file of a call, not sending it: {e}")
+            return False
+    return True
+
+
+@dataclasses.dataclass
+class _TraceBuffer:
+    """The events of a trace that isn't sampled, held until one of its calls
+    fails or is slow. Discarded with the calls of the trace otherwise.
+
+    Its calls run on any thread, so it is only used with `lock` held.
+    """
+
+    root_id: str
+    # Whether the trace is sent: its events so far were, and later ones are
+    # sent as they happen
+    keep: bool = False
+    # Set once the trace has more than MAX_BUFFERED_TRACE_EVENTS events, which
+    # are then discarded along with every later one
+    overflowed: bool = False
+    # Call starts and ends, as arguments of `_send_call_event`, with their
+    # files not uploaded until the trace is kept
+    events: list[tuple[list[Future], Callable[[], Any]]] = dataclasses.field(
+        default_factory=list
+    )
+    # Monotonic start times of the calls that are running, by id
+    started_at: dict[str, float] = dataclasses.field(default_factory=dict)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+    def add_event(self, uploads: list[Future], send: Callable[[], Any]) -> None:
+        if self.overflowed:
+            return
+        if len(self.events) >= MAX_BUFFERED_TRACE_EVENTS:
+            logger.warning(
+                f"Trace with root call {self.root_id} has more than "
+                f"{MAX_BUFFERED_TRACE_EVENTS} calls waiting to be sampled, "
+                "discarding it"
+            )
+            self.overflowed = True
+            self.events = []
+            return
+        self.events.append((uploads, send))
+
+
+def _call_event_uploads(trace_buffer: Optional[_TraceBuffer]) -> list[Future]:
+    """The uploads of a call event, which are deferred in buffered traces."""
+    if trace_buffer is not None:
+        return digest_dedupe.DeferredUploads()
+    return []
+
+
 def safe_current_wb_run_id() -> Optional[str]:
     try:
         import wandb
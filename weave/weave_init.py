@@ -1,6 +1,7 @@
 import typing
 from . import init_message
 from .trace_server import remote_http_trace_server, sqlite_trace_server
+from .trace_server.async_remote_http_trace_server import AsyncRemoteHTTPTraceServer
 from . import context_state
 from . import errors
 from . import autopatch
@@ -114,7 +115,11 @@ def init_weave(
 
     # server = ClickHouseTraceServer(host="localhost")
     client = weave_client.WeaveClient(
-        entity_name, project_name, remote_server, ensure_project_exists
+        entity_name,
+        project_name,
+        remote_server,
+        ensure_project_exists,
+        async_server=AsyncRemoteHTTPTraceServer.from_sync_server(remote_server),
     )
 
     _current_inited_client = InitializedClient(client)
@@ -177,6 +182,7 @@ def init_local() -> InitializedClient:
 def finish() -> None:
     global _current_inited_client
     if _current_inited_client is not None:
+        _current_inited_client.client.flush()
         _current_inited_client.reset()
         _current_inited_client = None
 